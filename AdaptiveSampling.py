@@ -0,0 +1,217 @@
+#
+# AdaptiveSampling chooses how often the control channels are sampled.
+# The engine used to read every channel once a second whatever the
+# readings did; with an AdaptiveInterval it samples less often while
+# every reading is stable and far from its setpoint, and goes back to
+# the fastest interval as soon as one of them moves or gets close.
+#
+# For every channel, after every tick:
+#
+#   - within nearDistance of the setpoint, or the setpoint just changed:
+#     the fastest interval
+#   - changing faster than maxRate (per second, measured over the last
+#     rateWindow seconds): the fastest interval
+#   - otherwise the interval grows by 'growth' (and at least by one
+#     minInterval) per tick up to the slowest one, but stays short
+#     enough that, at the current rate, the reading cannot cover half of
+#     its way to the near band between two samples
+#
+# The shortest interval of all channels is used, rounded down to a whole
+# number of minIntervals so the ticks stay on the grid of the other
+# periodic jobs and share their wakeups. It is published with its reason
+# ('near setpoint', 'changing', 'approaching', 'stable', ...) so the I2C
+# reads and wakeups saved can be measured.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from collections import deque
+from math import floor
+
+import logging
+
+log = logging.getLogger('plantsitter.sampling')
+
+##
+## Default settings
+##
+DEFAULT_MIN_INTERVAL = 1.0
+DEFAULT_MAX_INTERVAL = 30.0
+DEFAULT_GROWTH = 1.5
+DEFAULT_NEAR_DISTANCE = 2.0
+DEFAULT_MAX_RATE = 0.01
+DEFAULT_RATE_WINDOW = 30.0
+
+##
+## Share of the way to the near band a reading may cover between two
+## samples
+##
+APPROACH_SHARE = 0.5
+
+##
+## Reasons of an interval
+##
+REASON_START = 'start'
+REASON_NEAR = 'near setpoint'
+REASON_SETPOINT = 'setpoint changed'
+REASON_CHANGING = 'changing'
+REASON_APPROACHING = 'approaching'
+REASON_STABLE = 'stable'
+
+REASONS = (REASON_START, REASON_NEAR, REASON_SETPOINT, REASON_CHANGING,
+           REASON_APPROACHING, REASON_STABLE)
+
+##
+## Number of past decisions kept in AdaptiveInterval.history
+##
+HISTORY_LENGTH = 100
+
+##
+## AdaptiveInterval - The sampling interval policy
+##
+class AdaptiveInterval():
+    "Sampling interval from the rate of change and the distance to the setpoint"
+
+    ##
+    ## Class Initialization method
+    ##
+    ##  minInterval   - fastest interval in seconds (when moving or near)
+    ##  maxInterval   - slowest interval in seconds
+    ##  growth        - factor the interval grows by per stable tick
+    ##  nearDistances - {channel name: distance from the setpoint that
+    ##                  counts as near}, DEFAULT_NEAR_DISTANCE otherwise
+    ##  maxRates      - {channel name: largest rate of change per second
+    ##                  that counts as stable}, DEFAULT_MAX_RATE otherwise
+    ##  rateWindow    - seconds the rate of change is measured over
+    ##
+    def __init__(self, minInterval = DEFAULT_MIN_INTERVAL, maxInterval = DEFAULT_MAX_INTERVAL,
+                 growth = DEFAULT_GROWTH, nearDistances = None, maxRates = None,
+                 rateWindow = DEFAULT_RATE_WINDOW):
+        if not 0 < minInterval <= maxInterval:
+            raise ValueError("need 0 < minInterval <= maxInterval")
+
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.growth = growth
+        self.nearDistances = nearDistances or {}
+        self.maxRates = maxRates or {}
+        self.rateWindow = rateWindow
+
+        ## Current interval, its reason and the channel it came from
+        self.interval = minInterval
+        self.reason = REASON_START
+        self.channel = None
+
+        ## Ticks decided by each reason, interval changes, and the last
+        ## HISTORY_LENGTH (time, interval, reason, channel) decisions
+        self.reasons = {reason: 0 for reason in REASONS}
+        self.changes = 0
+        self.history = deque(maxlen = HISTORY_LENGTH)
+
+        ## Called as listener(interval, reason, channel) when the
+        ## interval changes
+        self.listeners = []
+
+        ## Per channel: deque of recent (time, value) points and the
+        ## setpoint seen by the last tick
+        self._points = {}
+        self._setPoints = {}
+
+    ##
+    ## _rate - Rate of change per second of 'name' over the points of
+    ## the last rateWindow seconds, after adding (when, value)
+    ##
+    def _rate(self, name, when, value):
+        points = self._points.get(name)
+        if points is None:
+            points = deque()
+            self._points[name] = points
+        points.append((when, value))
+
+        ## Keep one point at least rateWindow old as the reference
+        while len(points) > 2 and points[1][0] <= when - self.rateWindow:
+            points.popleft()
+
+        first, start = points[0]
+        if when <= first:
+            return None
+        return abs(value - start) / (when - first)
+
+    ##
+    ## _channelInterval - (interval, reason) wanted by one channel
+    ##
+    def _channelInterval(self, channel, when):
+        name = channel.name
+        value = channel.value
+        rate = self._rate(name, when, value)
+
+        setPoint = channel.setPoint
+        changed = self._setPoints.get(name, setPoint) != setPoint
+        self._setPoints[name] = setPoint
+
+        near = self.nearDistances.get(name, DEFAULT_NEAR_DISTANCE)
+        distance = abs(value - setPoint)
+        if changed:
+            return self.minInterval, REASON_SETPOINT
+        if distance <= near:
+            return self.minInterval, REASON_NEAR
+        if rate is None or rate > self.maxRates.get(name, DEFAULT_MAX_RATE):
+            return self.minInterval, REASON_CHANGING
+
+        interval = max(self.interval * self.growth, self.interval + self.minInterval)
+        interval = min(interval, self.maxInterval)
+        if rate > 0:
+            approach = (distance - near) * APPROACH_SHARE / rate
+            if approach < interval:
+                return approach, REASON_APPROACHING
+        return interval, REASON_STABLE
+
+    ##
+    ## update - Choose the interval after a tick at 'when' (seconds)
+    ## from the latest reading of every channel. Returns the interval.
+    ##
+    def update(self, channels, when):
+        interval = None
+        reason = REASON_START
+        source = None
+        for channel in channels:
+            if channel.value is None or channel.value != channel.value:
+                continue
+            wanted, why = self._channelInterval(channel, when)
+            if interval is None or wanted < interval:
+                interval, reason, source = wanted, why, channel.name
+
+        if interval is None:
+            interval = self.minInterval
+        interval = min(interval, self.maxInterval)
+        interval = max(1, floor(interval / self.minInterval)) * self.minInterval
+
+        self.reasons[reason] = self.reasons[reason] + 1
+        self.history.append((when, interval, reason, source))
+        if interval != self.interval:
+            self.changes = self.changes + 1
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Sampling every %.1f s: %s (%s)", interval, reason, source)
+            for listener in self.listeners:
+                listener(interval, reason, source)
+
+        self.interval = interval
+        self.reason = reason
+        self.channel = source
+        return interval
+
+    def getStats(self):
+        return {
+            "interval": self.interval,
+            "reason": self.reason,
+            "channel": self.channel,
+            "changes": self.changes,
+            "reasons": dict(self.reasons),
+        }
+
+    ## End class AdaptiveInterval definition
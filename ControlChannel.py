@@ -0,0 +1,481 @@
+#
+# ControlChannel is the generic, table-driven control loop of PlantSitter.
+# Each channel (air temperature, soil humidity, or any other zone) is
+# described by a ChannelConfig: how to read it, its setpoint limits, its
+# three states, and which LEDs, display and buttons belong to it. A
+# single ControlEngine drives every channel from one scheduler, so the
+# per tick cost is one pass over a list of channels and a Pi can look
+# after dozens of zones from one process.
+#
+# Each channel is a three-state machine:
+#
+#   idle  - the initial state ('off')
+#   below - the reading is below the setpoint ('heat', 'dry')
+#   above - the reading is above the setpoint ('cool', 'hum')
+#
+# Decisions follow the original TemperatureMachine / HumidityMachine
+# rules: from idle go to below or above as soon as the reading differs
+# from the setpoint, then switch between below and above whenever the
+# reading crosses the setpoint.
+#
+# A channel may filter its readings (see SensorFilter.py). The engine
+# takes one reading per channel and tick; decisions and reports use the
+# latest of them, so every sample goes through the filter exactly once.
+# The ticks run every displayPeriod seconds, or at the interval chosen
+# by a sampling policy (see AdaptiveSampling.py) after every tick.
+#
+# Setpoint changes are events: the button threads only change the
+# setpoint under the channel's lock, and the engine re-evaluates the
+# channel and refreshes its display from the scheduler a few tens of
+# milliseconds later. Presses that arrive in the meantime are folded
+# into the same update.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from collections import namedtuple
+from datetime import datetime
+from math import floor
+from time import monotonic, time
+
+import logging
+import threading
+
+from DeadlineScheduler import DeadlineScheduler
+from TelemetryProtocol import MAX_CHANNEL, packFrame, registerStates
+
+##
+## ChannelConfig - One row of the channel table
+##
+##  name         - channel name, used for logging and metrics
+##  channel      - telemetry / rollup channel id (0..255, unique)
+##  read         - callable returning the current reading
+##  setPoint     - initial setpoint
+##  minSetPoint  - lowest setpoint the buttons can select
+##  maxSetPoint  - highest setpoint the buttons can select
+##  states       - (idle, below setpoint, above setpoint) state names
+##  lights       - {state name: LED pulsed while in that state}
+##  display      - object with show(message), or None
+##  buttons      - (increase pin, decrease pin), or None
+##  serialLabels - (reading label, setpoint label) of the text report
+##  clockLine    - True to show the date and time on the first LCD line
+##  filter       - callable creating the reading filter of the channel
+##                 (e.g. a SensorFilter.StreamingFilter), or None
+##
+ChannelConfig = namedtuple('ChannelConfig',
+                           ['name', 'channel', 'read', 'setPoint', 'minSetPoint',
+                            'maxSetPoint', 'states', 'lights', 'display', 'buttons',
+                            'serialLabels', 'clockLine', 'filter'],
+                           defaults = [None, None, None, ('Reading', 'Target'), False, None])
+
+##
+## Name of the tick job in the scheduler
+##
+TICK_JOB = "channels.display"
+
+##
+## Name of the job applying setpoint changes, and the default seconds a
+## change waits for more presses before it is applied
+##
+SETPOINT_JOB = "channels.setpoint"
+SETPOINT_DELAY = 0.03
+
+##
+## Ticks per half of the alternating LCD line (reading / state and setpoint)
+##
+ALTERNATE_TICKS = 5
+
+##
+## ControlChannel - The running state of one channel
+##
+class ControlChannel():
+    "A table-driven three-state control loop"
+
+    def __init__(self, config):
+        self.config = config
+        self.name = config.name
+        self.idle, self.below, self.above = config.states
+        self.state = self.idle
+        self.setPoint = config.setPoint
+
+        ## Serializes setpoint changes from the button threads, and the
+        ## listener(channel, setPoint) functions called after each one
+        ## (from the thread that made it)
+        self._setPointLock = threading.Lock()
+        self.setPointListeners = []
+
+        ## Filter of the readings (None to use them as they are) and the
+        ## last reading taken by the engine, after the filter
+        self.filter = config.filter() if config.filter is not None else None
+        self.value = None
+
+        ## Tick counter used to alternate the second line of the display
+        self.altCounter = 1
+
+        ## Sequence number of the binary telemetry frames
+        self.sequence = 0
+
+        ## Called as listener(channel, source, target, seconds) after
+        ## every transition
+        self.listeners = []
+
+        self.transitions = 0
+        self.log = logging.getLogger('plantsitter.' + config.name)
+
+    ##
+    ## read - Take a reading, pass it through the filter and remember it.
+    ## Until the filter has accepted a reading the raw one is used.
+    ##
+    def read(self):
+        value = self.config.read()
+        if self.filter is not None:
+            filtered = self.filter.update(value)
+            if filtered is not None:
+                value = filtered
+        self.value = value
+        return value
+
+    ##
+    ## current - The last reading, or a new one if there is none yet
+    ##
+    def current(self):
+        if self.value is None:
+            return self.read()
+        return self.value
+
+    ##
+    ## adjustSetPoint - Move the setpoint by 'delta', within the
+    ## configured limits, and tell the listeners if it changed. Safe to
+    ## call from any thread. Returns the setpoint.
+    ##
+    def adjustSetPoint(self, delta):
+        with self._setPointLock:
+            previous = self.setPoint
+            setPoint = min(max(previous + delta, self.config.minSetPoint),
+                           self.config.maxSetPoint)
+            self.setPoint = setPoint
+
+        if setPoint != previous:
+            for listener in self.setPointListeners:
+                listener(self, setPoint)
+        return setPoint
+
+    ##
+    ## increaseSetPoint / decreaseSetPoint - Button handlers moving the
+    ## setpoint by one unit
+    ##
+    def increaseSetPoint(self):
+        self.log.info("Increasing Set Point")
+        self.adjustSetPoint(1)
+
+    def decreaseSetPoint(self):
+        self.log.info("Decreasing Set Point")
+        self.adjustSetPoint(-1)
+
+    ##
+    ## target - The state the channel should be in for 'reading'
+    ##
+    def target(self, reading):
+        state = self.state
+        setPoint = self.setPoint
+        if state == self.idle:
+            if setPoint > reading:
+                return self.below
+            if setPoint < reading:
+                return self.above
+        elif state == self.above:
+            if setPoint > reading:
+                return self.below
+        elif state == self.below:
+            if setPoint < reading:
+                return self.above
+        return state
+
+    ##
+    ## decide - Make one control decision on 'value' (a fresh reading
+    ## when None) and transition if needed. Returns the state.
+    ##
+    def decide(self, value = None):
+        if value is None:
+            value = self.read()
+        reading = floor(value)
+
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("State: %s, Target: %s, Actual: %s",
+                           self.state, self.setPoint, reading,
+                           extra = {'fields': {'state': self.state,
+                                               'setPoint': self.setPoint,
+                                               'reading': reading}})
+
+        target = self.target(reading)
+        if target != self.state:
+            self.transition(target)
+        return self.state
+
+    ##
+    ## transition - Leave the current state for 'target': the LED of the
+    ## old state goes off and the LED of the new one starts pulsing.
+    ##
+    def transition(self, target):
+        if target not in (self.idle, self.below, self.above):
+            raise ValueError(self.name + " has no state " + str(target))
+
+        started = monotonic()
+        source = self.state
+        lights = self.config.lights or {}
+
+        light = lights.get(source)
+        if light is not None:
+            light.off()
+        light = lights.get(target)
+        if light is not None:
+            light.pulse()
+
+        self.state = target
+        self.transitions = self.transitions + 1
+        self.log.info("Changing state to %s", target)
+
+        seconds = monotonic() - started
+        for listener in self.listeners:
+            listener(self, source, target, seconds)
+
+    ##
+    ## composeScreen - The LCD message for 'value'. The (second) line
+    ## alternates every ALTERNATE_TICKS ticks between the reading and
+    ## the state and setpoint. 'clock' is the first line for channels
+    ## with clockLine set; the engine formats it once for all channels.
+    ##
+    def composeScreen(self, value, clock = None):
+        if self.altCounter <= ALTERNATE_TICKS:
+            line = ' Current: ' + str(round(value, 2))
+        else:
+            line = ' ' + self.state.capitalize() + ' | Set: ' + str(self.setPoint)
+
+        self.altCounter = self.altCounter + 1
+        if self.altCounter > 2 * ALTERNATE_TICKS:
+            self.altCounter = 1
+
+        if self.config.clockLine:
+            if clock is None:
+                clock = datetime.now().strftime('%b %d  %H:%M:%S\n')
+            return clock + line
+        return line
+
+    ##
+    ## serialText - The original free text report
+    ##
+    def serialText(self, value):
+        readingLabel, setPointLabel = self.config.serialLabels
+        return ("State: " + self.state + ", \n" + readingLabel + ": " + str(value) +
+                ", \n" + setPointLabel + ": " + str(self.setPoint))
+
+    ##
+    ## serialFrame - A binary telemetry frame (see TelemetryProtocol.py)
+    ##
+    def serialFrame(self, value, timestamp):
+        frame = packFrame(self.config.channel, self.state, value, self.setPoint,
+                          self.sequence, timestamp)
+        self.sequence = self.sequence + 1
+        return frame
+
+    ## End class ControlChannel definition
+
+##
+## ControlEngine - Drives every channel from one scheduler
+##
+class ControlEngine():
+    "One scheduler for all control channels"
+
+    ##
+    ## Class Initialization method
+    ##
+    ##  displayPeriod  - seconds between ticks (reading, logging, LCD)
+    ##  decisionPeriod - seconds between control decisions
+    ##  reportPeriod   - seconds between serial reports
+    ##  clock          - wall clock time source, in seconds since the
+    ##                   epoch (swappable for simulation)
+    ##  setPointDelay  - seconds a setpoint change waits for further
+    ##                   presses before it is applied
+    ##
+    def __init__(self, displayPeriod = 1, decisionPeriod = 10, reportPeriod = 30,
+                 clock = time, setPointDelay = SETPOINT_DELAY):
+        self.clock = clock
+        self.displayPeriod = displayPeriod
+        self.decisionPeriod = decisionPeriod
+        self.reportPeriod = reportPeriod
+        self.setPointDelay = setPointDelay
+
+        self.channels = []
+        self.byName = {}
+
+        ## Called as handler(channel, when, value) for every reading of
+        ## every tick (rollups, database logging, ...)
+        self.sampleHandlers = []
+
+        ## Called as handler(when) after every tick, once all channels
+        ## have been read
+        self.tickHandlers = []
+
+        ## Called as reportHandler(channel, when, value) for every serial
+        ## report
+        self.reportHandler = None
+
+        ## Sampling policy choosing the tick interval, anything with
+        ## update(channels, when) returning seconds; None ticks every
+        ## displayPeriod seconds
+        self.sampling = None
+
+        ## Channels whose setpoint changed since the last update, the
+        ## changes seen and the updates that applied them
+        self._changed = set()
+        self._changedLock = threading.Lock()
+        self.setPointEvents = 0
+        self.setPointUpdates = 0
+
+        self.scheduler = None
+
+    ##
+    ## addChannel - Create the channel described by 'config'. Its id must
+    ## fit a telemetry frame and be unique, since frames and rollups are
+    ## keyed by it, and its states get telemetry state codes.
+    ##
+    def addChannel(self, config):
+        if not isinstance(config.channel, int) or not 0 <= config.channel <= MAX_CHANNEL:
+            raise ValueError(config.name + ": channel id must be 0.." + str(MAX_CHANNEL))
+        for other in self.channels:
+            if other.config.channel == config.channel:
+                raise ValueError(config.name + ": channel id " + str(config.channel) +
+                                 " is already used by " + other.name)
+        if len(config.states) != 3 or len(set(config.states)) != 3:
+            raise ValueError(config.name + ": states must be three distinct names")
+        registerStates(config.states)
+
+        channel = ControlChannel(config)
+        channel.setPointListeners.append(self.setPointChanged)
+        self.channels.append(channel)
+        self.byName[config.name] = channel
+        return channel
+
+    ##
+    ## setPointChanged - Setpoint listener of every channel: schedule an
+    ## update setPointDelay seconds from now, unless one is pending
+    ##
+    def setPointChanged(self, channel, setPoint):
+        with self._changedLock:
+            self._changed.add(channel)
+            self.setPointEvents = self.setPointEvents + 1
+        if self.scheduler is not None:
+            self.scheduler.trigger(SETPOINT_JOB, self.setPointDelay)
+
+    ##
+    ## applySetPoints - Re-evaluate every channel whose setpoint changed
+    ## and show its new setpoint on its display right away
+    ##
+    def applySetPoints(self):
+        with self._changedLock:
+            changed = self._changed
+            self._changed = set()
+        if not changed:
+            return
+        self.setPointUpdates = self.setPointUpdates + 1
+
+        clock = datetime.fromtimestamp(self.clock()).strftime('%b %d  %H:%M:%S\n')
+        for channel in self.channels:
+            if channel not in changed:
+                continue
+            value = channel.current()
+            channel.decide(value)
+
+            display = channel.config.display
+            if display is not None:
+                ## Start on the state and setpoint half of the LCD line
+                channel.altCounter = ALTERNATE_TICKS + 1
+                display.show(channel.composeScreen(value, clock))
+
+        ## Let the sampling policy see the change now
+        if self.sampling is not None and self.scheduler is not None:
+            self.scheduler.trigger(TICK_JOB)
+
+    ##
+    ## tick - Read every channel, hand the readings to the sample
+    ## handlers, update the displays and let the sampling policy choose
+    ## when the next tick is due
+    ##
+    def tick(self):
+        when = self.clock()
+        clock = datetime.fromtimestamp(when).strftime('%b %d  %H:%M:%S\n')
+        handlers = self.sampleHandlers
+
+        for channel in self.channels:
+            channel.log.debug("Processing %s Display Info...", channel.name.capitalize())
+            value = channel.read()
+            for handler in handlers:
+                handler(channel, when, value)
+            display = channel.config.display
+            if display is not None:
+                display.show(channel.composeScreen(value, clock))
+
+        for handler in self.tickHandlers:
+            handler(when)
+
+        if self.sampling is not None and self.scheduler is not None:
+            interval = self.sampling.update(self.channels, when)
+            if interval != self.scheduler.jobs[TICK_JOB].period:
+                self.scheduler.setPeriod(TICK_JOB, interval)
+
+    ##
+    ## decide - One control decision per channel, on the reading of the
+    ## last tick
+    ##
+    def decide(self):
+        for channel in self.channels:
+            channel.decide(channel.current())
+
+    ##
+    ## report - One serial report per channel
+    ##
+    def report(self):
+        if self.reportHandler is None:
+            return
+        when = self.clock()
+        for channel in self.channels:
+            self.reportHandler(channel, when, channel.current())
+
+    ##
+    ## addJobs - Add the tick, decision, report and setpoint jobs to
+    ## 'scheduler'. 'wrap' optionally wraps every job function, e.g. to
+    ## run it on an executor from the asyncio engine.
+    ##
+    def addJobs(self, scheduler, wrap = None):
+        if wrap is None:
+            wrap = lambda func: func
+        scheduler.addJob(TICK_JOB, self.displayPeriod, wrap(self.tick))
+        scheduler.addJob("channels.lights", self.decisionPeriod, wrap(self.decide),
+                         offset = self.decisionPeriod)
+        scheduler.addJob("channels.serial", self.reportPeriod, wrap(self.report),
+                         offset = self.reportPeriod)
+        scheduler.addJob(SETPOINT_JOB, None, wrap(self.applySetPoints))
+        self.scheduler = scheduler
+        return scheduler
+
+    ##
+    ## run - Run every channel on a new scheduler (plus any jobs added to
+    ## 'scheduler' beforehand) until isDone() returns True or stop() is
+    ## called.
+    ##
+    def run(self, isDone = None, scheduler = None):
+        if scheduler is None:
+            scheduler = DeadlineScheduler()
+        self.addJobs(scheduler)
+        scheduler.run(isDone = isDone)
+
+    def stop(self):
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
+    ## End class ControlEngine definition
@@ -0,0 +1,464 @@
+#
+# DeadlineScheduler runs named periodic jobs on a grid of monotonic
+# deadlines instead of "do the work, then sleep(period)". The time a
+# job takes therefore never pushes the following runs back, so the
+# 1 s / 10 s / 30 s cadences of PlantSitter stay exact over hours of
+# operation. Overruns are either skipped or coalesced, and every job
+# keeps lateness and runtime histograms so we can see whether the loops
+# are keeping up. The period of a job can be changed while it runs, for
+# jobs that choose their own cadence, and any job can be triggered from
+# another thread to run early. Jobs without a period only run when they
+# are triggered. A job that raises is counted and logged, and the
+# scheduler carries on with the next deadline, so one failing device
+# never stops the jobs of the others. When run() returns the deadlines
+# become offsets again, so a later run() resumes every job where it
+# left off instead of waiting out the time the scheduler was stopped.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from bisect import bisect_left
+from math import floor, inf
+from time import monotonic
+
+import logging
+import threading
+
+log = logging.getLogger('plantsitter.scheduler')
+
+##
+## Overrun policies
+##
+##  OVERRUN_SKIP     - activations that were missed are dropped and the
+##                     job waits for the next deadline on its grid
+##  OVERRUN_COALESCE - all missed activations are merged into a single
+##                     immediate run, after which the grid resumes
+##
+OVERRUN_SKIP = 'skip'
+OVERRUN_COALESCE = 'coalesce'
+
+##
+## Default histogram bucket upper bounds, in seconds
+##
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02,
+                   0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+##
+## Histogram - Fixed bucket histogram with O(log buckets) updates.
+##
+class Histogram():
+    "Fixed bucket latency histogram"
+
+    def __init__(self, buckets = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+
+        ## One count per bucket plus the +Inf bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    ##
+    ## observe - Record a single value
+    ##
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count = self.count + 1
+        self.sum = self.sum + value
+        if value > self.max:
+            self.max = value
+
+    ##
+    ## mean - Average of all observed values
+    ##
+    def mean(self):
+        if self.count == 0:
+            return 0.0
+        return self.sum / self.count
+
+    ##
+    ## quantile - Estimate a quantile (0..1) as the upper bound of the
+    ## bucket holding it, capped at the largest value seen.
+    ##
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+
+        target = q * self.count
+        seen = 0
+        for index, bucketCount in enumerate(self.counts):
+            seen = seen + bucketCount
+            if seen >= target:
+                if index < len(self.buckets):
+                    return min(self.buckets[index], self.max)
+                return self.max
+        return self.max
+
+    ##
+    ## cumulative - (upper bound, cumulative count) pairs, ending with
+    ## the +Inf bucket.
+    ##
+    def cumulative(self):
+        pairs = []
+        seen = 0
+        for bound, bucketCount in zip(self.buckets + (float('inf'),), self.counts):
+            seen = seen + bucketCount
+            pairs.append((bound, seen))
+        return pairs
+
+    ## End class Histogram definition
+
+##
+## PeriodicJob - Bookkeeping for one named job
+##
+class PeriodicJob():
+    "A named job that runs on a fixed grid of deadlines"
+
+    def __init__(self, name, period, func, overrun, deadline):
+        self.name = name
+        self.period = period
+        self.func = func
+        self.overrun = overrun
+        self.deadline = deadline
+
+        ## Deadline of the last activation, whether the job is running
+        ## right now, and the earliest deadline asked for by trigger()
+        ## while it was running
+        self.lastDeadline = None
+        self.running = False
+        self.requested = None
+
+        self.runs = 0
+        self.skipped = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.lateness = Histogram()
+        self.runtime = Histogram()
+
+    ##
+    ## setPeriod - Run the job every 'period' seconds from now on. The
+    ## next deadline is 'period' after the last (or the current)
+    ## activation, so a shorter period can make the job due at once.
+    ##
+    def setPeriod(self, period):
+        if period <= 0:
+            raise ValueError("period must be positive")
+        if not self.running and self.lastDeadline is not None:
+            self.deadline = self.lastDeadline + period
+        self.period = period
+
+    ##
+    ## advance - Move the deadline to the next activation after a run
+    ## that finished at time 'now'. A job without a period waits for the
+    ## next trigger.
+    ##
+    def advance(self, now):
+        if self.period is None:
+            self.deadline = inf
+            return
+
+        self.deadline = self.deadline + self.period
+        if self.deadline > now:
+            return
+
+        ## We overran one or more activations
+        missed = floor((now - self.deadline) / self.period) + 1
+        if self.overrun == OVERRUN_COALESCE:
+            ## Run once right away, then resume the grid after it
+            self.coalesced = self.coalesced + missed - 1
+            self.deadline = self.deadline + (missed - 1) * self.period
+        else:
+            self.skipped = self.skipped + missed
+            self.deadline = self.deadline + missed * self.period
+
+    ##
+    ## getStats - Summary of the job's timing
+    ##
+    def getStats(self):
+        return {
+            "period": self.period,
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "latenessMean": self.lateness.mean(),
+            "latenessP99": self.lateness.quantile(0.99),
+            "latenessMax": self.lateness.max,
+            "runtimeMean": self.runtime.mean(),
+            "runtimeP99": self.runtime.quantile(0.99),
+            "runtimeMax": self.runtime.max,
+        }
+
+    ## End class PeriodicJob definition
+
+##
+## DeadlineScheduler - Runs periodic jobs at exact cadences
+##
+class DeadlineScheduler():
+    "Drift-free scheduler for named periodic jobs"
+
+    ##
+    ## Class Initialization method
+    ##
+    ##  clock - monotonic time source (swappable for simulation)
+    ##  sleep       - function waiting a number of seconds of 'clock' time
+    ##                in run(), e.g. the sleep() of a virtual clock. By
+    ##                default run() waits on the stop event, which keeps
+    ##                stop() responsive.
+    ##  stopOnError - let an exception raised by a job end run() instead
+    ##                of logging it and carrying on
+    ##
+    def __init__(self, clock = monotonic, sleep = None, stopOnError = False):
+        self.clock = clock
+        self.sleep = sleep
+        self.stopOnError = stopOnError
+        self.jobs = {}
+        self._stop = threading.Event()
+
+        ## Set to make a waiting run() look at the deadlines again
+        self._wake = threading.Event()
+
+        ## Guards the deadlines against trigger() from other threads
+        self._lock = threading.Lock()
+        self._started = False
+
+        ## Event loop and wake event of a running runAsync()
+        self._loop = None
+        self._asyncWake = None
+
+    ##
+    ## addJob - Register a job that runs func() every period seconds.
+    ## The first run happens 'offset' seconds after the scheduler starts,
+    ## or after now if it is already running (immediately by default). A period of None registers a job that
+    ## only runs when it is triggered. func may be a coroutine function
+    ## when the scheduler is driven with runAsync().
+    ##
+    def addJob(self, name, period, func, overrun = OVERRUN_SKIP, offset = 0):
+        if overrun not in (OVERRUN_SKIP, OVERRUN_COALESCE):
+            raise ValueError("Unknown overrun policy: " + str(overrun))
+
+        with self._lock:
+            deadline = inf if period is None else offset
+            if self._started:
+                deadline = deadline + self.clock()
+            job = PeriodicJob(name, period, func, overrun, deadline)
+            self.jobs[name] = job
+        return job
+
+    ##
+    ## setPeriod - Change the period of job 'name' (see
+    ## PeriodicJob.setPeriod). Meant to be called from the scheduler's
+    ## own thread, e.g. by the job itself.
+    ##
+    def setPeriod(self, name, period):
+        self.jobs[name].setPeriod(period)
+
+    ##
+    ## trigger - Run job 'name' 'delay' seconds from now, unless it is
+    ## already due earlier. Safe to call from any thread; triggers that
+    ## arrive before the job runs are coalesced into that one run, and
+    ## triggers that arrive while it runs into one more run.
+    ##
+    def trigger(self, name, delay = 0):
+        with self._lock:
+            job = self.jobs[name]
+            if not self._started:
+                ## Deadlines are still offsets from the start
+                job.deadline = min(job.deadline, delay)
+            elif job.running:
+                deadline = self.clock() + delay
+                if job.requested is None or deadline < job.requested:
+                    job.requested = deadline
+            else:
+                job.deadline = min(job.deadline, self.clock() + delay)
+        self._wakeUp()
+
+    ##
+    ## _wakeUp - Make a waiting run() or runAsync() look at the deadlines
+    ## again
+    ##
+    def _wakeUp(self):
+        self._wake.set()
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._asyncWake.set)
+            except RuntimeError:
+                ## The loop has already been closed
+                pass
+
+    ##
+    ## stop - Ask a running scheduler to return
+    ##
+    def stop(self):
+        self._stop.set()
+        self._wakeUp()
+
+    ##
+    ## _start - Convert the job offsets into absolute deadlines
+    ##
+    def _start(self):
+        self._stop.clear()
+        self._rebase(self.clock(), True)
+
+    ##
+    ## _finish - Turn the deadlines back into offsets when run() returns,
+    ## so that the next run() resumes every job where it left off
+    ##
+    def _finish(self):
+        self._rebase(-self.clock(), False)
+
+    ##
+    ## _rebase - Add 'shift' to every deadline and mark the scheduler as
+    ## 'started' or not
+    ##
+    def _rebase(self, shift, started):
+        with self._lock:
+            for job in self.jobs.values():
+                job.deadline = job.deadline + shift
+                if job.lastDeadline is not None:
+                    job.lastDeadline = job.lastDeadline + shift
+                if job.requested is not None:
+                    job.deadline = min(job.deadline, job.requested + shift)
+                    job.requested = None
+            self._started = started
+
+    ##
+    ## _nextJob - The job with the earliest deadline
+    ##
+    def _nextJob(self):
+        return min(self.jobs.values(), key = lambda job: job.deadline)
+
+    ##
+    ## _record - Update the job's histograms and compute its next
+    ## deadline.
+    ##
+    def _record(self, job, started, finished):
+        with self._lock:
+            job.running = False
+            job.lastDeadline = job.deadline
+            job.runs = job.runs + 1
+            job.lateness.observe(max(0.0, started - job.deadline))
+            job.runtime.observe(finished - started)
+            job.advance(finished)
+            if job.requested is not None:
+                job.deadline = min(job.deadline, job.requested)
+                job.requested = None
+
+    ##
+    ## _failed - Count an exception raised by 'job'. Returns True when it
+    ## should end the scheduler.
+    ##
+    def _failed(self, job):
+        job.errors = job.errors + 1
+        if self.stopOnError:
+            return True
+        log.exception("Job %s failed (%d errors so far)", job.name, job.errors)
+        return False
+
+    ##
+    ## run - Run the jobs in the calling thread until stop() is called
+    ## or isDone() returns True.
+    ##
+    def run(self, isDone = None):
+        self._start()
+        try:
+            while not self._stop.is_set():
+                if isDone is not None and isDone():
+                    break
+
+                self._wake.clear()
+                job = self._nextJob()
+                delay = job.deadline - self.clock()
+                if delay > 0:
+                    if self.sleep is not None:
+                        self.sleep(delay)
+                    else:
+                        ## Waiting on the event keeps stop() and trigger()
+                        ## responsive; look at the deadlines again after it
+                        self._wake.wait(None if delay == inf else delay)
+                        continue
+
+                started = self.clock()
+                job.running = True
+                try:
+                    job.func()
+                except Exception:
+                    if self._failed(job):
+                        raise
+                finally:
+                    self._record(job, started, self.clock())
+        finally:
+            self._finish()
+
+    ##
+    ## runAsync - Coroutine version of run() for the asyncio engine
+    ##
+    async def runAsync(self, isDone = None):
+        ## Only the asyncio engine pays for these imports
+        import asyncio
+        import inspect
+
+        self._asyncWake = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._start()
+        try:
+            while not self._stop.is_set():
+                if isDone is not None and isDone():
+                    break
+
+                self._asyncWake.clear()
+                job = self._nextJob()
+                delay = job.deadline - self.clock()
+                if delay > 0:
+                    ## Until trigger() or stop() wakes us, or the deadline
+                    try:
+                        await asyncio.wait_for(self._asyncWake.wait(),
+                                               None if delay == inf else delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                started = self.clock()
+                job.running = True
+                try:
+                    result = job.func()
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception:
+                    if self._failed(job):
+                        raise
+                finally:
+                    self._record(job, started, self.clock())
+        finally:
+            self._loop = None
+            self._finish()
+
+    ##
+    ## getStats - Per job timing summary
+    ##
+    def getStats(self):
+        return {name: job.getStats() for name, job in self.jobs.items()}
+
+    ##
+    ## formatStats - Human readable table of getStats(), in milliseconds
+    ##
+    def formatStats(self):
+        lines = ["%-24s %6s %6s %6s %6s %10s %10s %10s %10s" %
+                 ("job", "runs", "skip", "coal", "err", "late p99", "late max",
+                  "run p99", "run max")]
+        for name, job in self.jobs.items():
+            lines.append("%-24s %6d %6d %6d %6d %10.2f %10.2f %10.2f %10.2f" %
+                         (name, job.runs, job.skipped, job.coalesced, job.errors,
+                          job.lateness.quantile(0.99) * 1000,
+                          job.lateness.max * 1000,
+                          job.runtime.quantile(0.99) * 1000,
+                          job.runtime.max * 1000))
+        return "\n".join(lines)
+
+    ## End class DeadlineScheduler definition
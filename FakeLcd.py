@@ -0,0 +1,177 @@
+#
+# FakeLcd provides stand-ins for the GPIO pins and the 16x2 character
+# LCD so that display code can be exercised and measured without a
+# Raspberry Pi. Both count the traffic they would have caused on the
+# real hardware.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from time import sleep
+
+##
+## Cost of sending one byte to an HD44780 in 4-bit mode through the
+## adafruit Character_LCD driver: one write to RS, then for each of the
+## two nibbles four data line writes and a three write enable pulse.
+## The driver also sleeps for 1 ms before every byte, and for 3 ms
+## after a clear.
+##
+PIN_WRITES_PER_BYTE = 15
+SECONDS_PER_BYTE = 0.001
+SECONDS_PER_CLEAR = 0.003
+
+##
+## CountingPin - Drop-in replacement for digitalio.DigitalInOut that
+## remembers its value and counts every write.
+##
+class CountingPin():
+    "Fake digital output that counts writes"
+
+    def __init__(self, name = None):
+        self.name = name
+        self.direction = None
+        self.writes = 0
+        self._value = False
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        self.writes = self.writes + 1
+
+    def switch_to_output(self, value = False, drive_mode = None):
+        self.value = value
+
+    def switch_to_input(self, pull = None):
+        pass
+
+    def deinit(self):
+        pass
+
+    ## End class CountingPin definition
+
+##
+## FakeCharacterLcd - In-memory model of an adafruit Character_LCD.
+## It keeps the visible cells and counts the bytes, pin writes and
+## driver delays that the same calls would have cost on the device.
+##
+class FakeCharacterLcd():
+    "Fake 16x2 character LCD that counts bus traffic"
+
+    ##
+    ## Class Initialization method
+    ##
+    ##  realTime - when True, actually sleep for the driver delays so
+    ##             that throughput measurements are realistic
+    ##
+    def __init__(self, columns = 16, lines = 2, realTime = False):
+        self.columns = columns
+        self.lines = lines
+        self.realTime = realTime
+        self.column = 0
+        self.row = 0
+
+        self.cells = [[' '] * columns for row in range(lines)]
+
+        ## Statistics
+        self.clears = 0
+        self.commandBytes = 0
+        self.dataBytes = 0
+        self.busySeconds = 0.0
+
+        self._cursorColumn = 0
+        self._cursorRow = 0
+        self._message = None
+
+    ##
+    ## pinWrites - Number of GPIO writes the traffic so far would cost
+    ##
+    @property
+    def pinWrites(self):
+        return (self.commandBytes + self.dataBytes) * PIN_WRITES_PER_BYTE
+
+    ##
+    ## resetCounters - Zero the statistics
+    ##
+    def resetCounters(self):
+        self.clears = 0
+        self.commandBytes = 0
+        self.dataBytes = 0
+        self.busySeconds = 0.0
+
+    def _wait(self, seconds):
+        self.busySeconds = self.busySeconds + seconds
+        if self.realTime:
+            sleep(seconds)
+
+    def _command(self):
+        self.commandBytes = self.commandBytes + 1
+        self._wait(SECONDS_PER_BYTE)
+
+    def _data(self, character):
+        self.dataBytes = self.dataBytes + 1
+        self._wait(SECONDS_PER_BYTE)
+        if self._cursorRow < self.lines and self._cursorColumn < self.columns:
+            self.cells[self._cursorRow][self._cursorColumn] = character
+        self._cursorColumn = self._cursorColumn + 1
+
+    def clear(self):
+        self._command()
+        self._wait(SECONDS_PER_CLEAR)
+        self.clears = self.clears + 1
+        self.cells = [[' '] * self.columns for row in range(self.lines)]
+        self._cursorColumn = 0
+        self._cursorRow = 0
+
+    def home(self):
+        self._command()
+        self._cursorColumn = 0
+        self._cursorRow = 0
+
+    def cursor_position(self, column, row):
+        row = min(row, self.lines - 1)
+        column = min(column, self.columns - 1)
+        self._command()
+        self._cursorColumn = column
+        self._cursorRow = row
+        self.column = column
+        self.row = row
+
+    @property
+    def message(self):
+        return self._message
+
+    ##
+    ## message - Same semantics as the adafruit driver: the message
+    ## starts at the last cursor_position() and the position is reset
+    ## to (0, 0) afterwards.
+    ##
+    @message.setter
+    def message(self, message):
+        self._message = message
+        line = self.row
+        self.cursor_position(self.column, line)
+        for character in message:
+            if character == '\n':
+                line = line + 1
+                self.cursor_position(0, line)
+            else:
+                self._data(character)
+        self.column = 0
+        self.row = 0
+
+    ##
+    ## text - The visible contents of the display, one line per row
+    ##
+    def text(self):
+        return '\n'.join(''.join(row) for row in self.cells)
+
+    ## End class FakeCharacterLcd definition
@@ -0,0 +1,235 @@
+#
+# HistoryRing is a fixed-size, memory-mapped ring file of compact binary
+# PlantSitter readings. It keeps the newest 'capacity' records, uses a
+# constant amount of disk space, survives restarts, and lets readers get
+# at the last N records as zero-copy memoryviews or NumPy arrays.
+#
+# File layout:
+#
+#   header (64 bytes, little endian)
+#     magic b'PSHR', version (H), record size (H), capacity (I),
+#     next write index (I), record count (I), reserved
+#   capacity records of RECORD.size bytes (see RECORD below)
+#
+# A record holds the temperature and the humidity channel only. Channels
+# added beyond those two are summarized by the rollups and reported over
+# the UART, but not recorded here. Their states may still be stored in
+# the two state fields: any state known to TelemetryProtocol (including
+# registered ones) has a code.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from collections import namedtuple
+
+import mmap
+import os
+import struct
+
+from TelemetryProtocol import STATE_CODES, STATE_NAMES
+
+MAGIC = b'PSHR'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHHIII')
+HEADER_SIZE = 64
+
+##
+## One record (24 bytes):
+##
+##   time                 epoch seconds (double)
+##   temperature          degrees Fahrenheit (float)
+##   humidity             percent (float)
+##   temperatureState     state code of the temperature machine
+##   humidityState        state code of the humidity machine
+##   temperatureSetPoint  temperature setpoint
+##   humiditySetPoint     humidity setpoint
+##   (2 bytes of padding)
+##
+RECORD = struct.Struct('<dffBBhh2x')
+
+FIELDS = ['time', 'temperature', 'humidity', 'temperatureState',
+          'humidityState', 'temperatureSetPoint', 'humiditySetPoint']
+
+HistoryRecord = namedtuple('HistoryRecord', FIELDS)
+
+##
+## numpyDtype - NumPy dtype matching RECORD. NumPy is only imported
+## when it is actually needed.
+##
+def numpyDtype():
+    import numpy
+    return numpy.dtype([('time', '<f8'), ('temperature', '<f4'),
+                        ('humidity', '<f4'), ('temperatureState', 'u1'),
+                        ('humidityState', 'u1'), ('temperatureSetPoint', '<i2'),
+                        ('humiditySetPoint', '<i2'), ('padding', 'V2')])
+
+##
+## HistoryRing - The ring file
+##
+class HistoryRing():
+    "Memory-mapped ring buffer of PlantSitter readings"
+
+    ##
+    ## Class Initialization method
+    ##
+    ##  path      - ring file, created if it does not exist
+    ##  capacity  - number of records kept (only used on creation)
+    ##  syncEvery - flush the mapping to storage every this many appends
+    ##              (0 leaves it to the operating system)
+    ##  readOnly  - map an existing file for reading only; append()
+    ##              then raises
+    ##
+    def __init__(self, path, capacity = 86400, syncEvery = 60, readOnly = False):
+        self.path = path
+        self.syncEvery = syncEvery
+        self.readOnly = readOnly
+        self._sinceSync = 0
+
+        if readOnly:
+            self._file = open(path, 'rb')
+            self._map = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+        else:
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                self._create(path, capacity)
+            self._file = open(path, 'r+b')
+            self._map = mmap.mmap(self._file.fileno(), 0)
+
+        magic, version, recordSize, capacity, head, count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or recordSize != RECORD.size:
+            self.close()
+            raise ValueError(path + " is not a PlantSitter history file")
+        if len(self._map) != HEADER_SIZE + capacity * RECORD.size:
+            self.close()
+            raise ValueError(path + " has an unexpected size")
+
+        self.capacity = capacity
+        self.head = head
+        self.count = count
+
+    ##
+    ## _create - Write an empty ring file of the final size
+    ##
+    def _create(self, path, capacity):
+        with open(path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, capacity, 0, 0).ljust(HEADER_SIZE, b'\0'))
+            file.truncate(HEADER_SIZE + capacity * RECORD.size)
+
+    ##
+    ## append - Store one reading, overwriting the oldest record once
+    ## the ring is full. States are given by name ('off', 'heat', ...);
+    ## a name without a state code raises ValueError.
+    ##
+    def append(self, time, temperature, humidity, temperatureState,
+               humidityState, temperatureSetPoint, humiditySetPoint):
+        if self.readOnly:
+            raise ValueError(self.path + " is open read-only")
+        for state in (temperatureState, humidityState):
+            if state not in STATE_CODES:
+                raise ValueError("Unknown state " + repr(state) + ", see registerStates()")
+
+        RECORD.pack_into(self._map, HEADER_SIZE + self.head * RECORD.size,
+                         time, temperature, humidity,
+                         STATE_CODES[temperatureState], STATE_CODES[humidityState],
+                         int(temperatureSetPoint), int(humiditySetPoint))
+
+        ## The header is updated after the record so that a crash never
+        ## exposes a half written record.
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count = self.count + 1
+        HEADER.pack_into(self._map, 0, MAGIC, VERSION, RECORD.size,
+                         self.capacity, self.head, self.count)
+
+        self._sinceSync = self._sinceSync + 1
+        if self.syncEvery and self._sinceSync >= self.syncEvery:
+            self.flush()
+
+    ##
+    ## flush - Write dirty pages of the mapping to storage
+    ##
+    def flush(self):
+        self._map.flush()
+        self._sinceSync = 0
+
+    ##
+    ## close - Flush and release the mapping
+    ##
+    def close(self):
+        if self._map is not None:
+            if not self.readOnly:
+                self._map.flush()
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    ##
+    ## _segments - (first index, record count) of the one or two
+    ## contiguous pieces of the ring holding the last n records, oldest
+    ## first.
+    ##
+    def _segments(self, n):
+        n = min(n, self.count)
+        if n <= 0:
+            return []
+        start = (self.head - n) % self.capacity
+        if start + n <= self.capacity:
+            return [(start, n)]
+        return [(start, self.capacity - start), (0, n - (self.capacity - start))]
+
+    ##
+    ## lastViews - Zero-copy memoryviews of the raw bytes of the last n
+    ## records, oldest first. There are two views when the records wrap
+    ## around the end of the ring.
+    ##
+    def lastViews(self, n):
+        view = memoryview(self._map)
+        return [view[HEADER_SIZE + start * RECORD.size:
+                     HEADER_SIZE + (start + length) * RECORD.size]
+                for start, length in self._segments(n)]
+
+    ##
+    ## lastArrays - The same as lastViews, as zero-copy NumPy record
+    ## arrays using numpyDtype().
+    ##
+    def lastArrays(self, n):
+        import numpy
+        dtype = numpyDtype()
+        return [numpy.frombuffer(self._map, dtype = dtype, count = length,
+                                 offset = HEADER_SIZE + start * RECORD.size)
+                for start, length in self._segments(n)]
+
+    ##
+    ## lastArray - The last n records as a single NumPy array. This is
+    ## only a copy when the records wrap around the end of the ring.
+    ##
+    def lastArray(self, n):
+        import numpy
+        arrays = self.lastArrays(n)
+        if not arrays:
+            return numpy.empty(0, dtype = numpyDtype())
+        if len(arrays) == 1:
+            return arrays[0]
+        return numpy.concatenate(arrays)
+
+    ##
+    ## last - The last n records decoded into HistoryRecords
+    ##
+    def last(self, n):
+        records = []
+        for view in self.lastViews(n):
+            for fields in RECORD.iter_unpack(view):
+                records.append(HistoryRecord(fields[0], fields[1], fields[2],
+                                             STATE_NAMES.get(fields[3], str(fields[3])),
+                                             STATE_NAMES.get(fields[4], str(fields[4])),
+                                             fields[5], fields[6]))
+        return records
+
+    ## End class HistoryRing definition
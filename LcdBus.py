@@ -0,0 +1,288 @@
+#
+# LcdBus arbitrates the GPIO lines shared by PlantSitter's two 16x2
+# displays. Both displays are wired to the same RS and D4-D7 lines and
+# only differ by their enable line, so the bus owns the shared lines
+# and hands out one LcdHandle per enable pin. All drawing goes through
+# a command queue served by a single worker thread, which means two
+# screens can be updated every tick without ever interleaving their
+# nibbles on the wires.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from time import monotonic
+
+import queue
+import threading
+
+from LcdFramebuffer import LcdFramebuffer
+
+##
+## Command kinds understood by the bus worker
+##
+COMMAND_SHOW = 'show'
+COMMAND_CLEAR = 'clear'
+COMMAND_CLOSE = 'close'
+COMMAND_STOP = 'stop'
+
+##
+## defaultLcdFactory - Build an adafruit Character_LCD_Mono. The import
+## is done here so the bus can be used with fake LCDs on a dev box.
+##
+def defaultLcdFactory(rs, en, d4, d5, d6, d7, columns, rows):
+    import adafruit_character_lcd.character_lcd as characterlcd
+    return characterlcd.Character_LCD_Mono(rs, en, d4, d5, d6, d7, columns, rows)
+
+##
+## LcdHandle - One display on the shared bus, selected by its enable
+## pin. Every method only queues work for the bus worker and returns
+## right away.
+##
+class LcdHandle():
+    "A display attached to a shared LcdBus"
+
+    def __init__(self, bus, enable, lcd, columns, rows):
+        self.bus = bus
+        self.enable = enable
+        self.lcd = lcd
+        self.framebuffer = LcdFramebuffer(columns, rows)
+        self.framebuffer.setBlank()
+
+        ## Latest message waiting to be drawn, and whether this handle is
+        ## already sitting in the command queue for it.
+        self._pending = None
+        self._queued = False
+        self._closed = False
+
+    ##
+    ## show - Draw 'message'. If several messages are submitted before
+    ## the worker gets to this display, only the newest one is drawn.
+    ##
+    def show(self, message):
+        if self._closed:
+            return
+        with self.bus._lock:
+            if self._queued:
+                self.bus.coalesced = self.bus.coalesced + 1
+            self._pending = message
+            if self._queued:
+                return
+            self._queued = True
+        self.bus._submit(self, COMMAND_SHOW)
+
+    ##
+    ## clear - Clear the display
+    ##
+    def clear(self):
+        if self._closed:
+            return
+        self.bus._submit(self, COMMAND_CLEAR)
+
+    ##
+    ## close - Clear the display, release its enable pin and wait until
+    ## that has been done. The shared lines are released with the last
+    ## handle.
+    ##
+    def close(self, timeout = 5.0):
+        if self._closed:
+            return
+        self._closed = True
+        done = threading.Event()
+        self.bus._submit(self, COMMAND_CLOSE, done)
+        done.wait(timeout)
+
+    ## End class LcdHandle definition
+
+##
+## LcdBus - Owner of the shared LCD lines
+##
+class LcdBus():
+    "Serialized driver for several LCDs sharing RS and data lines"
+
+    ##
+    ## Class Initialization method
+    ##
+    ##  rs, d4 - d7 - the shared digital output pins
+    ##  lcdFactory  - callable(rs, en, d4, d5, d6, d7, columns, rows)
+    ##                building the LCD driver of one display
+    ##  histogram   - optional histogram (anything with observe(seconds))
+    ##                receiving the time spent driving the lines for
+    ##                every frame
+    ##
+    def __init__(self, rs, d4, d5, d6, d7, lcdFactory = defaultLcdFactory,
+                 histogram = None):
+        self.rs = rs
+        self.d4 = d4
+        self.d5 = d5
+        self.d6 = d6
+        self.d7 = d7
+        self.lcdFactory = lcdFactory
+        self.histogram = histogram
+
+        self.handles = []
+
+        ## Statistics
+        self.commands = 0
+        self.batches = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.frames = 0
+        self.cellsWritten = 0
+        self.cursorMoves = 0
+        self.busySeconds = 0.0
+        self._startTime = monotonic()
+
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._serve, name="LcdBus",
+                                        daemon=True)
+        self._thread.start()
+
+    ##
+    ## attach - Create a handle for the display wired to 'enable'. The
+    ## display is initialized by the bus worker so that its start-up
+    ## sequence cannot collide with traffic to the other display.
+    ##
+    def attach(self, enable, columns = 16, rows = 2):
+        result = {}
+        done = threading.Event()
+
+        def initialize():
+            try:
+                lcd = self.lcdFactory(self.rs, enable, self.d4, self.d5,
+                                      self.d6, self.d7, columns, rows)
+                lcd.clear()
+                result['handle'] = LcdHandle(self, enable, lcd, columns, rows)
+            except Exception as error:
+                result['error'] = error
+            finally:
+                done.set()
+
+        self._queue.put((None, initialize, None))
+        done.wait()
+
+        if 'error' in result:
+            raise result['error']
+        handle = result['handle']
+        self.handles.append(handle)
+        return handle
+
+    ##
+    ## flush - Wait until every queued command has been executed
+    ##
+    def flush(self):
+        self._queue.join()
+
+    ##
+    ## getStats - Throughput of the bus
+    ##
+    def getStats(self):
+        elapsed = monotonic() - self._startTime
+        writes = self.cellsWritten + self.cursorMoves
+        writesPerSecond = 0.0
+        if elapsed > 0:
+            writesPerSecond = writes / elapsed
+        busyWritesPerSecond = 0.0
+        if self.busySeconds > 0:
+            busyWritesPerSecond = writes / self.busySeconds
+
+        return {
+            "queueDepth": self._queue.qsize(),
+            "commands": self.commands,
+            "batches": self.batches,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "frames": self.frames,
+            "writes": writes,
+            "writesPerSecond": writesPerSecond,
+            "busyWritesPerSecond": busyWritesPerSecond,
+        }
+
+    def _submit(self, handle, kind, argument = None):
+        self._queue.put((handle, kind, argument))
+
+    ##
+    ## _serve - Body of the bus worker. Every command that is already
+    ## queued is executed back to back as one batch.
+    ##
+    def _serve(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            started = monotonic()
+            stop = False
+            for handle, kind, argument in batch:
+                try:
+                    if kind == COMMAND_STOP:
+                        stop = True
+                    elif handle is None:
+                        ## Bus level work (display initialization)
+                        kind()
+                    else:
+                        self._execute(handle, kind, argument)
+                except Exception:
+                    ## A failing display must not take the bus down
+                    self.errors = self.errors + 1
+                finally:
+                    self.commands = self.commands + 1
+                    self._queue.task_done()
+
+            self.batches = self.batches + 1
+            self.busySeconds = self.busySeconds + (monotonic() - started)
+            if stop:
+                return
+
+    ##
+    ## _execute - Run a single display command on the worker thread
+    ##
+    def _execute(self, handle, kind, argument):
+        if kind == COMMAND_SHOW:
+            with self._lock:
+                message = handle._pending
+                handle._pending = None
+                handle._queued = False
+            if message is None:
+                return
+
+            framebuffer = handle.framebuffer
+            cells = framebuffer.cellsWritten
+            moves = framebuffer.cursorMoves
+            started = monotonic()
+            framebuffer.render(handle.lcd, message)
+            if self.histogram is not None:
+                self.histogram.observe(monotonic() - started)
+            self.frames = self.frames + 1
+            self.cellsWritten = self.cellsWritten + framebuffer.cellsWritten - cells
+            self.cursorMoves = self.cursorMoves + framebuffer.cursorMoves - moves
+
+        elif kind == COMMAND_CLEAR:
+            handle.lcd.clear()
+            handle.framebuffer.setBlank()
+
+        elif kind == COMMAND_CLOSE:
+            try:
+                handle.lcd.clear()
+                handle.framebuffer.setBlank()
+                handle.enable.deinit()
+            finally:
+                if handle in self.handles:
+                    self.handles.remove(handle)
+
+                ## Release the shared lines with the last display
+                if not self.handles:
+                    for pin in (self.rs, self.d4, self.d5, self.d6, self.d7):
+                        pin.deinit()
+                    self._queue.put((None, COMMAND_STOP, None))
+                argument.set()
+
+    ## End class LcdBus definition
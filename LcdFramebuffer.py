@@ -0,0 +1,123 @@
+#
+# LcdFramebuffer keeps a shadow copy of what is currently shown on a
+# character LCD and, for each new message, only sends the cells that
+# changed, positioning the cursor at the start of every changed run.
+# This avoids the slow (and flickering) HD44780 clear command on every
+# update and, in the common case where only the seconds digit or one
+# decimal changes, cuts GPIO traffic by an order of magnitude.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+##
+## Two changed runs separated by at most this many unchanged cells are
+## sent as a single run. Rewriting one unchanged cell costs the same
+## single byte as the cursor move it saves.
+##
+MERGE_GAP = 1
+
+##
+## LcdFramebuffer - Shadow framebuffer for a columns x rows display
+##
+class LcdFramebuffer():
+    "Shadow framebuffer that renders only the changed LCD cells"
+
+    def __init__(self, columns = 16, rows = 2):
+        self.columns = columns
+        self.rows = rows
+
+        ## None means the content of the display is unknown
+        self.cells = None
+
+        ## Statistics
+        self.frames = 0
+        self.cellsWritten = 0
+        self.cursorMoves = 0
+
+    ##
+    ## setBlank - Record that the display has just been cleared
+    ##
+    def setBlank(self):
+        self.cells = [[' '] * self.columns for row in range(self.rows)]
+
+    ##
+    ## invalidate - Forget what is on the display; the next render
+    ## rewrites every cell.
+    ##
+    def invalidate(self):
+        self.cells = None
+
+    ##
+    ## layout - Convert a message (lines separated by newlines) into a
+    ## full frame, padding every row with spaces and dropping anything
+    ## that does not fit on the display.
+    ##
+    def layout(self, message):
+        lines = message.split('\n')
+        frame = []
+        for row in range(self.rows):
+            line = ''
+            if row < len(lines):
+                line = lines[row][:self.columns]
+            frame.append(list(line.ljust(self.columns)))
+        return frame
+
+    ##
+    ## diff - List of (column, row, text) runs that need to be written
+    ## to turn the current display into 'frame'.
+    ##
+    def diff(self, frame):
+        runs = []
+        for row in range(self.rows):
+            target = frame[row]
+            if self.cells is None:
+                runs.append((0, row, ''.join(target)))
+                continue
+
+            shown = self.cells[row]
+            start = None
+            end = None
+            for column in range(self.columns):
+                if target[column] == shown[column]:
+                    continue
+                if start is not None and column - end - 1 <= MERGE_GAP:
+                    end = column
+                    continue
+                if start is not None:
+                    runs.append((start, row, ''.join(target[start:end + 1])))
+                start = column
+                end = column
+
+            if start is not None:
+                runs.append((start, row, ''.join(target[start:end + 1])))
+        return runs
+
+    ##
+    ## render - Update 'lcd' (an adafruit Character_LCD) so that it shows
+    ## 'message', writing only the cells that changed.
+    ##
+    def render(self, lcd, message):
+        frame = self.layout(message)
+        runs = self.diff(frame)
+
+        for column, row, text in runs:
+            ##
+            ## The message setter moves the cursor to (lcd.column,
+            ## lcd.row) itself, so setting them directly costs a single
+            ## cursor command where cursor_position() would add a second.
+            lcd.column = column
+            lcd.row = row
+            lcd.message = text
+            self.cursorMoves = self.cursorMoves + 1
+            self.cellsWritten = self.cellsWritten + len(text)
+
+        self.cells = frame
+        self.frames = self.frames + 1
+        return runs
+
+    ## End class LcdFramebuffer definition
@@ -0,0 +1,243 @@
+#
+# LedCompositor drives every indicator LED of PlantSitter from a single
+# thread. gpiozero starts one background thread per PWMLED.pulse() call
+# (and stops and restarts it on every new effect); here the LEDs only
+# record the effect they should show, and one compositor thread renders
+# all of them at a fixed frame rate from precomputed fade tables:
+#
+#   - asking an LED for the effect it already shows is a no-op, so a
+#     repeated pulse() does not restart the fade
+#   - a pin is only written when its brightness changes
+#   - the thread sleeps while no LED is pulsing, so steady LEDs cost
+#     nothing
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from time import monotonic
+
+import threading
+
+from PlantSitterHAL import Led
+
+##
+## Frames per second of the compositor (gpiozero fades at 25)
+##
+DEFAULT_FRAME_RATE = 25
+
+##
+## Effect kinds
+##
+EFFECT_OFF = 'off'
+EFFECT_ON = 'on'
+EFFECT_PULSE = 'pulse'
+
+##
+## fadeTable - Brightness of every frame of one pulse: a linear fade in
+## over fadeIn seconds and out over fadeOut seconds, like gpiozero.
+##
+def fadeTable(fadeIn, fadeOut, frameRate):
+    rising = int(round(fadeIn * frameRate))
+    falling = int(round(fadeOut * frameRate))
+    table = [index / rising for index in range(rising)]
+    table.extend(1.0 - index / falling for index in range(falling))
+    return tuple(table) or (0.0,)
+
+##
+## AnimatedLed - Led whose effects are rendered by the compositor. It
+## has the gpiozero PWMLED methods PlantSitter uses.
+##
+class AnimatedLed(Led):
+    "LED rendered by the LED compositor"
+
+    def __init__(self, compositor, device, name):
+        self.compositor = compositor
+        self.device = device
+        self.name = name
+
+        ## (key, fade table, start time, repeats) of the current effect;
+        ## replaced as a whole so the compositor never sees half of one
+        self.effect = ((EFFECT_OFF,), None, 0.0, None)
+
+        ## Brightness last written to the device (None before the first)
+        self.written = None
+
+    def on(self):
+        self.compositor.setEffect(self, (EFFECT_ON,))
+
+    def off(self):
+        self.compositor.setEffect(self, (EFFECT_OFF,))
+
+    def pulse(self, fade_in_time = 1, fade_out_time = 1, n = None, background = True):
+        self.compositor.setEffect(self, (EFFECT_PULSE, fade_in_time, fade_out_time, n))
+
+    @property
+    def value(self):
+        return self.written or 0.0
+
+    @property
+    def is_lit(self):
+        return self.effect[0][0] != EFFECT_OFF
+
+    def close(self):
+        self.off()
+
+    ## End class AnimatedLed definition
+
+##
+## LedCompositor - One thread rendering every attached LED
+##
+class LedCompositor():
+    "Single thread driving every LED from precomputed fade tables"
+
+    ##
+    ## Class Initialization method
+    ##
+    ##  frameRate - frames per second while any LED is pulsing
+    ##
+    def __init__(self, frameRate = DEFAULT_FRAME_RATE):
+        self.frameRate = frameRate
+        self.leds = []
+
+        self.frames = 0
+        self.writes = 0
+        self.effectChanges = 0
+        self.deduplicated = 0
+
+        self._tables = {}
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    ##
+    ## attach - Wrap 'device' (anything with a writable value between 0
+    ## and 1, e.g. a gpiozero PWMLED) in an AnimatedLed
+    ##
+    def attach(self, device, name = None):
+        led = AnimatedLed(self, device, name)
+        self.leds.append(led)
+        return led
+
+    def _table(self, fadeIn, fadeOut):
+        key = (fadeIn, fadeOut)
+        table = self._tables.get(key)
+        if table is None:
+            table = fadeTable(fadeIn, fadeOut, self.frameRate)
+            self._tables[key] = table
+        return table
+
+    ##
+    ## setEffect - Give 'led' a new effect. The same effect again is
+    ## ignored, unless it was a pulse with a repeat count that finished.
+    ##
+    def setEffect(self, led, key):
+        with self._lock:
+            if led.effect[0] == key:
+                self.deduplicated = self.deduplicated + 1
+                return
+
+            table = None
+            repeats = None
+            if key[0] == EFFECT_PULSE:
+                table = self._table(key[1], key[2])
+                repeats = key[3]
+            led.effect = (key, table, monotonic(), repeats)
+            self.effectChanges = self.effectChanges + 1
+
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="LedCompositor",
+                                                daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    ##
+    ## _brightness - Brightness of 'led' at 'now'; a finished pulse turns
+    ## the LED off.
+    ##
+    def _brightness(self, led, now):
+        key, table, started, repeats = led.effect
+        kind = key[0]
+        if kind == EFFECT_OFF:
+            return 0.0
+        if kind == EFFECT_ON:
+            return 1.0
+
+        frame = int((now - started) * self.frameRate)
+        if repeats is not None and frame >= len(table) * repeats:
+            with self._lock:
+                if led.effect[0] == key:
+                    led.effect = ((EFFECT_OFF,), None, now, None)
+            return 0.0
+        return table[frame % len(table)]
+
+    ##
+    ## renderFrame - Write the brightness of every LED that changed and
+    ## return True while any LED is pulsing.
+    ##
+    def renderFrame(self, now = None):
+        if now is None:
+            now = monotonic()
+
+        pulsing = False
+        for led in self.leds:
+            value = self._brightness(led, now)
+            if value != led.written:
+                led.device.value = value
+                led.written = value
+                self.writes = self.writes + 1
+            if led.effect[0][0] == EFFECT_PULSE:
+                pulsing = True
+
+        self.frames = self.frames + 1
+        return pulsing
+
+    def _run(self):
+        frameTime = 1.0 / self.frameRate
+        deadline = monotonic()
+        while not self._stop.is_set():
+            self._wake.clear()
+            if not self.renderFrame():
+                ## Nothing is moving - sleep until an effect changes
+                self._wake.wait()
+                deadline = monotonic()
+                continue
+
+            ## Next frame on the frame grid, skipping missed frames
+            now = monotonic()
+            deadline = max(deadline + frameTime, now)
+            self._wake.wait(deadline - now)
+
+    ##
+    ## stop - Stop the thread and turn every LED off
+    ##
+    def stop(self):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._stop.set()
+            self._wake.set()
+            thread.join()
+
+        for led in self.leds:
+            led.effect = ((EFFECT_OFF,), None, 0.0, None)
+            if led.written:
+                led.device.value = 0.0
+                led.written = 0.0
+
+    def getStats(self):
+        return {
+            "frames": self.frames,
+            "writes": self.writes,
+            "effectChanges": self.effectChanges,
+            "deduplicated": self.deduplicated,
+        }
+
+    ## End class LedCompositor definition
@@ -0,0 +1,159 @@
+#
+# MemoryProfiler is PlantSitter's opt-in memory profiling mode. It is
+# off by default, so normal runs pay nothing for allocation tracking.
+# Once started (by a command line flag or by SIGUSR1), it takes a
+# tracemalloc snapshot periodically, compares it with the previous one
+# and with the first one, and appends the top growing allocation sites
+# to a report file. Slow leaks in the long running loops show up as
+# sites that keep growing from one report to the next.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from datetime import datetime
+
+import signal
+import threading
+
+##
+## Frames that only describe the profiler itself or the import system
+##
+IGNORED_FILES = ('<frozen importlib._bootstrap>',
+                 '<frozen importlib._bootstrap_external>',
+                 '<unknown>',
+                 '*tracemalloc.py',
+                 '*linecache.py')
+
+##
+## MemoryProfiler - Periodic tracemalloc snapshots and diffs
+##
+class MemoryProfiler():
+    "Opt-in tracemalloc snapshots of the growing allocation sites"
+
+    ##
+    ## Class Initialization method
+    ##
+    ##  path   - report file the top growing sites are appended to
+    ##  frames - number of stack frames stored per allocation; more
+    ##           frames give better tracebacks and cost more memory
+    ##  top    - number of allocation sites per report
+    ##
+    def __init__(self, path = 'plantsitter-memory.txt', frames = 10, top = 20):
+        self.path = path
+        self.frames = frames
+        self.top = top
+
+        self.snapshots = 0
+        self._first = None
+        self._previous = None
+        self._lock = threading.Lock()
+
+    ##
+    ## isRunning - True while allocations are being traced
+    ##
+    def isRunning(self):
+        import tracemalloc
+        return tracemalloc.is_tracing()
+
+    ##
+    ## start - Begin tracing allocations and take the baseline snapshot
+    ##
+    def start(self):
+        import tracemalloc
+        with self._lock:
+            if tracemalloc.is_tracing():
+                return
+            tracemalloc.start(self.frames)
+            self._first = self._take()
+            self._previous = self._first
+        self._write("memory profiling started, " + str(self.frames) + " frame(s)")
+
+    ##
+    ## stop - Write a final report and stop tracing
+    ##
+    def stop(self):
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            return
+        self.snapshot()
+        with self._lock:
+            tracemalloc.stop()
+            self._first = None
+            self._previous = None
+        self._write("memory profiling stopped")
+
+    ##
+    ## toggle - Start when stopped, stop when started
+    ##
+    def toggle(self):
+        if self.isRunning():
+            self.stop()
+        else:
+            self.start()
+
+    ##
+    ## installSignal - Toggle profiling whenever 'signum' is received,
+    ## e.g. kill -USR1 <pid>. Must be called from the main thread. The
+    ## handler only hands the work to a helper thread, so it never runs
+    ## a snapshot inside the interrupted code.
+    ##
+    def installSignal(self, signum = signal.SIGUSR1):
+        def handler(number, frame):
+            threading.Thread(target=self.toggle, name="MemoryProfiler",
+                             daemon=True).start()
+        signal.signal(signum, handler)
+
+    def _take(self):
+        import tracemalloc
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, pattern) for pattern in IGNORED_FILES])
+
+    ##
+    ## snapshot - Take a snapshot and report the sites that grew since the
+    ## previous snapshot and since profiling started. Does nothing when
+    ## profiling is off, so it can be scheduled unconditionally.
+    ##
+    def snapshot(self):
+        import tracemalloc
+        with self._lock:
+            if not tracemalloc.is_tracing() or self._previous is None:
+                return
+            current = self._take()
+            previous = self._previous
+            first = self._first
+            self._previous = current
+            self.snapshots = self.snapshots + 1
+
+        groupBy = 'traceback' if self.frames > 1 else 'lineno'
+        sinceLast = current.compare_to(previous, groupBy)
+        sinceStart = current.compare_to(first, groupBy)
+        traced, peak = tracemalloc.get_traced_memory()
+
+        lines = ["snapshot " + str(self.snapshots) + ": traced " +
+                 str(traced // 1024) + " KiB, peak " + str(peak // 1024) + " KiB"]
+        for title, statistics in (("growth since previous snapshot", sinceLast),
+                                  ("growth since profiling started", sinceStart)):
+            lines.append("  top " + str(self.top) + " " + title + ":")
+            growing = [stat for stat in statistics if stat.size_diff > 0][:self.top]
+            if not growing:
+                lines.append("    (none)")
+            for stat in growing:
+                ## Most recent frame (the allocation site) first
+                frames = list(stat.traceback)[::-1]
+                lines.append("    %+10.1f KiB %+8d blocks  %s" %
+                             (stat.size_diff / 1024, stat.count_diff, frames[0]))
+                for frame in frames[1:]:
+                    lines.append("                                 " + str(frame))
+        self._write("\n".join(lines))
+
+    def _write(self, text):
+        stamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with open(self.path, 'a') as file:
+            file.write("[" + stamp + "] " + text + "\n")
+
+    ## End class MemoryProfiler definition
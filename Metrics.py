@@ -0,0 +1,299 @@
+#
+# Metrics holds the counters and latency histograms PlantSitter keeps
+# about its hot path (sensor reads, display updates, serial writes and
+# state transitions) and renders them in the Prometheus text exposition
+# format. The result can be written atomically to a node_exporter
+# textfile collector directory, or served over HTTP on a local port.
+#
+# Recording a value costs a lock and a bisect on a short tuple, so the
+# metrics are meant to be left on in production. Statistics that other
+# objects already keep (e.g. LcdBus.getStats()) are pulled in by
+# collectors when the metrics are rendered, so they cost nothing on the
+# hot path.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from time import monotonic
+
+import os
+import threading
+
+from DeadlineScheduler import Histogram
+
+##
+## Histogram bucket upper bounds, in seconds. They cover everything from
+## a cached sensor snapshot (microseconds) to a stuck I2C bus.
+##
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+##
+## _formatLabels - Prometheus label set, e.g. {machine="temperature"}
+##
+def _formatLabels(names, values, extra = None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(name + '="' + value + '"')
+    return '{' + ','.join(escaped) + '}'
+
+def _formatValue(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+##
+## CounterChild - One label combination of a Counter
+##
+class CounterChild():
+    "Monotonic counter"
+
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount = 1):
+        with self._lock:
+            self.value = self.value + amount
+
+##
+## Counter - Counter family, one child per label combination
+##
+class Counter():
+    "Prometheus counter family"
+
+    def __init__(self, name, help, labelNames = ()):
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    ##
+    ## labels - The child for the given label values. Callers on a hot
+    ## path should look their child up once and keep it.
+    ##
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, CounterChild())
+        return child
+
+    def inc(self, amount = 1):
+        self.labels().inc(amount)
+
+    def format(self):
+        lines = ['# HELP ' + self.name + ' ' + self.help,
+                 '# TYPE ' + self.name + ' counter']
+        for values, child in sorted(self._children.items()):
+            lines.append(self.name + _formatLabels(self.labelNames, values) +
+                         ' ' + _formatValue(child.value))
+        return lines
+
+    ## End class Counter definition
+
+##
+## _Timer - Context manager observing the time spent in its block
+##
+class _Timer():
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = monotonic()
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        self.histogram.observe(monotonic() - self.started)
+        return False
+
+##
+## HistogramChild - One label combination of a LatencyHistogram. It is a
+## DeadlineScheduler Histogram whose updates are serialized, since the
+## same child can be observed from several threads.
+##
+class HistogramChild(Histogram):
+    "Thread-safe latency histogram"
+
+    def __init__(self, buckets):
+        Histogram.__init__(self, buckets)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            Histogram.observe(self, value)
+
+    ##
+    ## time - Time a block of code:
+    ##
+    ##   with histogram.time():
+    ##       ...
+    ##
+    def time(self):
+        return _Timer(self)
+
+##
+## LatencyHistogram - Histogram family, one child per label combination
+##
+class LatencyHistogram():
+    "Prometheus histogram family"
+
+    def __init__(self, name, help, labelNames = (), buckets = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self.buckets = tuple(buckets)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = HistogramChild(self.buckets)
+                    self._children[values] = child
+        return child
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def format(self):
+        lines = ['# HELP ' + self.name + ' ' + self.help,
+                 '# TYPE ' + self.name + ' histogram']
+        for values, child in sorted(self._children.items()):
+            with child._lock:
+                pairs = child.cumulative()
+                total = child.sum
+                count = child.count
+            for bound, seen in pairs:
+                lines.append(self.name + '_bucket' +
+                             _formatLabels(self.labelNames, values, ('le', _formatValue(bound))) +
+                             ' ' + str(seen))
+            labels = _formatLabels(self.labelNames, values)
+            lines.append(self.name + '_sum' + labels + ' ' + _formatValue(total))
+            lines.append(self.name + '_count' + labels + ' ' + str(count))
+        return lines
+
+    ## End class LatencyHistogram definition
+
+##
+## MetricsRegistry - Every metric of the process, plus collectors
+##
+class MetricsRegistry():
+    "Registry rendering all metrics in the Prometheus text format"
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+        self._server = None
+
+    def counter(self, name, help, labelNames = ()):
+        metric = Counter(name, help, labelNames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelNames = (), buckets = LATENCY_BUCKETS):
+        metric = LatencyHistogram(name, help, labelNames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    ##
+    ## addCollector - Register a function called at render time. It
+    ## returns a list of (name, type, help, samples) tuples, where type
+    ## is 'counter' or 'gauge' and samples is a list of (labels
+    ## dictionary, value) pairs.
+    ##
+    def addCollector(self, collector):
+        self.collectors.append(collector)
+
+    ##
+    ## formatPrometheus - All metrics in the text exposition format
+    ##
+    def formatPrometheus(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.format())
+
+        for collector in self.collectors:
+            for name, kind, help, samples in collector():
+                lines.append('# HELP ' + name + ' ' + help)
+                lines.append('# TYPE ' + name + ' ' + kind)
+                for labels, value in samples:
+                    lines.append(name + _formatLabels(list(labels.keys()), list(labels.values())) +
+                                 ' ' + _formatValue(value))
+
+        return '\n'.join(lines) + '\n'
+
+    ##
+    ## writeTextfile - Write the metrics for the node_exporter textfile
+    ## collector. The file is replaced atomically so node_exporter never
+    ## reads a partial file.
+    ##
+    def writeTextfile(self, path):
+        temporary = path + '.' + str(os.getpid()) + '.tmp'
+        with open(temporary, 'w') as file:
+            file.write(self.formatPrometheus())
+        os.replace(temporary, path)
+
+    ##
+    ## serve - Serve the metrics at http://address:port/metrics from a
+    ## daemon thread.
+    ##
+    def serve(self, port, address = '127.0.0.1'):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.formatPrometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((address, port), MetricsHandler)
+        self._server.daemon_threads = True
+        thread = threading.Thread(target=self._server.serve_forever,
+                                  name="MetricsServer", daemon=True)
+        thread.start()
+        return self._server
+
+    ##
+    ## stop - Stop the HTTP server, if one is running
+    ##
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    ## End class MetricsRegistry definition
@@ -0,0 +1,401 @@
+#
+# PlantSimulation runs the PlantSitter control channels against a model
+# of the plant on a virtual clock, so days of operation take seconds.
+#
+# The channel table of PlantSitterChannels.py (setpoints, limits, states,
+# filters) is used as it is; only the readings, the LEDs and the time
+# source are swapped:
+#
+#   - a VirtualClock replaces sleep(), time() and the monotonic clock of
+#     the scheduler, the sensor sampler and the engine
+#   - a PlantModel replaces thSensor. Its air temperature follows a
+#     daily ambient cycle and is pushed up in 'heat' and down in 'cool';
+#     its soil moisture dries out faster when it is warm, is watered in
+#     'dry' and is ventilated in 'hum'
+#
+# The result is a report of the transitions of every channel, the time
+# spent in each state and the time spent within a tolerance of the
+# setpoint, which makes changes to the control logic easy to compare,
+# plus the sensor reads and scheduler wakeups it took (with --adaptive
+# the ticks follow the adaptive sampling settings of the table).
+#
+# Usage: python PlantSimulation.py [--days 3] [--seed 1]
+#                                  [--decision-period 10]
+#                                  [--temperature 72] [--humidity 40]
+#                                  [--adaptive] [--json]
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from datetime import datetime, timedelta
+from math import cos, pi
+from time import monotonic
+
+import argparse
+import json
+import random
+
+import PlantSitterChannels
+
+from AdaptiveSampling import AdaptiveInterval
+from ControlChannel import ControlEngine
+from DeadlineScheduler import DeadlineScheduler
+from PlantSitterHAL import Sensor, SimulatedLed
+from SensorSampler import SensorSampler
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+##
+## Plant model parameters
+##
+##  AMBIENT_MEAN, AMBIENT_SWING - daily ambient temperature cycle in
+##                                degrees Fahrenheit, warmest at
+##                                AMBIENT_PEAK_HOUR
+##  AIR_TIME_CONSTANT           - seconds for the air to close 63% of
+##                                the gap to the ambient temperature
+##  HEAT_RATE, COOL_RATE        - degrees per hour added / removed while
+##                                heating / cooling
+##  DRYING_RATE                 - moisture percent lost per hour at 70 F,
+##                                DRYING_PER_DEGREE more per degree above
+##  WATERING_RATE               - moisture percent added per hour in 'dry'
+##  VENTILATION_RATE            - extra percent lost per hour in 'hum'
+##  TEMPERATURE_NOISE, MOISTURE_NOISE - standard deviation of the sensor
+##                                noise
+##  MODEL_STEP                  - integration step in seconds
+##
+AMBIENT_MEAN = 68.0
+AMBIENT_SWING = 8.0
+AMBIENT_PEAK_HOUR = 15
+AIR_TIME_CONSTANT = 1800.0
+HEAT_RATE = 12.0
+COOL_RATE = 12.0
+DRYING_RATE = 1.0
+DRYING_PER_DEGREE = 0.05
+WATERING_RATE = 15.0
+VENTILATION_RATE = 2.0
+TEMPERATURE_NOISE = 0.2
+MOISTURE_NOISE = 0.5
+MODEL_STEP = 1.0
+
+##
+## Distance from the setpoint still counted as "at setpoint", per channel
+##
+DEFAULT_TOLERANCES = {'temperature': 1.0, 'humidity': 2.0}
+
+##
+## VirtualClock - Time that only moves when something sleeps on it
+##
+class VirtualClock():
+    "Simulated clock"
+
+    def __init__(self, start = None):
+        if start is None:
+            start = datetime(2024, 6, 1)
+        self.start = start
+        self.epoch = start.timestamp()
+        self.elapsed = 0.0
+
+        ## Sleeps that moved the clock, i.e. wakeups of the sleeper
+        self.wakeups = 0
+
+    ## Seconds since the simulation started (the monotonic clock)
+    def monotonic(self):
+        return self.elapsed
+
+    ## Seconds since the epoch (the wall clock)
+    def time(self):
+        return self.epoch + self.elapsed
+
+    def now(self):
+        return self.start + timedelta(seconds = self.elapsed)
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.elapsed = self.elapsed + seconds
+            self.wakeups = self.wakeups + 1
+
+    ## End class VirtualClock definition
+
+##
+## PlantModel - Air temperature and soil moisture of the plant, read
+## through the sensor interface like thSensor. The model is integrated
+## up to the clock time whenever it is read, using the states of the
+## connected channels as the actuators.
+##
+class PlantModel(Sensor):
+    "Thermal and soil moisture model"
+
+    def __init__(self, clock, fahrenheit = 68.0, moisture = 45.0, seed = 1):
+        self.clock = clock
+        self.fahrenheit = fahrenheit
+        self.moisture = moisture
+        self.random = random.Random(seed)
+
+        self.temperatureChannel = None
+        self.humidityChannel = None
+
+        self._time = clock.monotonic()
+        self._dayOffset = (clock.start - clock.start.replace(hour = 0, minute = 0, second = 0,
+                                                             microsecond = 0)).total_seconds()
+
+    ##
+    ## connect - The channels whose states drive the heater, the cooler,
+    ## the watering and the ventilation
+    ##
+    def connect(self, temperatureChannel, humidityChannel):
+        self.temperatureChannel = temperatureChannel
+        self.humidityChannel = humidityChannel
+
+    def ambient(self, elapsed):
+        secondOfDay = (self._dayOffset + elapsed) % SECONDS_PER_DAY
+        phase = 2 * pi * (secondOfDay - AMBIENT_PEAK_HOUR * 3600) / SECONDS_PER_DAY
+        return AMBIENT_MEAN + AMBIENT_SWING * cos(phase)
+
+    def _step(self, seconds, heating, cooling, watering, ventilating):
+        hours = seconds / 3600
+
+        fahrenheit = self.fahrenheit
+        fahrenheit = fahrenheit + (self.ambient(self._time) - fahrenheit) * seconds / AIR_TIME_CONSTANT
+        if heating:
+            fahrenheit = fahrenheit + HEAT_RATE * hours
+        if cooling:
+            fahrenheit = fahrenheit - COOL_RATE * hours
+
+        moisture = self.moisture - DRYING_RATE * hours * max(0.0, 1 + DRYING_PER_DEGREE * (fahrenheit - 70))
+        if watering:
+            moisture = moisture + WATERING_RATE * hours
+        if ventilating:
+            moisture = moisture - VENTILATION_RATE * hours
+
+        self.fahrenheit = fahrenheit
+        self.moisture = min(100.0, max(0.0, moisture))
+
+    ##
+    ## advance - Integrate the model up to the current clock time
+    ##
+    def advance(self):
+        now = self.clock.monotonic()
+        temperature = self.temperatureChannel
+        humidity = self.humidityChannel
+        heating = temperature is not None and temperature.state == temperature.below
+        cooling = temperature is not None and temperature.state == temperature.above
+        watering = humidity is not None and humidity.state == humidity.below
+        ventilating = humidity is not None and humidity.state == humidity.above
+
+        while self._time < now:
+            seconds = min(MODEL_STEP, now - self._time)
+            self._step(seconds, heating, cooling, watering, ventilating)
+            self._time = self._time + seconds
+
+    ##
+    ## read - (degrees Celsius, relative humidity) with sensor noise
+    ##
+    def read(self):
+        self.advance()
+        fahrenheit = self.fahrenheit + self.random.gauss(0.0, TEMPERATURE_NOISE)
+        moisture = self.moisture + self.random.gauss(0.0, MOISTURE_NOISE)
+        return (fahrenheit - 32) * 5 / 9, min(100.0, max(0.0, moisture))
+
+    @property
+    def temperature(self):
+        return self.read()[0]
+
+    @property
+    def relative_humidity(self):
+        return self.read()[1]
+
+    ## End class PlantModel definition
+
+##
+## ChannelStatistics - Time in state, time at setpoint and transitions
+## of one channel. Every reading stands for the time until the next one.
+##
+class ChannelStatistics():
+    "Control quality of one simulated channel"
+
+    def __init__(self, channel, tolerance):
+        self.channel = channel
+        self.tolerance = tolerance
+
+        self.transitions = 0
+        self.transitionsTo = {state: 0 for state in channel.config.states}
+        self.timeInState = {state: 0.0 for state in channel.config.states}
+        self.timeAtSetPoint = 0.0
+        self.absoluteDeviation = 0.0
+        self.maxDeviation = 0.0
+        self.duration = 0.0
+
+        self._last = None
+
+    def sample(self, channel, when, value):
+        if self._last is not None:
+            lastWhen, lastValue, lastState, lastSetPoint = self._last
+            seconds = when - lastWhen
+            deviation = abs(lastValue - lastSetPoint)
+            self.duration = self.duration + seconds
+            self.timeInState[lastState] = self.timeInState[lastState] + seconds
+            self.absoluteDeviation = self.absoluteDeviation + deviation * seconds
+            if deviation <= self.tolerance:
+                self.timeAtSetPoint = self.timeAtSetPoint + seconds
+            if deviation > self.maxDeviation:
+                self.maxDeviation = deviation
+        self._last = (when, value, channel.state, channel.setPoint)
+
+    def transition(self, channel, source, target, seconds):
+        self.transitions = self.transitions + 1
+        self.transitionsTo[target] = self.transitionsTo[target] + 1
+
+    def getStats(self):
+        duration = self.duration or 1.0
+        return {
+            "setPoint": self.channel.setPoint,
+            "tolerance": self.tolerance,
+            "transitions": self.transitions,
+            "transitionsPerDay": self.transitions * SECONDS_PER_DAY / duration,
+            "transitionsTo": dict(self.transitionsTo),
+            "timeInState": {state: seconds / duration
+                            for state, seconds in self.timeInState.items()},
+            "timeAtSetPoint": self.timeAtSetPoint / duration,
+            "meanAbsoluteDeviation": self.absoluteDeviation / duration,
+            "maxDeviation": self.maxDeviation,
+        }
+
+    ## End class ChannelStatistics definition
+
+##
+## runSimulation - Run the PlantSitter channels against the plant model
+## for 'days' simulated days and return the report.
+##
+##  seed           - seed of the sensor noise
+##  decisionPeriod - seconds between control decisions
+##  setPoints      - {channel name: setpoint} overriding the table
+##  tolerances     - {channel name: distance counted as at setpoint}
+##  adaptive       - sample at the adaptive interval of the SAMPLE_*
+##                   settings of the table instead of every second
+##  channels       - the channel table (PlantSitterChannels.CHANNELS by
+##                   default)
+##
+def runSimulation(days = 3, seed = 1, decisionPeriod = PlantSitterChannels.DECISION_PERIOD,
+                  setPoints = None, tolerances = None, start = None, adaptive = False,
+                  channels = None):
+    if channels is None:
+        channels = PlantSitterChannels.CHANNELS
+    setPoints = setPoints or {}
+    tolerances = dict(DEFAULT_TOLERANCES, **(tolerances or {}))
+
+    clock = VirtualClock(start)
+    model = PlantModel(clock, seed = seed)
+    sampler = SensorSampler(model, maxAge = PlantSitterChannels.SENSOR_MAX_AGE,
+                            clock = clock.monotonic)
+
+    readers = {
+        'temperature': lambda: (((9/5) * sampler.getSnapshot().temperature) + 32),
+        'humidity': lambda: sampler.getSnapshot().humidity,
+    }
+
+    engine = ControlEngine(displayPeriod = 1, decisionPeriod = decisionPeriod,
+                           reportPeriod = PlantSitterChannels.SERIAL_REPORT_PERIOD,
+                           clock = clock.time)
+    for config in channels:
+        lights = {state: SimulatedLed(index)
+                  for index, state in enumerate(config.states[1:])}
+        engine.addChannel(config._replace(read = readers[config.name],
+                                          setPoint = setPoints.get(config.name, config.setPoint),
+                                          lights = lights,
+                                          display = None,
+                                          buttons = None))
+    model.connect(engine.byName['temperature'], engine.byName['humidity'])
+
+    if adaptive:
+        engine.sampling = AdaptiveInterval(PlantSitterChannels.SAMPLE_MIN_INTERVAL,
+                                           PlantSitterChannels.SAMPLE_MAX_INTERVAL,
+                                           nearDistances = PlantSitterChannels.SAMPLE_NEAR_DISTANCES,
+                                           maxRates = PlantSitterChannels.SAMPLE_MAX_RATES)
+
+    statistics = {}
+    for channel in engine.channels:
+        statistics[channel.name] = ChannelStatistics(channel, tolerances[channel.name])
+        channel.listeners.append(statistics[channel.name].transition)
+    engine.sampleHandlers.append(lambda channel, when, value:
+                                 statistics[channel.name].sample(channel, when, value))
+
+    scheduler = DeadlineScheduler(clock = clock.monotonic, sleep = clock.sleep)
+    engine.addJobs(scheduler)
+
+    end = days * SECONDS_PER_DAY
+    started = monotonic()
+    engine.decide()
+    scheduler.run(isDone = lambda: clock.monotonic() >= end)
+    wallSeconds = monotonic() - started
+
+    return {
+        "days": days,
+        "seed": seed,
+        "decisionPeriod": decisionPeriod,
+        "simulatedSeconds": clock.monotonic(),
+        "wallSeconds": wallSeconds,
+        "speedup": clock.monotonic() / wallSeconds if wallSeconds else None,
+        "sensorReads": sampler.reads,
+        "wakeups": clock.wakeups,
+        "sampling": engine.sampling.getStats() if engine.sampling is not None else None,
+        "channels": {name: stats.getStats() for name, stats in statistics.items()},
+    }
+
+##
+## formatReport - Human readable report of runSimulation()
+##
+def formatReport(report):
+    lines = ["%.1f simulated days in %.2f s (%.0fx real time), decision every %s s, seed %s" %
+             (report["days"], report["wallSeconds"], report["speedup"] or 0,
+              report["decisionPeriod"], report["seed"])]
+    lines.append("%d sensor reads, %d wakeups" % (report["sensorReads"], report["wakeups"]))
+    if report["sampling"] is not None:
+        lines.append("adaptive sampling: " +
+                     ", ".join("%s %d" % (reason, count)
+                               for reason, count in report["sampling"]["reasons"].items()
+                               if count))
+    for name, stats in report["channels"].items():
+        lines.append("")
+        lines.append("%s: setpoint %s +/- %s" % (name, stats["setPoint"], stats["tolerance"]))
+        lines.append("  transitions       %d (%.1f per day)" %
+                     (stats["transitions"], stats["transitionsPerDay"]))
+        lines.append("  time at setpoint  %.1f%%" % (stats["timeAtSetPoint"] * 100))
+        lines.append("  mean |deviation|  %.2f, max %.2f" %
+                     (stats["meanAbsoluteDeviation"], stats["maxDeviation"]))
+        lines.append("  time in state     " +
+                     ", ".join("%s %.1f%%" % (state, share * 100)
+                               for state, share in stats["timeInState"].items()))
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Accelerated PlantSitter simulation")
+    parser.add_argument("--days", type = float, default = 3)
+    parser.add_argument("--seed", type = int, default = 1)
+    parser.add_argument("--decision-period", type = float, default = PlantSitterChannels.DECISION_PERIOD)
+    parser.add_argument("--temperature", type = float, help = "temperature setpoint")
+    parser.add_argument("--humidity", type = float, help = "humidity setpoint")
+    parser.add_argument("--adaptive", action = "store_true",
+                        help = "sample at the adaptive interval")
+    parser.add_argument("--json", action = "store_true", help = "print the report as JSON")
+    arguments = parser.parse_args()
+
+    setPoints = {}
+    if arguments.temperature is not None:
+        setPoints['temperature'] = arguments.temperature
+    if arguments.humidity is not None:
+        setPoints['humidity'] = arguments.humidity
+
+    report = runSimulation(arguments.days, arguments.seed, arguments.decision_period,
+                           setPoints, adaptive = arguments.adaptive)
+    if arguments.json:
+        print(json.dumps(report, indent = 2, sort_keys = True))
+    else:
+        print(formatReport(report))
+
+if __name__ == '__main__':
+    main()
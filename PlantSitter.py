@@ -1,6 +1,7 @@
-# PlantSitter uses a state machine desing to run two state machines 
-# simultaneously - one for air temperature control and another for 
-# soil humidity control. 
+# PlantSitter runs a table-driven set of control channels - one for air
+# temperature control and another for soil humidity control - from a
+# single scheduler. Each channel is a three-state machine described by a
+# row of the channel table (see ControlChannel.py).
 #
 #------------------------------------------------------------------ 
 # Change History
@@ -11,1119 +12,1052 @@
 #------------------------------------------------------------------
 
 ##
-## This import is used for timing in the main loop
+## Startup timing - imported first so that its clock starts as early as
+## possible. Every timed import and device bring-up is recorded in it.
 ##
-from time import sleep
-from datetime import datetime 
+from StartupProfile import startup
 
-import tracemalloc
-
-import asyncio
-from reduct import Client, Bucket, BucketSettings, QuotaType
-from datetime import datetime
-import random
+##
+## All hardware - the temperature sensor on the I2C bus, the LEDs, the
+## buttons, the LCD lines and the serial port - is reached through the
+## hardware abstraction layer. Its real backend imports the adafruit,
+## gpiozero and pyserial libraries only when a device is first used, and
+## its simulated backend (PLANTSITTER_HAL=sim) lets PlantSitter run on
+## any machine.
+##
+from PlantSitterHAL import (LazyDevice, SENSOR_AHTX0, SENSOR_MODE_PERIODIC,
+                            SENSOR_MODE_TRIGGERED, SENSOR_SHT31D, createHal, isBuilt)
 
 ##
-## This import is used for Python 'multithreading'
+## Used by the asyncio engine to run blocking device I/O off the
+## event loop
 ##
-import threading
+from concurrent.futures import ThreadPoolExecutor
+import sys
 
 ##
-## These imports allow us to build a fully functional state machine
+## Shared sensor snapshot cache, for one sensor or for several sampled
+## together
 ##
-from statemachine import StateMachine, State
+from SensorSampler import MultiSensorSampler, SensorSampler
 
 ##
-## Imports necessary to provide connectivity to the 
-## thermostat sensor and the I2C bus
+## Drift-free scheduler for the 1 s / 10 s / 30 s cadences
 ##
-import board
-import adafruit_ahtx0
-import adafruit_sht31d
+from DeadlineScheduler import DeadlineScheduler
 
-############################################################
-########## FIXME: Find the appropriate library    ##########
-########## for the temperature sensor.            ##########
-############################################################
+##
+## Table-driven control channels, one engine for all of them
+##
+from ControlChannel import ControlEngine
 
 ##
-## These are the packages that we need to pull in so that we can work
-## with the GPIO interface on the Raspberry Pi board and work with
-## the 16x2 LCD display
+## The channel table and the control settings, shared with the offline
+## tools (simulation, setpoint sweep)
 ##
-# import board - already imported for I2C connectivity
-import digitalio
-import adafruit_character_lcd.character_lcd as characterlcd
+import PlantSitterChannels
+from PlantSitterChannels import (DECISION_PERIOD, SAMPLE_MAX_INTERVAL, SAMPLE_MAX_RATES,
+                                 SAMPLE_MIN_INTERVAL, SAMPLE_NEAR_DISTANCES, SENSOR_MAX_AGE,
+                                 SERIAL_REPORT_PERIOD)
 
-## This imports the Python serial package to handle communications over the
-## Raspberry Pi's serial port. 
-import serial
+##
+## Sampling interval from the rate of change and distance to setpoint
+##
+from AdaptiveSampling import AdaptiveInterval
 
 ##
-## Imports required to handle our Button, and our PWMLED devices
+## Arbitrated driver for the LCD lines shared by both displays. Each
+## display keeps a shadow framebuffer so only changed cells are sent.
 ##
-from gpiozero import Button, PWMLED
+from LcdBus import LcdBus
 
 ##
-## This package is necessary so that we can delegate the blinking
-## lights to their own thread so that more work can be done at the
-## same time
+## Single writer thread for the UART and the binary telemetry framing
 ##
-from threading import Thread
+from SerialWriter import SerialWriter
 
 ##
-## This is needed to get coherent matching of temperatures.
+## Memory-mapped ring file holding the local reading history
 ##
-from math import floor
+from HistoryRing import HistoryRing
 
 ##
-## DEBUG flag - boolean value to indicate whether or not to print 
-## status messages on the console of the program
-## 
-DEBUG = True
+## Incremental minute/hour/day rollups
+##
+from Rollups import MAX_GAP, RollupEngine
 
 ##
-## Create an I2C instance so that we can communicate with
-## devices on the I2C bus.
+## Hot path latency histograms and counters
 ##
-i2c = board.I2C()
+from Metrics import MetricsRegistry
 
 ##
-## Initialize our Temperature and Humidity sensor.
-## Toggle between the following two thSensor 
-## variable definitions depending on whether you 
-## are using an AHTx0 or SHT31 temperature sensor.
+## One thread rendering every LED effect
 ##
+from LedCompositor import LedCompositor
 
-thSensor = adafruit_ahtx0.AHTx0(i2c)
+##
+## Opt-in tracemalloc snapshots
+##
+from MemoryProfiler import MemoryProfiler
 
-#thSensor = adafruit_sht31d.SHT31D(i2c)
+##
+## Non-blocking logging - records are queued and written by a background
+## thread, so a slow console never blocks the control loops
+##
+import logging
+from PlantSitterLogging import getLogger, setupLogging
 
 ##
-## Initialize our serial connection
+## DEBUG flag - boolean value to indicate whether or not to log the
+## per tick status messages of the program
+## 
+DEBUG = True
+
 ##
-## Because we imported the entire package instead of just importing Serial and
-## some of the other flags from the serial package, we need to reference those
-## objects with dot notation.
+## Logging configuration
 ##
-## e.g. ser = serial.Serial
+##  LOG_LEVEL      - level of every subsystem (DEBUG shows the per tick
+##                   status messages)
+##  LOG_LEVELS     - per subsystem overrides, e.g. {'humidity': 'INFO'}.
+##                   Subsystems: main, one per channel (temperature,
+##                   humidity), scheduler (job errors), startup (device
+##                   bring-up and its timing report), database
+##                   (ReductStore writers), serial (serial port write
+##                   failures), sensor (sensor errors and background
+##                   conversions) and sampling (adaptive sampling)
+##  LOG_JSON       - write JSON lines instead of plain text
+##  LOG_FILE       - append to this file instead of writing to stderr
+##  LOG_RATE_LIMIT - (messages, seconds): each repetitive message is let
+##                   through at most this often; None disables the limit
 ##
-ser = serial.Serial(
-        port='/dev/ttyS0', # This would be /dev/ttyAM0 prior to Raspberry Pi 3
-        baudrate = 115200, # This sets the speed of the serial interface in
-                           # bits/second
-        parity=serial.PARITY_NONE,      # Disable parity
-        stopbits=serial.STOPBITS_ONE,   # Serial protocol will use one stop bit
-        bytesize=serial.EIGHTBITS,      # We are using 8-bit bytes 
-        timeout=1          # Configure a 1-second timeout
-)
+LOG_LEVEL = 'DEBUG' if DEBUG else 'INFO'
+LOG_LEVELS = {}
+LOG_JSON = False
+LOG_FILE = None
+LOG_RATE_LIMIT = (5, 60.0)
 
 ##
-## Our four LEDs:
-## GPIO 18
-## GPIO 23
-## GPIO 21
-## GPIO 20
+## The logging pipeline, once main() has started it
 ##
-redLight = PWMLED(18)
-blueLight = PWMLED(23)
-yellowLight = PWMLED(21)
-greenLight = PWMLED(20)
+loggingPipeline = None
+
+log = getLogger('main')
+temperatureLog = getLogger('temperature')
+humidityLog = getLogger('humidity')
+schedulerLog = getLogger('scheduler')
+startupLog = getLogger('startup')
 
 ##
-## ManagedDisplay - Class intended to manage the 16x2 
-## Display
-##
-## This code is largely taken from the work done in module 4, and
-## converted into a class so that we can more easily consume the 
-## operational capabilities.
+## Select the hardware backend: 'real' on the Raspberry Pi, 'sim' for the
+## in-memory devices. The PLANTSITTER_HAL environment variable overrides
+## this setting.
 ##
-class ManagedTemperatureDisplay():
-    ##
-    ## Class Initialization method to setup the display
-    ##
-    def __init__(self):
-        ##
-        ## Setup the six GPIO lines to communicate with the display.
-        ## This leverages the digitalio class to handle digital 
-        ## outputs on the GPIO lines. There is also an analagous
-        ## class for analog IO.
-        ##
-        ## You need to make sure that the port mappings match the
-        ## physical wiring of the display interface to the 
-        ## GPIO interface.
-        ##
-        ## compatible with all versions of RPI as of Jan. 2019
-        ##
-        self.lcd_rs = digitalio.DigitalInOut(board.D17)
-        self.lcd_en = digitalio.DigitalInOut(board.D8)
-        self.lcd_d4 = digitalio.DigitalInOut(board.D5)
-        self.lcd_d5 = digitalio.DigitalInOut(board.D6)
-        self.lcd_d6 = digitalio.DigitalInOut(board.D13)
-        self.lcd_d7 = digitalio.DigitalInOut(board.D26)
+HAL_BACKEND = None
 
-        # Modify this if you have a different sized character LCD
-        self.lcd_columns = 16
-        self.lcd_rows = 2 
+hal = createHal(HAL_BACKEND)
 
-        # Initialise the lcd class
-        self.lcd = characterlcd.Character_LCD_Mono(self.lcd_rs, self.lcd_en, 
-                    self.lcd_d4, self.lcd_d5, self.lcd_d6, self.lcd_d7, 
-                    self.lcd_columns, self.lcd_rows)
-
-        # wipe LCD screen before we start
-        self.lcd.clear()
+##
+## Initialize our Temperature and Humidity sensor.
+## Set SENSOR_TYPE to SENSOR_AHTX0 or SENSOR_SHT31D depending on
+## whether you are using an AHTx0 or SHT31 temperature sensor.
+## The I2C bus is created together with the sensor on first use.
+##
+SENSOR_TYPE = SENSOR_AHTX0
 
-    ##
-    ## cleanupDisplay - Method used to cleanup the digitalIO lines that
-    ## are used to run the display.
-    ##
-    def cleanupDisplay(self):
-        # Clear the LCD first - otherwise we won't be abe to update it.
-        self.lcd.clear()
-        self.lcd_rs.deinit()
-        self.lcd_en.deinit()
-        self.lcd_d4.deinit()
-        self.lcd_d5.deinit()
-        self.lcd_d6.deinit()
-        self.lcd_d7.deinit()
-        
-    ##
-    ## clear - Convenience method used to clear the display
-    ##
-    def clear(self):
-        self.lcd.clear()
+##
+## SENSOR_MODE selects how the sensor is read:
+##
+##  SENSOR_MODE_TRIGGERED - every read starts a conversion and waits for
+##                          it (80 ms on the AHTx0, 15 ms on the SHT31)
+##  SENSOR_MODE_PERIODIC  - the SHT31 measures every SENSOR_INTERVAL
+##                          seconds by itself and a read fetches the
+##                          latest result; the AHTx0, which has no such
+##                          mode, is converted ahead of time by a
+##                          background thread. Reads take about a
+##                          millisecond either way.
+##
+SENSOR_MODE = SENSOR_MODE_TRIGGERED
+SENSOR_INTERVAL = 1.0
 
-    ##
-    ## updateTemperatureScreen - Convenience method used to update the temperatuere screen message.
-    ##
-    def updateTemperatureScreen(self, message):
-        self.lcd.clear()
-        self.lcd.message = message
+thSensor = hal.sensor(SENSOR_TYPE, SENSOR_MODE, SENSOR_INTERVAL)
 
-        ## End class ManagedTemperatureDisplay definition 
+##
+## Several sensors - list them as (name, type, I2C address or None for
+## the default, TCA9548A mux channel or None) to sample them all in one
+## cycle: every conversion is triggered, then one wait, then every
+## sensor is read back. Sensors with the same address go on different
+## mux channels. The first sensor is the one the control channels read;
+## the others are read with sampler.getSnapshot(name = ...). An empty
+## list keeps the single sensor above.
+##
+##   SENSORS = [('bench', SENSOR_AHTX0, None, 0),
+##              ('shelf', SENSOR_AHTX0, None, 1),
+##              ('soil', SENSOR_SHT31D, 0x44, None)]
+##
+SENSORS = []
 
-class ManagedHumidityDisplay():
-    ## 
-    ## Class Initialization method to setup the display
-    ##
-    def __init__(self):
-        ##
-        ## Setup the six GPIO lines to communicate with the display.
-        ## This leverages the digitalio class to handle digital 
-        ## outputs on the GPIO lines. There is also an analagous
-        ## class for analog IO.
-        ##
-        ## You need to make sure that the port mappings match the
-        ## physical wiring of the display interface to the 
-        ## GPIO interface.
-        ##
-        ## compatible with all versions of RPI as of Jan. 2019
-        ##
-        self.lcd_rs = digitalio.DigitalInOut(board.D17)
-        self.lcd_en = digitalio.DigitalInOut(board.D7)
-        self.lcd_d4 = digitalio.DigitalInOut(board.D5)
-        self.lcd_d5 = digitalio.DigitalInOut(board.D6)
-        self.lcd_d6 = digitalio.DigitalInOut(board.D13)
-        self.lcd_d7 = digitalio.DigitalInOut(board.D26)
+sensors = [(name, hal.pipelinedSensor(name, kind, address, muxChannel))
+           for name, kind, address, muxChannel in SENSORS]
 
-        # Modify this if you have a different sized character LCD
-        self.lcd_columns = 16
-        self.lcd_rows = 2 
+##
+## Metrics - latency histograms of the sensor reads, the display updates,
+## the serial writes and the state transitions, plus counters of sensor
+## reads, I2C errors and transitions per state. They are cheap enough to
+## stay on in production.
+##
+## Every METRICS_PERIOD seconds they are written to METRICS_FILE in the
+## Prometheus text format (point it into the node_exporter textfile
+## collector directory). Set METRICS_PORT to also serve them at
+## http://127.0.0.1:METRICS_PORT/metrics. None disables either output.
+##
+METRICS_FILE = 'plantsitter.prom'
+METRICS_PORT = None
+METRICS_PERIOD = 15
+
+metrics = MetricsRegistry()
+
+sensorReadSeconds = metrics.histogram(
+    'plantsitter_sensor_read_seconds',
+    'Time spent reading the temperature/humidity sensor(s) over I2C, per sampling cycle.')
+sensorGetSeconds = metrics.histogram(
+    'plantsitter_sensor_get_seconds',
+    'Time taken by a channel reading, including cached snapshots.',
+    ('machine',))
+displayUpdateSeconds = metrics.histogram(
+    'plantsitter_display_update_seconds',
+    'Time taken by one display update.',
+    ('display',))
+lcdRenderSeconds = metrics.histogram(
+    'plantsitter_lcd_render_seconds',
+    'Time spent driving the LCD lines for one frame.')
+serialWriteSeconds = metrics.histogram(
+    'plantsitter_serial_write_seconds',
+    'Time spent in a single write to the serial port.')
+transitionSeconds = metrics.histogram(
+    'plantsitter_transition_seconds',
+    'Time taken by a channel state transition.',
+    ('machine',))
+transitionsTotal = metrics.counter(
+    'plantsitter_transitions_total',
+    'State transitions, by channel and state entered.',
+    ('machine', 'state'))
+
+temperatureGetSeconds = sensorGetSeconds.labels('temperature')
+humidityGetSeconds = sensorGetSeconds.labels('humidity')
+temperatureTransitionSeconds = transitionSeconds.labels('temperature')
+humidityTransitionSeconds = transitionSeconds.labels('humidity')
 
-        # Initialise the lcd class
-        self.lcd = characterlcd.Character_LCD_Mono(self.lcd_rs, self.lcd_en, 
-                    self.lcd_d4, self.lcd_d5, self.lcd_d6, self.lcd_d7, 
-                    self.lcd_columns, self.lcd_rows)
+##
+## Memory profiling - off by default, because tracing every allocation
+## slows down the whole program. Enable it with MEMORY_PROFILE, the
+## --memory-profile command line flag, or at run time by sending SIGUSR1
+## (kill -USR1 <pid>), which toggles it on and off. While it is on, a
+## snapshot is taken every MEMORY_PROFILE_PERIOD seconds and the top
+## growing allocation sites are appended to MEMORY_PROFILE_FILE.
+## MEMORY_PROFILE_FRAMES (or --memory-frames=N) is the traceback depth
+## recorded for every allocation.
+##
+MEMORY_PROFILE = False
+MEMORY_PROFILE_FILE = 'plantsitter-memory.txt'
+MEMORY_PROFILE_FRAMES = 10
+MEMORY_PROFILE_PERIOD = 300
+MEMORY_PROFILE_TOP = 20
 
-        # wipe LCD screen before we start
-        self.lcd.clear()
+memoryProfiler = MemoryProfiler(MEMORY_PROFILE_FILE,
+                                frames = MEMORY_PROFILE_FRAMES,
+                                top = MEMORY_PROFILE_TOP)
 
-    ##
-    ## cleanupDisplay - Method used to cleanup the digitalIO lines that
-    ## are used to run the display.
-    ##
-    def cleanupDisplay(self):
-        # Clear the LCD first - otherwise we won't be abe to update it.
-        self.lcd.clear()
-        self.lcd_rs.deinit()
-        self.lcd_en.deinit()
-        self.lcd_d4.deinit()
-        self.lcd_d5.deinit()
-        self.lcd_d6.deinit()
-        self.lcd_d7.deinit()
-        
-    ##
-    ## clear - Convenience method used to clear the display
-    ##
-    def clear(self):
-        self.lcd.clear()
+##
+## All readers share a single sensor sampler. The sampler owns thSensor
+## (or every sensor in SENSORS) and publishes one timestamped
+## (temperature, humidity) snapshot per sensor, which is only refreshed
+## from the I2C bus once it is older than SENSOR_MAX_AGE seconds (see
+## PlantSitterChannels.py). This
+## keeps the LCD, the LEDs and the serial output in agreement and cuts
+## the bus traffic to one sampling cycle per tick.
+##
+## A failed read (e.g. an I2C NACK) is retried on the next tick, and up
+## to SENSOR_MAX_FAILURES failed reads in a row of a sensor are bridged
+## with its last good snapshot. After that the sensor's channels have no
+## reading - their ticks fail and are counted - until a read succeeds.
+##
+SENSOR_MAX_FAILURES = 3
 
-    ##
-    ## updateHumidityScreen - Convenience method used to update the humidity screen message.
-    ##
-    def updateHumidityScreen(self, message):
-        self.lcd.clear()
-        self.lcd.message = message
+if sensors:
+    sampler = MultiSensorSampler(sensors, maxAge = SENSOR_MAX_AGE,
+                                 histogram = sensorReadSeconds,
+                                 maxFailures = SENSOR_MAX_FAILURES)
+else:
+    sampler = SensorSampler(thSensor, maxAge = SENSOR_MAX_AGE,
+                            histogram = sensorReadSeconds,
+                            maxFailures = SENSOR_MAX_FAILURES)
 
-    ## End class ManagedHumidityDisplay definition  
+sensorDevices = [sensor for name, sensor in sensors] or [thSensor]
 
 ##
-## Initialize our displays
+## Initialize our serial connection
 ##
-temperature_screen = ManagedTemperatureDisplay()
-humidity_screen = ManagedHumidityDisplay()
-
-####################################################################################################################
-####################################################################################################################
-####################################################################################################################
-#####  _______                                  _                  __  __            _     _              ##########
-##### |__   __|                                | |                |  \/  |          | |   (_)             ##########
-#####    | | ___ _ __ ___  _ __   ___ _ __ __ _| |_ _   _ _ __ ___| \  / | __ _  ___| |__  _ _ __   ___   ##########
-#####    | |/ _ \ '_ ` _ \| '_ \ / _ \ '__/ _` | __| | | | '__/ _ \ |\/| |/ _` |/ __| '_ \| | '_ \ / _ \  ##########
-#####    | |  __/ | | | | | |_) |  __/ | | (_| | |_| |_| | | |  __/ |  | | (_| | (__| | | | | | | |  __/  ##########
-#####    |_|\___|_| |_| |_| .__/ \___|_|  \__,_|\__|\__,_|_|  \___|_|  |_|\__,_|\___|_| |_|_|_| |_|\___|  ##########
-#####                     | |                                                                             ##########
-#####                     |_|                                                                             ##########
-#####                                                                                                     ##########
-####################################################################################################################
-####################################################################################################################
-####################################################################################################################
+## The port is opened on first use with no parity, one stop bit, 8-bit
+## bytes and a 1-second timeout.
+##
+ser = hal.serialPort(port = '/dev/ttyS0',   # This would be /dev/ttyAM0 prior to Raspberry Pi 3
+                     baudrate = 115200)     # This sets the speed of the serial interface in
+                                            # bits/second
 
 ##
-## TemperatureMachine - This is our StateMachine implementation class.
-## The purpose of this state machine is to manage the states
-## handled by our thermostat:
+## Serial reporting
 ##
-##  off
-##  heat
-##  cool
+## All output to the UART goes through a single writer thread so that
+## messages from the two state machines can never interleave.
 ##
+## SERIAL_FORMAT selects between the original free text messages
+## ('text') and compact, CRC protected binary frames ('binary') - see
+## TelemetryProtocol.py. SERIAL_REPORT_PERIOD (see PlantSitterChannels.py)
+## is the number of seconds between reports of each state machine.
 ##
-class TemperatureMachine(StateMachine):
-    "A state machine designed to manage the temperature"
+SERIAL_FORMAT = 'text'
 
-    ##
-    ## Define the three states for our machine.
-    ##
-    ##  off - nothing lit up
-    ##  red - only red LED fading in and out
-    ##  blue - only blue LED fading in and out
-    ##
-    off = State(initial = True)
-    heat = State()
-    cool = State()
+serialWriter = LazyDevice(lambda: SerialWriter(ser, histogram = serialWriteSeconds),
+                          'serialWriter')
 
-    ##
-    ## Default temperature setPoint is 72 degrees Fahrenheit
-    ##
-    setPoint = 72
+##
+## Database logging - when enabled, every sensor snapshot is queued to a
+## long-lived ReductStore writer which flushes it in batches. The writers
+## keep one connection open each and create their bucket once at startup.
+##
+DB_LOGGING = False
 
-    ##
-    ## These variables enable a safety feature which 
-    ## sets a maximum and minimum target temperature
-    ##
-    maxSetPoint = 95
-    minSetPoint = 60
+DB_BATCH_SIZE = 50          # Flush after this many queued samples
+DB_FLUSH_INTERVAL = 5.0     # ... or after this many seconds
 
+##
+## createDatabaseWriters - One batched ReductStore writer per channel, by
+## channel name
+##
+def createDatabaseWriters():
+    ##
+    ## Batched ReductStore writer - only imported when database logging
+    ## is enabled (it pulls in asyncio, and reduct once started)
+    ##
+    with startup.measure('import', 'ReductWriter'):
+        from ReductWriter import ReductWriter
+
+    return {
+        'temperature': ReductWriter("http://192.168.8.176:8383/",
+                                    "temperature--token",
+                                    "temperature-bucket",
+                                    batchSize = DB_BATCH_SIZE,
+                                    flushInterval = DB_FLUSH_INTERVAL),
+        'humidity': ReductWriter("http://192.168.8.176:8384/",
+                                 "humidity-token",
+                                 "humidity-bucket",
+                                 batchSize = DB_BATCH_SIZE,
+                                 flushInterval = DB_FLUSH_INTERVAL),
+    }
 
-    ##
-    ## cycle - event that provides the state machine behavior
-    ## of transitioning between the three states of our 
-    ## thermostat
-    ##
-    cycle = (
-        off.to(heat) |
-        heat.to(cool) |
-        cool.to(off)
-    )
+##
+## Database writer of each channel, by channel name
+##
+databaseWriters = createDatabaseWriters() if DB_LOGGING else {}
 
-    cycle_heat_to_cool = (
-        heat.to(cool)
-    )
+##
+## Local history - every sampling tick appends one compact record (time,
+## temperature, humidity, both machine states and both setpoints) to a
+## fixed size, memory-mapped ring file. The file keeps the newest
+## HISTORY_CAPACITY records (one week at 1 Hz is about 14 MB) and
+## survives restarts. Set HISTORY_FILE to None to disable it.
+##
+HISTORY_FILE = 'plantsitter-history.ring'
+HISTORY_CAPACITY = 7 * 24 * 60 * 60
 
-    cycle_cool_to_heat = (
-        cool.to(heat)
-    )
+history = None
+if HISTORY_FILE is not None:
+    history = LazyDevice(lambda: HistoryRing(HISTORY_FILE, capacity = HISTORY_CAPACITY),
+                         'history')
 
-    cycle_cool_to_off = (
-        cool.to(off)
-    )
+##
+## Rollups - minute, hour and day min/max/mean/count and time-in-state
+## summaries of both machines, updated on every tick. Closed buckets are
+## appended to ROLLUP_FILE. Set ROLLUP_FILE to None to keep them in
+## memory only.
+##
+## The time between two ticks is credited to the state of the first one,
+## up to ROLLUP_GAP_FACTOR times the longest tick interval (at least
+## Rollups.MAX_GAP); a longer gap is an outage.
+##
+ROLLUP_FILE = 'plantsitter-rollups.bin'
+ROLLUP_GAP_FACTOR = 1.5
 
-    cycle_off_to_heat = (
-        off.to(heat)
-    )
+##
+## rollupMaxGap - Longest gap between two ticks credited to a state
+##
+def rollupMaxGap():
+    interval = controlEngine.displayPeriod
+    if ADAPTIVE_SAMPLING:
+        interval = max(interval, SAMPLE_MAX_INTERVAL)
+    return max(MAX_GAP, interval * ROLLUP_GAP_FACTOR)
 
-    cycle_off_to_cool = (
-        off.to(cool)
-    )
+def createRollups():
+    engine = RollupEngine(ROLLUP_FILE, maxGap = rollupMaxGap())
+    for config in CHANNELS:
+        engine.addChannel(config.channel, config.states)
+    return engine
 
-    ##
-    ## on_enter_heat - Action performed when the state machine transitions
-    ## into the 'heat' state
-    ##
-    def on_enter_heat(self):
-        ##
-        ## Pulse the red indicator light upon entering 
-        ## the 'heat' state. 
-        redLight.pulse()
+rollups = LazyDevice(createRollups, 'rollups')
 
-        if(DEBUG):
-            print("* Changing state to heat")
+##
+## Our four LEDs:
+## GPIO 18
+## GPIO 23
+## GPIO 21
+## GPIO 20
+##
+## The LEDs do not run their own fade threads. A single compositor
+## thread renders all four at LED_FRAME_RATE frames per second from
+## precomputed fade tables, only while one of them is pulsing, and
+## ignores repeated requests for the effect an LED already shows.
+##
+LED_FRAME_RATE = 25
 
-    ##
-    ## on_exit_heat - Action performed when the statemachine transitions
-    ## out of the 'heat' state.
-    ##
-    def on_exit_heat(self):
-        ##
-        ## Turn off the red indicator light upon exiting 
-        ## the heat state.
-        redLight.off()
+ledCompositor = LedCompositor(LED_FRAME_RATE)
 
-    ##
-    ## on_enter_cool - Action performed when the state machine transitions
-    ## into the 'cool' state
-    ##
-    def on_enter_cool(self):
-        ##
-        ## Pulse the blue indicator light upon entering 
-        ## the 'cool' state.
-        blueLight.pulse()
+redLight = ledCompositor.attach(hal.led(18), 'red')
+blueLight = ledCompositor.attach(hal.led(23), 'blue')
+yellowLight = ledCompositor.attach(hal.led(21), 'yellow')
+greenLight = ledCompositor.attach(hal.led(20), 'green')
 
-        if(DEBUG):
-            print("* Changing state to cool")
+##
+## Setup the GPIO lines shared by both displays. The two displays are
+## wired to the same RS and D4-D7 lines and only differ by their enable
+## line, so one LcdBus owns the shared lines and serializes all the
+## traffic to both screens.
+##
+## This leverages the digitalio class to handle digital 
+## outputs on the GPIO lines. There is also an analagous
+## class for analog IO.
+##
+## You need to make sure that the port mappings match the
+## physical wiring of the display interface to the 
+## GPIO interface.
+##
+## compatible with all versions of RPI as of Jan. 2019
+##
+lcdBus = LazyDevice(lambda: LcdBus(hal.digitalOutput('D17'),  # RS
+                                   hal.digitalOutput('D5'),   # D4
+                                   hal.digitalOutput('D6'),   # D5
+                                   hal.digitalOutput('D13'),  # D6
+                                   hal.digitalOutput('D26'),  # D7
+                                   lcdFactory = hal.lcdFactory(),
+                                   histogram = lcdRenderSeconds),
+                    'lcdBus')
 
-    ##
-    ## on_exit_cool - Action performed when the statemachine transitions
-    ## out of the 'cool' state.
-    ##
-    def on_exit_cool(self):
-        ##
-        ## Turn off the blue indicator light upon exiting 
-        ## the 'cool' state.
-        blueLight.off()
+##
+## ManagedDisplay - Class intended to manage one 16x2 Display
+##
+## This code is largely taken from the work done in module 4, and
+## converted into a class so that we can more easily consume the
+## operational capabilities. Every display sits on the shared LCD bus
+## and is selected by its own enable line.
+##
+class ManagedDisplay():
+    "A 16x2 character LCD on the shared LCD bus"
 
     ##
-    ## on_enter_off - Action performed when the state machine transitions
-    ## into the 'off' state
-    ##
-    def on_enter_off(self):
-        ##
-        ## Turn off all lights upon entering the off state.
-        redLight.off()
-        blueLight.off()
-
-        if(DEBUG):
-            print("* Changing state to off")
-
-   ##
-    ## processTempIncButton - Utility method used to update the 
-    ## setPoint for the temperature. This will increase the setPoint
-    ## by a single degree. This is triggered by the button_pressed event
-    ## handler for our second button
-    ##
-    def processTempIncButton(self):
-
-        if(DEBUG):
-            print("Increasing Set Point (Temperature)")
-
-        ##
-        ## Update the setPoint of the thermostat and the status lights
-        ## within the circuit.
-        # If the setPoint is less than the maximum set point, 
-        if (self.setPoint < self.maxSetPoint):
-            # then increment the setPoint by 1
-            self.setPoint = self.setPoint + 1
-
+    ## Class Initialization method to setup the display
     ##
-    ## processTempDecButton - Utility method used to update the 
-    ## setPoint for the temperature. This will decrease the setPoint
-    ## by a single degree. This is triggered by the button_pressed event
-    ## handler for our third button
+    ##  name      - display name, used for logging and metrics
+    ##  enablePin - GPIO line of the enable input of this display
     ##
+    def __init__(self, name, enablePin):
+        self.name = name
+        self.lcd_en = hal.digitalOutput(enablePin)
 
-    def processTempDecButton(self):
+        # Modify this if you have a different sized character LCD
+        self.lcd_columns = 16
+        self.lcd_rows = 2
 
-        if(DEBUG):
-            print("Decreasing Set Point (Temperature)")
+        ## Update timer of this display
+        self.updateSeconds = displayUpdateSeconds.labels(name)
 
         ##
-        ## Update the setPoint of the thermostat and the status lights
-        ## within the circuit.
-        # If the setPoint is greater than the minimum set point,
-        if (self.setPoint > self.minSetPoint):
-            # then decrease the set point by 1
-            self.setPoint = self.setPoint - 1
+        ## Initialise the lcd on first use. The bus wipes the LCD screen
+        ## before we start and afterwards only sends the cells that changed.
+        self.lcd = LazyDevice(lambda: lcdBus.attach(self.lcd_en, self.lcd_columns, self.lcd_rows),
+                              name + 'Lcd')
 
     ##
-    ## updateDBTemperature - this method updates our database with a timestamped temperature reading
-    ##
-#    async def updateDBTemperature(self):
-#        current_temperature = floor(self.getFahrenheit())
-#        date_and_time = str(datetime.now().strftime('%b %d  %H:%M:%S\n'))
-#        # Create a ReductStore client object
-#        async with Client("http://192.168.8.176:8383/", api_token="temperature--token") as client:
-#            bucket = await client.create_bucket(
-#                "temperature-bucket",
-#                BucketSettings(quota_type=QuotaType.FIFO, quota_size=1_000_000_000),
-#                exist_ok=True,
-#             )
-# 
-#            await bucket.write(current_temperature, timestamp=date_and_time)
-# 
-#            if(DEBUG):
-#                print("-- WRITING DATA TO TEMPERATURE BUCKET --") 
-
-    ##
-    ## updateLights - Utility method to update the LED indicators on the 
-    ## Thermostat
+    ## cleanupDisplay - Method used to cleanup the digitalIO lines that
+    ## are used to run the display.
     ##
-    def updateLights(self):
-        ## Make sure we are comparing temperatures in the correct scale
-        current_temperature = floor(self.getFahrenheit())
-        redLight.off()
-        blueLight.off()
-    
-        ## Verify values for debug purposes
-        if(DEBUG):
-            print(f"State: {self.current_state.id}")
-            print(f"Target Temperature: {self.setPoint}")
-            print(f"Actual Temperature: {current_temperature}")
-
-        # Determine visual identifiers
-
-        # If the current state is off,
-        if (self.current_state.id == 'off'):
-            # if the setPoint is greater 
-            # than the current temperature,
-            if (self.setPoint > current_temperature):
-                # enter the heat state. 
-                self.on_enter_heat()
-                self.send("cycle_off_to_heat")
-            
-            # Otherwise, if the SetPoint is less 
-            # than the current temperature,
-            elif (self.setPoint < current_temperature):
-                # enter the cool state.
-                self.on_enter_cool()
-                self.send("cycle_off_to_cool")
-
-        # Otherwise (if the current state is not off),
-        else:
-            # if the current state is cool,
-            if (self.current_state.id == 'cool'):
-                # if the setPoint is greater 
-                # than the current temperature,
-                if (self.setPoint > current_temperature):
-                    # then transition from cool
-                    # state to heat state.
-                    self.on_exit_cool()
-                    self.on_enter_heat()
-                    self.send("cycle_cool_to_heat")
-            # if the current state is heat,
-            if (self.current_state.id == 'heat'):
-                # if the setPoint is less than 
-                # the current temperature,
-                if (self.setPoint < current_temperature):
-                    # then transition from heat
-                    # state to cool state.
-                    self.on_exit_heat()
-                    self.on_enter_cool()
-                    self.send("cycle_heat_to_cool")
+    def cleanupDisplay(self):
+        # Clear the LCD first - otherwise we won't be abe to update it.
+        if isBuilt(self.lcd):
+            self.lcd.close()
 
     ##
-    ## run - kickoff the display management functionality of the thermostat
+    ## clear - Convenience method used to clear the display
     ##
-    def run(self):
-        temperatureDisplayThread = Thread(target=self.processTemperatureData,)
-        temperatureDisplayThread.start()
-#        temperatureDBThread = Thread(target=asyncio.run(self.updateDBTemperature()),)
-#        temperatureDBThread.start()
+    def clear(self):
+        self.lcd.clear()
 
     ##
-    ## Get the temperature in Fahrenheit
+    ## show - Convenience method used to update the screen message.
     ##
-    def getFahrenheit(self):
-        t = thSensor.temperature
-        return (((9/5) * t) + 32)
-    
-    ##
-    ##  Configure output string for the Thermostat Server
-    ##
-    def setupSerialOutput(self):
-        ##
-        ## The following output string will be sent to the 
-        ## TemperatureServer over the Serial Port (UART)
-        output = "State: " + str(self.current_state.id) + ", \nCurrent Temp: " + str(self.getFahrenheit()) + ", \nTarget Temp: " + str(self.setPoint)
+    def show(self, message):
+        with self.updateSeconds.time():
+            self.lcd.show(message)
 
-        return output
-    
-    ## Continue display output
-    endDisplay = False
-
-    ##
-    ##  This function is designed to manage the LCD Display and 
-    ##  store timestamped temperatuyre data to the database.
+    ## End class ManagedDisplay definition
 
-    ##
-    def processTemperatureData(self):
-        counter = 1
-        altCounter = 1
-        while not self.endDisplay:
-            ## Only display if the DEBUG flag is set
-            if(DEBUG):
-                print("Processing Temperature Display Info...")
-    
-            ## Grab the current time        
-            current_time = str(datetime.now())
-    
-            ## Setup display line 1
-
-            ##
-            ## Setup the first line of the LCD display to incude the 
-            ## current date and time.
-            lcd_line_1 = datetime.now().strftime('%b %d  %H:%M:%S\n')
-    
-            ## Setup Display Line 2
-            if(altCounter < 6):
-
-                ##
-                ## Setup the second line of the LCD display to incude the 
-                # current temperature in degrees Fahrenheit. 
-                temperature_string = str(round(tsm.getFahrenheit(), 2))
-                line_string = ' Current: ' + temperature_string           
-                
-                lcd_line_2 = line_string
-    
-                altCounter = altCounter + 1
-
-            else:
-                state_string = str(self.current_state.id).capitalize()
-                set_point_string = str(self.setPoint)
-                line_string = ' ' + state_string + ' | Set: ' + set_point_string
-                ##
-                ## Setup the second line of the LCD display to incude the 
-                ## current state of the thermostat and the current 
-                ## temperature setpoint in degrees Fahrenheit. 
-                lcd_line_2 = line_string
-    
-                altCounter = altCounter + 1
-                if(altCounter >= 11):
-                    # Run the routine to update the lights every 10 seconds
-                    # to keep operations smooth
-                    self.updateLights()
-                    altCounter = 1
-
-            ## Update Display
-            temperature_screen.updateTemperatureScreen(lcd_line_1 + lcd_line_2)
-
-            ## Update server every 30 seconds
-            if(DEBUG):
-               print(f"TemperatureStateMachine Counter: {counter}")
-            if((counter % 30) == 0):
-                ##
-                ## Send our current state information to the 
-                ## TemperatureServer over the Serial Port (UART). 
-                ser.write(tsm.setupSerialOutput().encode())
-#                asyncio.run(self.updateDBTemperature())
-
-                counter = 1
-            else:
-                counter = counter + 1
-
-            sleep(1)
-
-        ## Cleanup display
-        temperature_screen.cleanupDisplay()
-
-    ## End class TemperatureMachine definition
+##
+## Initialize our displays
+##
+temperature_screen = ManagedDisplay('temperature', 'D8')
+humidity_screen = ManagedDisplay('humidity', 'D7')
 
 #################################################################################################################
-#################################################################################################################
-#################################################################################################################
-#####  _    _                 _     _ _ _         __  __            _     _             #########################
-##### | |  | |               (_)   | (_) |       |  \/  |          | |   (_)            #########################
-##### | |__| |_   _ _ __ ___  _  __| |_| |_ _   _| \  / | __ _  ___| |__  _ _ __   ___  #########################
-##### |  __  | | | | '_ ` _ \| |/ _` | | __| | | | |\/| |/ _` |/ __| '_ \| | '_ \ / _ \ #########################
-##### | |  | | |_| | | | | | | | (_| | | |_| |_| | |  | | (_| | (__| | | | | | | |  __/ #########################
-##### |_|  |_|\__,_|_| |_| |_|_|\__,_|_|\__|\__, |_|  |_|\__,_|\___|_| |_|_|_| |_|\___| #########################
-#####                                        __/ |                                      #########################
-#####                                       |___/                                       #########################
-#################################################################################################################
-#################################################################################################################
-#################################################################################################################
+##
+## Control channels
+##
+## Air temperature and soil humidity are two rows of one channel table.
+## Each row names the reading, the setpoint limits, the three states and
+## the LEDs, display and buttons of the channel (see ControlChannel.py),
+## and a single ControlEngine drives every row from one scheduler. Adding
+## a zone is adding a row.
+##
+##  temperature - off / heat (red LED) / cool (blue LED), in Fahrenheit
+##  humidity    - off / dry (yellow LED) / hum (green LED), in percent
+##
 #################################################################################################################
 
+##
+## readFahrenheit - The temperature in Fahrenheit from the shared snapshot
+##
+def readFahrenheit():
+    with temperatureGetSeconds.time():
+        t = sampler.getSnapshot().temperature
+    return (((9/5) * t) + 32)
 
-class HumidityMachine(StateMachine):
-    "A state machine designed to manage soil humidity"
+##
+## readHumidity - The humidity from the shared snapshot
+##
+def readHumidity():
+    with humidityGetSeconds.time():
+        h = sampler.getSnapshot().humidity
+    return h
 
-    ##
-    ## Define the three states for our machine.
-    ##
-    ##  off
-    ##  dry
-    ##  hum
-    ##
-    off = State(initial = True)
-    dry = State()
-    hum = State()
+##
+## The rows of PlantSitterChannels.py, which also set the reading filter
+## of each channel (see SensorFilter.py), with their devices
+##
+TEMPERATURE_CHANNEL = PlantSitterChannels.TEMPERATURE_CHANNEL._replace(
+    read = readFahrenheit,
+    lights = {'heat': redLight, 'cool': blueLight},
+    display = temperature_screen,
+    buttons = (25, 12))             # Red button up, blue button down
 
-    ##
-    ## Default humidity setPoint is defined here
-    ##
-    setPoint = 40
+HUMIDITY_CHANNEL = PlantSitterChannels.HUMIDITY_CHANNEL._replace(
+    read = readHumidity,
+    lights = {'dry': yellowLight, 'hum': greenLight},
+    display = humidity_screen,
+    buttons = (24, 16))
 
-    ##
-    ## These variables enable a safety feature which 
-    ## sets a maximum and minimum target humidity level
-    ##
-    maxSetPoint = 100
-    minSetPoint = 10
+CHANNELS = [TEMPERATURE_CHANNEL, HUMIDITY_CHANNEL]
 
+##
+## Adaptive sampling (see AdaptiveSampling.py). When ADAPTIVE_SAMPLING is
+## set, the readings, the LCD updates and the history records follow the
+## interval chosen by the SAMPLE_* policy of PlantSitterChannels.py,
+## between SAMPLE_MIN_INTERVAL and SAMPLE_MAX_INTERVAL seconds. The LCD
+## clock then also advances in steps of the interval.
+##
+ADAPTIVE_SAMPLING = False
 
-    ##
-    ## cycle - event that provides the state machine behavior
-    ## of transitioning between the three states of our 
-    ## thermostat
-    ##
-    cycle = (
-        off.to(dry) |
-        dry.to(hum) |
-        hum.to(off)
-    )
+##
+## One engine for every channel: a reading and a display update every
+## second (or at the adaptive interval), a control decision every
+## DECISION_PERIOD seconds and a serial report every SERIAL_REPORT_PERIOD
+## seconds.
+##
+controlEngine = ControlEngine(displayPeriod = 1, decisionPeriod = DECISION_PERIOD,
+                              reportPeriod = SERIAL_REPORT_PERIOD)
 
-    cycle_dry_to_hum = (
-        dry.to(hum)
-    )
+for config in CHANNELS:
+    controlEngine.addChannel(config)
 
-    cycle_hum_to_dry = (
-        hum.to(dry)
-    )
+temperatureChannel = controlEngine.byName['temperature']
+humidityChannel = controlEngine.byName['humidity']
 
-    cycle_hum_to_off = (
-        hum.to(off)
-    )
+sampling = None
+if ADAPTIVE_SAMPLING:
+    sampling = AdaptiveInterval(SAMPLE_MIN_INTERVAL, SAMPLE_MAX_INTERVAL,
+                                nearDistances = SAMPLE_NEAR_DISTANCES,
+                                maxRates = SAMPLE_MAX_RATES)
+    controlEngine.sampling = sampling
 
-    cycle_off_to_dry = (
-        off.to(dry)
-    )
+##
+## logReading - Add a channel reading to the rollups and queue it for
+## the database (never blocks).
+##
+def logReading(channel, when, value):
+    rollups.update(channel.config.channel, when, value, channel.state)
 
-    cycle_off_to_hum = (
-        off.to(hum)
-    )
+    writer = databaseWriters.get(channel.name)
+    if writer is not None:
+        writer.write(channel.name, round(value, 2), int(when * 1_000_000))
 
-    ##
-    ## on_enter_heat - Action performed when the state machine transitions
-    ## into the 'heat' state
-    ##
-    def on_enter_dry(self):
-        ##
-        ## Pulse the yellow indicator light upon entering 
-        ## the 'dry' state. 
-        yellowLight.pulse()
+##
+## countTransition - Time and count every state transition
+##
+def countTransition(channel, source, target, seconds):
+    transitionSeconds.labels(channel.name).observe(seconds)
+    transitionsTotal.labels(channel.name, target).inc()
 
-        if(DEBUG):
-            print("* Changing state to dry")
+##
+## sendReport - Send the state information of a channel to its server
+## over the Serial Port (UART).
+##
+def sendReport(channel, when, value):
+    if SERIAL_FORMAT == 'binary':
+        serialWriter.send(channel.serialFrame(value, when))
+    else:
+        serialWriter.send(channel.serialText(value).encode())
 
-    ##
-    ## on_exit_heat - Action performed when the statemachine transitions
-    ## out of the 'heat' state.
-    ##
-    def on_exit_dry(self):
-        ##
-        ## Turn off the yellow indicator light upon exiting 
-        ## the dry state.
-        yellowLight.off()
+controlEngine.sampleHandlers.append(logReading)
+controlEngine.reportHandler = sendReport
+for channel in controlEngine.channels:
+    channel.listeners.append(countTransition)
 
-    ##
-    ## on_enter_hum - Action performed when the state machine transitions
-    ## into the 'hum' state
-    ##
-    def on_enter_hum(self):
-        ##
-        ## Pulse the green indicator light upon entering 
-        ## the 'hum' state.
-        greenLight.pulse()
+##
+## recordHistory - Append the current readings, states and setpoints of
+## both channels to the local history ring after every tick. The raw
+## sensor readings are kept, ahead of the channel filters, so recorded
+## traces can be replayed through other filter settings.
+##
+def recordHistory(when):
+    if history is None:
+        return
 
-        if(DEBUG):
-            print("* Changing state to hum")
+    snapshot = sampler.getSnapshot()
+    history.append(snapshot.timestamp.timestamp(),
+                   ((9/5) * snapshot.temperature) + 32, snapshot.humidity,
+                   temperatureChannel.state, humidityChannel.state,
+                   temperatureChannel.setPoint, humidityChannel.setPoint)
 
-    ##
-    ## on_exit_hum - Action performed when the statemachine transitions
-    ## out of the 'hum' state.
-    ##
-    def on_exit_hum(self):
-        ##
-        ## Turn off the green indicator light upon exiting 
-        ## the 'hum' state.
-        greenLight.off()
+controlEngine.tickHandlers.append(recordHistory)
 
-    ##
-    ## on_enter_off - Action performed when the state machine transitions
-    ## into the 'off' state
-    ##
-    def on_enter_off(self):
-        ##
-        ## Turn off all lights upon entering the off state.
-        yellowLight.off()
-        greenLight.off()
-
-        if(DEBUG):
-            print("* Changing state to off")
-
-   ##
-    ## processHumIncButton - Utility method used to update the 
-    ## setPoint for the humidity. This will increase the setPoint
-    ## by a single degree. This is triggered by the button_pressed event
-    ## handler for our second button
-    ##
-    def processHumIncButton(self):
+##
+## collectDeviceStats - Metrics collector for the statistics the sampler,
+## the serial writer and the LCD bus already keep. Devices that have
+## not been brought up yet are left out.
+##
+def collectDeviceStats():
+    families = [
+        ('plantsitter_sensor_reads_total', 'counter',
+         'Reads of the temperature/humidity sensor.', [({}, sampler.reads)]),
+        ('plantsitter_i2c_errors_total', 'counter',
+         'Sensor reads that failed on the I2C bus.', [({}, sampler.errors)]),
+    ]
+
+    if sensors:
+        families.append(('plantsitter_sensor_errors_total', 'counter',
+                         'Failed reads, by sensor.',
+                         [({'sensor': name}, count) for name, count in sampler.sensorErrors.items()]))
+        families.append(('plantsitter_sensor_cycles_total', 'counter',
+                         'Sampling cycles over every sensor.', [({}, sampler.cycles)]))
+
+    ## Periodic mode: the background conversions or the SHT31 fetches
+    sensorStats = getattr(thSensor, 'getStats', None) if isBuilt(thSensor) else None
+    if sensorStats is not None:
+        stats = sensorStats()
+        families.append(('plantsitter_sensor_conversion_errors_total', 'counter',
+                         'Failed background conversions, or periodic fetches the sensor did not acknowledge.',
+                         [({}, stats['errors'])]))
+        families.append(('plantsitter_sensor_stale_reads_total', 'counter',
+                         'Reads refused because the latest periodic result was too old.',
+                         [({}, stats['stale'])]))
+        if stats['age'] is not None:
+            families.append(('plantsitter_sensor_result_age_seconds', 'gauge',
+                             'Age of the latest periodic result.', [({}, stats['age'])]))
+
+    if isBuilt(serialWriter):
+        stats = serialWriter.getStats()
+        families.append(('plantsitter_serial_bytes_total', 'counter',
+                         'Bytes written to the serial port.', [({}, stats['bytes'])]))
+        families.append(('plantsitter_serial_errors_total', 'counter',
+                         'Failed serial port writes.', [({}, stats['errors'])]))
+        families.append(('plantsitter_serial_dropped_total', 'counter',
+                         'Messages dropped while the serial queue was full.',
+                         [({}, stats['dropped'])]))
+        families.append(('plantsitter_serial_queue_depth', 'gauge',
+                         'Messages waiting for the serial writer.', [({}, stats['queueDepth'])]))
+
+    filters = [channel for channel in controlEngine.channels if channel.filter is not None]
+    if filters:
+        families.append(('plantsitter_filter_rejected_total', 'counter',
+                         'Readings dropped by the reading filter, by channel.',
+                         [({'channel': channel.name}, channel.filter.rejected)
+                          for channel in filters]))
+
+    families.append(('plantsitter_setpoint_changes_total', 'counter',
+                     'Setpoint changes made with the buttons.',
+                     [({}, controlEngine.setPointEvents)]))
+    families.append(('plantsitter_setpoint_updates_total', 'counter',
+                     'Re-evaluations applying one or more setpoint changes.',
+                     [({}, controlEngine.setPointUpdates)]))
+
+    if sampling is not None:
+        stats = sampling.getStats()
+        families.append(('plantsitter_sample_interval_seconds', 'gauge',
+                         'Current interval between channel samples.',
+                         [({}, stats['interval'])]))
+        families.append(('plantsitter_sample_interval_ticks_total', 'counter',
+                         'Ticks, by the reason of the interval that followed.',
+                         [({'reason': reason}, count)
+                          for reason, count in stats['reasons'].items()]))
+
+    stats = ledCompositor.getStats()
+    families.append(('plantsitter_led_frames_total', 'counter',
+                     'Frames rendered by the LED compositor.', [({}, stats['frames'])]))
+    families.append(('plantsitter_led_writes_total', 'counter',
+                     'LED brightness changes written to the pins.', [({}, stats['writes'])]))
+    families.append(('plantsitter_led_effects_deduplicated_total', 'counter',
+                     'LED effect requests ignored because the effect was already shown.',
+                     [({}, stats['deduplicated'])]))
+
+    if isBuilt(lcdBus):
+        stats = lcdBus.getStats()
+        families.append(('plantsitter_lcd_frames_total', 'counter',
+                         'Frames drawn on the LCDs.', [({}, stats['frames'])]))
+        families.append(('plantsitter_lcd_errors_total', 'counter',
+                         'Failed LCD commands.', [({}, stats['errors'])]))
+        families.append(('plantsitter_lcd_queue_depth', 'gauge',
+                         'Commands waiting for the LCD bus.', [({}, stats['queueDepth'])]))
+
+    return families
+
+metrics.addCollector(collectDeviceStats)
 
-        if(DEBUG):
-            print("Increasing Set Point (Humidity)")
+##
+## collectServiceStats - Metrics collector for the scheduler jobs, the
+## database writers and the logging pipeline
+##
+def collectServiceStats():
+    families = []
+
+    scheduler = controlEngine.scheduler
+    if scheduler is not None:
+        jobs = list(scheduler.jobs.values())
+        families.append(('plantsitter_job_runs_total', 'counter',
+                         'Runs of every scheduler job.',
+                         [({'job': job.name}, job.runs) for job in jobs]))
+        families.append(('plantsitter_job_errors_total', 'counter',
+                         'Scheduler job runs that raised, by job.',
+                         [({'job': job.name}, job.errors) for job in jobs]))
+
+    if loggingPipeline is not None:
+        stats = loggingPipeline.getStats()
+        families.append(('plantsitter_log_records_dropped_total', 'counter',
+                         'Log records dropped because the log queue was full.',
+                         [({}, stats['dropped'])]))
+        families.append(('plantsitter_log_queue_depth', 'gauge',
+                         'Log records waiting for the log writer.', [({}, stats['queueDepth'])]))
+
+    if databaseWriters:
+        stats = [({'channel': name}, writer.getStats()) for name, writer in databaseWriters.items()]
+        families.append(('plantsitter_database_written_total', 'counter',
+                         'Samples written to the database, by channel.',
+                         [(labels, writerStats['written']) for labels, writerStats in stats]))
+        families.append(('plantsitter_database_dropped_total', 'counter',
+                         'Samples dropped because the database queue was full, by channel.',
+                         [(labels, writerStats['dropped']) for labels, writerStats in stats]))
+        families.append(('plantsitter_database_errors_total', 'counter',
+                         'Failed database connections and writes, by channel.',
+                         [(labels, writerStats['errors']) for labels, writerStats in stats]))
+        families.append(('plantsitter_database_queue_depth', 'gauge',
+                         'Samples waiting for the database writer, by channel.',
+                         [(labels, writerStats['queueDepth']) for labels, writerStats in stats]))
+        families.append(('plantsitter_database_connected', 'gauge',
+                         'Whether the database writer is connected, by channel.',
+                         [(labels, int(writerStats['connected'])) for labels, writerStats in stats]))
+
+    return families
+
+metrics.addCollector(collectServiceStats)
 
-        ##
-        ## Update the setPoint of the thermostat and the status lights
-        ## within the circuit.
-        # If the setPoint is less than the maximum set point, 
-        if (self.setPoint < self.maxSetPoint):
-            # then increment the setPoint by 1
-            self.setPoint = self.setPoint + 1
+##
+## exportMetrics - Write the metrics to the node_exporter textfile
+##
+def exportMetrics():
+    if METRICS_FILE is not None:
+        metrics.writeTextfile(METRICS_FILE)
 
-    ##
-    ## processHumDecButton - Utility method used to update the 
-    ## setPoint for the humidity. This will decrease the setPoint
-    ## by a single degree. This is triggered by the button_pressed event
-    ## handler for our third button
-    ##
+##
+## addServiceJobs - The jobs that are not part of any channel: the
+## metrics export and the memory snapshots. The local history is
+## recorded by the engine after every tick.
+##
+def addServiceJobs(scheduler):
+    ## Export the metrics of every channel
+    scheduler.addJob("metrics", METRICS_PERIOD, exportMetrics,
+                     offset = METRICS_PERIOD)
 
-    def processHumDecButton(self):
+    ## Memory snapshots (does nothing unless profiling is on)
+    scheduler.addJob("memory", MEMORY_PROFILE_PERIOD, memoryProfiler.snapshot,
+                     offset = MEMORY_PROFILE_PERIOD)
 
-        if(DEBUG):
-            print("Decreasing Set Point (Humidity)")
+##
+## wireButtons - Connect the setpoint buttons of every channel. 'wrap'
+## optionally wraps every handler, e.g. to hand it over to the event
+## loop. A press only moves the setpoint; the engine re-evaluates the
+## channel and refreshes its display a few tens of milliseconds later.
+## The buttons are returned so they stay referenced.
+##
+def wireButtons(wrap = None):
+    buttons = []
+    for channel in controlEngine.channels:
+        if channel.config.buttons is None:
+            continue
+        incPin, decPin = channel.config.buttons
+        for pin, handler in ((incPin, channel.increaseSetPoint),
+                             (decPin, channel.decreaseSetPoint)):
+            button = hal.button(pin)
+            button.when_pressed = handler if wrap is None else wrap(handler)
+            buttons.append(button)
+    return buttons
 
-        ##
-        ## Update the setPoint of the thermostat and the status lights
-        ## within the circuit.
-        # If the setPoint is greater than the minimum set point,
-        if (self.setPoint > self.minSetPoint):
-            # then decrease the set point by 1
-            self.setPoint = self.setPoint - 1       
-
-#    ##
-#    ## updateDBHumidity - this method updates our database with a timestamped temperature reading
-#    ##
-#    async def updateDBHumidity(self):
-#        current_humidity = str(round(hsm.getHumidity(), 2))
-#        date_and_time = str(datetime.now().strftime('%b %d  %H:%M:%S\n'))
-#        # Create a ReductStore client object
-#        async with Client("http://192.168.8.176:8384/", api_token="humidity-token") as client:
-#            bucket = await client.create_bucket(
-#                "humidity-bucket",
-#                BucketSettings(quota_type=QuotaType.FIFO, quota_size=1_000_000_000),
-#                exist_ok=True,
-#            )    
-#            await bucket.write(current_humidity, timestamp=date_and_time)  
-#            if(DEBUG):
-#                print("-- WRITING DATA TO HUMIDITY BUCKET --")  
+##
+## shutdown - Close the displays, flush the writers, the history and the
+## rollups, and write the metrics one last time.
+##
+def shutdown():
+    ## Close down the displays
+    for channel in controlEngine.channels:
+        if channel.config.display is not None:
+            channel.config.display.cleanupDisplay()
 
-    ##
-    ## updateLights - Utility method to update the LED indicators on the 
-    ## Thermostat
-    ##
-    def updateLights(self):
-        
-        hum = floor(self.getHumidity())
-        yellowLight.off()
-        greenLight.off()
-    
-        ## Verify values for debug purposes
-        if(DEBUG):
-            print(f"State: {self.current_state.id}")
-            print(f"Target Humidity: {self.setPoint}")
-            print(f"Actual Humidity: {hum}")
-
-        # Determine visual identifiers
-
-        # If the current state is off,
-        if (self.current_state.id == 'off'):
-            # if the setPoint is greater 
-            # than the current humidity,
-            if (self.setPoint > hum):
-                # enter the dry state. 
-                self.on_enter_dry()
-                self.send("cycle_off_to_dry")
-            
-            # Otherwise, if the SetPoint is less 
-            # than the current humidity,
-            elif (self.setPoint < hum):
-                # enter the hum state.
-                self.on_enter_hum()
-                self.send("cycle_off_to_hum")
-
-        # Otherwise (if the current state is not off),
-        else:
-            # if the current state is hum,
-            if (self.current_state.id == 'hum'):
-                # if the setPoint is greater 
-                # than the current humidity,
-                if (self.setPoint > hum):
-                    # then transition from hum
-                    # state to dry state.
-                    self.on_exit_hum()
-                    self.on_enter_dry()
-                    self.send("cycle_hum_to_dry")
-            # if the current state is dry,
-            if (self.current_state.id == 'dry'):
-                # if the setPoint is less than 
-                # the current humidity,
-                if (self.setPoint < hum):
-                    # then transition from dry
-                    # state to hum state.
-                    self.on_exit_dry()
-                    self.on_enter_hum()
-                    self.send("cycle_dry_to_hum")
+    ## Flush any queued samples to the database
+    for writer in databaseWriters.values():
+        writer.stop()
 
-    ##
-    ## run - kickoff the display management functionality of the thermostat
-    ##
-    def run(self):
-        humidityDisplayThread = Thread(target=self.processHumidityData,)
-        humidityDisplayThread.start()
-#        humidityDBThread = Thread(target=asyncio.run(self.updateDBHumidity()),)
-#        humidityDBThread.start()
+    if isBuilt(serialWriter):
+        serialWriter.close()
 
-    ##
-    ## Get the humidity
-    ##
-    def getHumidity(self):
-        h = thSensor.relative_humidity
-        return h 
-    
-    ##
-    ##  Configure output string for the Thermostat Server
-    ##
-    def setupSerialOutput(self):
-        ##
-        ## The following output string will be sent to the 
-        ## HumidityServer over the Serial Port (UART)
-        output = "State: " + str(self.current_state.id) + ", \nHumidity: " + str(self.getHumidity()) + ", \nTarget Hum: " + str(self.setPoint)
+    ## Stop the LED thread and turn the LEDs off
+    ledCompositor.stop()
 
-        return output
-    
-    ## Continue display output
-    endDisplay = False
+    ## Stop the periodic acquisition of the sensor
+    if SENSOR_MODE == SENSOR_MODE_PERIODIC and isBuilt(thSensor):
+        thSensor.close()
 
-    ##
-    ##  This function is designed to manage the LCD Display and 
-    ##  write wimestamped data to the humidity database.
-    ##
-    def processHumidityData(self):
-        counter = 1
-        altCounter = 1
-        while not self.endDisplay:
-            ## Only display if the DEBUG flag is set
-            if(DEBUG):
-                print("Processing Humidity Display Info...")
-
-            ## Setup Display
-            if(altCounter < 6):
-
-                ##
-                ## Setup the second line of the LCD display to incude the 
-                ## current humidity. 
-                ##
-                humidity_string = " Current: " + str(round(hsm.getHumidity(), 2))
-
-                lcd_line = humidity_string
-    
-                altCounter = altCounter + 1
-
-            else:
-                state_string = str(self.current_state.id).capitalize()
-                set_point_string = str(self.setPoint)
-                line_string = " " + state_string + " | Set: " + set_point_string
-
-                ##
-                ## Setup the second line of the LCD display to incude the 
-                ## current state of the hygrometer and the current 
-                ## humidity setpoint. 
-                lcd_line = line_string
-    
-                altCounter = altCounter + 1
-                if(altCounter >= 11):
-                    # Run the routine to update the lights every 10 seconds
-                    # to keep operations smooth
-                    self.updateLights()
-                    altCounter = 1
-
-            ## Update Display
-            humidity_screen.updateHumidityScreen(lcd_line)
-
-            ## Update server every 30 seconds
-            if(DEBUG):
-               print(f"HumidityStateMachine Counter: {counter}")
-            if((counter % 30) == 0):
-                ##
-                ## Send our current state information to the 
-                ## HumidityServer over the Serial Port (UART). 
-                ser.write(hsm.setupSerialOutput().encode())
-#                asyncio.run(self.updateDBHumidity())
-
-                counter = 1
-            else:
-                counter = counter + 1
-
-            sleep(1)
-
-        ## Cleanup display
-        humidity_screen.cleanupDisplay()
-
-    ## End class HumidityMachine definition
-
-##
-## Create a TemperatureStateMachine object called tsm
-##
-tsm = TemperatureMachine()
-
-##
-## This function sets up and starts a state machine of type TemperatureStateMachine
-##
-def runTemperatureStateMachine():
-    ##
-    ## Setup our Temperature State Machine
-    ##
-    
-    tsm.run()
+    ## Write the history and the open rollups to storage
+    if isBuilt(history):
+        history.close()
+    if isBuilt(rollups):
+        rollups.close()
 
-    ##
-    ## Configure our Red button to use GPIO 25 and to execute
-    ## the function to increase the setpoint by a degree.
-    ##
-    tempIncButton = Button(25)
+    exportMetrics()
+    metrics.stop()
+    memoryProfiler.stop()
 
-    ##
-    ## Change the value of the temperature setpoint when 
-    ## the red button is pushed.
-    tempIncButton.when_pressed = tsm.processTempIncButton
+##
+## runThreadedEngine - Run every channel from one scheduler in the
+## calling thread until the user creates a keyboard interrupt (CTRL-C),
+## then clean up. The buttons call back from the gpiozero thread and only
+## move the setpoints.
+##
+def runThreadedEngine():
+    buttons = wireButtons()
 
     ##
-    ## Configure our Blue button to use GPIO 12 and to execute
-    ## the function to decrease the setpoint by a degree.
-    ##
-    tempDecButton = Button(12)
+    ## Each cadence is a job on a grid of monotonic deadlines, so the
+    ## time spent on I2C, the LCD and the UART does not make the
+    ## loops drift.
     ##
-    ## Change the value of the temperature setpoint when 
-    ## the blue button is pushed.
-    tempDecButton.when_pressed = tsm.processTempDecButton
+    scheduler = DeadlineScheduler()
+    controlEngine.addJobs(scheduler)
+    addServiceJobs(scheduler)
 
-    ##
-    ## Setup loop variable
-    ##
-    repeat = True
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        ## Catch the keyboard interrupt (CTRL-C) and exit cleanly
+        ## we do not need to manually clean up the GPIO pins, the
+        ## gpiozero library handles that process.
+        log.info("Cleaning up. Exiting...")
+    finally:
+        schedulerLog.info("Job statistics:\n%s", scheduler.formatStats())
+        shutdown()
 
-    ##
-    ## Repeat until the user creates a keyboard interrupt (CTRL-C)
-    ##
-    while repeat:
-        try:
-            ## wait
-            sleep(30)
+##
+## bringUpDevices - Bring up every device concurrently, take the first
+## sensor reading and make the first control decision of every channel,
+## so that the plant is looked after as soon as possible after a power
+## cycle. Devices that share a bus or a library are brought up in order
+## within their group.
+##
+## Nothing here stops the start: a device that fails is logged with its
+## timing and built again on first use, and a failed first decision is
+## left to the next tick of the scheduler.
+##
+def bringUpDevices():
+    with startup.measure('step', 'bring up devices'):
+        failures = hal.bringUp([
+            sensorDevices + [sampler.sample],                       # I2C
+            [ser, serialWriter],                                    # UART
+            [light.device for light in ledCompositor.leds],         # gpiozero
+            [temperature_screen.lcd, humidity_screen.lcd],          # LCD bus
+        ])
+
+    took = dict((entry.name, entry.duration) for entry in startup.failures())
+    for name, error in failures:
+        startupLog.warning("%s failed to come up after %.1f ms, retrying on first use",
+                           name, took.get(name, 0.0) * 1000, exc_info = error)
+
+    try:
+        controlEngine.decide()
+    except Exception:
+        startupLog.exception("First control decision failed, leaving it to the scheduler")
+    else:
+        startup.mark('first control decision')
+
+    startupLog.info("%s", startup.formatReport())
+    return failures
 
-        except KeyboardInterrupt:
-            ## Catch the keyboard interrupt (CTRL-C) and exit cleanly
-            ## we do not need to manually clean up the GPIO pins, the 
-            ## gpiozero library handles that process.
-            print("Cleaning up. Exiting...")
+#################################################################################################################
+##
+## Asyncio engine
+##
+## Instead of running the scheduler in the main thread, every channel job
+## runs as a coroutine on a single event loop. All blocking device access
+## (sensor reads, LCD updates and serial writes) is scheduled onto one
+## dedicated I/O worker so the shared LCD pins and the serial port are
+## never driven from two threads at once, and the event loop stays free
+## for network I/O.
+##
+#################################################################################################################
 
-            ## Stop the loop
-            repeat = False
-            
-            ## Close down the display
-            tsm.endDisplay = True
-            sleep(1)
+##
+## ENGINE_MODE - 'threads' (the scheduler runs in the main thread) or
+## 'asyncio'.
+## Passing --asyncio on the command line selects the asyncio engine.
+##
+ENGINE_MODE = 'threads'
 
 ##
-## Create a HumidityStateMachine object called hsm
+## Single worker used for every blocking device operation
 ##
-hsm = HumidityMachine()
+deviceExecutor = None
 
 ##
-## This function sets up and starts a state machine of type HUmidityStateMachine
+## runOnDevice - Schedule a blocking device call on the I/O worker and
+## wait for its result without blocking the event loop.
 ##
-def runHumidityStateMachine():
-    ##
-    ## Setup our Humidity State Machine
-    ##
-    hsm.run()
+async def runOnDevice(func, *args):
+    import asyncio
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(deviceExecutor, func, *args)
 
-    ##
-    ## Configure our humIncButton (humidity increase button) 
-    #  to use GPIO pin 24.
-    ##
-    humIncButton = Button(24)
-    ##
-    ## Change the state of our thermostat when 
-    ## the green button is pushed.
-    humIncButton.when_pressed = hsm.processHumIncButton
+##
+## Deadline scheduler shared by every task in asyncio mode
+##
+asyncScheduler = None
+
+##
+## asyncMain - Wire up the buttons and run every channel on the current
+## event loop.
+##
+async def asyncMain():
+    import asyncio
+    loop = asyncio.get_running_loop()
 
     ##
+    ## gpiozero calls the button handlers from its own thread, so hand
+    ## the setpoint changes over to the event loop.
     ##
-    ## Configure our humDecButton (humidity decrease button) 
-    #  to use GPIO pin 16.
-    ##
-    humDecButton = Button(16)
-    ##
-    ## Change the state of our thermostat when 
-    ## the green button is pushed.
-    humDecButton.when_pressed = hsm.processHumDecButton
-    ##
-    ## Setup loop variable
-    ##
-    repeat = True
+    def onLoop(handler):
+        return lambda: loop.call_soon_threadsafe(handler)
+
+    buttons = wireButtons(onLoop)
 
     ##
-    ## Repeat until the user creates a keyboard interrupt (CTRL-C)
+    ## Every channel job touches the devices, so it runs on the I/O worker
     ##
-    while repeat:
-        try:
-            ## wait
-            sleep(30)
+    def onDevice(func):
+        return lambda: runOnDevice(func)
 
-        except KeyboardInterrupt:
-            ## Catch the keyboard interrupt (CTRL-C) and exit cleanly
-            ## we do not need to manually clean up the GPIO pins, the 
-            ## gpiozero library handles that process.
-            print("Cleaning up. Exiting...")
+    global asyncScheduler
+    asyncScheduler = DeadlineScheduler()
+    controlEngine.addJobs(asyncScheduler, wrap = onDevice)
+    addServiceJobs(asyncScheduler)
 
-            ## Stop the loop
-            repeat = False
-            
-            ## Close down the display
-            hsm.endDisplay = True
-            sleep(1)
+    await asyncScheduler.runAsync()
 
 ##
-## This is our main function which runs an instance of each state machine
-## in a separate thread.
+## runAsyncEngine - Run every channel on one event loop until the user
+## creates a keyboard interrupt (CTRL-C), then clean up.
+##
+def runAsyncEngine():
+    ## asyncio is only imported when this engine is selected
+    with startup.measure('import', 'asyncio'):
+        import asyncio
+
+    global deviceExecutor
+    deviceExecutor = ThreadPoolExecutor(max_workers = 1,
+                                        thread_name_prefix = "PlantSitterIO")
+
+    try:
+        asyncio.run(asyncMain())
+    except KeyboardInterrupt:
+        log.info("Cleaning up. Exiting...")
+    finally:
+        if asyncScheduler is not None:
+            schedulerLog.info("Job statistics:\n%s", asyncScheduler.formatStats())
+
+        deviceExecutor.shutdown()
+        shutdown()
+
+##
+## This is our main function which runs every control channel from one
+## scheduler, in the main thread or on an event loop in asyncio mode.
 ##
 def main():
 
-    tracemalloc.start()
+    ## Start the background log writer before anything else logs
+    global loggingPipeline
+    loggingPipeline = setupLogging(LOG_LEVEL, LOG_LEVELS, jsonLines = LOG_JSON, path = LOG_FILE,
+                                   rateLimit = LOG_RATE_LIMIT)
+
+    ## Memory profiling is opt-in; SIGUSR1 toggles it at any time
+    for argument in sys.argv[1:]:
+        if argument.startswith('--memory-frames='):
+            memoryProfiler.frames = int(argument.split('=', 1)[1])
+    memoryProfiler.installSignal()
+    if MEMORY_PROFILE or '--memory-profile' in sys.argv:
+        memoryProfiler.start()
+
+    ## Bring the hardware up and make the first control decisions
+    bringUpDevices()
+
+    if METRICS_PORT is not None:
+        metrics.serve(METRICS_PORT)
 
-    ## Create a thread for the HumidityStateMachine
-    temperature_control_thread = threading.Thread(target=runTemperatureStateMachine,)
+    ## Open the database connections. They connect in the background,
+    ## so they do not delay the control loops.
+    for writer in databaseWriters.values():
+        writer.start()
 
-    ## Create a thread for the TemperatureStateMachine
-    humidity_control_thread = threading.Thread(target=runHumidityStateMachine,)
+    ## Run every channel on a single event loop if requested
+    if ENGINE_MODE == 'asyncio' or '--asyncio' in sys.argv:
+        runAsyncEngine()
+        return
 
-    ## Start the tempratureControlThread
-    temperature_control_thread.start()
+    runThreadedEngine()
 
-    ## Start the humidityControlThread
-    humidity_control_thread.start()
+startup.mark('PlantSitter loaded')
 
-## Call our main function.
-main()
+## Call our main function when run as a program. Importing this module
+## does not touch any hardware.
+if __name__ == '__main__':
+    main()
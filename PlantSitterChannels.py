@@ -0,0 +1,92 @@
+#
+# PlantSitterChannels is the channel table of PlantSitter and the control
+# settings that go with it: the setpoints, limits and states of every
+# channel, its reading filter, the sampling policy and the control
+# cadences. Importing it touches no hardware and changes no settings, so
+# the offline tools (PlantSimulation.py, SetpointSweep.py) share the
+# table with the device without importing PlantSitter.
+#
+# The rows leave out the devices. PlantSitter.py fills in the reading,
+# the LEDs, the display and the buttons of each channel.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from ControlChannel import ChannelConfig
+from SensorFilter import StreamingFilter
+from TelemetryProtocol import CHANNEL_HUMIDITY, CHANNEL_TEMPERATURE
+
+##
+## Seconds a sensor snapshot is served before the sensors are read
+## again, i.e. at most one sampling cycle per one second tick
+##
+SENSOR_MAX_AGE = 0.9
+
+##
+## Seconds between control decisions and between the serial reports of
+## each channel
+##
+DECISION_PERIOD = 10
+SERIAL_REPORT_PERIOD = 30
+
+##
+## Reading filters of the channels (see SensorFilter.py): a running
+## median of FILTER_WINDOW readings (one per second), smoothed with
+## FILTER_ALPHA, dropping readings further than the spike limit from the
+## median. Set a channel's filter to None to use the raw readings.
+##
+FILTER_WINDOW = 5
+FILTER_ALPHA = 0.5
+TEMPERATURE_SPIKE_LIMIT = 3.0       # degrees Fahrenheit
+HUMIDITY_SPIKE_LIMIT = 5.0          # percent
+
+##
+## Adaptive sampling policy (see AdaptiveSampling.py): an interval
+## between SAMPLE_MIN_INTERVAL and SAMPLE_MAX_INTERVAL seconds, slow
+## while every reading is stable (changing less than SAMPLE_MAX_RATES
+## per second) and further than SAMPLE_NEAR_DISTANCES from its setpoint,
+## fast otherwise. For a minimum below 1 s, lower SENSOR_MAX_AGE to
+## match; the filter windows count samples, not seconds.
+##
+SAMPLE_MIN_INTERVAL = 1.0
+SAMPLE_MAX_INTERVAL = 30.0
+SAMPLE_NEAR_DISTANCES = {'temperature': 2.0, 'humidity': 3.0}
+SAMPLE_MAX_RATES = {'temperature': 0.01, 'humidity': 0.02}
+
+##
+## The channels
+##
+##  temperature - off / heat / cool, in Fahrenheit
+##  humidity    - off / dry / hum, in percent
+##
+TEMPERATURE_CHANNEL = ChannelConfig(
+    name = 'temperature',
+    channel = CHANNEL_TEMPERATURE,
+    read = None,
+    setPoint = 72,                  # Default setPoint is 72 degrees Fahrenheit
+    minSetPoint = 60,
+    maxSetPoint = 95,
+    states = ('off', 'heat', 'cool'),
+    lights = None,
+    serialLabels = ('Current Temp', 'Target Temp'),
+    clockLine = True,
+    filter = lambda: StreamingFilter(FILTER_WINDOW, FILTER_ALPHA, TEMPERATURE_SPIKE_LIMIT))
+
+HUMIDITY_CHANNEL = ChannelConfig(
+    name = 'humidity',
+    channel = CHANNEL_HUMIDITY,
+    read = None,
+    setPoint = 40,                  # Default setPoint is 40 percent
+    minSetPoint = 10,
+    maxSetPoint = 100,
+    states = ('off', 'dry', 'hum'),
+    lights = None,
+    serialLabels = ('Humidity', 'Target Hum'),
+    filter = lambda: StreamingFilter(FILTER_WINDOW, FILTER_ALPHA, HUMIDITY_SPIKE_LIMIT))
+
+CHANNELS = [TEMPERATURE_CHANNEL, HUMIDITY_CHANNEL]
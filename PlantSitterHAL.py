@@ -0,0 +1,1135 @@
+#
+# PlantSitterHAL is the hardware abstraction layer of PlantSitter. It
+# defines the small interfaces the control logic relies on (sensor,
+# LED, button, LCD and serial port), provides real adapters built on the
+# adafruit, gpiozero and pyserial libraries and in-memory simulated
+# adapters, and selects between them by configuration.
+#
+# Every device is handed out as a LazyDevice, which only builds the
+# underlying object (and only imports its library) on first use. This
+# lets PlantSitter be imported, run and profiled on any machine with
+# the simulated backend:
+#
+#   PLANTSITTER_HAL=sim python PlantSitter.py
+#
+# Building a device and importing its library are both timed in the
+# startup profile (see StartupProfile.py), and bringUp() builds groups of
+# independent devices concurrently.
+#
+# Pipelined sensors split a reading into trigger() and collect(), so a
+# sampler can start the conversions of many sensors (including sensors
+# behind a TCA9548A I2C multiplexer) and wait for all of them at once.
+#
+# In the periodic sensor mode a read never waits for a conversion: the
+# SHT31 measures on its own and the latest result is fetched, and
+# sensors without such a mode (AHTx0) are converted ahead of time by a
+# background thread. Either way a result older than a few periods is not
+# served: read() raises TimeoutError, so a sensor that stopped answering
+# shows up as failed reads instead of a frozen value.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
+
+import logging
+import os
+import threading
+
+from FakeLcd import CountingPin, FakeCharacterLcd
+from StartupProfile import startup
+
+##
+## Backend names
+##
+BACKEND_REAL = 'real'
+BACKEND_SIMULATED = 'sim'
+
+##
+## Environment variable used to pick the backend
+##
+BACKEND_VARIABLE = 'PLANTSITTER_HAL'
+
+##
+## Supported temperature/humidity sensors
+##
+SENSOR_AHTX0 = 'ahtx0'
+SENSOR_SHT31D = 'sht31d'
+
+##
+## Worst case conversion time of each sensor, in seconds (AHT20: 80 ms,
+## SHT31 single shot at high repeatability: 15.5 ms)
+##
+CONVERSION_TIMES = {
+    SENSOR_AHTX0: 0.080,
+    SENSOR_SHT31D: 0.0155,
+}
+
+##
+## Default I2C address of the TCA9548A multiplexer
+##
+MUX_ADDRESS = 0x70
+
+##
+## Sensor modes
+##
+##  triggered - every read starts a conversion and waits for it
+##  periodic  - the sensor converts continuously (in hardware, or from a
+##              background thread) and a read returns the latest result
+##
+SENSOR_MODE_TRIGGERED = 'triggered'
+SENSOR_MODE_PERIODIC = 'periodic'
+
+##
+## Periods after which a periodic mode result is too old to be read
+##
+STALE_PERIODS = 3
+
+log = logging.getLogger('plantsitter.sensor')
+
+#################################################################################################################
+##
+## Interfaces
+##
+## These describe what PlantSitter uses of each device. They follow the
+## APIs of the adafruit, gpiozero and pyserial objects, so the real
+## libraries satisfy them as they are.
+##
+#################################################################################################################
+
+##
+## Sensor - Temperature (degrees Celsius) and relative humidity
+##
+class Sensor():
+    "Temperature and humidity sensor"
+
+    @property
+    def temperature(self):
+        raise NotImplementedError
+
+    @property
+    def relative_humidity(self):
+        raise NotImplementedError
+
+##
+## PipelinedSensor - Sensor whose conversion is started by trigger() and
+## read back by collect() once conversionTime seconds have passed. The
+## temperature and relative_humidity properties still work, and like the
+## adafruit drivers they run a whole conversion each.
+##
+class PipelinedSensor(Sensor):
+    "Temperature and humidity sensor with split trigger and read back"
+
+    conversionTime = 0.0
+
+    def trigger(self):
+        raise NotImplementedError
+
+    ##
+    ## collect - (temperature, humidity) of the last triggered conversion
+    ##
+    def collect(self):
+        raise NotImplementedError
+
+    def read(self):
+        self.trigger()
+        sleep(self.conversionTime)
+        return self.collect()
+
+    @property
+    def temperature(self):
+        return self.read()[0]
+
+    @property
+    def relative_humidity(self):
+        return self.read()[1]
+
+##
+## Led - A PWM driven indicator light
+##
+class Led():
+    "PWM indicator light"
+
+    value = 0.0
+
+    def on(self):
+        raise NotImplementedError
+
+    def off(self):
+        raise NotImplementedError
+
+    def pulse(self, fade_in_time = 1, fade_out_time = 1, n = None, background = True):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+##
+## Button - A push button calling when_pressed when pushed
+##
+class Button():
+    "Push button"
+
+    when_pressed = None
+    when_released = None
+
+    def close(self):
+        pass
+
+##
+## DigitalOutput - One GPIO line (the digitalio.DigitalInOut API)
+##
+class DigitalOutput():
+    "Digital output line"
+
+    value = False
+
+    def switch_to_output(self, value = False, drive_mode = None):
+        raise NotImplementedError
+
+    def deinit(self):
+        pass
+
+##
+## Lcd - A character LCD (the adafruit Character_LCD API)
+##
+class Lcd():
+    "Character LCD"
+
+    column = 0
+    row = 0
+    message = ''
+
+    def clear(self):
+        raise NotImplementedError
+
+    def cursor_position(self, column, row):
+        raise NotImplementedError
+
+##
+## SerialPort - A byte stream (the pyserial API)
+##
+class SerialPort():
+    "Serial port"
+
+    in_waiting = 0
+
+    def write(self, data):
+        raise NotImplementedError
+
+    def read(self, size = 1):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+#################################################################################################################
+##
+## Lazy construction
+##
+#################################################################################################################
+
+##
+## LazyDevice - Proxy that builds its device with 'factory' the first
+## time any attribute is read or written.
+##
+class LazyDevice():
+    "Proxy building its device on first use"
+
+    def __init__(self, factory, name = None):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_device', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    ##
+    ## build - Build the device now (if needed) and return it
+    ##
+    def build(self):
+        device = self._device
+        if device is not None:
+            return device
+
+        with self._lock:
+            if self._device is None:
+                with startup.measure('device', str(self._name)):
+                    object.__setattr__(self, '_device', self._factory())
+            return self._device
+
+    ##
+    ## isBuilt - True once the device exists
+    ##
+    def isBuilt(self):
+        return self._device is not None
+
+    def __getattr__(self, name):
+        return getattr(self.build(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.build(), name, value)
+
+    def __repr__(self):
+        state = 'built' if self.isBuilt() else 'not built'
+        return '<LazyDevice ' + str(self._name) + ' (' + state + ')>'
+
+##
+## bringUpName - Name of a bring-up item in the startup profile
+##
+def bringUpName(item):
+    if isinstance(item, LazyDevice):
+        return str(item._name)
+    return getattr(item, '__qualname__', str(item))
+
+##
+## isBuilt - True if 'device' is not a LazyDevice or has been built
+##
+def isBuilt(device):
+    if isinstance(device, LazyDevice):
+        return device.isBuilt()
+    return device is not None
+
+#################################################################################################################
+##
+## Background acquisition
+##
+#################################################################################################################
+
+##
+## BackgroundSensor - Periodic mode for sensors that have none in
+## hardware. A daemon thread converts every 'interval' seconds (trigger,
+## wait, collect for a pipelined sensor, the two properties otherwise)
+## and read() returns the latest result without touching the bus. Only
+## the very first read waits, for the first conversion. Once the latest
+## result is older than maxAge (STALE_PERIODS intervals by default),
+## because the conversions fail or the thread has died, read() raises
+## TimeoutError.
+##
+class BackgroundSensor(Sensor):
+    "Sensor converted ahead of time by a background thread"
+
+    def __init__(self, sensor, interval = 1.0, timeout = 5.0, maxAge = None,
+                 clock = monotonic):
+        self.sensor = sensor
+        self.interval = interval
+        self.timeout = timeout
+        self.maxAge = STALE_PERIODS * interval if maxAge is None else maxAge
+        self.clock = clock
+
+        ## Conversions, failed conversions, and reads refused because
+        ## the latest result was too old
+        self.conversions = 0
+        self.errors = 0
+        self.stale = 0
+        self.updated = None
+        self._latest = None
+
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="SensorPreTrigger",
+                                        daemon=True)
+        self._thread.start()
+
+    ##
+    ## _convert - One conversion, or None when stopped during it
+    ##
+    def _convert(self):
+        trigger = getattr(self.sensor, 'trigger', None)
+        if trigger is None:
+            return self.sensor.temperature, self.sensor.relative_humidity
+
+        trigger()
+        if self._stop.wait(self.sensor.conversionTime):
+            return None
+        return self.sensor.collect()
+
+    def _run(self):
+        deadline = monotonic()
+        while not self._stop.is_set():
+            try:
+                result = self._convert()
+            except Exception:
+                self.errors = self.errors + 1
+                log.warning("Background sensor conversion failed", exc_info = True)
+            else:
+                if result is not None:
+                    self.updated = self.clock()
+                    self._latest = result
+                    self.conversions = self.conversions + 1
+                    self._ready.set()
+
+            ## Next conversion on the interval grid, skipping missed slots
+            now = monotonic()
+            deadline = max(deadline + self.interval, now)
+            self._stop.wait(deadline - now)
+
+    ##
+    ## read - The latest (temperature, humidity)
+    ##
+    def read(self):
+        latest = self._latest
+        if latest is None:
+            if not self._ready.wait(self.timeout):
+                raise TimeoutError("No sensor conversion finished yet")
+            latest = self._latest
+
+        age = self.clock() - self.updated
+        if age > self.maxAge:
+            self.stale = self.stale + 1
+            raise TimeoutError("Sensor result is %.1f s old (%d failed conversions%s)"
+                               % (age, self.errors,
+                                  "" if self._thread.is_alive() else ", thread stopped"))
+        return latest
+
+    def getStats(self):
+        return {
+            "conversions": self.conversions,
+            "errors": self.errors,
+            "stale": self.stale,
+            "age": None if self.updated is None else self.clock() - self.updated,
+        }
+
+    @property
+    def temperature(self):
+        return self.read()[0]
+
+    @property
+    def relative_humidity(self):
+        return self.read()[1]
+
+    ##
+    ## close - Stop the background thread
+    ##
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+#################################################################################################################
+##
+## Real adapters
+##
+#################################################################################################################
+
+##
+## PipelinedAhtx0 - AHT10/AHT20 conversions on the I2C device of an
+## adafruit_ahtx0.AHTx0 driver, which has already reset and calibrated
+## the part.
+##
+class PipelinedAhtx0(PipelinedSensor):
+    "AHTx0 with split trigger and read back"
+
+    ## Command starting a measurement, and the busy bit of the status byte
+    TRIGGER = bytes([0xAC, 0x33, 0x00])
+    STATUS_BUSY = 0x80
+
+    ##
+    ##  pollInterval - seconds between status polls while still busy
+    ##  timeout      - seconds collect() polls before giving up (twice
+    ##                 the conversion time by default)
+    ##
+    def __init__(self, driver, pollInterval = 0.005, timeout = None):
+        self.i2cDevice = driver.i2c_device
+        self.conversionTime = CONVERSION_TIMES[SENSOR_AHTX0]
+        self.pollInterval = pollInterval
+        self.timeout = 2 * self.conversionTime if timeout is None else timeout
+        self._buffer = bytearray(6)
+
+    def trigger(self):
+        with self.i2cDevice as i2c:
+            i2c.write(self.TRIGGER)
+
+    def collect(self):
+        buffer = self._buffer
+        deadline = monotonic() + self.timeout
+        while True:
+            with self.i2cDevice as i2c:
+                i2c.readinto(buffer)
+            if not buffer[0] & self.STATUS_BUSY:
+                break
+            if monotonic() > deadline:
+                raise TimeoutError("AHTx0 still busy %.0f ms after its conversion"
+                                   % (self.timeout * 1000))
+            sleep(self.pollInterval)
+
+        humidity = (buffer[1] << 12) | (buffer[2] << 4) | (buffer[3] >> 4)
+        temperature = ((buffer[3] & 0xF) << 16) | (buffer[4] << 8) | buffer[5]
+        return ((temperature * 200.0) / 0x100000) - 50, (humidity * 100) / 0x100000
+
+##
+## _sht31Crc - CRC-8 (polynomial 0x31, initial value 0xFF) of an SHT31 word
+##
+def _sht31Crc(data):
+    crc = 0xFF
+    for byte in data:
+        crc = crc ^ byte
+        for _ in range(8):
+            if crc & 0x80:
+                crc = ((crc << 1) ^ 0x31) & 0xFF
+            else:
+                crc = (crc << 1) & 0xFF
+    return crc
+
+##
+## _decodeSht31 - (temperature, humidity) of a 6 byte SHT31 result
+##
+def _decodeSht31(buffer):
+    if _sht31Crc(buffer[0:2]) != buffer[2] or _sht31Crc(buffer[3:5]) != buffer[5]:
+        raise RuntimeError("SHT31 CRC mismatch")
+
+    temperature = (buffer[0] << 8) | buffer[1]
+    humidity = (buffer[3] << 8) | buffer[4]
+    return -45 + (175 * temperature / 65535), 100 * humidity / 65535
+
+##
+## PipelinedSht31d - SHT31 single shot conversions (high repeatability,
+## no clock stretching) on the I2C device of an adafruit_sht31d.SHT31D
+## driver. The sensor does not acknowledge a read until its conversion
+## is done, so collect() retries until then.
+##
+class PipelinedSht31d(PipelinedSensor):
+    "SHT31 with split trigger and read back"
+
+    TRIGGER = bytes([0x24, 0x00])
+
+    def __init__(self, driver, pollInterval = 0.002, retries = 10):
+        self.i2cDevice = driver.i2c_device
+        self.conversionTime = CONVERSION_TIMES[SENSOR_SHT31D]
+        self.pollInterval = pollInterval
+        self.retries = retries
+        self._buffer = bytearray(6)
+
+    def trigger(self):
+        with self.i2cDevice as i2c:
+            i2c.write(self.TRIGGER)
+
+    def collect(self):
+        buffer = self._buffer
+        for attempt in range(self.retries + 1):
+            try:
+                with self.i2cDevice as i2c:
+                    i2c.readinto(buffer)
+                break
+            except OSError:
+                if attempt == self.retries:
+                    raise
+                sleep(self.pollInterval)
+        return _decodeSht31(buffer)
+
+##
+## PeriodicSht31d - SHT31 in periodic acquisition mode (high
+## repeatability). The sensor measures 'rate' times per second on its
+## own; read() fetches the newest result, which takes one short bus
+## transaction and never waits for a conversion. The sensor does not
+## acknowledge a fetch when nothing new was measured, and read() then
+## returns the previous result - unless it is older than maxAge
+## (STALE_PERIODS measurement periods by default), in which case read()
+## raises TimeoutError.
+##
+class PeriodicSht31d(Sensor):
+    "SHT31 measuring on its own, read without waiting"
+
+    ## Periodic acquisition commands by measurements per second
+    RATES = {
+        0.5: bytes([0x20, 0x32]),
+        1: bytes([0x21, 0x30]),
+        2: bytes([0x22, 0x36]),
+        4: bytes([0x23, 0x34]),
+        10: bytes([0x27, 0x37]),
+    }
+    FETCH = bytes([0xE0, 0x00])
+    BREAK = bytes([0x30, 0x93])
+
+    def __init__(self, driver, rate = 1, timeout = 2.0, maxAge = None, clock = monotonic):
+        if rate not in self.RATES:
+            raise ValueError("Unsupported SHT31 rate: " + str(rate))
+
+        self.i2cDevice = driver.i2c_device
+        self.rate = rate
+        self.maxAge = STALE_PERIODS / rate if maxAge is None else maxAge
+        self.clock = clock
+
+        ## Fetches, fetches with a new result, fetches the sensor did not
+        ## acknowledge, and reads refused because the result was too old
+        self.fetches = 0
+        self.updates = 0
+        self.errors = 0
+        self.stale = 0
+        self.updated = None
+        self._latest = None
+        self._buffer = bytearray(6)
+
+        with self.i2cDevice as i2c:
+            i2c.write(self.RATES[rate])
+
+        ## Wait for the first result here, so read() never has to
+        deadline = monotonic() + timeout
+        while self._fetch() is None:
+            if monotonic() > deadline:
+                raise TimeoutError("SHT31 did not start measuring")
+            sleep(CONVERSION_TIMES[SENSOR_SHT31D])
+
+    def _fetch(self):
+        buffer = self._buffer
+        try:
+            with self.i2cDevice as i2c:
+                i2c.write(self.FETCH)
+                i2c.readinto(buffer)
+        except OSError:
+            self.errors = self.errors + 1
+            return None
+
+        self._latest = _decodeSht31(buffer)
+        self.updated = self.clock()
+        self.updates = self.updates + 1
+        return self._latest
+
+    ##
+    ## read - The newest (temperature, humidity)
+    ##
+    def read(self):
+        self.fetches = self.fetches + 1
+        self._fetch()
+
+        age = self.clock() - self.updated
+        if age > self.maxAge:
+            self.stale = self.stale + 1
+            raise TimeoutError("SHT31 result is %.1f s old" % age)
+        return self._latest
+
+    def getStats(self):
+        return {
+            "fetches": self.fetches,
+            "updates": self.updates,
+            "errors": self.errors,
+            "stale": self.stale,
+            "age": self.clock() - self.updated,
+        }
+
+    @property
+    def temperature(self):
+        return self.read()[0]
+
+    @property
+    def relative_humidity(self):
+        return self.read()[1]
+
+    ##
+    ## close - Stop the periodic acquisition
+    ##
+    def close(self):
+        with self.i2cDevice as i2c:
+            i2c.write(self.BREAK)
+
+##
+## RealHardware - Each library is imported through the startup profile
+## the first time a device needs it.
+##
+class RealHardware():
+    "Devices backed by the adafruit, gpiozero and pyserial libraries"
+
+    def __init__(self):
+        self._i2c = None
+        self._muxes = {}
+        self._lock = threading.Lock()
+
+    ##
+    ## i2c - The shared I2C bus, created on first use
+    ##
+    def i2c(self):
+        with self._lock:
+            if self._i2c is None:
+                board = startup.importModule('board')
+                self._i2c = board.I2C()
+            return self._i2c
+
+    ##
+    ## sensor - The sensor of type 'kind' in 'mode'. In the periodic
+    ## mode the SHT31 measures about once per 'interval' seconds by
+    ## itself, and the AHTx0 is converted by a background thread.
+    ##
+    def sensor(self, kind, mode = SENSOR_MODE_TRIGGERED, interval = 1.0):
+        if mode not in (SENSOR_MODE_TRIGGERED, SENSOR_MODE_PERIODIC):
+            raise ValueError("Unknown sensor mode: " + str(mode))
+
+        if kind == SENSOR_SHT31D:
+            adafruit_sht31d = startup.importModule('adafruit_sht31d')
+            driver = adafruit_sht31d.SHT31D(self.i2c())
+            if mode == SENSOR_MODE_PERIODIC:
+                rate = min(PeriodicSht31d.RATES, key = lambda rate: abs(rate - 1 / interval))
+                return PeriodicSht31d(driver, rate)
+            return driver
+
+        adafruit_ahtx0 = startup.importModule('adafruit_ahtx0')
+        driver = adafruit_ahtx0.AHTx0(self.i2c())
+        if mode == SENSOR_MODE_PERIODIC:
+            return BackgroundSensor(PipelinedAhtx0(driver), interval)
+        return driver
+
+    ##
+    ## mux - The TCA9548A multiplexer at 'address', created on first use
+    ##
+    def mux(self, address = MUX_ADDRESS):
+        bus = self.i2c()
+        with self._lock:
+            if address not in self._muxes:
+                adafruit_tca9548a = startup.importModule('adafruit_tca9548a')
+                self._muxes[address] = adafruit_tca9548a.TCA9548A(bus, address)
+            return self._muxes[address]
+
+    ##
+    ## pipelinedSensor - A sensor of type 'kind' at 'address' (None for
+    ## the default address), behind channel 'muxChannel' of the
+    ## multiplexer when that is not None. The mux channel is selected
+    ## every time the bus is locked for the sensor.
+    ##
+    def pipelinedSensor(self, kind, address = None, muxChannel = None):
+        bus = self.i2c() if muxChannel is None else self.mux()[muxChannel]
+        arguments = () if address is None else (address,)
+
+        if kind == SENSOR_SHT31D:
+            adafruit_sht31d = startup.importModule('adafruit_sht31d')
+            return PipelinedSht31d(adafruit_sht31d.SHT31D(bus, *arguments))
+
+        adafruit_ahtx0 = startup.importModule('adafruit_ahtx0')
+        return PipelinedAhtx0(adafruit_ahtx0.AHTx0(bus, *arguments))
+
+    def led(self, pin):
+        gpiozero = startup.importModule('gpiozero')
+        return gpiozero.PWMLED(pin)
+
+    def button(self, pin):
+        gpiozero = startup.importModule('gpiozero')
+        return gpiozero.Button(pin)
+
+    def digitalOutput(self, pinName):
+        board = startup.importModule('board')
+        digitalio = startup.importModule('digitalio')
+        return digitalio.DigitalInOut(getattr(board, pinName))
+
+    def lcdFactory(self):
+        characterlcd = startup.importModule('adafruit_character_lcd.character_lcd')
+        return characterlcd.Character_LCD_Mono
+
+    ##
+    ## serialPort - Open the serial port with the settings PlantSitter
+    ## has always used: no parity, one stop bit, 8-bit bytes and a one
+    ## second timeout.
+    ##
+    def serialPort(self, port, baudrate):
+        serial = startup.importModule('serial')
+        return serial.Serial(
+            port = port,
+            baudrate = baudrate,
+            parity = serial.PARITY_NONE,
+            stopbits = serial.STOPBITS_ONE,
+            bytesize = serial.EIGHTBITS,
+            timeout = 1
+        )
+
+    ## End class RealHardware definition
+
+#################################################################################################################
+##
+## Simulated adapters
+##
+#################################################################################################################
+
+##
+## SimulatedSensor - Sensor whose readings are set by the caller. An
+## optional conversion time makes every read block like the real part.
+##
+class SimulatedSensor(Sensor):
+    "In-memory temperature and humidity sensor"
+
+    def __init__(self, celsius = 22.0, humidity = 40.0, conversionTime = 0.0):
+        self.celsius = celsius
+        self.humidity = humidity
+        self.conversionTime = conversionTime
+        self.reads = 0
+
+    def _convert(self):
+        self.reads = self.reads + 1
+        if self.conversionTime:
+            sleep(self.conversionTime)
+
+    @property
+    def temperature(self):
+        self._convert()
+        return self.celsius
+
+    @property
+    def relative_humidity(self):
+        self._convert()
+        return self.humidity
+
+##
+## SimulatedPeriodicSensor - Sensor measuring on its own; a read only
+## costs the fetch transfer of 'fetchTime' seconds.
+##
+class SimulatedPeriodicSensor(Sensor):
+    "In-memory sensor in periodic acquisition mode"
+
+    def __init__(self, celsius = 22.0, humidity = 40.0, fetchTime = 0.0):
+        self.celsius = celsius
+        self.humidity = humidity
+        self.fetchTime = fetchTime
+        self.fetches = 0
+
+    def read(self):
+        self.fetches = self.fetches + 1
+        if self.fetchTime:
+            sleep(self.fetchTime)
+        return self.celsius, self.humidity
+
+    @property
+    def temperature(self):
+        return self.read()[0]
+
+    @property
+    def relative_humidity(self):
+        return self.read()[1]
+
+    def close(self):
+        pass
+
+##
+## SimulatedMux - TCA9548A model counting channel selections. Selecting
+## another channel costs 'selectTime' seconds, like the extra I2C write
+## on the real part.
+##
+class SimulatedMux():
+    "In-memory I2C multiplexer"
+
+    def __init__(self, selectTime = 0.0):
+        self.selectTime = selectTime
+        self.channel = None
+        self.selects = 0
+        self._lock = threading.Lock()
+
+    def select(self, channel):
+        with self._lock:
+            if channel != self.channel:
+                if self.selectTime:
+                    sleep(self.selectTime)
+                self.channel = channel
+                self.selects = self.selects + 1
+
+##
+## SimulatedPipelinedSensor - Pipelined sensor with a modelled conversion
+## time. Each bus transfer takes 'transferTime' seconds, and collect()
+## blocks until the conversion started by trigger() is complete.
+##
+class SimulatedPipelinedSensor(PipelinedSensor):
+    "In-memory pipelined temperature and humidity sensor"
+
+    def __init__(self, celsius = 22.0, humidity = 40.0, conversionTime = 0.0,
+                 transferTime = 0.0, mux = None, muxChannel = None):
+        self.celsius = celsius
+        self.humidity = humidity
+        self.conversionTime = conversionTime
+        self.transferTime = transferTime
+        self.mux = mux
+        self.muxChannel = muxChannel
+        self.triggers = 0
+        self.reads = 0
+        self._ready = None
+
+    def _transfer(self):
+        if self.mux is not None:
+            self.mux.select(self.muxChannel)
+        if self.transferTime:
+            sleep(self.transferTime)
+
+    def trigger(self):
+        self._transfer()
+        self.triggers = self.triggers + 1
+        self._ready = monotonic() + self.conversionTime
+
+    def collect(self):
+        if self._ready is None:
+            raise RuntimeError("collect() called before trigger()")
+        remaining = self._ready - monotonic()
+        if remaining > 0:
+            sleep(remaining)
+        self._transfer()
+        self._ready = None
+        self.reads = self.reads + 1
+        return self.celsius, self.humidity
+
+##
+## SimulatedLed - Remembers what it was last asked to do. With 'threaded'
+## set, pulse() behaves like gpiozero: it stops the fade thread of the
+## previous effect and starts a new thread that writes the brightness
+## 25 times per second, so the thread and CPU cost of per-LED fades can
+## be measured without a Pi.
+##
+class SimulatedLed(Led):
+    "In-memory PWM LED"
+
+    ## Frames per second of the gpiozero fade threads
+    FADE_RATE = 25
+
+    def __init__(self, pin, threaded = False):
+        self.pin = pin
+        self.value = 0.0
+        self.effect = 'off'
+        self.calls = 0
+        self.pulses = 0
+        self.threaded = threaded
+        self.threadsStarted = 0
+        self._fade = None
+        self._stopFade = threading.Event()
+
+    def _stopFadeThread(self):
+        if self._fade is not None:
+            self._stopFade.set()
+            self._fade.join()
+            self._fade = None
+
+    def _runFade(self, fadeIn, fadeOut, stop):
+        rising = int(fadeIn * self.FADE_RATE)
+        falling = int(fadeOut * self.FADE_RATE)
+        frames = ([index / rising for index in range(rising)] +
+                  [1.0 - index / falling for index in range(falling)])
+        while True:
+            for value in frames:
+                self.value = value
+                if stop.wait(1 / self.FADE_RATE):
+                    return
+
+    def on(self):
+        self.calls = self.calls + 1
+        self._stopFadeThread()
+        self.effect = 'on'
+        self.value = 1.0
+
+    def off(self):
+        self.calls = self.calls + 1
+        self._stopFadeThread()
+        self.effect = 'off'
+        self.value = 0.0
+
+    def pulse(self, fade_in_time = 1, fade_out_time = 1, n = None, background = True):
+        self.calls = self.calls + 1
+        self.pulses = self.pulses + 1
+        self.effect = 'pulse'
+        if self.threaded:
+            self._stopFadeThread()
+            self._stopFade = threading.Event()
+            self._fade = threading.Thread(target=self._runFade,
+                                          args=(fade_in_time, fade_out_time, self._stopFade),
+                                          daemon=True)
+            self._fade.start()
+            self.threadsStarted = self.threadsStarted + 1
+
+    @property
+    def is_lit(self):
+        return self.effect != 'off'
+
+    def close(self):
+        self._stopFadeThread()
+
+##
+## SimulatedButton - press() runs the when_pressed handler
+##
+class SimulatedButton(Button):
+    "In-memory push button"
+
+    def __init__(self, pin):
+        self.pin = pin
+        self.when_pressed = None
+        self.when_released = None
+
+    def press(self):
+        if self.when_pressed is not None:
+            self.when_pressed()
+        if self.when_released is not None:
+            self.when_released()
+
+##
+## SimulatedSerial - Collects written bytes; bytes queued with feed()
+## can be read back.
+##
+class SimulatedSerial(SerialPort):
+    "In-memory serial port"
+
+    def __init__(self, port = None, baudrate = None):
+        self.port = port
+        self.baudrate = baudrate
+        self.written = bytearray()
+        self.writes = 0
+        self._incoming = bytearray()
+
+    def write(self, data):
+        self.writes = self.writes + 1
+        self.written += data
+        return len(data)
+
+    def feed(self, data):
+        self._incoming += data
+
+    @property
+    def in_waiting(self):
+        return len(self._incoming)
+
+    def read(self, size = 1):
+        data = bytes(self._incoming[:size])
+        del self._incoming[:size]
+        return data
+
+class SimulatedHardware():
+    "In-memory devices for development machines and benchmarks"
+
+    def __init__(self):
+        self._mux = None
+        self._lock = threading.Lock()
+
+    def sensor(self, kind, mode = SENSOR_MODE_TRIGGERED, interval = 1.0):
+        if mode == SENSOR_MODE_TRIGGERED:
+            return SimulatedSensor()
+        if kind == SENSOR_SHT31D:
+            return SimulatedPeriodicSensor()
+        return BackgroundSensor(SimulatedPipelinedSensor(conversionTime = CONVERSION_TIMES[kind]),
+                                interval)
+
+    def mux(self, address = MUX_ADDRESS):
+        with self._lock:
+            if self._mux is None:
+                self._mux = SimulatedMux()
+            return self._mux
+
+    def pipelinedSensor(self, kind, address = None, muxChannel = None):
+        mux = None if muxChannel is None else self.mux()
+        return SimulatedPipelinedSensor(conversionTime = CONVERSION_TIMES[kind],
+                                        mux = mux, muxChannel = muxChannel)
+
+    def led(self, pin):
+        return SimulatedLed(pin)
+
+    def button(self, pin):
+        return SimulatedButton(pin)
+
+    def digitalOutput(self, pinName):
+        return CountingPin(pinName)
+
+    def lcdFactory(self):
+        def createLcd(rs, en, d4, d5, d6, d7, columns, rows):
+            return FakeCharacterLcd(columns, rows)
+        return createLcd
+
+    def serialPort(self, port, baudrate):
+        return SimulatedSerial(port, baudrate)
+
+    ## End class SimulatedHardware definition
+
+#################################################################################################################
+##
+## The layer itself
+##
+#################################################################################################################
+
+##
+## HardwareAbstractionLayer - Hands out lazily built devices of the
+## selected backend and keeps track of them.
+##
+class HardwareAbstractionLayer():
+    "Lazily built devices of the configured backend"
+
+    def __init__(self, backend):
+        if backend == BACKEND_SIMULATED:
+            self.hardware = SimulatedHardware()
+        elif backend == BACKEND_REAL:
+            self.hardware = RealHardware()
+        else:
+            raise ValueError("Unknown hardware backend: " + str(backend))
+
+        self.backend = backend
+
+        ## Every device handed out, by name
+        self.devices = {}
+
+    def _lazy(self, name, factory):
+        device = LazyDevice(factory, name)
+        self.devices[name] = device
+        return device
+
+    def sensor(self, kind = SENSOR_AHTX0, mode = SENSOR_MODE_TRIGGERED, interval = 1.0):
+        return self._lazy('sensor', lambda: self.hardware.sensor(kind, mode, interval))
+
+    ##
+    ## pipelinedSensor - One of several sensors sampled together, see
+    ## RealHardware.pipelinedSensor()
+    ##
+    def pipelinedSensor(self, name, kind = SENSOR_AHTX0, address = None, muxChannel = None):
+        return self._lazy('sensor.' + name,
+                          lambda: self.hardware.pipelinedSensor(kind, address, muxChannel))
+
+    def led(self, pin):
+        return self._lazy('led' + str(pin), lambda: self.hardware.led(pin))
+
+    def button(self, pin):
+        return self._lazy('button' + str(pin), lambda: self.hardware.button(pin))
+
+    def digitalOutput(self, pinName):
+        return self._lazy(pinName, lambda: self.hardware.digitalOutput(pinName))
+
+    def lcdFactory(self):
+        return self.hardware.lcdFactory()
+
+    def serialPort(self, port = '/dev/ttyS0', baudrate = 115200):
+        return self._lazy('serial', lambda: self.hardware.serialPort(port, baudrate))
+
+    ##
+    ## bringUp - Bring devices up ahead of their first use.
+    ##
+    ## 'groups' is a list of lists. The groups are independent of each
+    ## other and are brought up concurrently; the items of one group
+    ## (devices sharing a bus or a library, e.g. all gpiozero LEDs) are
+    ## built in order. An item is either a LazyDevice or a function to
+    ## call, such as a first sensor read. An item that raises does not
+    ## stop its group or the others: its error is recorded in the startup
+    ## profile, the rest is still brought up, and a LazyDevice that failed
+    ## is built again on its first use. Returns the (name, error) of every
+    ## failed item.
+    ##
+    def bringUp(self, groups):
+        def bringUpGroup(group):
+            failures = []
+            for item in group:
+                try:
+                    if isinstance(item, LazyDevice):
+                        item.build()
+                    else:
+                        with startup.measure('step', bringUpName(item)):
+                            item()
+                except Exception as error:
+                    failures.append((bringUpName(item), error))
+            return failures
+
+        if not groups:
+            return []
+
+        with ThreadPoolExecutor(max_workers = len(groups),
+                                thread_name_prefix = "BringUp") as executor:
+            futures = [executor.submit(bringUpGroup, group) for group in groups]
+
+        failures = []
+        for future in futures:
+            failures.extend(future.result())
+        return failures
+
+    ## End class HardwareAbstractionLayer definition
+
+##
+## createHal - Build the layer for 'backend', which defaults to the
+## PLANTSITTER_HAL environment variable and then to the real hardware.
+##
+def createHal(backend = None):
+    if backend is None:
+        backend = os.environ.get(BACKEND_VARIABLE, BACKEND_REAL)
+    return HardwareAbstractionLayer(backend)
@@ -0,0 +1,275 @@
+#
+# PlantSitterLogging is the non-blocking logging pipeline of PlantSitter.
+# Call sites log through the standard logging module on a per-subsystem
+# logger ("plantsitter.temperature", "plantsitter.display", ...). The
+# records are put on a bounded queue without being formatted, and a
+# single background listener thread formats and writes them, so a slow
+# console or journald can never block the control loops.
+#
+# Features:
+#
+#   - per-subsystem levels
+#   - rate limiting of repetitive messages, with a count of what was
+#     suppressed attached to the next message that gets through
+#   - plain text or JSON lines output, to stderr or a file
+#   - nothing is formatted for a disabled level, and the message text
+#     is only built on the listener thread
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from time import monotonic
+
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+
+##
+## Name of the parent logger of every subsystem
+##
+ROOT_LOGGER = 'plantsitter'
+
+TEXT_FORMAT = '%(asctime)s %(levelname)-7s %(subsystem)-12s %(message)s'
+
+##
+## getLogger - The logger of one subsystem, e.g. getLogger('temperature')
+##
+def getLogger(subsystem):
+    return logging.getLogger(ROOT_LOGGER + '.' + subsystem)
+
+##
+## _subsystem - Subsystem name of a record ('temperature' for
+## 'plantsitter.temperature')
+##
+def _subsystem(record):
+    name = record.name
+    if name.startswith(ROOT_LOGGER + '.'):
+        return name[len(ROOT_LOGGER) + 1:]
+    return name
+
+##
+## RateLimitFilter - Lets at most 'burst' records with the same logger
+## and message template through per 'interval' seconds. The number of
+## records dropped in between is attached to the next one let through
+## as record.suppressed. Records at or above 'exemptLevel' are never
+## limited.
+##
+class RateLimitFilter(logging.Filter):
+    "Rate limit for repetitive log messages"
+
+    def __init__(self, burst = 5, interval = 60.0, exemptLevel = logging.WARNING,
+                 clock = monotonic):
+        logging.Filter.__init__(self)
+        self.burst = burst
+        self.interval = interval
+        self.exemptLevel = exemptLevel
+        self.clock = clock
+
+        ## (logger name, template) -> [window start, count, suppressed]
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= self.exemptLevel:
+            return True
+
+        key = (record.name, record.msg)
+        now = self.clock()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = 0 if window is None else window[2]
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+
+            if window[1] < self.burst:
+                window[1] = window[1] + 1
+                return True
+
+            window[2] = window[2] + 1
+            return False
+
+    ## End class RateLimitFilter definition
+
+##
+## NonBlockingQueueHandler - Puts records on the queue as they are. The
+## standard QueueHandler formats the message in the calling thread; here
+## that is left to the listener. A full queue drops the record instead
+## of blocking.
+##
+class NonBlockingQueueHandler(QueueHandler):
+    "Queue handler that neither formats nor blocks"
+
+    def __init__(self, recordQueue):
+        QueueHandler.__init__(self, recordQueue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped = self.dropped + 1
+
+    ## End class NonBlockingQueueHandler definition
+
+##
+## PipelineListener - Queue listener whose stop() waits for room on a
+## full queue instead of failing. The standard listener puts its stop
+## sentinel with put_nowait(), which raises queue.Full when the call
+## sites have just filled the queue. If the writer thread makes no room
+## within 'timeout' seconds it is left behind (it is a daemon thread).
+##
+class PipelineListener(QueueListener):
+    "Queue listener with a blocking stop"
+
+    def __init__(self, recordQueue, handler, timeout = 5.0):
+        QueueListener.__init__(self, recordQueue, handler)
+        self.timeout = timeout
+
+    ##
+    ## stop - Write everything queued before the sentinel and stop the
+    ## thread. Returns False if the thread could not be stopped in time.
+    ##
+    def stop(self):
+        if self._thread is None:
+            return True
+        try:
+            self.queue.put(self._sentinel, timeout = self.timeout)
+        except queue.Full:
+            return False
+        self._thread.join(self.timeout)
+        stopped = not self._thread.is_alive()
+        self._thread = None
+        return stopped
+
+    ## End class PipelineListener definition
+
+##
+## TextFormatter - One line per record
+##
+class TextFormatter(logging.Formatter):
+    "Plain text log lines"
+
+    def __init__(self):
+        logging.Formatter.__init__(self, TEXT_FORMAT)
+
+    def format(self, record):
+        record.subsystem = _subsystem(record)
+        text = logging.Formatter.format(self, record)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            text = text + " (" + str(suppressed) + " similar messages suppressed)"
+        return text
+
+##
+## JsonLinesFormatter - One JSON object per record. Structured values
+## passed as extra = {'fields': {...}} are included as they are.
+##
+class JsonLinesFormatter(logging.Formatter):
+    "JSON lines log records"
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec = 'milliseconds'),
+            "level": record.levelname,
+            "subsystem": _subsystem(record),
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry["fields"] = fields
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default = str)
+
+##
+## LoggingPipeline - The queue, its handler and the listener thread
+##
+class LoggingPipeline():
+    "Background writer for PlantSitter log records"
+
+    def __init__(self, handler, queueHandler, listener):
+        self.handler = handler
+        self.queueHandler = queueHandler
+        self.listener = listener
+        self._stopped = False
+
+    ##
+    ## stop - Write everything still queued and stop the listener
+    ##
+    def stop(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        if not self.listener.stop():
+            sys.stderr.write("plantsitter: log writer did not stop, %d records not written\n"
+                             % self.queueHandler.queue.qsize())
+        self.handler.flush()
+
+    def getStats(self):
+        return {
+            "queueDepth": self.queueHandler.queue.qsize(),
+            "dropped": self.queueHandler.dropped,
+        }
+
+    ## End class LoggingPipeline definition
+
+##
+## setupLogging - Start the pipeline.
+##
+##  level     - level of every subsystem not listed in 'levels'
+##  levels    - per-subsystem levels, e.g. {'scheduler': 'INFO'}
+##  jsonLines - write JSON lines instead of plain text
+##  path      - append to this file instead of writing to stderr
+##  rateLimit - (burst, interval seconds) for repetitive messages, or
+##              None to let everything through
+##  maxQueue  - records waiting beyond this are dropped
+##
+def setupLogging(level = 'INFO', levels = None, jsonLines = False, path = None,
+                 rateLimit = (5, 60.0), maxQueue = 10000):
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level)
+    root.propagate = False
+    for subsystem, subsystemLevel in (levels or {}).items():
+        getLogger(subsystem).setLevel(subsystemLevel)
+
+    if path is not None:
+        handler = logging.FileHandler(path)
+    else:
+        handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonLinesFormatter() if jsonLines else TextFormatter())
+
+    recordQueue = queue.Queue(maxQueue)
+    queueHandler = NonBlockingQueueHandler(recordQueue)
+    if rateLimit is not None:
+        queueHandler.addFilter(RateLimitFilter(rateLimit[0], rateLimit[1]))
+
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queueHandler)
+
+    listener = PipelineListener(recordQueue, handler)
+    listener.start()
+
+    pipeline = LoggingPipeline(handler, queueHandler, listener)
+    atexit.register(pipeline.stop)
+    return pipeline
@@ -0,0 +1,401 @@
+#
+# ReductWriter is a long-lived service that logs PlantSitter readings to
+# a ReductStore database. It keeps a single client connection open,
+# creates its bucket once at startup and writes queued samples in
+# batches, either when enough samples have accumulated or when the
+# flush interval expires. The control loops only ever append to an
+# in-memory queue, so a slow or unreachable database never stalls them.
+#
+# When the server cannot be reached, or a write fails, the writer closes
+# the connection and opens it again after a back-off that doubles up to
+# maxRetryDelay. Samples of a failed write go back to the front of the
+# queue, so nothing is lost unless the queue overflows meanwhile, and
+# nothing that was already written is written twice.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from collections import deque
+from time import monotonic, time
+
+import asyncio
+import logging
+import threading
+
+##
+## Status messages go to the "database" subsystem of the PlantSitter
+## logging pipeline
+##
+log = logging.getLogger('plantsitter.database')
+
+##
+## epochMicroseconds - Convert a datetime (or the current time when
+## None) into the integer UNIX timestamp in microseconds expected by
+## ReductStore.
+##
+def epochMicroseconds(when = None):
+    if when is None:
+        return int(time() * 1_000_000)
+    return int(when.timestamp() * 1_000_000)
+
+##
+## ReductBackend - The ReductStore client connection of one bucket. The
+## writer only calls open(), write() and close(), so any object with
+## those coroutines can stand in for it (e.g. a client of a local fake
+## server).
+##
+class ReductBackend():
+    "ReductStore client of a single bucket"
+
+    def __init__(self, url, apiToken, bucketName, quotaSize):
+        self.url = url
+        self.apiToken = apiToken
+        self.bucketName = bucketName
+        self.quotaSize = quotaSize
+        self._client = None
+        self._bucket = None
+
+    ##
+    ## open - Connect and create the bucket unless it exists
+    ##
+    async def open(self):
+        ## reduct is only imported once a writer is actually started
+        from reduct import BucketSettings, Client, QuotaType
+
+        client = Client(self.url, api_token=self.apiToken)
+        await client.__aenter__()
+        self._client = client
+        self._bucket = await client.create_bucket(
+            self.bucketName,
+            BucketSettings(quota_type=QuotaType.FIFO, quota_size=self.quotaSize),
+            exist_ok=True,
+        )
+
+    ##
+    ## write - Write the (timestamp, payload) records of one entry as a
+    ## single batch
+    ##
+    async def write(self, entry, records):
+        from reduct import Batch
+
+        batch = Batch()
+        for timestamp, payload in records:
+            batch.add(timestamp, data=payload, content_type="text/plain")
+        await self._bucket.write_batch(entry, batch)
+
+    ##
+    ## close - Close the connection, if open
+    ##
+    async def close(self):
+        client = self._client
+        self._client = None
+        self._bucket = None
+        if client is not None:
+            await client.__aexit__(None, None, None)
+
+    ## End class ReductBackend definition
+
+##
+## ReductWriter - Background writer for a single ReductStore bucket.
+##
+class ReductWriter():
+    "Batched, persistent writer for a ReductStore bucket"
+
+    ##
+    ## Class Initialization method
+    ##
+    ##  url           - ReductStore server URL
+    ##  apiToken      - API token used to authenticate
+    ##  bucketName    - bucket created (once) at startup
+    ##  quotaSize     - FIFO quota of the bucket in bytes
+    ##  batchSize     - number of queued samples that triggers a flush
+    ##  flushInterval - maximum number of seconds a sample may wait
+    ##  maxQueue      - queue limit; the oldest samples are dropped
+    ##                  beyond it so that writers never block
+    ##  retryDelay    - seconds before the first reconnection attempt
+    ##  maxRetryDelay - longest wait between reconnection attempts
+    ##  backend       - connection used instead of a ReductBackend of
+    ##                  'url'
+    ##
+    def __init__(self, url, apiToken, bucketName,
+                 quotaSize = 1_000_000_000, batchSize = 50,
+                 flushInterval = 5.0, maxQueue = 10_000,
+                 retryDelay = 1.0, maxRetryDelay = 60.0, backend = None):
+        self.url = url
+        self.apiToken = apiToken
+        self.bucketName = bucketName
+        self.quotaSize = quotaSize
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self.retryDelay = retryDelay
+        self.maxRetryDelay = maxRetryDelay
+
+        if backend is None:
+            backend = ReductBackend(url, apiToken, bucketName, quotaSize)
+        self.backend = backend
+
+        ## Pending (entry, timestamp, payload) samples
+        self._queue = deque(maxlen = maxQueue)
+
+        ## Statistics
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.errors = 0
+        self.retries = 0
+        self.connected = False
+        self.lastFlushSeconds = 0.0
+        self._startTime = None
+
+        self._loop = None
+        self._wakeup = None
+        self._thread = None
+        self._running = False
+        self._ready = threading.Event()
+
+    ##
+    ## start - Start the writer thread with its own event loop
+    ##
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._running = True
+        self._startTime = monotonic()
+        self._thread = threading.Thread(target=self._threadMain,
+                                        name="ReductWriter-" + self.bucketName,
+                                        daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    ##
+    ## stop - Flush whatever is still queued and shut the writer down
+    ##
+    def stop(self, timeout = 10.0):
+        if self._thread is None:
+            return
+
+        self._running = False
+        self._notify()
+        self._thread.join(timeout)
+        self._thread = None
+
+    ##
+    ## write - Queue a single sample. Safe to call from any thread and
+    ## never blocks; the sample is written with the next batch.
+    ##
+    ##  entry     - ReductStore entry name (e.g. "temperature")
+    ##  value     - the reading; it is stored as its text representation
+    ##  timestamp - integer epoch microseconds (defaults to now)
+    ##
+    def write(self, entry, value, timestamp = None):
+        if timestamp is None:
+            timestamp = epochMicroseconds()
+
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped = self.dropped + 1
+        self._queue.append((entry, int(timestamp), str(value).encode()))
+
+        if len(self._queue) >= self.batchSize:
+            self._notify()
+
+    ##
+    ## _notify - Wake the writer loop from another thread
+    ##
+    def _notify(self):
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except (AttributeError, RuntimeError):
+            ## The loop has not been started or has already shut down
+            pass
+
+    ##
+    ## getStats - Throughput and queue depth of the writer
+    ##
+    def getStats(self):
+        elapsed = 0.0
+        if self._startTime is not None:
+            elapsed = monotonic() - self._startTime
+
+        throughput = 0.0
+        if elapsed > 0:
+            throughput = self.written / elapsed
+
+        return {
+            "bucket": self.bucketName,
+            "queueDepth": len(self._queue),
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "errors": self.errors,
+            "retries": self.retries,
+            "connected": self.connected,
+            "samplesPerSecond": throughput,
+            "lastFlushSeconds": self.lastFlushSeconds,
+        }
+
+    ##
+    ## _threadMain - Body of the writer thread
+    ##
+    def _threadMain(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._wakeup = asyncio.Event()
+        self._ready.set()
+
+        try:
+            self._loop.run_until_complete(self._serve())
+        except Exception as error:
+            self.errors = self.errors + 1
+            self._running = False
+            log.error("%s writer stopped: %s", self.bucketName, error)
+        finally:
+            self._loop.close()
+
+    ##
+    ## _wait - Wait up to 'seconds' for write() or stop() to wake the
+    ## writer
+    ##
+    async def _wait(self, seconds):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    ##
+    ## _backOff - Wait 'seconds' before reconnecting; only stop() cuts
+    ## the wait short
+    ##
+    async def _backOff(self, seconds):
+        deadline = monotonic() + seconds
+        while self._running:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return
+            await self._wait(remaining)
+
+    ##
+    ## _serve - Hold one connection open for the lifetime of the writer
+    ## and flush batches until stopped, reconnecting with an increasing
+    ## back-off whenever the connection cannot be opened or a write
+    ## fails.
+    ##
+    async def _serve(self):
+        delay = self.retryDelay
+        while True:
+            try:
+                await self.backend.open()
+            except Exception as error:
+                self.errors = self.errors + 1
+                await self._close()
+                if not self._running:
+                    break
+                log.warning("Cannot open %s: %s (retrying in %.1f s)",
+                            self.bucketName, error, delay)
+            else:
+                self.connected = True
+                delay = self.retryDelay
+                finished = await self._writeBatches()
+                await self._close()
+                if finished or not self._running:
+                    break
+
+            self.retries = self.retries + 1
+            await self._backOff(delay)
+            delay = min(delay * 2, self.maxRetryDelay)
+
+        if self._queue:
+            log.error("%s writer stopped with %d samples not written",
+                      self.bucketName, len(self._queue))
+
+    ##
+    ## _writeBatches - Flush batches until stopped, then drain the queue.
+    ## Returns False as soon as a write fails.
+    ##
+    async def _writeBatches(self):
+        while self._running:
+            ## A full batch left over from the last flush (or queued
+            ## while disconnected) is written without waiting
+            if len(self._queue) < self.batchSize:
+                await self._wait(self.flushInterval)
+            if not await self._flush():
+                return False
+
+        ## Drain the remaining samples on shutdown
+        while self._queue:
+            if not await self._flush():
+                return False
+        return True
+
+    ##
+    ## _close - Close the connection, which may already be broken
+    ##
+    async def _close(self):
+        self.connected = False
+        try:
+            await self.backend.close()
+        except Exception as error:
+            log.debug("Closing %s: %s", self.bucketName, error)
+
+    ##
+    ## _requeue - Put the samples of a failed write back at the front of
+    ## the queue, dropping the oldest ones that no longer fit
+    ##
+    def _requeue(self, samples):
+        room = self._queue.maxlen - len(self._queue)
+        if len(samples) > room:
+            self.dropped = self.dropped + len(samples) - room
+            samples = samples[len(samples) - room:]
+        self._queue.extendleft(reversed(samples))
+
+    ##
+    ## _flush - Write up to one batch per entry of queued samples.
+    ## Returns False if a write failed; only the samples of the entries
+    ## that were not written are queued again.
+    ##
+    async def _flush(self):
+        if not self._queue:
+            return True
+
+        started = monotonic()
+
+        ## Group the queued samples by entry
+        samples = []
+        batches = {}
+        while self._queue and len(samples) < self.batchSize:
+            sample = self._queue.popleft()
+            samples.append(sample)
+            entry, timestamp, payload = sample
+            batches.setdefault(entry, []).append((timestamp, payload))
+
+        ## Entries written before a failure are not written again
+        written = set()
+        try:
+            for entry, records in batches.items():
+                await self.backend.write(entry, records)
+                written.add(entry)
+        except Exception as error:
+            self.errors = self.errors + 1
+            pending = [sample for sample in samples if sample[0] not in written]
+            self.written = self.written + len(samples) - len(pending)
+            self._requeue(pending)
+            log.warning("Failed to write to %s: %s (%d samples to retry)",
+                        self.bucketName, error, len(pending))
+            return False
+
+        count = len(samples)
+        self.written = self.written + count
+        self.batches = self.batches + 1
+        self.lastFlushSeconds = monotonic() - started
+
+        log.debug("Wrote %d samples to %s", count, self.bucketName)
+
+        return True
+
+    ## End class ReductWriter definition
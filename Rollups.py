@@ -0,0 +1,289 @@
+#
+# Rollups keeps incremental minute, hour and day summaries of the
+# PlantSitter readings: minimum, maximum, mean, sample count and the
+# time spent in each machine state. Every sample costs O(1) work, and
+# closed buckets are appended to a compact binary file so that reports
+# and remote queries never have to touch raw samples.
+#
+# Rollup file record (little endian, 38 bytes):
+#
+#   resolution (B), channel id (B), bucket start in epoch seconds (d),
+#   sample count (I), minimum (f), maximum (f), mean (f),
+#   seconds in each of the channel's three states (3f)
+#
+# The time between two samples is split at bucket boundaries, so every
+# second in a state is credited to the minute, hour and day it falls in.
+# Days start at local midnight, also across daylight saving time
+# changes.
+#
+# Buckets still open at shutdown are written as well, so a period that
+# spans a restart can appear twice with the same start; readers combine
+# such records.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from collections import namedtuple
+from time import localtime, mktime
+
+import struct
+import threading
+
+##
+## Bucket resolutions and their lengths in seconds
+##
+MINUTE = 1
+HOUR = 2
+DAY = 3
+
+RESOLUTIONS = {
+    MINUTE: 60,
+    HOUR: 60 * 60,
+    DAY: 24 * 60 * 60,
+}
+
+RESOLUTION_NAMES = {MINUTE: 'minute', HOUR: 'hour', DAY: 'day'}
+
+##
+## Time between two samples that is credited to a state is capped at
+## this many seconds by default, so an outage is not counted as time in
+## a state. It has to be longer than the sampling interval, or part of
+## every interval is lost.
+##
+MAX_GAP = 10.0
+
+RECORD = struct.Struct('<BBdIfff3f')
+
+RollupRecord = namedtuple('RollupRecord',
+                          ['resolution', 'channel', 'start', 'count', 'minimum',
+                           'maximum', 'mean', 'stateSeconds'])
+
+##
+## Bucket - Running summary of one channel over one period
+##
+class Bucket():
+    "Running min/max/mean/count and time-in-state of one period"
+
+    __slots__ = ('start', 'count', 'minimum', 'maximum', 'total', 'stateSeconds')
+
+    def __init__(self, start, states):
+        self.start = start
+        self.count = 0
+        self.minimum = float('inf')
+        self.maximum = float('-inf')
+        self.total = 0.0
+        self.stateSeconds = [0.0] * states
+
+    def add(self, value):
+        self.count = self.count + 1
+        self.total = self.total + value
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+
+    def mean(self):
+        if self.count == 0:
+            return 0.0
+        return self.total / self.count
+
+    ## End class Bucket definition
+
+##
+## RollupEngine - Maintains the open buckets of every channel
+##
+class RollupEngine():
+    "Incremental minute/hour/day rollups of PlantSitter readings"
+
+    ##
+    ## Class Initialization method
+    ##
+    ##  path      - file the closed buckets are appended to (None keeps
+    ##              them in memory only)
+    ##  utcOffset - seconds added to epoch time before bucketing so that
+    ##              days start at local midnight (None follows the local
+    ##              time zone, including daylight saving time changes)
+    ##  onClose   - optional callback receiving every closed RollupRecord
+    ##  maxGap    - longest time between two samples credited to a state
+    ##
+    def __init__(self, path = None, utcOffset = None, onClose = None, maxGap = MAX_GAP):
+        self.path = path
+        self.onClose = onClose
+        self.maxGap = maxGap
+        self.utcOffset = utcOffset
+
+        self.channels = {}
+        self.closed = 0
+
+        self._lock = threading.Lock()
+        self._file = None
+        if path is not None:
+            self._file = open(path, 'ab')
+
+    ##
+    ## addChannel - Register a channel and the names of its states
+    ## (at most three, e.g. ('off', 'heat', 'cool')).
+    ##
+    def addChannel(self, channel, states):
+        self.channels[channel] = {
+            'states': {name: index for index, name in enumerate(states)},
+            'buckets': {},
+            'lastTime': None,
+            'lastState': None,
+        }
+
+    ##
+    ## _bucketStart - Start of the period of 'resolution' holding 'when'.
+    ## 'local' is localtime(when) when following the local time zone,
+    ## None otherwise.
+    ##
+    def _bucketStart(self, resolution, when, local):
+        if local is None:
+            utcOffset = self.utcOffset
+        elif resolution == DAY:
+            ## Local midnight, which is 23 or 25 hours after the last one
+            ## on the days daylight saving time starts or ends
+            return mktime((local.tm_year, local.tm_mon, local.tm_mday, 0, 0, 0, 0, 0, -1))
+        else:
+            utcOffset = local.tm_gmtoff
+
+        length = RESOLUTIONS[resolution]
+        shifted = when + utcOffset
+        return shifted - (shifted % length) - utcOffset
+
+    ##
+    ## update - Add one sample of 'channel' taken at epoch time 'when'
+    ## while the channel's machine was in 'state'.
+    ##
+    def update(self, channel, when, value, state):
+        with self._lock:
+            info = self.channels[channel]
+            buckets = info['buckets']
+            stateCount = len(info['states'])
+
+            ## The time since the previous sample belongs to its state
+            lastTime = info['lastTime']
+            elapsed = 0.0
+            if lastTime is not None:
+                elapsed = min(max(0.0, when - lastTime), self.maxGap)
+            lastState = info['lastState']
+            if lastState is None:
+                elapsed = 0.0
+
+            local = localtime(when) if self.utcOffset is None else None
+            for resolution in RESOLUTIONS:
+                start = self._bucketStart(resolution, when, local)
+                bucket = buckets.get(resolution)
+                share = elapsed
+                if bucket is not None and bucket.start != start:
+                    ## The part of the interval up to the end of the
+                    ## bucket being closed still belongs to it, the rest
+                    ## to the new bucket (or to empty ones in between,
+                    ## which are not kept)
+                    share = 0.0
+                    if elapsed:
+                        spanEnd = lastTime + elapsed
+                        end = self._bucketStart(resolution, spanEnd,
+                                                None if local is None else localtime(spanEnd))
+                        if end == bucket.start:
+                            end = spanEnd
+                        bucket.stateSeconds[lastState] += max(0.0, end - lastTime)
+                        if end == start:
+                            share = spanEnd - end
+                    self._close(resolution, channel, bucket)
+                    bucket = None
+                if bucket is None:
+                    bucket = Bucket(start, stateCount)
+                    buckets[resolution] = bucket
+
+                bucket.add(value)
+                if share:
+                    bucket.stateSeconds[lastState] += share
+
+            info['lastTime'] = when
+            info['lastState'] = info['states'].get(state)
+
+    ##
+    ## current - The open bucket of 'channel' at 'resolution' as a
+    ## RollupRecord, or None
+    ##
+    def current(self, channel, resolution):
+        with self._lock:
+            bucket = self.channels[channel]['buckets'].get(resolution)
+            if bucket is None:
+                return None
+            return self._record(resolution, channel, bucket)
+
+    ##
+    ## flush - Close every open bucket (used at shutdown)
+    ##
+    def flush(self):
+        with self._lock:
+            for channel, info in self.channels.items():
+                for resolution, bucket in info['buckets'].items():
+                    self._close(resolution, channel, bucket)
+                info['buckets'] = {}
+            if self._file is not None:
+                self._file.flush()
+
+    ##
+    ## close - Close the open buckets and the rollup file
+    ##
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _record(self, resolution, channel, bucket):
+        return RollupRecord(resolution, channel, bucket.start, bucket.count,
+                            bucket.minimum, bucket.maximum, bucket.mean(),
+                            tuple(bucket.stateSeconds))
+
+    ##
+    ## _close - Persist a finished bucket. The caller holds self._lock.
+    ##
+    def _close(self, resolution, channel, bucket):
+        if bucket.count == 0:
+            return
+
+        record = self._record(resolution, channel, bucket)
+        self.closed = self.closed + 1
+
+        if self._file is not None:
+            seconds = (list(record.stateSeconds) + [0.0, 0.0, 0.0])[:3]
+            self._file.write(RECORD.pack(resolution, channel, record.start,
+                                         record.count, record.minimum,
+                                         record.maximum, record.mean, *seconds))
+            ## Day and hour buckets are rare; make sure they hit the disk
+            if resolution != MINUTE:
+                self._file.flush()
+
+        if self.onClose is not None:
+            self.onClose(record)
+
+    ## End class RollupEngine definition
+
+##
+## readRollups - Generator over the records of a rollup file, optionally
+## filtered by resolution, channel and start time.
+##
+def readRollups(path, resolution = None, channel = None, since = None):
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    usable = len(data) - (len(data) % RECORD.size)
+    for fields in RECORD.iter_unpack(memoryview(data)[:usable]):
+        if resolution is not None and fields[0] != resolution:
+            continue
+        if channel is not None and fields[1] != channel:
+            continue
+        if since is not None and fields[2] < since:
+            continue
+        yield RollupRecord(fields[0], fields[1], fields[2], fields[3], fields[4],
+                           fields[5], fields[6], tuple(fields[7:10]))
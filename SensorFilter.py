@@ -0,0 +1,160 @@
+#
+# SensorFilter is the streaming filter stage between a sensor reading and
+# the control decision of a channel. A single noisy sample used to be
+# enough to flip a channel between states (and so restart its LED pulse
+# and add a transition to the serial log); every reading now passes
+# through three steps, each with a fixed cost per sample:
+#
+#   - spike rejection: a reading further than spikeLimit from the running
+#     median is dropped. After maxRejects rejections in a row the level
+#     is taken to have really moved and the window restarts from it.
+#   - running median over the last 'window' readings, kept in a
+#     preallocated ring plus a sorted copy of it
+#   - exponential moving average of the median (alpha 1 turns it off)
+#
+# A reading that is not a number is dropped like a spike.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from bisect import bisect_left, insort
+
+##
+## Default filter settings
+##
+DEFAULT_WINDOW = 5
+DEFAULT_ALPHA = 0.5
+DEFAULT_MAX_REJECTS = 3
+
+##
+## StreamingFilter - Spike rejection, running median and EMA over one
+## stream of readings
+##
+class StreamingFilter():
+    "Constant cost per sample filter for one channel's readings"
+
+    ##
+    ## Class Initialization method
+    ##
+    ##  window     - number of readings in the running median
+    ##  alpha      - weight of a new median in the moving average, 1 for
+    ##               no smoothing
+    ##  spikeLimit - largest distance from the median still accepted, or
+    ##               None to accept every reading
+    ##  maxRejects - rejections in a row after which a reading is taken
+    ##               as a real step
+    ##
+    def __init__(self, window = DEFAULT_WINDOW, alpha = DEFAULT_ALPHA, spikeLimit = None,
+                 maxRejects = DEFAULT_MAX_REJECTS):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha must be in (0, 1]")
+
+        self.window = window
+        self.alpha = alpha
+        self.spikeLimit = spikeLimit
+        self.maxRejects = maxRejects
+
+        ## Ring of the last readings in arrival order, the same readings
+        ## sorted, the next ring slot and the number of readings held
+        self._ring = [0.0] * window
+        self._sorted = []
+        self._next = 0
+        self._count = 0
+
+        ## Rejections in a row
+        self._rejectRun = 0
+
+        ## Latest filtered value (None before the first reading)
+        self.value = None
+
+        self.samples = 0
+        self.rejected = 0
+        self.steps = 0
+
+    ##
+    ## median - Median of the readings in the window (None when empty)
+    ##
+    def median(self):
+        count = self._count
+        if count == 0:
+            return None
+        middle = count // 2
+        if count % 2:
+            return self._sorted[middle]
+        return (self._sorted[middle - 1] + self._sorted[middle]) / 2
+
+    ##
+    ## _push - Add 'reading' to the window, replacing the oldest one once
+    ## the window is full
+    ##
+    def _push(self, reading):
+        ring = self._ring
+        ordered = self._sorted
+        if self._count == self.window:
+            del ordered[bisect_left(ordered, ring[self._next])]
+        else:
+            self._count = self._count + 1
+        ring[self._next] = reading
+        insort(ordered, reading)
+        self._next = (self._next + 1) % self.window
+
+    ##
+    ## reset - Forget every reading; the next one starts a new window
+    ## and a new average
+    ##
+    def reset(self):
+        self._sorted.clear()
+        self._next = 0
+        self._count = 0
+        self._rejectRun = 0
+        self.value = None
+
+    ##
+    ## update - Filter one reading and return the filtered value. A
+    ## rejected reading returns the previous value (None before the
+    ## first accepted reading).
+    ##
+    def update(self, reading):
+        self.samples = self.samples + 1
+        if reading != reading:
+            self.rejected = self.rejected + 1
+            return self.value
+
+        if self.spikeLimit is not None and self._count:
+            if abs(reading - self.median()) > self.spikeLimit:
+                if self._rejectRun < self.maxRejects:
+                    self._rejectRun = self._rejectRun + 1
+                    self.rejected = self.rejected + 1
+                    return self.value
+
+                ## The readings stay away from the median - a real step,
+                ## so the window starts again from the new level
+                self._sorted.clear()
+                self._next = 0
+                self._count = 0
+                self.steps = self.steps + 1
+        self._rejectRun = 0
+
+        self._push(reading)
+        median = self.median()
+        if self.value is None:
+            self.value = median
+        else:
+            self.value = self.value + self.alpha * (median - self.value)
+        return self.value
+
+    def getStats(self):
+        return {
+            "samples": self.samples,
+            "rejected": self.rejected,
+            "steps": self.steps,
+        }
+
+    ## End class StreamingFilter definition
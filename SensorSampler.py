@@ -0,0 +1,368 @@
+#
+# SensorSampler owns the temperature/humidity sensor and publishes a
+# single, coherent, timestamped snapshot of its readings so that every
+# consumer (state machines, LCDs, LEDs and the serial link) agrees on
+# the same values while the I2C bus is only touched once per tick.
+#
+# MultiSensorSampler does the same for several sensors. It triggers the
+# conversion of every sensor, waits once for the slowest of them and then
+# reads them all back, so a sampling cycle takes about one conversion
+# time however many sensors there are.
+#
+# Both samplers treat a failed read the same way: it is counted and
+# logged, and up to maxFailures failed reads in a row of a sensor are
+# bridged with its previous snapshot (whose timestamp shows how old it
+# is). After that, or when there is no previous snapshot, asking for the
+# sensor's reading raises StaleReadingError until a read succeeds again.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from collections import namedtuple
+from time import monotonic, sleep
+from datetime import datetime
+
+import logging
+import threading
+
+log = logging.getLogger('plantsitter.sensor')
+
+##
+## SensorSnapshot - immutable view of one sensor conversion.
+##
+##  timestamp   - wall clock time the reading was taken (datetime)
+##  monotonic   - monotonic clock value used for age calculations
+##  temperature - temperature in degrees Celsius
+##  humidity    - relative humidity in percent
+##
+SensorSnapshot = namedtuple('SensorSnapshot',
+                            ['timestamp', 'monotonic', 'temperature', 'humidity'])
+
+##
+## Default maximum age (in seconds) of a snapshot before a new
+## conversion is started on the sensor.
+##
+DEFAULT_MAX_AGE = 1.0
+
+##
+## Default number of failed reads in a row that are bridged with the
+## previous snapshot
+##
+DEFAULT_MAX_FAILURES = 3
+
+##
+## StaleReadingError - Raised for a sensor without a usable reading
+##
+class StaleReadingError(RuntimeError):
+    "No recent reading from a sensor"
+
+##
+## SensorSampler - Class that owns the sensor object. Readers call
+## getSnapshot() and get back the most recent snapshot, which is only
+## refreshed from the hardware once it is older than maxAge.
+##
+class SensorSampler():
+    "Owns the temperature/humidity sensor and publishes coherent snapshots"
+
+    ##
+    ## Class Initialization method
+    ##
+    ##  sensor    - any object exposing .temperature and .relative_humidity;
+    ##              sensors with read() (pipelined and periodic ones, see
+    ##              PlantSitterHAL.py) are read with a single call
+    ##  maxAge    - maximum age of a snapshot in seconds
+    ##  histogram - optional histogram (anything with observe(seconds))
+    ##              receiving the duration of every sensor read
+    ##  clock       - monotonic time source for the snapshot ages
+    ##                (swappable for simulation)
+    ##  maxFailures - failed reads in a row bridged with the previous
+    ##                snapshot before StaleReadingError is raised
+    ##
+    def __init__(self, sensor, maxAge = DEFAULT_MAX_AGE, histogram = None,
+                 clock = monotonic, maxFailures = DEFAULT_MAX_FAILURES):
+        self.sensor = sensor
+        self.maxAge = maxAge
+        self.histogram = histogram
+        self.clock = clock
+        self.maxFailures = maxFailures
+
+        ## Number of times the sensor itself has been read, the number
+        ## of reads that failed (I2C errors), and the failed reads since
+        ## the last good one
+        self.reads = 0
+        self.errors = 0
+        self.failures = 0
+
+        ## The latest published snapshot (None until the first read) and
+        ## the time of the last read, good or failed
+        self._snapshot = None
+        self._attempted = None
+
+        ## Serializes access to the sensor so that only one thread
+        ## ever starts a conversion at a time.
+        self._lock = threading.Lock()
+
+    ##
+    ## sample - Force a fresh conversion on the sensor and publish it.
+    ##
+    def sample(self):
+        with self._lock:
+            return self._sampleLocked()
+
+    ##
+    ## _sampleLocked - Read both values from the sensor. The caller
+    ## must hold self._lock.
+    ##
+    def _sampleLocked(self):
+        started = monotonic()
+        try:
+            read = getattr(self.sensor, 'read', None)
+            if read is not None:
+                temperature, humidity = read()
+            else:
+                temperature = self.sensor.temperature
+                humidity = self.sensor.relative_humidity
+        except Exception as error:
+            self.errors = self.errors + 1
+            self.failures = self.failures + 1
+            self._attempted = self.clock()
+            if self._snapshot is None or self.failures > self.maxFailures:
+                raise StaleReadingError("No reading from the sensor (%d failed reads in a row)"
+                                        % self.failures) from error
+            log.warning("Sensor read failed (%d in a row), keeping the previous reading",
+                        self.failures, exc_info = True)
+            return self._snapshot
+        finally:
+            if self.histogram is not None:
+                self.histogram.observe(monotonic() - started)
+        self.reads = self.reads + 1
+        self.failures = 0
+
+        self._snapshot = SensorSnapshot(datetime.now(), self.clock(),
+                                        temperature, humidity)
+        self._attempted = self._snapshot.monotonic
+        return self._snapshot
+
+    ##
+    ## _current - The snapshot if the last read, good or bridged, is no
+    ## older than maxAge seconds, otherwise None
+    ##
+    def _current(self, maxAge):
+        snapshot = self._snapshot
+        attempted = self._attempted
+        if snapshot is None or self.failures > self.maxFailures:
+            return None
+        if self.clock() - attempted > maxAge:
+            return None
+        return snapshot
+
+    ##
+    ## getSnapshot - Return a snapshot that is no older than maxAge
+    ## seconds, reading the sensor only when the current one is stale.
+    ## A failed read is retried once maxAge has passed.
+    ##
+    def getSnapshot(self, maxAge = None):
+        if maxAge is None:
+            maxAge = self.maxAge
+
+        ## Fast path - no lock needed to look at an immutable tuple
+        snapshot = self._current(maxAge)
+        if snapshot is not None:
+            return snapshot
+
+        with self._lock:
+            ## Another thread may have refreshed it while we waited
+            snapshot = self._current(maxAge)
+            if snapshot is not None:
+                return snapshot
+            return self._sampleLocked()
+
+    ##
+    ## Convenience accessors
+    ##
+    def getCelsius(self):
+        return self.getSnapshot().temperature
+
+    def getFahrenheit(self):
+        return (((9/5) * self.getSnapshot().temperature) + 32)
+
+    def getHumidity(self):
+        return self.getSnapshot().humidity
+
+    ## End class SensorSampler definition
+
+##
+## MultiSensorSampler - Samples several pipelined sensors (see
+## PlantSitterHAL.PipelinedSensor) in one cycle: trigger all, wait for
+## the slowest conversion, read all. It offers the same accessors as
+## SensorSampler, for the first sensor unless another one is named.
+##
+## A sensor that fails keeps its previous snapshot for up to maxFailures
+## cycles in a row, and the others are still published; after that,
+## asking for it raises StaleReadingError.
+##
+class MultiSensorSampler():
+    "Samples several sensors with one shared conversion wait"
+
+    ##
+    ## Class Initialization method
+    ##
+    ##  sensors     - list of (name, pipelined sensor) pairs
+    ##  maxAge      - maximum age of a cycle in seconds
+    ##  histogram   - optional histogram (anything with observe(seconds))
+    ##                receiving the duration of every sampling cycle
+    ##  clock       - monotonic time source for the snapshot ages
+    ##                (swappable for simulation)
+    ##  maxFailures - failed reads in a row of a sensor bridged with its
+    ##                previous snapshot before StaleReadingError is raised
+    ##
+    def __init__(self, sensors, maxAge = DEFAULT_MAX_AGE, histogram = None,
+                 clock = monotonic, maxFailures = DEFAULT_MAX_FAILURES):
+        self.sensors = list(sensors)
+        if not self.sensors:
+            raise ValueError("MultiSensorSampler needs at least one sensor")
+
+        self.names = [name for name, sensor in self.sensors]
+        self.default = self.names[0]
+        self.maxAge = maxAge
+        self.histogram = histogram
+        self.clock = clock
+        self.maxFailures = maxFailures
+
+        ## Sensor reads, failed reads (in total, per sensor and in a row
+        ## per sensor), cycles, and the duration of the last cycle in
+        ## seconds
+        self.reads = 0
+        self.errors = 0
+        self.sensorErrors = {name: 0 for name in self.names}
+        self.failures = {name: 0 for name in self.names}
+        self.cycles = 0
+        self.lastCycle = None
+
+        ## Latest snapshot of every sensor, replaced as a whole, and the
+        ## clock time the last cycle finished
+        self._snapshots = {}
+        self._sampled = None
+
+        self._lock = threading.Lock()
+
+    ##
+    ## sample - Run a sampling cycle now and return the snapshot of the
+    ## default sensor.
+    ##
+    def sample(self):
+        with self._lock:
+            self._sampleLocked()
+        return self._snapshot(self.default)
+
+    def _failed(self, name, stage):
+        self.errors = self.errors + 1
+        self.sensorErrors[name] = self.sensorErrors[name] + 1
+        self.failures[name] = self.failures[name] + 1
+        log.warning("Sensor %s failed during %s (%d in a row)", name, stage,
+                    self.failures[name], exc_info = True)
+
+    ##
+    ## _sampleLocked - One trigger-all, wait, read-all cycle. The caller
+    ## must hold self._lock.
+    ##
+    def _sampleLocked(self):
+        started = monotonic()
+
+        ## Start every conversion, remembering when each one is done
+        pending = []
+        for name, sensor in self.sensors:
+            try:
+                sensor.trigger()
+            except Exception:
+                self._failed(name, 'trigger')
+                continue
+            pending.append((name, sensor, monotonic() + sensor.conversionTime))
+
+        ## One wait, for the slowest conversion
+        if pending:
+            remaining = max(ready for name, sensor, ready in pending) - monotonic()
+            if remaining > 0:
+                sleep(remaining)
+
+        snapshots = dict(self._snapshots)
+        for name, sensor, ready in pending:
+            try:
+                temperature, humidity = sensor.collect()
+            except Exception:
+                self._failed(name, 'read back')
+                continue
+            self.reads = self.reads + 1
+            self.failures[name] = 0
+            snapshots[name] = SensorSnapshot(datetime.now(), self.clock(),
+                                             temperature, humidity)
+
+        self.cycles = self.cycles + 1
+        self.lastCycle = monotonic() - started
+        if self.histogram is not None:
+            self.histogram.observe(self.lastCycle)
+
+        self._snapshots = snapshots
+        self._sampled = self.clock()
+
+    def _snapshot(self, name):
+        snapshot = self._snapshots.get(name)
+        failures = self.failures.get(name, 0)
+        if snapshot is None or failures > self.maxFailures:
+            raise StaleReadingError("No reading from sensor %s (%d failed reads in a row)"
+                                    % (name, failures))
+        return snapshot
+
+    ##
+    ## _refresh - Run a new cycle if the last one is older than maxAge
+    ##
+    def _refresh(self, maxAge):
+        if maxAge is None:
+            maxAge = self.maxAge
+
+        ## Fast path - no lock needed, the dictionary is never modified
+        sampled = self._sampled
+        if sampled is not None and (self.clock() - sampled) <= maxAge:
+            return
+
+        with self._lock:
+            sampled = self._sampled
+            if sampled is None or (self.clock() - sampled) > maxAge:
+                self._sampleLocked()
+
+    ##
+    ## getSnapshot - The snapshot of sensor 'name' (the first sensor when
+    ## None) from a cycle no older than maxAge seconds. A new cycle
+    ## refreshes every sensor.
+    ##
+    def getSnapshot(self, maxAge = None, name = None):
+        self._refresh(maxAge)
+        return self._snapshot(self.default if name is None else name)
+
+    ##
+    ## getSnapshots - {name: snapshot} of every sensor with a usable
+    ## reading
+    ##
+    def getSnapshots(self, maxAge = None):
+        self._refresh(maxAge)
+        return {name: snapshot for name, snapshot in self._snapshots.items()
+                if self.failures[name] <= self.maxFailures}
+
+    ##
+    ## Convenience accessors
+    ##
+    def getCelsius(self, name = None):
+        return self.getSnapshot(name = name).temperature
+
+    def getFahrenheit(self, name = None):
+        return (((9/5) * self.getSnapshot(name = name).temperature) + 32)
+
+    def getHumidity(self, name = None):
+        return self.getSnapshot(name = name).humidity
+
+    ## End class MultiSensorSampler definition
@@ -0,0 +1,172 @@
+#
+# SerialWriter is the only code that writes to the UART. Both state
+# machines hand it complete messages, and a dedicated thread writes
+# everything that has been queued in one ser.write() call, so messages
+# can never interleave on the wire and the control loops never block on
+# a slow serial port. The queue is bounded: while the port is stalled,
+# messages that do not fit are dropped and counted instead of growing
+# memory without limit. A failing port is logged on the first error and
+# then at most every errorLogInterval seconds.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from time import monotonic
+
+import logging
+import queue
+import threading
+
+log = logging.getLogger('plantsitter.serial')
+
+##
+## SerialWriter - Batched writer for a pyserial port (or anything with
+## a write(bytes) method)
+##
+class SerialWriter():
+    "Single writer thread for the serial port"
+
+    ##
+    ## Class Initialization method
+    ##
+    ##  port      - the serial port object
+    ##  maxBatch  - maximum number of bytes combined into one write
+    ##  histogram - optional histogram (anything with observe(seconds))
+    ##              receiving the duration of every port.write()
+    ##  maxQueue  - messages waiting at most; send() drops the message
+    ##              beyond it
+    ##  errorLogInterval - seconds between two logged write failures
+    ##
+    def __init__(self, port, maxBatch = 4096, histogram = None, maxQueue = 1000,
+                 errorLogInterval = 60.0):
+        self.port = port
+        self.maxBatch = maxBatch
+        self.histogram = histogram
+        self.errorLogInterval = errorLogInterval
+
+        ## Statistics
+        self.messages = 0
+        self.writes = 0
+        self.bytesWritten = 0
+        self.errors = 0
+        self.dropped = 0
+        self._startTime = monotonic()
+
+        ## Errors since the last successful write, and when the last one
+        ## was logged
+        self._failing = 0
+        self._loggedAt = None
+
+        self._queue = queue.Queue(maxsize = maxQueue)
+        self._thread = threading.Thread(target=self._serve, name="SerialWriter",
+                                        daemon=True)
+        self._thread.start()
+
+    ##
+    ## send - Queue one complete message (bytes). Never blocks; the
+    ## message is dropped when the queue is full.
+    ##
+    def send(self, data):
+        try:
+            self._queue.put_nowait(data)
+        except queue.Full:
+            self.dropped = self.dropped + 1
+
+    ##
+    ## flush - Wait until everything queued so far has been written
+    ##
+    def flush(self):
+        self._queue.join()
+
+    ##
+    ## close - Write whatever is still queued and stop the writer
+    ##
+    def close(self, timeout = 5.0):
+        try:
+            self._queue.put(None, timeout = timeout)
+        except queue.Full:
+            log.warning("Serial port stalled, %d messages not written", self._queue.qsize())
+            return
+        self._thread.join(timeout)
+
+    ##
+    ## getStats - Writer throughput
+    ##
+    def getStats(self):
+        elapsed = monotonic() - self._startTime
+        bytesPerSecond = 0.0
+        if elapsed > 0:
+            bytesPerSecond = self.bytesWritten / elapsed
+
+        return {
+            "queueDepth": self._queue.qsize(),
+            "messages": self.messages,
+            "writes": self.writes,
+            "bytes": self.bytesWritten,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "bytesPerSecond": bytesPerSecond,
+        }
+
+    ##
+    ## _serve - Body of the writer thread. Everything already queued is
+    ## joined into a single write, up to maxBatch bytes.
+    ##
+    def _serve(self):
+        stop = False
+        while not stop:
+            batch = []
+            size = 0
+            item = self._queue.get()
+            while True:
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+                    size = size + len(item)
+                if stop or size >= self.maxBatch:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            try:
+                if batch:
+                    data = b''.join(batch)
+                    started = monotonic()
+                    self.port.write(data)
+                    if self.histogram is not None:
+                        self.histogram.observe(monotonic() - started)
+                    self.writes = self.writes + 1
+                    self.bytesWritten = self.bytesWritten + len(data)
+                    self.messages = self.messages + len(batch)
+                    if self._failing:
+                        log.info("Serial port writes recovered after %d errors", self._failing)
+                        self._failing = 0
+            except Exception:
+                self.errors = self.errors + 1
+                self._failed(len(batch))
+            finally:
+                for index in range(len(batch) + (1 if stop else 0)):
+                    self._queue.task_done()
+
+    ##
+    ## _failed - Log a failed write of 'count' messages: the first one
+    ## after a success, then one every errorLogInterval seconds
+    ##
+    def _failed(self, count):
+        self._failing = self._failing + 1
+        now = monotonic()
+        if self._failing > 1 and now - self._loggedAt < self.errorLogInterval:
+            return
+        self._loggedAt = now
+        log.warning("Serial port write of %d messages failed (%d errors in a row)",
+                    count, self._failing, exc_info = True)
+
+    ## End class SerialWriter definition
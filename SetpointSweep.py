@@ -0,0 +1,346 @@
+#
+# SetpointSweep replays the PlantSitter channel decisions over recorded
+# readings for a whole grid of candidate configurations at once, to help
+# choose a setpoint, a hysteresis threshold and a decision period.
+#
+# Readings come from a HistoryRing file or from a CSV file with a header
+# naming at least 'time' and the channel ('temperature', 'humidity').
+# For every decision period the readings are sampled on the decision
+# grid, floored like ControlChannel.decide() does, and run-length encoded
+# (a setpoint can only be crossed where the floored reading changes, so
+# months of slowly moving 1 Hz data shrink to a few thousand runs). The
+# off/below/above rules are then evaluated with NumPy for every
+# (setpoint, threshold) pair side by side, in chunks of bounded size.
+#
+# A threshold of 0 is exactly the rule of ControlChannel.target(); a
+# threshold h only leaves a state once the reading is more than h past
+# the setpoint, which shows what a hysteresis band would save.
+#
+# Reported per configuration: transitions (and per day), share of time
+# in each state, and the deviation of the readings from the setpoint.
+# The replay is open loop - the recorded readings do not react to the
+# replayed decisions - so use PlantSimulation.py to compare how a
+# configuration actually holds the plant.
+#
+# Usage: python SetpointSweep.py history.ring|readings.csv
+#                                [--channel temperature]
+#                                [--set-points 60:95] [--step 1]
+#                                [--thresholds 0,1,2,3]
+#                                [--decision-periods 1,5,10,30,60,300]
+#                                [--tolerance 1] [--sort [-]transitions]
+#                                [--top 20] [--output sweep.csv]
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from time import monotonic
+
+import argparse
+import os
+
+from HistoryRing import HistoryRing
+from PlantSimulation import DEFAULT_TOLERANCES, SECONDS_PER_DAY
+from PlantSitterChannels import CHANNELS
+
+##
+## Largest number of (configuration, run) cells evaluated at once. The
+## replay of one chunk holds a few arrays of this many bytes.
+##
+CHUNK_CELLS = 1 << 22
+
+DEFAULT_THRESHOLDS = (0, 1, 2, 3)
+DEFAULT_DECISION_PERIODS = (1, 5, 10, 30, 60, 300)
+
+##
+## Replayed states, as stored in the state arrays
+##
+STATE_IDLE = 0
+STATE_BELOW = 1
+STATE_ABOVE = -1
+
+##
+## Fields of one result row
+##
+RESULT_FIELDS = ['setPoint', 'threshold', 'decisionPeriod', 'transitions',
+                 'transitionsPerDay', 'idle', 'below', 'above',
+                 'timeAtSetPoint', 'meanAbsoluteDeviation', 'maxDeviation']
+
+def resultDtype():
+    import numpy
+    return numpy.dtype([(field, '<i8' if field == 'transitions' else '<f8')
+                        for field in RESULT_FIELDS])
+
+##
+## loadReadings - (times, values) of 'channel' as float64 NumPy arrays
+## sorted by time, without missing readings. CSV files are recognised by
+## their extension, anything else must be a HistoryRing file.
+##
+def loadReadings(path, channel):
+    import numpy
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+
+    if path.lower().endswith('.csv'):
+        with open(path) as source:
+            header = [name.strip() for name in source.readline().split(',')]
+        if 'time' not in header or channel not in header:
+            raise ValueError(path + " has no 'time' and '" + channel + "' columns")
+        data = numpy.loadtxt(path, delimiter = ',', skiprows = 1, ndmin = 2,
+                             usecols = (header.index('time'), header.index(channel)))
+        times = data[:, 0]
+        values = data[:, 1]
+    else:
+        ring = HistoryRing(path, readOnly = True)
+        try:
+            records = ring.lastArray(ring.count)
+            times = records['time'].astype(numpy.float64)
+            values = records[channel].astype(numpy.float64)
+
+            ## The record array may still point into the mapping
+            del records
+        finally:
+            ring.close()
+
+    keep = numpy.isfinite(times) & numpy.isfinite(values)
+    times = times[keep]
+    values = values[keep]
+    order = numpy.argsort(times, kind = 'stable')
+    return times[order], values[order]
+
+##
+## decisionReadings - The floored reading seen by each decision taken
+## every 'decisionPeriod' seconds: the latest reading at or before it,
+## like the engine reading the newest sensor snapshot.
+##
+def decisionReadings(times, values, decisionPeriod):
+    import numpy
+    count = int((times[-1] - times[0]) // decisionPeriod) + 1
+    grid = times[0] + numpy.arange(count) * decisionPeriod
+    latest = numpy.searchsorted(times, grid, side = 'right') - 1
+    return numpy.floor(values[numpy.maximum(latest, 0)])
+
+##
+## runLengths - Run-length encode 'readings' into (values, lengths)
+##
+def runLengths(readings):
+    import numpy
+    if len(readings) == 0:
+        return readings, numpy.empty(0, dtype = numpy.float64)
+    starts = numpy.flatnonzero(numpy.concatenate(([True], readings[1:] != readings[:-1])))
+    lengths = numpy.diff(numpy.append(starts, len(readings)))
+    return readings[starts], lengths.astype(numpy.float64)
+
+##
+## replay - Run the off/below/above rules over the runs for every
+## (setPoints[i], thresholds[i]) configuration. Returns (transitions,
+## decisions spent below, decisions spent above) per configuration.
+##
+## A decision goes below when the setpoint is more than the threshold
+## above the reading, above when it is more than the threshold below
+## it, and otherwise keeps the state. The state is therefore the last
+## such non-holding decision (idle before the first one), which is a
+## forward fill along the runs; the last state of a chunk seeds the
+## next one.
+##
+def replay(runValues, runWeights, setPoints, thresholds, chunkCells = CHUNK_CELLS):
+    import numpy
+    runWeights = numpy.asarray(runWeights, dtype = numpy.float64)
+    count = len(setPoints)
+    transitions = numpy.zeros(count, dtype = numpy.int64)
+    below = numpy.zeros(count)
+    above = numpy.zeros(count)
+
+    block = max(1, min(count, chunkCells // 1024))
+    length = max(1, chunkCells // block)
+    for first in range(0, count, block):
+        last = min(first + block, count)
+        rows = last - first
+        points = numpy.asarray(setPoints[first:last], dtype = numpy.float64)[:, None]
+        bands = numpy.asarray(thresholds[first:last], dtype = numpy.float64)[:, None]
+        carry = numpy.full(rows, STATE_IDLE, dtype = numpy.int8)
+
+        for start in range(0, len(runValues), length):
+            values = runValues[start:start + length]
+            weights = runWeights[start:start + length]
+            difference = points - values
+            columns = len(values) + 1
+
+            ## Column 0 holds the state carried over from the last chunk
+            decisions = numpy.empty((rows, columns), dtype = numpy.int8)
+            decisions[:, 0] = carry
+            decisions[:, 1:] = difference > bands
+            decisions[:, 1:] -= difference < -bands
+
+            ## Forward fill: index (into the flattened chunk) of the last
+            ## non-holding decision of every cell
+            sources = numpy.arange(rows * columns, dtype = numpy.int32).reshape(rows, columns)
+            sources[:, 1:][decisions[:, 1:] == 0] = 0
+            numpy.maximum.accumulate(sources, axis = 1, out = sources)
+            states = numpy.take(decisions, sources)
+
+            transitions[first:last] += numpy.count_nonzero(states[:, 1:] != states[:, :-1],
+                                                           axis = 1)
+
+            ## states is +1 below, -1 above and 0 idle, so one product
+            ## gives below - above and another below + above
+            signed = states[:, 1:].astype(numpy.float64)
+            difference = signed @ weights
+            total = numpy.abs(signed, out = signed) @ weights
+            below[first:last] += (total + difference) / 2
+            above[first:last] += (total - difference) / 2
+            carry = states[:, -1].copy()
+
+    return transitions, below, above
+
+##
+## deviations - (share of readings within 'tolerance', mean absolute
+## deviation, maximum deviation) of 'values' from every setpoint, from
+## one sort and a cumulative sum instead of a pass per setpoint.
+##
+def deviations(values, setPoints, tolerance):
+    import numpy
+    ordered = numpy.sort(values)
+    count = len(ordered)
+    points = numpy.asarray(setPoints, dtype = numpy.float64)
+    if count == 0:
+        nothing = numpy.zeros(len(points))
+        return nothing, nothing, nothing
+
+    sums = numpy.concatenate(([0.0], numpy.cumsum(ordered)))
+    split = numpy.searchsorted(ordered, points)
+    absolute = (points * split - sums[split]) + (sums[count] - sums[split] -
+                                                 points * (count - split))
+    within = (numpy.searchsorted(ordered, points + tolerance, side = 'right') -
+              numpy.searchsorted(ordered, points - tolerance, side = 'left'))
+    largest = numpy.maximum(ordered[-1] - points, points - ordered[0])
+    return within / count, absolute / count, largest
+
+##
+## sweep - Replay every combination of 'setPoints', 'thresholds' and
+## 'decisionPeriods' over the readings and return a NumPy array with
+## one resultDtype() row per configuration.
+##
+def sweep(times, values, setPoints, thresholds = DEFAULT_THRESHOLDS,
+          decisionPeriods = DEFAULT_DECISION_PERIODS, tolerance = 1.0,
+          chunkCells = CHUNK_CELLS):
+    import numpy
+    setPoints = numpy.asarray(setPoints, dtype = numpy.float64)
+    thresholds = numpy.asarray(thresholds, dtype = numpy.float64)
+    gridPoints = numpy.repeat(setPoints, len(thresholds))
+    gridThresholds = numpy.tile(thresholds, len(setPoints))
+
+    ## The readings do not depend on the decisions, so neither does the
+    ## deviation from each setpoint
+    atSetPoint, meanDeviation, maxDeviation = deviations(values, setPoints, tolerance)
+
+    results = numpy.zeros(len(gridPoints) * len(decisionPeriods), dtype = resultDtype())
+    if len(values) == 0:
+        return results
+
+    for index, decisionPeriod in enumerate(decisionPeriods):
+        runValues, runWeights = runLengths(decisionReadings(times, values, decisionPeriod))
+        transitions, below, above = replay(runValues, runWeights, gridPoints,
+                                           gridThresholds, chunkCells)
+
+        decisions = runWeights.sum()
+        days = max(decisions * decisionPeriod, 1.0) / SECONDS_PER_DAY
+        rows = results[index * len(gridPoints):(index + 1) * len(gridPoints)]
+        rows['setPoint'] = gridPoints
+        rows['threshold'] = gridThresholds
+        rows['decisionPeriod'] = decisionPeriod
+        rows['transitions'] = transitions
+        rows['transitionsPerDay'] = transitions / days
+        rows['below'] = below / decisions
+        rows['above'] = above / decisions
+        rows['idle'] = 1.0 - rows['below'] - rows['above']
+        rows['timeAtSetPoint'] = numpy.repeat(atSetPoint, len(thresholds))
+        rows['meanAbsoluteDeviation'] = numpy.repeat(meanDeviation, len(thresholds))
+        rows['maxDeviation'] = numpy.repeat(maxDeviation, len(thresholds))
+    return results
+
+##
+## parseValues - Numbers from "a,b,c" or an inclusive range "first:last"
+## taken in steps of 'step'
+##
+def parseValues(text, step = 1.0):
+    import numpy
+    if ':' in text:
+        first, last = (float(part) for part in text.split(':'))
+        return numpy.arange(first, last + step / 2, step)
+    return numpy.array([float(part) for part in text.split(',') if part.strip()])
+
+##
+## formatResults - Human readable table of 'results' rows, with the
+## state shares labelled by the channel's own state names
+##
+def formatResults(results, states):
+    idle, below, above = states
+    lines = ["%8s %9s %8s %11s %9s %6s %6s %6s %9s %8s" %
+             ("setpoint", "threshold", "period s", "transitions", "per day",
+              idle, below, above, "at sp %", "mean dev")]
+    for row in results:
+        lines.append("%8g %9g %8g %11d %9.1f %5.1f%% %5.1f%% %5.1f%% %8.1f%% %8.2f" %
+                     (row['setPoint'], row['threshold'], row['decisionPeriod'],
+                      row['transitions'], row['transitionsPerDay'], row['idle'] * 100,
+                      row['below'] * 100, row['above'] * 100,
+                      row['timeAtSetPoint'] * 100, row['meanAbsoluteDeviation']))
+    return "\n".join(lines)
+
+def main():
+    import numpy
+    channels = {config.name: config for config in CHANNELS}
+
+    parser = argparse.ArgumentParser(description = "Sweep PlantSitter setpoints over recorded readings")
+    parser.add_argument("path", help = "HistoryRing file or CSV file of readings")
+    parser.add_argument("--channel", choices = sorted(channels), default = 'temperature')
+    parser.add_argument("--set-points", help = "first:last or a,b,c (default: the channel limits)")
+    parser.add_argument("--step", type = float, default = 1.0, help = "setpoint step of a range")
+    parser.add_argument("--thresholds", default = ",".join(map(str, DEFAULT_THRESHOLDS)))
+    parser.add_argument("--decision-periods",
+                        default = ",".join(map(str, DEFAULT_DECISION_PERIODS)))
+    parser.add_argument("--tolerance", type = float, help = "distance counted as at setpoint")
+    parser.add_argument("--sort", default = 'transitions',
+                        help = "field the table is sorted by, '-field' for descending")
+    parser.add_argument("--top", type = int, default = 20, help = "rows shown, 0 for all")
+    parser.add_argument("--output", help = "write every row to this CSV file")
+    arguments = parser.parse_args()
+
+    sortField = arguments.sort.lstrip('-')
+    if sortField not in RESULT_FIELDS:
+        parser.error("--sort must be one of " + ", ".join(RESULT_FIELDS))
+
+    config = channels[arguments.channel]
+    setPoints = parseValues(arguments.set_points or "%s:%s" % (config.minSetPoint,
+                                                               config.maxSetPoint),
+                            arguments.step)
+    tolerance = arguments.tolerance
+    if tolerance is None:
+        tolerance = DEFAULT_TOLERANCES.get(config.name, 1.0)
+
+    started = monotonic()
+    times, values = loadReadings(arguments.path, config.name)
+    loaded = monotonic()
+    results = sweep(times, values, setPoints, parseValues(arguments.thresholds),
+                    parseValues(arguments.decision_periods), tolerance)
+    finished = monotonic()
+
+    print("%d readings of %s loaded in %.2f s, %d configurations swept in %.2f s" %
+          (len(values), config.name, loaded - started, len(results), finished - loaded))
+    order = numpy.argsort(results[sortField], kind = 'stable')
+    if arguments.sort.startswith('-'):
+        order = order[::-1]
+    results = results[order]
+    print(formatResults(results[:arguments.top] if arguments.top else results, config.states))
+
+    if arguments.output:
+        numpy.savetxt(arguments.output, results, delimiter = ',',
+                      header = ",".join(RESULT_FIELDS), comments = '',
+                      fmt = ['%g', '%g', '%g', '%d'] + ['%.6g'] * (len(RESULT_FIELDS) - 4))
+
+if __name__ == '__main__':
+    main()
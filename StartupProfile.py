@@ -0,0 +1,135 @@
+#
+# StartupProfile records how long PlantSitter takes to come up after a
+# power cycle: every timed import, every device bring-up and milestones
+# such as the first control decision, all relative to the moment this
+# module was first imported. formatReport() turns the record into the
+# startup-timing report printed at the end of bring-up. A step that
+# raises is recorded too, with its error, so a device that failed to
+# come up shows in the report next to the ones that did.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from collections import namedtuple
+from contextlib import contextmanager
+from time import perf_counter
+
+import importlib
+import sys
+import threading
+
+##
+## One line of the report. 'start' is in seconds since the profile
+## origin, 'duration' in seconds (0 for milestones), 'error' the
+## exception a failed step raised (None otherwise).
+##
+StartupEntry = namedtuple('StartupEntry', ['kind', 'name', 'start', 'duration', 'thread', 'error'],
+                          defaults = (None,))
+
+##
+## StartupProfile - Thread-safe record of startup timings
+##
+class StartupProfile():
+    "Per import and per device startup timings"
+
+    def __init__(self, clock = perf_counter):
+        self.clock = clock
+        self.origin = clock()
+        self.entries = []
+        self._marked = set()
+        self._lock = threading.Lock()
+
+    def _record(self, kind, name, start, duration, error = None):
+        entry = StartupEntry(kind, name, start - self.origin, duration,
+                             threading.current_thread().name, error)
+        with self._lock:
+            self.entries.append(entry)
+
+    ##
+    ## measure - Context manager timing one step, e.g.
+    ##
+    ##   with startup.measure('device', 'lcd'):
+    ##       ...
+    ##
+    ## An exception is recorded with the step and raised again.
+    ##
+    @contextmanager
+    def measure(self, kind, name):
+        start = self.clock()
+        try:
+            yield
+        except Exception as error:
+            self._record(kind, name, start, self.clock() - start, error)
+            raise
+        else:
+            self._record(kind, name, start, self.clock() - start)
+
+    ##
+    ## importModule - Import a module by name and record how long it
+    ## took. A module that is already loaded is returned without an
+    ## entry, so only the first (real) import shows up in the report.
+    ##
+    def importModule(self, name):
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+        with self.measure('import', name):
+            return importlib.import_module(name)
+
+    ##
+    ## mark - Record a milestone, only the first time it is reached
+    ##
+    def mark(self, name):
+        if name in self._marked:
+            return
+        with self._lock:
+            if name in self._marked:
+                return
+            self._marked.add(name)
+        self._record('mark', name, self.clock(), 0.0)
+
+    ##
+    ## elapsed - Seconds since the profile origin
+    ##
+    def elapsed(self):
+        return self.clock() - self.origin
+
+    ##
+    ## failures - The entries of the steps that raised, in start order
+    ##
+    def failures(self):
+        with self._lock:
+            entries = [entry for entry in self.entries if entry.error is not None]
+        return sorted(entries, key = lambda entry: entry.start)
+
+    ##
+    ## formatReport - The startup-timing report, in start order
+    ##
+    def formatReport(self):
+        with self._lock:
+            entries = sorted(self.entries, key = lambda entry: entry.start)
+
+        lines = ["Startup timing (ms since start):"]
+        lines.append("  {:>8} {:>8}  {:<7} {:<28} {}".format(
+            "start", "took", "kind", "name", "thread"))
+        for entry in entries:
+            took = '' if entry.kind == 'mark' else "{:8.1f}".format(entry.duration * 1000)
+            line = "  {:8.1f} {:>8}  {:<7} {:<28} {}".format(
+                entry.start * 1000, took, entry.kind, entry.name, entry.thread)
+            if entry.error is not None:
+                line += "  FAILED: " + type(entry.error).__name__ + ": " + str(entry.error)
+            lines.append(line)
+        return "\n".join(lines)
+
+    ## End class StartupProfile definition
+
+##
+## The process wide profile. Its origin is the first import of this
+## module, which PlantSitter does before anything else.
+##
+startup = StartupProfile()
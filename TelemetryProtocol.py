@@ -0,0 +1,146 @@
+#
+# TelemetryProtocol defines the compact binary framing used to report
+# PlantSitter state over the UART. Every report is a fixed-layout
+# record packed with struct, preceded by a two byte sync marker and
+# followed by a CRC-16 so that the receiver can validate each frame and
+# resynchronize after line noise.
+#
+# Frame layout (little endian, 16 bytes):
+#
+#   offset  size  field
+#   ------  ----  -----------------------------------------------
+#      0      2   sync marker 0xA5 0x5A
+#      2      1   channel id (ChannelConfig.channel, 0..255)
+#      3      1   state code (see STATE_CODES)
+#      4      2   reading in hundredths (signed)
+#      6      2   setpoint (signed)
+#      8      2   sequence number (wraps at 65536)
+#     10      4   timestamp, UNIX epoch seconds
+#     14      2   CRC-16/CCITT of bytes 2..13
+#
+# The state codes of the original two machines are fixed. The states of
+# any other channel get the next free codes when the channel is added to
+# the ControlEngine (see registerStates), so a receiver decodes them to
+# names if it registers the same channel table, and to the bare code
+# otherwise.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from binascii import crc_hqx
+from collections import namedtuple
+
+import struct
+
+##
+## Sync marker that starts every frame
+##
+SYNC = b'\xa5\x5a'
+
+##
+## Fixed record layout between the sync marker and the CRC
+##
+RECORD = struct.Struct('<BBhhHI')
+CRC = struct.Struct('<H')
+
+FRAME_SIZE = len(SYNC) + RECORD.size + CRC.size
+
+##
+## Channel ids of the two original channels, and the largest id a frame
+## can carry
+##
+CHANNEL_TEMPERATURE = 1
+CHANNEL_HUMIDITY = 2
+MAX_CHANNEL = 0xFF
+
+CHANNEL_NAMES = {
+    CHANNEL_TEMPERATURE: 'temperature',
+    CHANNEL_HUMIDITY: 'humidity',
+}
+
+##
+## State codes shared by every channel. registerStates() adds the states
+## of further channels.
+##
+STATE_CODES = {
+    'off': 0,
+    'heat': 1,
+    'cool': 2,
+    'dry': 3,
+    'hum': 4,
+}
+
+STATE_NAMES = {code: name for name, code in STATE_CODES.items()}
+
+MAX_STATE_CODE = 0xFF
+
+##
+## registerStates - Give every state name in 'states' that has no code
+## yet the next free one. Codes never change once given, so the frames
+## and history records already written keep their meaning.
+##
+def registerStates(states):
+    for name in states:
+        if name in STATE_CODES:
+            continue
+        code = len(STATE_CODES)
+        if code > MAX_STATE_CODE:
+            raise ValueError("No state code left for " + repr(name))
+        STATE_CODES[name] = code
+        STATE_NAMES[code] = name
+
+##
+## TelemetryRecord - A decoded frame
+##
+TelemetryRecord = namedtuple('TelemetryRecord',
+                             ['channel', 'state', 'reading', 'setpoint',
+                              'sequence', 'timestamp'])
+
+##
+## crc16 - CRC-16/CCITT-FALSE of 'data'
+##
+def crc16(data):
+    return crc_hqx(data, 0xFFFF)
+
+##
+## packFrame - Build one binary frame
+##
+##  channel   - channel id (0..MAX_CHANNEL)
+##  state     - state name ('off', 'heat', ... or a registered state)
+##  reading   - temperature or humidity reading
+##  setpoint  - the current setpoint
+##  sequence  - per channel sequence number
+##  timestamp - UNIX epoch seconds
+##
+def packFrame(channel, state, reading, setpoint, sequence, timestamp):
+    record = RECORD.pack(channel, STATE_CODES[state],
+                         int(round(reading * 100)), int(setpoint),
+                         sequence & 0xFFFF, int(timestamp))
+    return SYNC + record + CRC.pack(crc16(record))
+
+##
+## unpackFrame - Decode the frame that starts at 'offset' in 'buffer'.
+## Returns None if the sync marker or the CRC does not match.
+##
+def unpackFrame(buffer, offset = 0):
+    if buffer[offset:offset + len(SYNC)] != SYNC:
+        return None
+
+    start = offset + len(SYNC)
+    end = start + RECORD.size
+    if len(buffer) < end + CRC.size:
+        return None
+
+    record = bytes(buffer[start:end])
+    (crc,) = CRC.unpack_from(buffer, end)
+    if crc != crc16(record):
+        return None
+
+    channel, state, reading, setpoint, sequence, timestamp = RECORD.unpack(record)
+    return TelemetryRecord(channel, STATE_NAMES.get(state, str(state)),
+                           reading / 100, setpoint, sequence, timestamp)
@@ -0,0 +1,266 @@
+#
+# TelemetryReceiver is the receiving ("TemperatureServer") side of the
+# PlantSitter serial link. It reads the stream in large chunks, parses
+# both the original free text reports and the binary frames defined in
+# TelemetryProtocol.py, skips over garbage until it finds the start of
+# the next valid message, and hands back TelemetryRecords either from a
+# generator or from an async iterator.
+#
+# Usage: python TelemetryReceiver.py [port] [baudrate]
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+import asyncio
+import os
+import re
+import sys
+
+from TelemetryProtocol import (CHANNEL_HUMIDITY, CHANNEL_TEMPERATURE, FRAME_SIZE,
+                               SYNC, TelemetryRecord, unpackFrame)
+
+##
+## Size of each read from the stream
+##
+CHUNK_SIZE = 65536
+
+##
+## Start marker and longest plausible length of a text report. A text
+## report that has not completed within this many bytes is garbage.
+##
+TEXT_START = b'State: '
+MAX_TEXT_SIZE = 160
+
+##
+## The original text reports, e.g.
+##
+##   State: heat, \nCurrent Temp: 71.23, \nTarget Temp: 72
+##   State: off, \nHumidity: 40.5, \nTarget Hum: 40
+##
+## They carry no terminator, so a report is only complete once the
+## byte after the setpoint has arrived (or the stream has ended).
+##
+TEXT_REPORT = re.compile(
+    rb'State: (\w+), \n(Current Temp|Humidity): ([-+0-9.eE]+|nan|inf), \n'
+    rb'Target (?:Temp|Hum): (-?\d+)')
+
+TEXT_CHANNELS = {
+    b'Current Temp': CHANNEL_TEMPERATURE,
+    b'Humidity': CHANNEL_HUMIDITY,
+}
+
+##
+## TelemetryParser - Incremental parser for the PlantSitter stream
+##
+class TelemetryParser():
+    "Incremental parser for text and binary PlantSitter telemetry"
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+        ## Statistics
+        self.records = 0
+        self.binaryRecords = 0
+        self.textRecords = 0
+        self.crcErrors = 0
+        self.garbageBytes = 0
+        self.bytesReceived = 0
+
+    ##
+    ## feed - Add received bytes and return the list of records that
+    ## are now complete.
+    ##
+    def feed(self, data):
+        self.bytesReceived = self.bytesReceived + len(data)
+        self._buffer += data
+        return self._parse(False)
+
+    ##
+    ## flush - The stream has ended; return any final text report that
+    ## was waiting for its terminating byte.
+    ##
+    def flush(self):
+        records = self._parse(True)
+        self.garbageBytes = self.garbageBytes + len(self._buffer)
+        del self._buffer[:]
+        return records
+
+    ##
+    ## _nextStart - Offset of the next possible message start at or
+    ## after 'offset', or -1.
+    ##
+    def _nextStart(self, offset):
+        buffer = self._buffer
+        binary = buffer.find(SYNC, offset)
+        text = buffer.find(TEXT_START, offset)
+        if binary < 0:
+            return text
+        if text < 0:
+            return binary
+        return min(binary, text)
+
+    ##
+    ## _parse - Extract every complete message from the buffer
+    ##
+    def _parse(self, final):
+        buffer = self._buffer
+        records = []
+        offset = 0
+        size = len(buffer)
+
+        while offset < size:
+            start = self._nextStart(offset)
+            if start < 0:
+                ## Keep a trailing byte that may be half of a marker
+                keep = max(offset, size - (len(TEXT_START) - 1))
+                self.garbageBytes = self.garbageBytes + keep - offset
+                offset = keep
+                break
+
+            self.garbageBytes = self.garbageBytes + start - offset
+            offset = start
+
+            if buffer.startswith(SYNC, offset):
+                if size - offset < FRAME_SIZE:
+                    break
+                record = unpackFrame(buffer, offset)
+                if record is None:
+                    ## Bad CRC - resynchronize one byte further on
+                    self.crcErrors = self.crcErrors + 1
+                    self.garbageBytes = self.garbageBytes + 1
+                    offset = offset + 1
+                    continue
+                records.append(record)
+                self.binaryRecords = self.binaryRecords + 1
+                offset = offset + FRAME_SIZE
+                continue
+
+            match = TEXT_REPORT.match(buffer, offset)
+            if match is not None and (match.end() < size or final):
+                state, label, reading, setpoint = match.groups()
+                records.append(TelemetryRecord(TEXT_CHANNELS[label], state.decode(),
+                                               float(reading), int(setpoint),
+                                               None, None))
+                self.textRecords = self.textRecords + 1
+                offset = match.end()
+                continue
+
+            ##
+            ## Either incomplete or broken. It is broken if another
+            ## message already starts after it, or if it is too long.
+            ##
+            following = self._nextStart(offset + 1)
+            if following < 0 and size - offset < MAX_TEXT_SIZE and not final:
+                break
+            if following < 0:
+                following = size
+            self.garbageBytes = self.garbageBytes + following - offset
+            offset = following
+
+        del buffer[:offset]
+        self.records = self.records + len(records)
+        return records
+
+    ## End class TelemetryParser definition
+
+##
+## _readChunk - Read up to 'size' bytes from a file descriptor or from
+## an object with a read() method (file, pyserial port). Returns b'' at
+## the end of the stream and None when a non-blocking descriptor has
+## nothing to read yet.
+##
+def _readChunk(stream, size):
+    if isinstance(stream, int):
+        try:
+            return os.read(stream, size)
+        except BlockingIOError:
+            return None
+        except OSError:
+            ## A pty whose other side has closed reports EIO
+            return b''
+
+    ## Serial ports: never ask for less than what is already waiting
+    waiting = getattr(stream, 'in_waiting', None)
+    if waiting:
+        size = max(size, waiting)
+    return stream.read(size)
+
+##
+## readRecords - Generator yielding TelemetryRecords read from 'stream'
+## (a file descriptor or an object with read()) until end of stream.
+##
+def readRecords(stream, parser = None, chunkSize = CHUNK_SIZE):
+    if parser is None:
+        parser = TelemetryParser()
+
+    while True:
+        data = _readChunk(stream, chunkSize)
+        if not data:
+            ## A serial port with a timeout returns b'' while idle
+            if not isinstance(stream, int) and hasattr(stream, 'in_waiting'):
+                continue
+            break
+        yield from parser.feed(data)
+
+    yield from parser.flush()
+
+##
+## aiterRecords - Async iterator yielding TelemetryRecords read from
+## the file descriptor 'fd' (a pty or a serial device) on the running
+## event loop, without a helper thread.
+##
+async def aiterRecords(fd, parser = None, chunkSize = CHUNK_SIZE):
+    if parser is None:
+        parser = TelemetryParser()
+
+    loop = asyncio.get_running_loop()
+    readable = asyncio.Event()
+    loop.add_reader(fd, readable.set)
+    try:
+        while True:
+            await readable.wait()
+            readable.clear()
+            data = _readChunk(fd, chunkSize)
+            if data is None:
+                ## The descriptor was reported readable more than once
+                ## for data we have already read
+                continue
+            if not data:
+                break
+            for record in parser.feed(data):
+                yield record
+    finally:
+        loop.remove_reader(fd)
+
+    for record in parser.flush():
+        yield record
+
+##
+## openSerial - Open the receiving serial port
+##
+def openSerial(port = '/dev/ttyS0', baudrate = 115200):
+    import serial
+    return serial.Serial(port = port, baudrate = baudrate,
+                         parity = serial.PARITY_NONE,
+                         stopbits = serial.STOPBITS_ONE,
+                         bytesize = serial.EIGHTBITS,
+                         timeout = 1)
+
+def main():
+    port = '/dev/ttyS0'
+    baudrate = 115200
+    if len(sys.argv) > 1:
+        port = sys.argv[1]
+    if len(sys.argv) > 2:
+        baudrate = int(sys.argv[2])
+
+    for record in readRecords(openSerial(port, baudrate)):
+        print(record)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#
+# AdaptiveSamplingBenchmark runs PlantSimulation with fixed 1 Hz sampling
+# and with the adaptive sampling interval of the SAMPLE_* settings of
+# PlantSitterChannels.py, and compares the sensor reads and scheduler
+# wakeups each needed and how well the channels held their setpoints:
+#
+#   - holding: the default setpoints, which the plant stays close to
+#   - far: setpoints the plant cannot reach for hours (95 F, 10 %)
+#
+# Usage: python benchmarks/AdaptiveSamplingBenchmark.py [days]
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PlantSimulation import runSimulation
+
+SCENARIOS = [
+    ("holding", {}),
+    ("far", {'temperature': 95, 'humidity': 10}),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description = "Adaptive vs fixed sampling in the plant simulation")
+    parser.add_argument("days", nargs = "?", type = float, default = 0.5,
+                        help = "simulated days per run (default %(default)s)")
+    arguments = parser.parse_args()
+    days = arguments.days
+
+    logging.disable(logging.INFO)
+    print(f"{days:g} simulated days per run")
+    print("%-10s %-9s %10s %10s %9s %14s %14s" % ("scenario", "sampling", "reads", "wakeups",
+                                                   "wall s", "temp at sp", "hum at sp"))
+    for name, setPoints in SCENARIOS:
+        for adaptive in (False, True):
+            report = runSimulation(days, setPoints = setPoints, adaptive = adaptive)
+            channels = report["channels"]
+            print("%-10s %-9s %10d %10d %9.2f %13.1f%% %13.1f%%" %
+                  (name, "adaptive" if adaptive else "1 Hz", report["sensorReads"],
+                   report["wakeups"], report["wallSeconds"],
+                   channels["temperature"]["timeAtSetPoint"] * 100,
+                   channels["humidity"]["timeAtSetPoint"] * 100))
+            if adaptive:
+                print("%-20s %s" % ("", ", ".join("%s %d" % (reason, count) for reason, count
+                                                  in report["sampling"]["reasons"].items()
+                                                  if count)))
+
+if __name__ == '__main__':
+    main()
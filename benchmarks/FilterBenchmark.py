@@ -0,0 +1,142 @@
+#
+# FilterBenchmark measures the StreamingFilter of SensorFilter.py:
+#
+#   - the cost of one update() for several window sizes, which should
+#     hardly depend on the window
+#   - the transitions of a temperature channel deciding every 10th
+#     reading, with raw and with filtered readings. The trace is either a
+#     recorded one (a HistoryRing or CSV file, see SetpointSweep.py) or
+#     a synthetic 1 Hz trace with a daily cycle, sensor noise and
+#     occasional spikes.
+#
+# Usage: python benchmarks/FilterBenchmark.py [days | history file] [setpoint]
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from math import cos, pi
+from time import perf_counter
+
+import argparse
+import logging
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ControlChannel import ChannelConfig, ControlChannel
+from SensorFilter import StreamingFilter
+
+## Readings between two decisions (1 Hz readings, decisions every 10 s)
+DECISION_EVERY = 10
+
+## Synthetic trace: noise and spike size in degrees, share of spikes
+NOISE = 0.3
+SPIKE = 8.0
+SPIKE_RATE = 0.002
+
+WINDOWS = (1, 5, 15, 61)
+
+##
+## Filters compared on the trace: (label, factory or None for raw)
+##
+FILTERS = [
+    ("raw", None),
+    ("ema 0.5", lambda: StreamingFilter(1, 0.5)),
+    ("median 5", lambda: StreamingFilter(5, 1.0)),
+    ("median 5 + spikes", lambda: StreamingFilter(5, 1.0, 3.0)),
+    ("median 5 + spikes + ema", lambda: StreamingFilter(5, 0.5, 3.0)),
+]
+
+##
+## syntheticTrace - 'days' of 1 Hz temperatures in degrees Fahrenheit
+##
+def syntheticTrace(days, seed = 1):
+    generator = random.Random(seed)
+    trace = []
+    for second in range(int(days * 86400)):
+        value = 70.0 + 6.0 * cos(2 * pi * (second / 86400 - 0.6)) + generator.gauss(0, NOISE)
+        if generator.random() < SPIKE_RATE:
+            value = value + generator.choice((-SPIKE, SPIKE))
+        trace.append(value)
+    return trace
+
+##
+## recordedTrace - The temperatures of a HistoryRing or CSV file
+##
+def recordedTrace(path):
+    from SetpointSweep import loadReadings
+    times, values = loadReadings(path, 'temperature')
+    return values.tolist()
+
+##
+## updateCost - Nanoseconds per update() with a 'window' reading median
+##
+def updateCost(trace, window):
+    stream = StreamingFilter(window, 0.5, 3.0)
+    update = stream.update
+    started = perf_counter()
+    for value in trace:
+        update(value)
+    return (perf_counter() - started) / len(trace) * 1e9
+
+##
+## transitions - (transitions, rejected readings) of a channel fed the
+## trace through the filter made by 'factory'
+##
+def transitions(trace, setPoint, factory):
+    readings = iter(trace)
+    channel = ControlChannel(ChannelConfig(name = 'temperature', channel = 0,
+                                           read = lambda: next(readings),
+                                           setPoint = setPoint, minSetPoint = 60,
+                                           maxSetPoint = 95,
+                                           states = ('off', 'heat', 'cool'),
+                                           filter = factory))
+    for index in range(len(trace)):
+        channel.read()
+        if index % DECISION_EVERY == DECISION_EVERY - 1:
+            channel.decide(channel.current())
+    return channel.transitions, channel.filter.rejected if channel.filter else 0
+
+def main():
+    parser = argparse.ArgumentParser(description = "Cost and effect of the channel reading filter")
+    parser.add_argument("source", nargs = "?", type = str, default = "1",
+                        help = "days of synthetic readings, or a HistoryRing or CSV file (default %(default)s)")
+    parser.add_argument("setPoint", nargs = "?", type = int, default = 70,
+                        help = "temperature setpoint (default %(default)s)")
+    arguments = parser.parse_args()
+    source, setPoint = arguments.source, arguments.setPoint
+
+    logging.disable(logging.INFO)
+    if os.path.exists(source):
+        trace = recordedTrace(source)
+        print(f"{len(trace)} readings from {source}, setpoint {setPoint}")
+    else:
+        trace = syntheticTrace(float(source))
+        print(f"{len(trace)} synthetic readings ({source} days, noise {NOISE}, "
+              f"{SPIKE_RATE * 100:g}% spikes of {SPIKE}), setpoint {setPoint}")
+
+    print()
+    print("%-8s %16s" % ("window", "ns per reading"))
+    for window in WINDOWS:
+        print("%-8d %16.0f" % (window, updateCost(trace, window)))
+
+    print()
+    print("%-26s %12s %12s %10s" % ("filter", "transitions", "rejected", "avoided"))
+    raw = None
+    for label, factory in FILTERS:
+        count, rejected = transitions(trace, setPoint, factory)
+        if raw is None:
+            raw = count
+        print("%-26s %12d %12d %9.0f%%" % (label, count, rejected,
+                                            (1 - count / raw) * 100 if raw else 0.0))
+    print(f"decisions every {DECISION_EVERY} readings")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#
+# LcdBusBenchmark drives both PlantSitter displays from two threads at
+# a fixed frame rate, first directly (as the two display threads used
+# to) and then through the arbitrated LcdBus. It reports
+# the bus throughput in writes per second and counts how many LCD
+# operations overlapped on the shared data lines.
+#
+# Usage: python benchmarks/LcdBusBenchmark.py [seconds] [frames per second]
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from datetime import datetime
+from time import monotonic, sleep
+
+import argparse
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from FakeLcd import CountingPin, FakeCharacterLcd
+from LcdBus import LcdBus
+from LcdFramebuffer import LcdFramebuffer
+
+##
+## SharedLines - Detects two displays driving the shared lines at the
+## same time.
+##
+class SharedLines():
+    def __init__(self):
+        self.owner = None
+        self.collisions = 0
+        self._lock = threading.Lock()
+
+    def enter(self, lcd):
+        with self._lock:
+            if self.owner is not None and self.owner is not lcd:
+                self.collisions = self.collisions + 1
+            self.owner = lcd
+
+    def leave(self, lcd):
+        with self._lock:
+            if self.owner is lcd:
+                self.owner = None
+
+##
+## GuardedLcd - Fake LCD that reports its bus usage to SharedLines
+##
+class GuardedLcd(FakeCharacterLcd):
+    def __init__(self, lines, columns, rows):
+        FakeCharacterLcd.__init__(self, columns, rows, realTime = True)
+        self.sharedLines = lines
+
+    def _command(self):
+        self.sharedLines.enter(self)
+        FakeCharacterLcd._command(self)
+        self.sharedLines.leave(self)
+
+    def _data(self, character):
+        self.sharedLines.enter(self)
+        FakeCharacterLcd._data(self, character)
+        self.sharedLines.leave(self)
+
+def message(index):
+    return datetime.now().strftime('%b %d  %H:%M:%S\n') + ' Frame: ' + str(index)
+
+##
+## runDirect - Two threads each drawing on their own display object
+## with no coordination, like the original display threads.
+##
+def runDirect(seconds, rate):
+    lines = SharedLines()
+    displays = [GuardedLcd(lines, 16, 2), GuardedLcd(lines, 16, 2)]
+    frames = [0, 0]
+
+    def draw(index):
+        framebuffer = LcdFramebuffer()
+        framebuffer.setBlank()
+        deadline = monotonic() + seconds
+        while monotonic() < deadline:
+            framebuffer.render(displays[index], message(frames[index]))
+            frames[index] = frames[index] + 1
+            sleep(1 / rate)
+
+    threads = [threading.Thread(target=draw, args=(index,)) for index in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return lines.collisions, sum(frames)
+
+##
+## runBus - Two threads submitting frames to the arbitrated bus
+##
+def runBus(seconds, rate):
+    lines = SharedLines()
+    pins = [CountingPin(name) for name in ("rs", "d4", "d5", "d6", "d7")]
+    bus = LcdBus(*pins, lcdFactory = lambda rs, en, d4, d5, d6, d7, columns, rows:
+                 GuardedLcd(lines, columns, rows))
+    handles = [bus.attach(CountingPin("en1")), bus.attach(CountingPin("en2"))]
+    submitted = [0, 0]
+
+    def draw(index):
+        deadline = monotonic() + seconds
+        while monotonic() < deadline:
+            handles[index].show(message(submitted[index]))
+            submitted[index] = submitted[index] + 1
+            sleep(1 / rate)
+
+    threads = [threading.Thread(target=draw, args=(index,)) for index in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    bus.flush()
+
+    ## Each display must end up showing the last frame submitted to it
+    for index, handle in enumerate(handles):
+        assert handle.lcd.text().split('\n')[1].strip() == 'Frame: ' + str(submitted[index] - 1)
+
+    return lines.collisions, bus.getStats()
+
+def main():
+    parser = argparse.ArgumentParser(description = "Two display threads, direct vs through the LCD bus")
+    parser.add_argument("seconds", nargs = "?", type = float, default = 2.0,
+                        help = "seconds per run (default %(default)s)")
+    parser.add_argument("rate", nargs = "?", type = float, default = 50.0,
+                        help = "frames per second (default %(default)s)")
+    arguments = parser.parse_args()
+    seconds, rate = arguments.seconds, arguments.rate
+
+    collisions, frames = runDirect(seconds, rate)
+    print(f"direct: {frames} frames drawn, {collisions} overlapping operations")
+
+    collisions, stats = runBus(seconds, rate)
+    print(f"bus:    {stats['frames']} frames drawn, {collisions} overlapping operations")
+    print(f"        {stats['coalesced']} frames coalesced in {stats['batches']} batches")
+    print(f"        {stats['writesPerSecond']:.0f} writes/s overall, "
+          f"{stats['busyWritesPerSecond']:.0f} writes/s while busy")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#
+# LcdFramebufferBenchmark compares the original "clear, then rewrite the
+# whole message" LCD update with framebuffer diff rendering, using the
+# counting fake LCD so it runs on any machine.
+#
+# Usage: python benchmarks/LcdFramebufferBenchmark.py [ticks]
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from datetime import datetime, timedelta
+
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from FakeLcd import FakeCharacterLcd
+from LcdFramebuffer import LcdFramebuffer
+
+##
+## temperatureMessages - Messages shaped like the ones composed by
+## the temperature channel (ControlChannel.composeScreen), one per second.
+##
+def temperatureMessages(ticks, noise, seed = 1):
+    generator = random.Random(seed)
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    temperature = 71.5
+    messages = []
+    for tick in range(ticks):
+        temperature = temperature + generator.uniform(-noise, noise)
+        line_1 = now.strftime('%b %d  %H:%M:%S\n')
+        if (tick % 10) < 5:
+            line_2 = ' Current: ' + str(round(temperature, 2))
+        else:
+            line_2 = ' Heat | Set: 72'
+        messages.append(line_1 + line_2)
+        now = now + timedelta(seconds = 1)
+    return messages
+
+##
+## fullRedraw - The original update: clear, then write the message
+##
+def fullRedraw(messages):
+    lcd = FakeCharacterLcd()
+    for message in messages:
+        lcd.clear()
+        lcd.message = message
+    return lcd
+
+##
+## diffRedraw - Framebuffer diff rendering
+##
+def diffRedraw(messages):
+    lcd = FakeCharacterLcd()
+    lcd.clear()
+    framebuffer = LcdFramebuffer()
+    framebuffer.setBlank()
+    lcd.resetCounters()
+    for message in messages:
+        framebuffer.render(lcd, message)
+    return lcd
+
+def main():
+    parser = argparse.ArgumentParser(description = "LCD framebuffer diffs vs clear and redraw")
+    parser.add_argument("ticks", nargs = "?", type = int, default = 3600,
+                        help = "display updates (default %(default)s)")
+    arguments = parser.parse_args()
+    ticks = arguments.ticks
+
+    ##
+    ## A steady reading (only the clock changes) and a noisy one (the
+    ## last decimal changes almost every tick).
+    ##
+    for scenario, noise in (("steady", 0.0), ("noisy", 0.02)):
+        messages = temperatureMessages(ticks, noise)
+        full = fullRedraw(messages)
+        diff = diffRedraw(messages)
+
+        ## Both methods must leave the same text on the display
+        assert full.text() == diff.text()
+
+        print(f"{scenario}: {ticks} ticks")
+        print("%-12s %12s %12s %14s" % ("method", "bytes", "pin writes", "busy seconds"))
+        for name, lcd in (("full", full), ("diff", diff)):
+            print("%-12s %12d %12d %14.3f" % (name, lcd.commandBytes + lcd.dataBytes,
+                                              lcd.pinWrites, lcd.busySeconds))
+        print("pin write reduction: %.1fx" % (full.pinWrites / max(1, diff.pinWrites)))
+        print()
+
+if __name__ == '__main__':
+    main()
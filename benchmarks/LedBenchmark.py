@@ -0,0 +1,105 @@
+#
+# LedBenchmark compares gpiozero style per-LED fade threads with the
+# single LedCompositor thread on simulated LEDs, so it runs on any
+# machine. Both get the call pattern of the old updateLights: every
+# decision turns both LEDs of a machine off and pulses one of them
+# twice (on_enter by hand, then again from send()).
+#
+# Reported per engine: threads alive (peak), fade threads started, CPU
+# seconds used by the process, and compositor frames and pin writes.
+#
+# Usage: python benchmarks/LedBenchmark.py [seconds]
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from time import monotonic, process_time, sleep
+
+import argparse
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from LedCompositor import LedCompositor
+from PlantSitterHAL import SimulatedLed
+
+##
+## Seconds between control decisions (10 in PlantSitter, shortened so a
+## run sees many of them)
+##
+DECISION_PERIOD = 0.5
+
+##
+## legacyDecision - What updateLights did to the LEDs of one machine
+## when it moved to the state shown by 'lit'
+##
+def legacyDecision(lit, other):
+    lit.off()
+    other.off()
+    lit.pulse()
+    lit.pulse()
+
+##
+## run - Drive the (red, blue) and (yellow, green) pairs for 'seconds',
+## alternating the lit LED every fourth decision. Returns (peak threads,
+## CPU seconds).
+##
+def run(pairs, seconds):
+    peak = threading.active_count()
+    started = process_time()
+    deadline = monotonic() + seconds
+    decision = 0
+    while monotonic() < deadline:
+        for first, second in pairs:
+            if (decision // 4) % 2 == 0:
+                legacyDecision(first, second)
+            else:
+                legacyDecision(second, first)
+        decision = decision + 1
+
+        ## Sample the thread count while the fades run
+        end = monotonic() + DECISION_PERIOD
+        while monotonic() < end:
+            peak = max(peak, threading.active_count())
+            sleep(0.01)
+    return peak, process_time() - started
+
+def main():
+    parser = argparse.ArgumentParser(description = "LED compositor vs per-LED fade threads")
+    parser.add_argument("seconds", nargs = "?", type = float, default = 5.0,
+                        help = "seconds per run (default %(default)s)")
+    arguments = parser.parse_args()
+    seconds = arguments.seconds
+
+    baseline = threading.active_count()
+    print(f"{seconds:.0f} s, a decision every {DECISION_PERIOD} s, "
+          f"{baseline} thread(s) before starting")
+    print("%-12s %10s %10s %10s %10s %10s" % ("engine", "threads", "started", "cpu s",
+                                              "frames", "writes"))
+
+    leds = [SimulatedLed(pin, threaded = True) for pin in (18, 23, 21, 20)]
+    peak, cpu = run([(leds[0], leds[1]), (leds[2], leds[3])], seconds)
+    for led in leds:
+        led.close()
+    print("%-12s %10d %10d %10.3f %10s %10s" % ("per-LED", peak,
+                                                sum(led.threadsStarted for led in leds),
+                                                cpu, "-", "-"))
+
+    compositor = LedCompositor()
+    leds = [compositor.attach(SimulatedLed(pin), str(pin)) for pin in (18, 23, 21, 20)]
+    peak, cpu = run([(leds[0], leds[1]), (leds[2], leds[3])], seconds)
+    compositor.stop()
+    stats = compositor.getStats()
+    print("%-12s %10d %10d %10.3f %10d %10d" % ("compositor", peak, 1, cpu,
+                                                stats["frames"], stats["writes"]))
+    print(f"effect changes {stats['effectChanges']}, deduplicated {stats['deduplicated']}")
+
+if __name__ == '__main__':
+    main()
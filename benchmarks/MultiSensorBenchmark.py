@@ -0,0 +1,109 @@
+#
+# MultiSensorBenchmark compares the cycle time of reading several I2C
+# sensors one after another with the pipelined trigger-all-then-read-all
+# cycle of MultiSensorSampler. The simulated sensors model the AHT20
+# (80 ms) or SHT31 (15.5 ms) conversion time, a short bus transfer and,
+# optionally, a TCA9548A channel switch, so it runs on any machine.
+#
+# The sequential cycle reads .temperature and .relative_humidity of each
+# sensor like the adafruit drivers do, which is two conversions per
+# sensor. The pipelined cycle should stay close to one conversion time
+# whatever the number of sensors.
+#
+# Usage: python benchmarks/MultiSensorBenchmark.py [cycles]
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from statistics import median
+from time import monotonic
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PlantSitterHAL import (CONVERSION_TIMES, SENSOR_AHTX0, SENSOR_SHT31D,
+                            SimulatedMux, SimulatedPipelinedSensor)
+from SensorSampler import MultiSensorSampler
+
+##
+## Time of one bus transfer and of one mux channel switch, in seconds
+##
+TRANSFER_TIME = 0.0003
+SELECT_TIME = 0.0002
+
+SENSOR_COUNTS = (1, 2, 4, 8)
+
+##
+## createSensors - 'count' simulated sensors of type 'kind', each on its
+## own channel of one mux when 'useMux' is set
+##
+def createSensors(count, kind, useMux):
+    mux = SimulatedMux(SELECT_TIME) if useMux else None
+    return [('sensor' + str(index),
+             SimulatedPipelinedSensor(celsius = 20.0 + index,
+                                      conversionTime = CONVERSION_TIMES[kind],
+                                      transferTime = TRANSFER_TIME,
+                                      mux = mux,
+                                      muxChannel = index if useMux else None))
+            for index in range(count)]
+
+##
+## sequentialCycle - Median seconds to read both properties of every
+## sensor in turn
+##
+def sequentialCycle(sensors, cycles):
+    times = []
+    for cycle in range(cycles):
+        started = monotonic()
+        for name, sensor in sensors:
+            sensor.temperature
+            sensor.relative_humidity
+        times.append(monotonic() - started)
+    return median(times)
+
+##
+## pipelinedCycle - Median seconds of a MultiSensorSampler cycle
+##
+def pipelinedCycle(sensors, cycles):
+    sampler = MultiSensorSampler(sensors)
+    times = []
+    for cycle in range(cycles):
+        sampler.sample()
+        times.append(sampler.lastCycle)
+
+    ## Every sensor must have been read back with its own value
+    snapshots = sampler.getSnapshots()
+    for index, (name, sensor) in enumerate(sensors):
+        assert snapshots[name].temperature == 20.0 + index
+    return median(times)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Pipelined multi-sensor sampling vs sequential reads")
+    parser.add_argument("cycles", nargs = "?", type = int, default = 5,
+                        help = "sampling cycles per sensor count (default %(default)s)")
+    arguments = parser.parse_args()
+    cycles = arguments.cycles
+
+    for kind in (SENSOR_AHTX0, SENSOR_SHT31D):
+        for useMux in (False, True):
+            print(f"{kind}, conversion {CONVERSION_TIMES[kind] * 1000:.1f} ms"
+                  f"{', behind a TCA9548A' if useMux else ''}")
+            print("%-8s %16s %16s %10s" % ("sensors", "sequential ms", "pipelined ms", "speedup"))
+            for count in SENSOR_COUNTS:
+                sequential = sequentialCycle(createSensors(count, kind, useMux), cycles)
+                pipelined = pipelinedCycle(createSensors(count, kind, useMux), cycles)
+                print("%-8d %16.1f %16.1f %9.1fx" % (count, sequential * 1000,
+                                                     pipelined * 1000,
+                                                     sequential / pipelined))
+            print()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#
+# SensorModeBenchmark compares the read latency of the sensor modes on
+# simulated sensors with realistic conversion times, so it runs on any
+# machine:
+#
+#   - triggered: every read converts and waits (the adafruit drivers
+#     convert once per property, so twice per reading)
+#   - periodic SHT31: the sensor measures on its own and a read is one
+#     fetch transfer
+#   - periodic AHTx0: a background thread converts ahead of time and a
+#     read returns the latest result
+#
+# Every read goes through SensorSampler.sample(), like the control loop.
+#
+# Usage: python benchmarks/SensorModeBenchmark.py [reads]
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from statistics import median
+from time import monotonic, sleep
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PlantSitterHAL import (CONVERSION_TIMES, SENSOR_AHTX0, SENSOR_SHT31D,
+                            BackgroundSensor, SimulatedPeriodicSensor,
+                            SimulatedPipelinedSensor, SimulatedSensor)
+from SensorSampler import SensorSampler
+
+##
+## Time of one fetch (command plus 6 byte read) at 100 kHz, in seconds
+##
+FETCH_TIME = 0.0008
+
+##
+## Seconds between reads, and between background conversions
+##
+READ_INTERVAL = 0.02
+BACKGROUND_INTERVAL = 0.1
+
+##
+## measure - Read latencies of 'reads' samples, in milliseconds
+##
+def measure(sensor, reads):
+    sampler = SensorSampler(sensor)
+    times = []
+    for read in range(reads):
+        started = monotonic()
+        sampler.sample()
+        times.append((monotonic() - started) * 1000)
+        sleep(READ_INTERVAL)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description = "Triggered vs periodic sensor reads")
+    parser.add_argument("reads", nargs = "?", type = int, default = 20,
+                        help = "reads per mode (default %(default)s)")
+    arguments = parser.parse_args()
+    reads = arguments.reads
+
+    background = BackgroundSensor(
+        SimulatedPipelinedSensor(conversionTime = CONVERSION_TIMES[SENSOR_AHTX0],
+                                 transferTime = FETCH_TIME / 2),
+        BACKGROUND_INTERVAL)
+
+    scenarios = [
+        ("triggered ahtx0", SimulatedSensor(conversionTime = CONVERSION_TIMES[SENSOR_AHTX0])),
+        ("triggered sht31d", SimulatedSensor(conversionTime = CONVERSION_TIMES[SENSOR_SHT31D])),
+        ("periodic sht31d", SimulatedPeriodicSensor(fetchTime = FETCH_TIME)),
+        ("periodic ahtx0 (background)", background),
+    ]
+
+    print("%-30s %10s %10s %10s" % ("mode", "median ms", "min ms", "max ms"))
+    for name, sensor in scenarios:
+        times = measure(sensor, reads)
+        print("%-30s %10.3f %10.3f %10.3f" % (name, median(times), min(times), max(times)))
+
+    background.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#
+# SetpointEventBenchmark measures how quickly a setpoint button press
+# reaches the control decision and the LCD. Before setpoint changes were
+# events, a press only took effect at the next 10 s decision and showed
+# on the LCD at the next state/setpoint half of the alternating line
+# (up to 5 s later).
+#
+# A ControlEngine with one channel and a recording display runs on a
+# DeadlineScheduler, in a thread or on an event loop, while another
+# thread presses the buttons: single presses, and bursts of presses a
+# few milliseconds apart that should be coalesced into one update.
+# Reported per engine: the median and worst latency from the first press
+# of a burst to the display showing the final setpoint, and the updates
+# per burst.
+#
+# Usage: python benchmarks/SetpointEventBenchmark.py [bursts]
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from statistics import median
+from time import monotonic, sleep
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ControlChannel import ChannelConfig, ControlEngine
+from DeadlineScheduler import DeadlineScheduler
+
+## Presses per burst and seconds between the presses of a burst
+BURST_SIZES = (1, 5)
+PRESS_GAP = 0.005
+
+## Seconds between bursts
+BURST_GAP = 0.2
+
+##
+## RecordingDisplay - Remembers when each message was shown
+##
+class RecordingDisplay():
+    "Display recording its messages"
+
+    def __init__(self):
+        self.shown = []
+        self.changed = threading.Condition()
+
+    def show(self, message):
+        with self.changed:
+            self.shown.append((monotonic(), message))
+            self.changed.notify_all()
+
+    ##
+    ## waitFor - Time the message containing 'text' was shown, waiting
+    ## up to 'timeout' seconds for it
+    ##
+    def waitFor(self, text, since, timeout = 2.0):
+        deadline = monotonic() + timeout
+        with self.changed:
+            while True:
+                for when, message in self.shown:
+                    if when >= since and text in message:
+                        return when
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    return None
+                self.changed.wait(remaining)
+
+    ## End class RecordingDisplay definition
+
+def createEngine():
+    display = RecordingDisplay()
+    engine = ControlEngine()
+    channel = engine.addChannel(ChannelConfig(name = 'temperature', channel = 0,
+                                              read = lambda: 70.0, setPoint = 72,
+                                              minSetPoint = 60, maxSetPoint = 95,
+                                              states = ('off', 'heat', 'cool'),
+                                              display = display))
+    return engine, channel, display
+
+##
+## pressBursts - Press the buttons in bursts of every BURST_SIZES size
+## and return {size: (latencies, updates per burst)}. 'press' runs a
+## button handler the way the engine under test receives it.
+##
+def pressBursts(engine, channel, display, bursts, press):
+    results = {}
+    direction = -1
+    for size in BURST_SIZES:
+        latencies = []
+        updates = []
+        for burst in range(bursts):
+            before = engine.setPointUpdates
+            target = channel.setPoint + direction * size
+            started = monotonic()
+            for index in range(size):
+                press(channel.decreaseSetPoint if direction < 0 else channel.increaseSetPoint)
+                sleep(PRESS_GAP)
+            shown = display.waitFor('Set: ' + str(target), started)
+            if shown is not None:
+                latencies.append(shown - started)
+            sleep(BURST_GAP)
+            updates.append(engine.setPointUpdates - before)
+            direction = -direction
+        results[size] = (latencies, updates)
+    return results
+
+def report(name, results):
+    for size, (latencies, updates) in results.items():
+        print("%-10s %7d %12.1f %12.1f %14.2f" %
+              (name, size, median(latencies) * 1000, max(latencies) * 1000,
+               sum(updates) / len(updates)))
+
+def runThreaded(bursts):
+    engine, channel, display = createEngine()
+    scheduler = DeadlineScheduler()
+    engine.addJobs(scheduler)
+    thread = threading.Thread(target = scheduler.run, daemon = True)
+    thread.start()
+    sleep(0.1)
+
+    ## Like gpiozero, call the handler from the pressing thread
+    results = pressBursts(engine, channel, display, bursts, lambda handler: handler())
+    scheduler.stop()
+    thread.join()
+    return results
+
+def runAsync(bursts):
+    engine, channel, display = createEngine()
+    scheduler = DeadlineScheduler()
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        engine.addJobs(scheduler, wrap = lambda func: lambda: loop.run_in_executor(None, func))
+        task = asyncio.ensure_future(scheduler.runAsync())
+
+        ## Like the asyncio engine, hand the handler over to the loop
+        press = lambda handler: loop.call_soon_threadsafe(handler)
+        await asyncio.sleep(0.1)
+        results = await loop.run_in_executor(None, pressBursts, engine, channel, display,
+                                             bursts, press)
+        scheduler.stop()
+        await task
+        return results
+
+    return asyncio.run(main())
+
+def main():
+    parser = argparse.ArgumentParser(description = "Setpoint button press to display latency")
+    parser.add_argument("bursts", nargs = "?", type = int, default = 10,
+                        help = "bursts per burst size (default %(default)s)")
+    arguments = parser.parse_args()
+    bursts = arguments.bursts
+
+    logging.disable(logging.INFO)
+    print(f"{bursts} bursts per size, {PRESS_GAP * 1000:g} ms between presses, "
+          f"update delay {ControlEngine().setPointDelay * 1000:g} ms")
+    print("%-10s %7s %12s %12s %14s" % ("engine", "presses", "median ms", "max ms",
+                                        "updates/burst"))
+    report("threads", runThreaded(bursts))
+    report("asyncio", runAsync(bursts))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#
+# SetpointSweepBenchmark times SetpointSweep over synthetic 1 Hz
+# temperature readings (a daily cycle, slow drift and sensor noise) and
+# compares it with replaying the same readings through a ControlChannel
+# once per configuration, the way a plain Python sweep would.
+#
+# The Python replay is only run for a few configurations and the time
+# is extrapolated to the whole grid; its transition counts must match
+# the vectorized ones (threshold 0 is the ControlChannel rule).
+#
+# Usage: python benchmarks/SetpointSweepBenchmark.py [days]
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from time import monotonic
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+
+from ControlChannel import ChannelConfig, ControlChannel
+from SetpointSweep import DEFAULT_DECISION_PERIODS, DEFAULT_THRESHOLDS, sweep
+
+SET_POINTS = numpy.arange(60, 96)
+
+## Configurations replayed in Python: (setpoint, decision period)
+PYTHON_CONFIGURATIONS = ((66, 10), (70, 10), (72, 60))
+
+##
+## syntheticReadings - 'days' of 1 Hz readings in degrees Fahrenheit
+##
+def syntheticReadings(days, seed = 1):
+    generator = numpy.random.default_rng(seed)
+    times = numpy.arange(0, days * 86400, dtype = numpy.float64)
+    daily = 70.0 + 6.0 * numpy.cos(2 * numpy.pi * (times / 86400 - 0.6))
+    drift = numpy.cumsum(generator.normal(0, 0.002, len(times)))
+    noise = generator.normal(0, 0.2, len(times))
+    return times, daily + drift + noise
+
+##
+## pythonReplay - Transitions of one configuration decided by a
+## ControlChannel every 'decisionPeriod' readings
+##
+def pythonReplay(values, setPoint, decisionPeriod):
+    channel = ControlChannel(ChannelConfig(name = 'temperature', channel = 0, read = None,
+                                           setPoint = setPoint, minSetPoint = 60,
+                                           maxSetPoint = 95, states = ('off', 'heat', 'cool')))
+    for value in values[::decisionPeriod].tolist():
+        channel.decide(value)
+    return channel.transitions
+
+def main():
+    parser = argparse.ArgumentParser(description = "Vectorized setpoint sweep vs one replay per configuration")
+    parser.add_argument("days", nargs = "?", type = float, default = 90,
+                        help = "days of synthetic readings (default %(default)s)")
+    arguments = parser.parse_args()
+    days = arguments.days
+
+    logging.disable(logging.INFO)
+    times, values = syntheticReadings(days)
+    configurations = len(SET_POINTS) * len(DEFAULT_THRESHOLDS) * len(DEFAULT_DECISION_PERIODS)
+    print(f"{days:g} days of 1 Hz readings ({len(values)}), {configurations} configurations")
+
+    started = monotonic()
+    results = sweep(times, values, SET_POINTS)
+    vectorized = monotonic() - started
+
+    pythonSeconds = 0.0
+    pythonDecisions = 0
+    for setPoint, decisionPeriod in PYTHON_CONFIGURATIONS:
+        started = monotonic()
+        transitions = pythonReplay(values, setPoint, decisionPeriod)
+        pythonSeconds = pythonSeconds + monotonic() - started
+        pythonDecisions = pythonDecisions + len(values) // decisionPeriod
+
+        row = results[(results['setPoint'] == setPoint) & (results['threshold'] == 0) &
+                      (results['decisionPeriod'] == decisionPeriod)][0]
+        assert row['transitions'] == transitions, (setPoint, decisionPeriod, transitions,
+                                                   row['transitions'])
+
+    ## Decisions of the whole grid at the measured Python rate
+    gridDecisions = sum(len(values) // period for period in DEFAULT_DECISION_PERIODS)
+    gridDecisions = gridDecisions * len(SET_POINTS) * len(DEFAULT_THRESHOLDS)
+    extrapolated = pythonSeconds / pythonDecisions * gridDecisions
+
+    print("%-28s %12s" % ("sweep", "seconds"))
+    print("%-28s %12.2f" % ("vectorized (NumPy)", vectorized))
+    print("%-28s %12.0f" % ("ControlChannel per config", extrapolated))
+    print(f"speedup {extrapolated / vectorized:.0f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#
+# TelemetryReceiverBenchmark pushes a mixed stream of binary frames,
+# text reports and line noise through a Linux pty pair and measures how
+# fast TelemetryReceiver can read and parse it, with both the generator
+# and the async iterator.
+#
+# Usage: python benchmarks/TelemetryReceiverBenchmark.py [messages]
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from time import perf_counter
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import threading
+import tty
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from TelemetryProtocol import CHANNEL_HUMIDITY, CHANNEL_TEMPERATURE, packFrame
+from TelemetryReceiver import TelemetryParser, aiterRecords, readRecords
+
+##
+## buildStream - A stream of 'messages' reports, half binary and half
+## text, with a burst of garbage after roughly one message in a hundred.
+## It always ends with a binary frame so the last report is complete.
+##
+def buildStream(messages, seed = 1):
+    generator = random.Random(seed)
+    parts = []
+    for index in range(messages):
+        if index % 2 == 0 or index == messages - 1:
+            channel = CHANNEL_TEMPERATURE if index % 4 == 0 else CHANNEL_HUMIDITY
+            parts.append(packFrame(channel, 'off', generator.uniform(30, 90),
+                                   72, index, 1700000000 + index))
+        elif index % 4 == 1:
+            parts.append(("State: heat, \nCurrent Temp: " + str(generator.uniform(60, 80)) +
+                          ", \nTarget Temp: 72").encode())
+        else:
+            parts.append(("State: dry, \nHumidity: " + str(generator.uniform(20, 60)) +
+                          ", \nTarget Hum: 40").encode())
+
+        if generator.random() < 0.01:
+            parts.append(bytes(generator.randrange(256) for count in range(generator.randrange(1, 24))))
+    return b''.join(parts)
+
+##
+## openPtyPair - Raw mode pty pair; bytes written to the master come
+## out of the slave unchanged.
+##
+def openPtyPair():
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    return master, slave
+
+def startWriter(master, stream):
+    def write():
+        view = memoryview(stream)
+        while view:
+            written = os.write(master, view[:65536])
+            view = view[written:]
+    thread = threading.Thread(target=write, daemon=True)
+    thread.start()
+    return thread
+
+##
+## runGenerator - Parse the stream with readRecords()
+##
+def runGenerator(stream, expected):
+    master, slave = openPtyPair()
+    parser = TelemetryParser()
+    started = perf_counter()
+    writer = startWriter(master, stream)
+    count = 0
+    for record in readRecords(slave, parser):
+        count = count + 1
+        if count >= expected:
+            break
+    elapsed = perf_counter() - started
+    writer.join()
+    os.close(master)
+    os.close(slave)
+    return count, elapsed, parser
+
+##
+## runAsync - Parse the stream with aiterRecords()
+##
+def runAsync(stream, expected):
+    master, slave = openPtyPair()
+    os.set_blocking(slave, False)
+    parser = TelemetryParser()
+
+    async def consume():
+        count = 0
+        async for record in aiterRecords(slave, parser):
+            count = count + 1
+            if count >= expected:
+                break
+        return count
+
+    started = perf_counter()
+    writer = startWriter(master, stream)
+    count = asyncio.run(consume())
+    elapsed = perf_counter() - started
+    writer.join()
+    os.close(master)
+    os.close(slave)
+    return count, elapsed, parser
+
+def main():
+    parser = argparse.ArgumentParser(description = "Telemetry receiver parsing throughput")
+    parser.add_argument("messages", nargs = "?", type = int, default = 200000,
+                        help = "messages per run (default %(default)s)")
+    arguments = parser.parse_args()
+    messages = arguments.messages
+
+    stream = buildStream(messages)
+    print(f"{messages} messages, {len(stream)} bytes")
+    for name, run in (("generator", runGenerator), ("async", runAsync)):
+        count, elapsed, parser = run(stream, messages)
+        print("%-10s %8d records in %6.3f s  %10.0f records/s  %6.2f MB/s  "
+              "%d CRC errors, %d garbage bytes" %
+              (name, count, elapsed, count / elapsed, len(stream) / elapsed / 1e6,
+               parser.crcErrors, parser.garbageBytes))
+
+    ## For reference: the device sends one report per machine every 30 s
+    print("device rate at the default 30 s period: %.3f records/s" % (2 / 30))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+#
+# TickBenchmark measures the per-tick hot path of the control channels
+# on simulated hardware (PLANTSITTER_HAL=sim), so it runs on any Linux
+# box:
+#
+#   - control decisions, with and without a state transition
+#   - serial text report formatting plus encode
+#   - LCD message composition (composeScreen)
+#   - a bare state transition
+#   - one engine tick over 2, 12 and 48 channels, to show how the per
+#     tick cost grows with the number of zones
+#
+# Results can be saved as JSON and compared against an earlier run, so
+# tick latency regressions show up before a deploy.
+#
+# Usage: python benchmarks/TickBenchmark.py [--output results.json]
+#                                           [--compare baseline.json]
+#                                           [--threshold 0.10]
+#                                           [--repeat 7]
+#
+# With --compare the exit status is 1 if any benchmark got slower than
+# the baseline by more than the threshold.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from datetime import datetime
+from statistics import median
+
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+## Always use the in-memory devices
+os.environ['PLANTSITTER_HAL'] = 'sim'
+
+import PlantSitter
+
+from ControlChannel import ControlEngine
+from PlantSitterHAL import SimulatedLed
+
+##
+## Each measurement runs for at least this many seconds
+##
+MIN_SECONDS = 0.2
+
+##
+## measure - Time 'func' and return a result dictionary with the
+## per-call times in microseconds. The number of calls per run is
+## picked so that one run takes at least MIN_SECONDS.
+##
+def measure(func, repeat = 7):
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        if timer.timeit(number) >= MIN_SECONDS:
+            break
+        number = number * 2
+
+    times = [elapsed / number * 1e6 for elapsed in timer.repeat(repeat, number)]
+    return {
+        "median": median(times),
+        "min": min(times),
+        "max": max(times),
+        "calls": number,
+        "repeat": repeat,
+    }
+
+##
+## Channel counts of the engine tick benchmarks
+##
+ENGINE_SIZES = (2, 12, 48)
+
+##
+## Benchmark bodies
+##
+
+def holdDecision(channel, reading):
+    ## setPoint equal to the reading: off stays off
+    channel.setPoint = reading
+    return channel.decide
+
+def transitionDecision(channel, reading):
+    ## Alternate the setpoint around the reading so that every call
+    ## makes a heat <-> cool (or dry <-> hum) transition
+    setPoints = [reading + 5, reading - 5]
+    state = {'index': 0}
+    def decide():
+        channel.setPoint = setPoints[state['index']]
+        state['index'] = 1 - state['index']
+        channel.decide()
+    return decide
+
+def serialOutput(channel):
+    return lambda: channel.serialText(channel.read()).encode()
+
+def composeScreen(channel):
+    return lambda: channel.composeScreen(channel.read())
+
+def bareTransition(channel):
+    ## Cycle off -> heat -> cool -> off without reading anything
+    order = {channel.idle: channel.below, channel.below: channel.above,
+             channel.above: channel.idle}
+    return lambda: channel.transition(order[channel.state])
+
+##
+## simulatedEngine - An engine with 'size' channels reading the shared
+## sampler, each with its own LEDs and no display
+##
+def simulatedEngine(size):
+    engine = ControlEngine()
+    for index in range(size):
+        base = PlantSitter.CHANNELS[index % len(PlantSitter.CHANNELS)]
+        engine.addChannel(base._replace(name = base.name + str(index),
+                                        channel = index,
+                                        lights = {base.states[1]: SimulatedLed(2 * index),
+                                                  base.states[2]: SimulatedLed(2 * index + 1)},
+                                        display = None,
+                                        buttons = None))
+    return engine
+
+def runBenchmarks(repeat):
+    temperatureChannel = PlantSitter.temperatureChannel
+    humidityChannel = PlantSitter.humidityChannel
+    temperature = int(temperatureChannel.read())
+    humidity = int(humidityChannel.read())
+
+    benchmarks = [
+        ("temperature.decide.hold", holdDecision(temperatureChannel, temperature)),
+        ("humidity.decide.hold", holdDecision(humidityChannel, humidity)),
+        ("temperature.decide.transition", transitionDecision(temperatureChannel, temperature)),
+        ("humidity.decide.transition", transitionDecision(humidityChannel, humidity)),
+        ("temperature.serialText", serialOutput(temperatureChannel)),
+        ("humidity.serialText", serialOutput(humidityChannel)),
+        ("temperature.composeScreen", composeScreen(temperatureChannel)),
+        ("humidity.composeScreen", composeScreen(humidityChannel)),
+        ("channel.transition.bare", bareTransition(simulatedEngine(1).channels[0])),
+    ]
+    for size in ENGINE_SIZES:
+        benchmarks.append(("engine.tick." + str(size), simulatedEngine(size).tick))
+
+    results = {}
+    for name, func in benchmarks:
+        results[name] = measure(func, repeat)
+        print("%-40s %10.2f us" % (name, results[name]["median"]))
+    return results
+
+##
+## saveResults - Write results with enough context to compare them later
+##
+def saveResults(path, results):
+    document = {
+        "created": datetime.now().isoformat(timespec = 'seconds'),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "node": platform.node(),
+        "results": results,
+    }
+    with open(path, 'w') as file:
+        json.dump(document, file, indent = 2, sort_keys = True)
+
+##
+## compareResults - Print the change of every benchmark against the
+## baseline file and return the names of the regressions.
+##
+def compareResults(path, results, threshold):
+    with open(path) as file:
+        baseline = json.load(file)["results"]
+
+    regressions = []
+    print()
+    print("%-40s %10s %10s %8s" % ("benchmark", "baseline", "now", "change"))
+    for name, result in results.items():
+        if name not in baseline:
+            print("%-40s %10s %10.2f %8s" % (name, "-", result["median"], "new"))
+            continue
+        before = baseline[name]["median"]
+        change = (result["median"] - before) / before
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print("%-40s %10.2f %10.2f %+7.1f%%%s" % (name, before, result["median"],
+                                                 change * 100, flag))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description = "PlantSitter tick benchmarks")
+    parser.add_argument("--output", help = "save the results to this JSON file")
+    parser.add_argument("--compare", help = "compare against this JSON file")
+    parser.add_argument("--threshold", type = float, default = 0.10,
+                        help = "slowdown reported as a regression (default 0.10)")
+    parser.add_argument("--repeat", type = int, default = 7)
+    arguments = parser.parse_args()
+
+    ## The logging pipeline is not started here, so the per tick debug
+    ## messages cost no more than a disabled level check
+    results = runBenchmarks(arguments.repeat)
+
+    if arguments.output:
+        saveResults(arguments.output, results)
+
+    if arguments.compare:
+        regressions = compareResults(arguments.compare, results, arguments.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {arguments.threshold:.0%}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
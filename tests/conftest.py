@@ -0,0 +1,18 @@
+#
+# Test setup: the PlantSitter modules live at the top of the repository
+# and every test runs on the simulated hardware backend.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('PLANTSITTER_HAL', 'sim')
@@ -0,0 +1,126 @@
+#
+# Tests of AdaptiveSampling: how the interval grows while the readings
+# are stable and what brings it back to the fastest one
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+import pytest
+
+from AdaptiveSampling import (APPROACH_SHARE, REASON_APPROACHING, REASON_CHANGING,
+                              REASON_NEAR, REASON_SETPOINT, REASON_STABLE, REASON_START,
+                              AdaptiveInterval)
+
+##
+## FakeChannel - The part of a ControlChannel the policy looks at
+##
+class FakeChannel():
+    "Channel stand-in with a settable reading and setpoint"
+
+    def __init__(self, name, value, setPoint):
+        self.name = name
+        self.value = value
+        self.setPoint = setPoint
+
+def testStableIntervalGrowsToTheMaximum():
+    policy = AdaptiveInterval(minInterval = 1, maxInterval = 30)
+    channel = FakeChannel('temperature', 60.0, 72)
+
+    when = 0.0
+    intervals = []
+    for tick in range(12):
+        intervals.append(policy.update([channel], when))
+        when = when + intervals[-1]
+
+    ## The first tick has no rate yet, then x1.5 (at least +1) up to 30
+    assert intervals == [1, 2, 3, 4, 6, 9, 13, 19, 28, 30, 30, 30]
+    assert policy.reason == REASON_STABLE
+    assert policy.getStats()["reasons"][REASON_CHANGING] == 1
+
+def testIntervalStaysOnTheGrid():
+    policy = AdaptiveInterval(minInterval = 2, maxInterval = 15)
+    channel = FakeChannel('temperature', 60.0, 72)
+    when = 0.0
+    for tick in range(10):
+        interval = policy.update([channel], when)
+        assert interval % 2 == 0 and 2 <= interval <= 15
+        when = when + interval
+    assert interval == 14
+
+def testBackToFastest():
+    policy = AdaptiveInterval(nearDistances = {'temperature': 2.0})
+    channel = FakeChannel('temperature', 60.0, 72)
+    when = 0.0
+    for tick in range(6):
+        when = when + policy.update([channel], when)
+    assert policy.interval > 1
+
+    ## The setpoint moved
+    channel.setPoint = 73
+    assert policy.update([channel], when) == 1
+    assert policy.reason == REASON_SETPOINT
+
+    ## The reading jumped
+    channel.value = 65.0
+    assert policy.update([channel], when + 1) == 1
+    assert policy.reason == REASON_CHANGING
+
+    ## The reading is near the setpoint, however stable
+    channel.value = 71.0
+    for tick in range(40):
+        assert policy.update([channel], when + 2 + tick) == 1
+    assert policy.reason == REASON_NEAR
+
+def testSlowApproachLimitsTheInterval():
+    policy = AdaptiveInterval(maxInterval = 30, nearDistances = {'temperature': 2.0},
+                              maxRates = {'temperature': 0.01})
+    channel = FakeChannel('temperature', 68.0, 72)
+    rate = 0.008
+
+    when = 0.0
+    while policy.reason != REASON_APPROACHING:
+        channel.value = 68.0 + rate * when
+        when = when + policy.update([channel], when)
+        assert when < 300
+
+    ## Half of the way to the near band at the measured rate
+    approach = (72 - channel.value - 2.0) * APPROACH_SHARE / rate
+    assert approach - 1 < policy.interval <= approach
+
+def testFastestChannelWins():
+    policy = AdaptiveInterval()
+    temperature = FakeChannel('temperature', 60.0, 72)
+    humidity = FakeChannel('humidity', 20.0, 40)
+    for when in range(5):
+        policy.update([temperature, humidity], float(when))
+
+    humidity.value = 39.0
+    assert policy.update([temperature, humidity], 5.0) == 1
+    assert (policy.reason, policy.channel) == (REASON_NEAR, 'humidity')
+
+def testMissingReadingsAreSkipped():
+    policy = AdaptiveInterval()
+    changes = []
+    policy.listeners.append(lambda interval, reason, channel: changes.append(interval))
+
+    channels = [FakeChannel('temperature', None, 72), FakeChannel('humidity', float('nan'), 40)]
+    assert policy.update(channels, 0.0) == 1
+    assert policy.reason == REASON_START
+    assert changes == []
+
+    channels[0].value = 60.0
+    policy.update(channels, 1.0)
+    policy.update(channels, 2.0)
+    assert changes == [2]
+    assert list(policy.history)[-1] == (2.0, 2, REASON_STABLE, 'temperature')
+
+def testBadLimits():
+    with pytest.raises(ValueError):
+        AdaptiveInterval(minInterval = 0)
+    with pytest.raises(ValueError):
+        AdaptiveInterval(minInterval = 10, maxInterval = 5)
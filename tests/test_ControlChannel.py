@@ -0,0 +1,188 @@
+#
+# Tests of ControlChannel and ControlEngine: the transition table of a
+# channel, the channel table checks of addChannel and the coalescing of
+# setpoint changes
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+import pytest
+
+from ControlChannel import ALTERNATE_TICKS, ChannelConfig, ControlChannel, ControlEngine
+from DeadlineScheduler import DeadlineScheduler
+from TelemetryProtocol import STATE_CODES, STATE_NAMES, packFrame, unpackFrame
+
+def channelConfig(name = 'temperature', channel = 1, states = ('off', 'heat', 'cool'),
+                  read = lambda: 70.0, setPoint = 72, lights = {}, display = None):
+    return ChannelConfig(name = name, channel = channel, read = read, setPoint = setPoint,
+                         minSetPoint = 60, maxSetPoint = 95, states = states, lights = lights,
+                         display = display)
+
+class FakeLight():
+    "LED stand-in recording its calls"
+
+    def __init__(self, calls, name):
+        self.calls = calls
+        self.name = name
+
+    def pulse(self):
+        self.calls.append(('pulse', self.name))
+
+    def off(self):
+        self.calls.append(('off', self.name))
+
+##
+## The transition table: (state, setpoint, reading, next state)
+##
+TRANSITIONS = [
+    ('off', 72, 70, 'heat'),
+    ('off', 72, 75, 'cool'),
+    ('off', 72, 72, 'off'),
+    ('heat', 72, 71, 'heat'),
+    ('heat', 72, 72, 'heat'),
+    ('heat', 72, 73, 'cool'),
+    ('cool', 72, 73, 'cool'),
+    ('cool', 72, 72, 'cool'),
+    ('cool', 72, 71, 'heat'),
+]
+
+@pytest.mark.parametrize('state, setPoint, reading, expected', TRANSITIONS)
+def testTransitionTable(state, setPoint, reading, expected):
+    channel = ControlChannel(channelConfig(setPoint = setPoint))
+    channel.state = state
+    assert channel.target(reading) == expected
+
+def testDecideFloorsTheReading():
+    channel = ControlChannel(channelConfig(setPoint = 72))
+    assert channel.decide(72.9) == 'off'
+    assert channel.decide(71.9) == 'heat'
+    assert channel.decide(72.9) == 'heat'
+    assert channel.decide(73.0) == 'cool'
+    assert channel.transitions == 2
+
+def testTransitionMovesTheLights():
+    calls = []
+    lights = {state: FakeLight(calls, state) for state in ('off', 'heat', 'cool')}
+    channel = ControlChannel(channelConfig(setPoint = 72, lights = lights))
+    seen = []
+    channel.listeners.append(lambda channel, source, target, seconds:
+                             seen.append((source, target)))
+
+    channel.decide(70.0)
+    channel.decide(75.0)
+    assert calls == [('off', 'off'), ('pulse', 'heat'), ('off', 'heat'), ('pulse', 'cool')]
+    assert seen == [('off', 'heat'), ('heat', 'cool')]
+
+    with pytest.raises(ValueError, match = "has no state"):
+        channel.transition('dry')
+
+def testThirdChannelWithNewStates():
+    engine = ControlEngine()
+    engine.addChannel(channelConfig())
+    engine.addChannel(channelConfig('humidity', 2, ('off', 'dry', 'hum')))
+    soil = engine.addChannel(channelConfig('soil', 3, ('rest', 'water', 'drain')))
+
+    ## The original codes stay put, the new states get their own
+    assert STATE_CODES['hum'] == 4
+    assert len(set(STATE_CODES[state] for state in ('rest', 'water', 'drain'))) == 3
+    assert STATE_NAMES[STATE_CODES['water']] == 'water'
+
+    soil.state = 'water'
+    record = unpackFrame(soil.serialFrame(35.5, 1_700_000_000))
+    assert (record.channel, record.state, record.reading) == (3, 'water', 35.5)
+
+def testChannelIdChecks():
+    engine = ControlEngine()
+    engine.addChannel(channelConfig())
+    with pytest.raises(ValueError, match = "already used by temperature"):
+        engine.addChannel(channelConfig('humidity', 1, ('off', 'dry', 'hum')))
+    with pytest.raises(ValueError, match = "channel id"):
+        engine.addChannel(channelConfig('soil', 256))
+    with pytest.raises(ValueError, match = "three distinct"):
+        engine.addChannel(channelConfig('soil', 3, ('off', 'off', 'water')))
+    assert [channel.name for channel in engine.channels] == ['temperature']
+
+def testUnknownStateCannotBePacked():
+    with pytest.raises(KeyError):
+        packFrame(1, 'never registered', 20.0, 20, 0, 0)
+
+class FakeDisplay():
+    "Display stand-in keeping every message"
+
+    def __init__(self):
+        self.messages = []
+
+    def show(self, message):
+        self.messages.append(message)
+
+class VirtualClock():
+    "Manual clock"
+
+    def __init__(self, now = 0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now = self.now + seconds
+
+##
+## runEngine - Run 'engine' on a virtual clock until isDone() is true,
+## returning the clock
+##
+def runEngine(engine, isDone):
+    clock = VirtualClock()
+    scheduler = DeadlineScheduler(clock = clock, sleep = clock.sleep)
+    engine.addJobs(scheduler)
+    scheduler.run(isDone = isDone)
+    return clock
+
+def testPressesAreCoalesced():
+    display = FakeDisplay()
+    engine = ControlEngine(clock = lambda: 1_700_000_000)
+    channel = engine.addChannel(channelConfig(read = lambda: 74.0, display = display))
+
+    ## Three presses within one tick are applied by a single update
+    def press(when):
+        if len(display.messages) == 2:
+            channel.increaseSetPoint()
+            channel.increaseSetPoint()
+            channel.increaseSetPoint()
+    engine.tickHandlers.append(press)
+
+    clock = runEngine(engine, lambda: engine.setPointUpdates >= 1)
+    assert channel.setPoint == 75
+    assert engine.setPointEvents == 3
+    assert engine.setPointUpdates == 1
+    assert clock() == pytest.approx(1.0 + engine.setPointDelay)
+
+    ## The update decided on the new setpoint and showed it right away
+    assert channel.state == 'heat'
+    assert display.messages[-1].endswith(' Heat | Set: 75')
+    assert channel.altCounter == ALTERNATE_TICKS + 2
+
+def testPressAtTheLimitIsNoEvent():
+    engine = ControlEngine()
+    channel = engine.addChannel(channelConfig(setPoint = 95))
+    assert channel.adjustSetPoint(1) == 95
+    assert engine.setPointEvents == 0
+    assert channel.adjustSetPoint(-40) == 60
+    assert engine.setPointEvents == 1
+
+def testOnlyChangedChannelsAreUpdated():
+    engine = ControlEngine(clock = lambda: 1_700_000_000)
+    temperature = engine.addChannel(channelConfig(read = lambda: 74.0))
+    humidity = engine.addChannel(channelConfig('humidity', 2, ('off', 'dry', 'hum'),
+                                               read = lambda: 30.0, setPoint = 40))
+    temperature.decreaseSetPoint()
+    engine.applySetPoints()
+
+    assert (temperature.state, humidity.state) == ('cool', 'off')
+    engine.applySetPoints()
+    assert engine.setPointUpdates == 1
@@ -0,0 +1,94 @@
+#
+# Tests of DeadlineScheduler: a job that raises is counted and logged,
+# and the other jobs keep running.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+import asyncio
+
+import pytest
+
+from DeadlineScheduler import DeadlineScheduler
+
+PERIOD = 0.005
+
+##
+## createScheduler - A scheduler with a job failing like a NACKed I2C
+## read and a job counting its runs
+##
+def createScheduler(stopOnError = False):
+    scheduler = DeadlineScheduler(stopOnError = stopOnError)
+    runs = []
+
+    def failing():
+        raise OSError(121, "Remote I/O error")
+
+    scheduler.addJob("sensor", PERIOD, failing)
+    scheduler.addJob("display", PERIOD, lambda: runs.append(1))
+    return scheduler, runs
+
+def testJobErrorDoesNotStopScheduler(caplog):
+    scheduler, runs = createScheduler()
+    scheduler.run(isDone = lambda: len(runs) >= 5)
+
+    sensor = scheduler.jobs["sensor"]
+    assert len(runs) >= 5
+    assert sensor.errors >= 4
+    assert sensor.runs == sensor.errors
+    assert "Job sensor failed" in caplog.text
+
+def testJobErrorDoesNotStopAsyncScheduler():
+    scheduler, runs = createScheduler()
+    asyncio.run(scheduler.runAsync(isDone = lambda: len(runs) >= 5))
+
+    assert len(runs) >= 5
+    assert scheduler.jobs["sensor"].errors >= 4
+
+def testStopOnError():
+    scheduler, runs = createScheduler(stopOnError = True)
+    with pytest.raises(OSError):
+        scheduler.run(isDone = lambda: len(runs) >= 5)
+
+    assert scheduler.jobs["sensor"].errors == 1
+
+##
+## VirtualClock - Clock whose sleep() advances it
+##
+class VirtualClock():
+    "Manual clock"
+
+    def __init__(self, now = 1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now = self.now + seconds
+
+def testRunTwiceResumesTheGrid():
+    clock = VirtualClock()
+    scheduler = DeadlineScheduler(clock = clock, sleep = clock.sleep)
+    fired = []
+    scheduler.addJob("tick", 1.0, lambda: fired.append(clock()))
+
+    scheduler.run(isDone = lambda: len(fired) >= 4)
+    assert fired == [1000.0, 1001.0, 1002.0, 1003.0]
+
+    ## Stopped for 1000 s: the next run picks up one period later, not
+    ## another 1000 s on
+    clock.now = 2003.0
+    scheduler.run(isDone = lambda: len(fired) >= 6)
+    assert fired[4:] == [2004.0, 2005.0]
+
+    ## Triggers between runs are offsets from the next start again
+    scheduler.trigger("tick", 0.5)
+    clock.now = 3000.0
+    scheduler.run(isDone = lambda: len(fired) >= 7)
+    assert fired[6] == 3000.5
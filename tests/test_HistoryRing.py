@@ -0,0 +1,86 @@
+#
+# Tests of HistoryRing on temporary ring files
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+import pytest
+
+from HistoryRing import HEADER_SIZE, RECORD, HistoryRing
+from TelemetryProtocol import registerStates
+
+def testRegisteredStates(tmp_path):
+    registerStates(('rest', 'water', 'drain'))
+    ring = HistoryRing(str(tmp_path / 'history.ring'), capacity = 4)
+    try:
+        ring.append(1.0, 70.0, 40.0, 'heat', 'water', 72, 35)
+        with pytest.raises(ValueError, match = "Unknown state"):
+            ring.append(2.0, 70.0, 40.0, 'heat', 'flood', 72, 35)
+
+        assert [(record.temperatureState, record.humidityState) for record in ring.last(4)] == \
+            [('heat', 'water')]
+    finally:
+        ring.close()
+
+##
+## fill - Append readings 1 .. count to 'ring', one second apart
+##
+def fill(ring, count):
+    for index in range(1, count + 1):
+        ring.append(float(index), 60.0 + index, 30.0 + index, 'heat', 'dry', 72, 40)
+
+def testWrapAroundRead(tmp_path):
+    ring = HistoryRing(str(tmp_path / 'history.ring'), capacity = 4)
+    try:
+        fill(ring, 6)
+        assert ring.count == 4
+        assert ring.head == 2
+
+        ## Oldest first, the two oldest records are gone
+        assert [record.time for record in ring.last(10)] == [3.0, 4.0, 5.0, 6.0]
+        assert [record.temperature for record in ring.last(3)] == [64.0, 65.0, 66.0]
+        assert ring.last(0) == []
+
+        views = ring.lastViews(4)
+        assert [len(view) for view in views] == [2 * RECORD.size, 2 * RECORD.size]
+        assert RECORD.unpack(views[0][:RECORD.size])[0] == 3.0
+        assert RECORD.unpack(views[1][-RECORD.size:])[0] == 6.0
+        ## The mapping cannot be closed while views of it exist
+        for view in views:
+            view.release()
+
+        ## Without a wrap, a single view
+        assert len(ring.lastViews(2)) == 1
+
+        array = ring.lastArray(4)
+        assert list(array['time']) == [3.0, 4.0, 5.0, 6.0]
+        assert list(array['humidity']) == [33.0, 34.0, 35.0, 36.0]
+        assert ring.lastArray(0).size == 0
+    finally:
+        ring.close()
+
+def testReopenKeepsThePosition(tmp_path):
+    path = str(tmp_path / 'history.ring')
+    ring = HistoryRing(path, capacity = 4)
+    fill(ring, 5)
+    ring.close()
+
+    ring = HistoryRing(path, capacity = 100)
+    try:
+        assert ring.capacity == 4
+        ring.append(6.0, 66.0, 36.0, 'cool', 'hum', 70, 45)
+        assert [record.time for record in ring.last(4)] == [3.0, 4.0, 5.0, 6.0]
+        assert ring.last(1)[0].temperatureState == 'cool'
+    finally:
+        ring.close()
+
+def testForeignFileIsRejected(tmp_path):
+    path = tmp_path / 'other.ring'
+    path.write_bytes(b'\0' * (HEADER_SIZE + 4 * RECORD.size))
+    with pytest.raises(ValueError, match = "not a PlantSitter history file"):
+        HistoryRing(str(path))
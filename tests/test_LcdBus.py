@@ -0,0 +1,151 @@
+#
+# Tests of LcdBus: two fake displays sharing the bus, coalescing of the
+# messages the worker has not drawn yet, and the release of the lines
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+import threading
+
+from FakeLcd import CountingPin, FakeCharacterLcd
+from LcdBus import LcdBus
+
+##
+## GatedLcd - Fake display whose clear() holds the bus worker until the
+## gate is opened, so that commands pile up behind it
+##
+class GatedLcd(FakeCharacterLcd):
+    "Fake LCD that can hold the bus worker"
+
+    def __init__(self, columns, lines):
+        FakeCharacterLcd.__init__(self, columns, lines)
+        self.gate = threading.Event()
+        self.gate.set()
+        self.entered = threading.Event()
+
+    def clear(self):
+        self.entered.set()
+        self.gate.wait(5.0)
+        FakeCharacterLcd.clear(self)
+
+    ## End class GatedLcd definition
+
+class ReleaseCountingPin(CountingPin):
+    "Fake pin remembering whether it was released"
+
+    def __init__(self, name = None):
+        CountingPin.__init__(self, name)
+        self.released = False
+
+    def deinit(self):
+        self.released = True
+
+##
+## makeBus - A bus on counting pins whose displays are GatedLcds
+##
+def makeBus(histogram = None):
+    pins = [ReleaseCountingPin(name) for name in ('rs', 'd4', 'd5', 'd6', 'd7')]
+    lcds = []
+
+    def lcdFactory(rs, en, d4, d5, d6, d7, columns, rows):
+        lcd = GatedLcd(columns, rows)
+        lcds.append(lcd)
+        return lcd
+
+    bus = LcdBus(*pins, lcdFactory = lcdFactory, histogram = histogram)
+    return bus, pins, lcds
+
+class ListHistogram():
+    "Histogram stand-in keeping every observation"
+
+    def __init__(self):
+        self.values = []
+
+    def observe(self, value):
+        self.values.append(value)
+
+def testTwoDisplaysShowTheirOwnMessages():
+    histogram = ListHistogram()
+    bus, pins, lcds = makeBus(histogram)
+    top = bus.attach(ReleaseCountingPin('e1'))
+    bottom = bus.attach(ReleaseCountingPin('e2'))
+
+    top.show("Temp 71.2\nSet 72")
+    bottom.show("Hum 40\nSet 45")
+    bus.flush()
+
+    assert lcds[0].text() == "Temp 71.2       \nSet 72          "
+    assert lcds[1].text() == "Hum 40          \nSet 45          "
+    stats = bus.getStats()
+    assert stats["frames"] == 2
+    assert stats["errors"] == 0
+    assert stats["queueDepth"] == 0
+    assert len(histogram.values) == 2
+
+def testPendingMessagesAreCoalesced():
+    bus, pins, lcds = makeBus()
+    handle = bus.attach(ReleaseCountingPin('e1'))
+    lcd = lcds[0]
+
+    ## Hold the worker in a clear() while three messages are submitted
+    lcd.gate.clear()
+    lcd.entered.clear()
+    handle.clear()
+    assert lcd.entered.wait(5.0)
+    handle.show("first")
+    handle.show("second")
+    handle.show("third")
+    lcd.gate.set()
+    bus.flush()
+
+    assert lcd.text().startswith("third ")
+    stats = bus.getStats()
+    assert stats["coalesced"] == 2
+    assert stats["frames"] == 1
+
+    ## Once drawn, the next message is queued again
+    handle.show("fourth")
+    bus.flush()
+    assert lcd.text().startswith("fourth")
+    assert bus.getStats()["frames"] == 2
+
+def testFailingDisplayDoesNotStopTheBus():
+    bus, pins, lcds = makeBus()
+    broken = bus.attach(ReleaseCountingPin('e1'))
+    working = bus.attach(ReleaseCountingPin('e2'))
+
+    def fail(message):
+        raise OSError("display gone")
+    broken.framebuffer.render = lambda lcd, message: fail(message)
+
+    broken.show("lost")
+    working.show("kept")
+    bus.flush()
+
+    assert bus.getStats()["errors"] == 1
+    assert lcds[1].text().startswith("kept")
+
+def testLinesAreReleasedWithTheLastDisplay():
+    bus, pins, lcds = makeBus()
+    firstEnable = ReleaseCountingPin('e1')
+    secondEnable = ReleaseCountingPin('e2')
+    first = bus.attach(firstEnable)
+    second = bus.attach(secondEnable)
+
+    first.close()
+    assert firstEnable.released
+    assert not any(pin.released for pin in pins)
+    first.show("ignored")
+
+    second.close()
+    assert secondEnable.released
+    assert all(pin.released for pin in pins)
+    assert bus.handles == []
+
+    bus._thread.join(5.0)
+    assert not bus._thread.is_alive()
@@ -0,0 +1,58 @@
+#
+# Tests of LcdFramebuffer: the runs of a diff and what they leave on a
+# fake display
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from FakeLcd import FakeCharacterLcd
+from LcdFramebuffer import LcdFramebuffer
+
+FIRST = "Oct 18  10:00:01\nT: 71.2 Set: 72"
+SECOND = "Oct 18  10:00:02\nT: 71.4 Set: 72"
+
+def testUnknownDisplayIsRewritten():
+    framebuffer = LcdFramebuffer()
+    assert framebuffer.diff(framebuffer.layout(FIRST)) == [
+        (0, 0, "Oct 18  10:00:01"),
+        (0, 1, "T: 71.2 Set: 72 "),
+    ]
+
+def testOnlyChangedCellsAreSent():
+    framebuffer = LcdFramebuffer()
+    lcd = FakeCharacterLcd()
+    framebuffer.render(lcd, FIRST)
+
+    assert framebuffer.render(lcd, SECOND) == [(15, 0, "2"), (6, 1, "4")]
+    assert framebuffer.render(lcd, SECOND) == []
+    assert lcd.text() == "Oct 18  10:00:02\nT: 71.4 Set: 72 "
+    assert framebuffer.cursorMoves == 4
+    assert framebuffer.frames == 3
+
+def testCloseRunsAreMerged():
+    framebuffer = LcdFramebuffer()
+    framebuffer.setBlank()
+
+    ## One unchanged cell between two changes is rewritten, two are not
+    assert framebuffer.diff(framebuffer.layout("a b")) == [(0, 0, "a b")]
+    assert framebuffer.diff(framebuffer.layout("a  b")) == [(0, 0, "a"), (3, 0, "b")]
+
+def testLayoutPadsAndClips():
+    framebuffer = LcdFramebuffer(columns = 4, rows = 2)
+    assert framebuffer.layout("toolong\nx\nthird") == [list("tool"), list("x   ")]
+    assert framebuffer.layout("") == [list("    "), list("    ")]
+
+def testBlankAndInvalidate():
+    framebuffer = LcdFramebuffer(columns = 4, rows = 1)
+    lcd = FakeCharacterLcd(columns = 4, lines = 1)
+    framebuffer.setBlank()
+    assert framebuffer.render(lcd, "  ab") == [(2, 0, "ab")]
+
+    framebuffer.invalidate()
+    assert framebuffer.render(lcd, "  ab") == [(0, 0, "  ab")]
+    assert lcd.text() == "  ab"
@@ -0,0 +1,116 @@
+#
+# Tests of LedCompositor: the fade tables, the frames rendered from them
+# and the effect bookkeeping of the LEDs
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from time import monotonic, sleep
+
+from LedCompositor import EFFECT_ON, EFFECT_PULSE, LedCompositor, fadeTable
+
+class FakePwmLed():
+    "PWMLED stand-in recording every value written"
+
+    def __init__(self):
+        self.values = []
+
+    @property
+    def value(self):
+        return self.values[-1] if self.values else 0.0
+
+    @value.setter
+    def value(self, value):
+        self.values.append(value)
+
+##
+## pulseEffect - The effect tuple setEffect() would store for a pulse,
+## so that frames can be rendered without the compositor thread
+##
+def pulseEffect(compositor, fadeIn, fadeOut, repeats, started = 0.0):
+    return ((EFFECT_PULSE, fadeIn, fadeOut, repeats),
+            compositor._table(fadeIn, fadeOut), started, repeats)
+
+def testFadeTable():
+    assert fadeTable(0.1, 0.1, 20) == (0.0, 0.5, 1.0, 0.5)
+    assert fadeTable(0.1, 0, 20) == (0.0, 0.5)
+    assert fadeTable(0, 0, 25) == (0.0,)
+
+def testFramesFollowTheTable():
+    compositor = LedCompositor(frameRate = 20)
+    device = FakePwmLed()
+    led = compositor.attach(device, 'heat')
+    led.effect = pulseEffect(compositor, 0.1, 0.1, None)
+
+    for frame in range(6):
+        assert compositor.renderFrame(frame / 20 + 0.001)
+    assert device.values == [0.0, 0.5, 1.0, 0.5, 0.0, 0.5]
+
+    ## A repeated brightness is not written again
+    compositor.renderFrame(5 / 20 + 0.01)
+    assert compositor.writes == 6
+    assert compositor.frames == 7
+
+def testCountedPulseEndsOff():
+    compositor = LedCompositor(frameRate = 20)
+    device = FakePwmLed()
+    led = compositor.attach(device)
+    led.effect = pulseEffect(compositor, 0.1, 0.1, 2)
+
+    assert compositor.renderFrame(7 / 20 + 0.001)
+    assert not compositor.renderFrame(8 / 20 + 0.001)
+    assert not led.is_lit
+    assert device.value == 0.0
+
+def testSameEffectIsNotRestarted():
+    compositor = LedCompositor()
+    device = FakePwmLed()
+    led = compositor.attach(device)
+    try:
+        led.pulse()
+        started = led.effect[2]
+        led.pulse()
+        assert led.effect[2] == started
+        led.on()
+        led.on()
+        assert compositor.getStats()["effectChanges"] == 2
+        assert compositor.getStats()["deduplicated"] == 2
+        assert led.effect[0] == (EFFECT_ON,)
+    finally:
+        compositor.stop()
+
+def testThreadDrivesAndStops():
+    compositor = LedCompositor(frameRate = 100)
+    devices = [FakePwmLed(), FakePwmLed()]
+    pulsing, steady = [compositor.attach(device) for device in devices]
+
+    pulsing.pulse(0.05, 0.05)
+    steady.on()
+    deadline = monotonic() + 5.0
+    while len(set(devices[0].values)) < 3 and monotonic() < deadline:
+        sleep(0.01)
+
+    compositor.stop()
+    assert len(set(devices[0].values)) >= 3
+    assert 1.0 in devices[1].values
+    assert devices[0].value == 0.0 and devices[1].value == 0.0
+    assert not pulsing.is_lit and not steady.is_lit
+
+    ## A new effect starts the thread again
+    steady.on()
+    deadline = monotonic() + 5.0
+    while devices[1].value != 1.0 and monotonic() < deadline:
+        sleep(0.01)
+    compositor.stop()
+    assert devices[1].values[-2:] == [1.0, 0.0]
+
+def testLedStateProperties():
+    compositor = LedCompositor()
+    led = compositor.attach(FakePwmLed())
+    assert led.value == 0.0
+    assert not led.is_lit
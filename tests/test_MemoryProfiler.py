@@ -0,0 +1,76 @@
+#
+# Tests of MemoryProfiler: a profiling session and its report, and the
+# signal toggle
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from time import monotonic, sleep
+
+import os
+import signal
+import tracemalloc
+
+import pytest
+
+from MemoryProfiler import MemoryProfiler
+
+pytestmark = pytest.mark.skipif(tracemalloc.is_tracing(),
+                                reason = "tracemalloc is already tracing")
+
+def allocate():
+    return [bytearray(1024) for index in range(200)]
+
+def testSessionReportsGrowingSites(tmp_path):
+    path = tmp_path / 'memory.txt'
+    profiler = MemoryProfiler(str(path), frames = 1, top = 5)
+
+    ## Nothing is traced or written while it is off
+    profiler.snapshot()
+    assert not profiler.isRunning()
+    assert not path.exists()
+
+    profiler.start()
+    try:
+        assert profiler.isRunning()
+        kept = allocate()
+        profiler.snapshot()
+    finally:
+        profiler.stop()
+    assert not profiler.isRunning()
+    assert len(kept) == 200
+
+    report = path.read_text()
+    assert "memory profiling started, 1 frame(s)" in report
+    assert "snapshot 1: traced" in report
+    assert "top 5 growth since previous snapshot:" in report
+    assert "test_MemoryProfiler.py" in report.split("snapshot 2")[0]
+    assert "snapshot 2" in report
+    assert report.rstrip().endswith("memory profiling stopped")
+    assert profiler.snapshots == 2
+
+def testStopWhenStoppedDoesNothing(tmp_path):
+    path = tmp_path / 'memory.txt'
+    profiler = MemoryProfiler(str(path))
+    profiler.stop()
+    assert not path.exists()
+
+def testSignalToggles(tmp_path):
+    profiler = MemoryProfiler(str(tmp_path / 'memory.txt'), frames = 1)
+    previous = signal.getsignal(signal.SIGUSR1)
+    profiler.installSignal()
+    try:
+        for running in (True, False):
+            os.kill(os.getpid(), signal.SIGUSR1)
+            deadline = monotonic() + 5.0
+            while profiler.isRunning() != running and monotonic() < deadline:
+                sleep(0.01)
+            assert profiler.isRunning() == running
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
+        profiler.stop()
@@ -0,0 +1,105 @@
+#
+# Tests of Metrics: the Prometheus text format of counters, histograms
+# and collectors, the textfile and the HTTP endpoint
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import os
+
+import pytest
+
+from Metrics import MetricsRegistry
+
+def testCounterFormat():
+    registry = MetricsRegistry()
+    reads = registry.counter('plantsitter_reads_total', 'Sensor reads.', ('channel',))
+    reads.labels('temperature').inc()
+    reads.labels('temperature').inc(2)
+    reads.labels('soil "A"\n').inc()
+    registry.counter('plantsitter_ticks_total', 'Ticks.').inc(0.5)
+
+    assert registry.formatPrometheus() == (
+        '# HELP plantsitter_reads_total Sensor reads.\n'
+        '# TYPE plantsitter_reads_total counter\n'
+        'plantsitter_reads_total{channel="soil \\"A\\"\\n"} 1\n'
+        'plantsitter_reads_total{channel="temperature"} 3\n'
+        '# HELP plantsitter_ticks_total Ticks.\n'
+        '# TYPE plantsitter_ticks_total counter\n'
+        'plantsitter_ticks_total 0.5\n')
+
+def testHistogramBucketsAreCumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram('plantsitter_read_seconds', 'Read time.', ('sensor',),
+                                 buckets = (0.01, 0.1))
+    child = latency.labels('sht31')
+    for value in (0.005, 0.01, 0.05, 2.0):
+        child.observe(value)
+    with latency.labels('aht20').time():
+        pass
+
+    lines = registry.formatPrometheus().splitlines()
+    assert lines[:2] == ['# HELP plantsitter_read_seconds Read time.',
+                         '# TYPE plantsitter_read_seconds histogram']
+    assert lines[-5:] == [
+        'plantsitter_read_seconds_bucket{sensor="sht31",le="0.01"} 2',
+        'plantsitter_read_seconds_bucket{sensor="sht31",le="0.1"} 3',
+        'plantsitter_read_seconds_bucket{sensor="sht31",le="+Inf"} 4',
+        'plantsitter_read_seconds_sum{sensor="sht31"} 2.065',
+        'plantsitter_read_seconds_count{sensor="sht31"} 4',
+    ]
+    assert 'plantsitter_read_seconds_count{sensor="aht20"} 1' in lines
+
+def testCollectorsAreRenderedLast():
+    registry = MetricsRegistry()
+    calls = []
+
+    def collect():
+        calls.append(1)
+        return [('plantsitter_lcd_queue_depth', 'gauge', 'Queued LCD commands.',
+                 [({'bus': 'lcd'}, 3)]),
+                ('plantsitter_uptime_seconds', 'gauge', 'Uptime.', [({}, 12.5)])]
+    registry.addCollector(collect)
+    registry.counter('plantsitter_ticks_total', 'Ticks.')
+
+    text = registry.formatPrometheus()
+    assert calls == [1]
+    assert text.index('plantsitter_ticks_total') < text.index('plantsitter_lcd_queue_depth')
+    assert '# TYPE plantsitter_lcd_queue_depth gauge\nplantsitter_lcd_queue_depth{bus="lcd"} 3\n' in text
+    assert text.endswith('plantsitter_uptime_seconds 12.5\n')
+
+def testTextfileIsReplaced(tmp_path):
+    registry = MetricsRegistry()
+    registry.counter('plantsitter_ticks_total', 'Ticks.').inc()
+    path = str(tmp_path / 'plantsitter.prom')
+    with open(path, 'w') as file:
+        file.write('old')
+
+    registry.writeTextfile(path)
+    with open(path) as file:
+        assert file.read() == registry.formatPrometheus()
+    assert os.listdir(str(tmp_path)) == ['plantsitter.prom']
+
+def testServe():
+    registry = MetricsRegistry()
+    registry.counter('plantsitter_ticks_total', 'Ticks.').inc(4)
+    server = registry.serve(0)
+    try:
+        url = 'http://127.0.0.1:' + str(server.server_address[1])
+        with urlopen(url + '/metrics', timeout = 5) as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert b'plantsitter_ticks_total 4\n' in response.read()
+        with pytest.raises(HTTPError) as error:
+            urlopen(url + '/other', timeout = 5)
+        assert error.value.code == 404
+    finally:
+        registry.stop()
+    assert registry._server is None
@@ -0,0 +1,40 @@
+#
+# Tests of PlantSimulation: a short run on the virtual clock, without
+# PlantSitter or any hardware setting
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from PlantSimulation import runSimulation
+
+def testImportHasNoSideEffects():
+    environment = dict(os.environ)
+    environment.pop('PLANTSITTER_HAL', None)
+    script = ("import os, sys, PlantSimulation; "
+              "print('PlantSitter' in sys.modules, 'PLANTSITTER_HAL' in os.environ)")
+    output = subprocess.run([sys.executable, '-c', script], env = environment, check = True,
+                            cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            capture_output = True, text = True).stdout
+    assert output.split() == ['False', 'False']
+
+def testShortRun():
+    report = runSimulation(days = 0.05, seed = 3)
+    again = runSimulation(days = 0.05, seed = 3)
+
+    ## The virtual clock makes runs repeatable
+    assert report['channels'] == again['channels']
+    for name in ('temperature', 'humidity'):
+        channel = report['channels'][name]
+        assert channel['transitions'] > 0
+        assert sum(channel['timeInState'].values()) == pytest.approx(1.0)
@@ -0,0 +1,159 @@
+#
+# Tests of the PlantSitter wiring, on the simulated hardware backend
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+import PlantSitter
+
+def testDatabaseWriterPerChannel():
+    writers = PlantSitter.createDatabaseWriters()
+
+    assert sorted(writers) == sorted(channel.name for channel in PlantSitter.controlEngine.channels)
+    assert writers['temperature'].bucketName == 'temperature-bucket'
+    assert writers['humidity'].bucketName == 'humidity-bucket'
+
+def testDatabaseWriterMetrics(monkeypatch):
+    writers = PlantSitter.createDatabaseWriters()
+    writers['humidity'].write('humidity', 40.0, 1)
+    monkeypatch.setattr(PlantSitter, 'databaseWriters', writers)
+
+    text = PlantSitter.metrics.formatPrometheus()
+    assert 'plantsitter_database_queue_depth{channel="humidity"} 1' in text
+    assert 'plantsitter_database_errors_total{channel="temperature"} 0' in text
+    assert 'plantsitter_database_connected{channel="humidity"} 0' in text
+
+def testLoggingMetrics(monkeypatch):
+    class Pipeline():
+        def getStats(self):
+            return {"queueDepth": 4, "dropped": 7}
+    monkeypatch.setattr(PlantSitter, 'loggingPipeline', Pipeline())
+
+    text = PlantSitter.metrics.formatPrometheus()
+    assert 'plantsitter_log_records_dropped_total 7' in text
+    assert 'plantsitter_log_queue_depth 4' in text
+
+def testPeriodicSensorMetrics(monkeypatch):
+    from PlantSitterHAL import BackgroundSensor, SimulatedPipelinedSensor
+
+    sensor = BackgroundSensor(SimulatedPipelinedSensor(), interval = 0.01)
+    try:
+        sensor.read()
+        monkeypatch.setattr(PlantSitter, 'thSensor', sensor)
+        text = PlantSitter.metrics.formatPrometheus()
+    finally:
+        sensor.close()
+    assert 'plantsitter_sensor_conversion_errors_total 0' in text
+    assert 'plantsitter_sensor_stale_reads_total 0' in text
+    assert 'plantsitter_sensor_result_age_seconds ' in text
+
+def testRollupGapCoversSamplingInterval(monkeypatch):
+    assert PlantSitter.rollupMaxGap() >= 1.5 * PlantSitter.controlEngine.displayPeriod
+
+    monkeypatch.setattr(PlantSitter, 'ADAPTIVE_SAMPLING', True)
+    monkeypatch.setattr(PlantSitter, 'ROLLUP_FILE', None)
+    assert PlantSitter.rollupMaxGap() >= 1.5 * PlantSitter.SAMPLE_MAX_INTERVAL
+    assert PlantSitter.createRollups().maxGap == PlantSitter.rollupMaxGap()
+
+def testSensorErrorsReachScrape(monkeypatch):
+    from DeadlineScheduler import DeadlineScheduler
+    from SensorSampler import SensorSampler
+
+    class NackingSensor():
+        def read(self):
+            raise OSError(121, "Remote I/O error")
+
+    monkeypatch.setattr(PlantSitter, 'sampler', SensorSampler(NackingSensor(), maxFailures = 0))
+    monkeypatch.setattr(PlantSitter.controlEngine, 'scheduler', None)
+
+    ## The failing ticks neither stop the scheduler nor the other jobs
+    scheduler = DeadlineScheduler()
+    PlantSitter.controlEngine.addJobs(scheduler)
+    runs = []
+    scheduler.addJob("probe", 0.005, lambda: runs.append(1))
+    scheduler.setPeriod("channels.display", 0.005)
+    scheduler.run(isDone = lambda: len(runs) >= 5 and scheduler.jobs["channels.display"].errors >= 3)
+
+    text = PlantSitter.metrics.formatPrometheus()
+    errors = scheduler.jobs["channels.display"].errors
+    assert 'plantsitter_i2c_errors_total %d' % errors in text
+    assert 'plantsitter_job_errors_total{job="channels.display"} %d' % errors in text
+    assert 'plantsitter_job_errors_total{job="probe"} 0' in text
+
+def testBringUpSurvivesFailures(monkeypatch, caplog):
+    class Hal():
+        def bringUp(self, groups):
+            return [('sensor', OSError(121, "Remote I/O error"))]
+
+    def decide():
+        raise RuntimeError("no reading yet")
+
+    monkeypatch.setattr(PlantSitter, 'hal', Hal())
+    monkeypatch.setattr(PlantSitter.controlEngine, 'decide', decide)
+
+    with caplog.at_level('WARNING', logger = 'plantsitter.startup'):
+        failures = PlantSitter.bringUpDevices()
+
+    assert [name for name, error in failures] == ['sensor']
+    assert "sensor failed to come up" in caplog.text
+    assert "First control decision failed" in caplog.text
+
+def testAsyncEngineRunsJobsOnTheDeviceWorker(monkeypatch):
+    import asyncio
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    engine = PlantSitter.controlEngine
+    channel = engine.byName['temperature']
+    monkeypatch.setattr(engine, 'scheduler', None)
+    monkeypatch.setattr(channel, 'setPoint', channel.setPoint)
+
+    ticks = []
+    applied = []
+    monkeypatch.setattr(engine, 'tick', lambda: ticks.append(threading.current_thread().name))
+    applySetPoints = engine.applySetPoints
+    def recordApply():
+        applied.append(threading.current_thread().name)
+        applySetPoints()
+    monkeypatch.setattr(engine, 'applySetPoints', recordApply)
+
+    executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "PlantSitterIO")
+    monkeypatch.setattr(PlantSitter, 'deviceExecutor', executor)
+    monkeypatch.setattr(PlantSitter, 'asyncScheduler', None)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        pressedOn = []
+        increase = channel.increaseSetPoint
+        monkeypatch.setattr(channel, 'increaseSetPoint',
+                            lambda: (pressedOn.append(threading.get_ident()), increase()))
+
+        task = asyncio.create_task(PlantSitter.asyncMain())
+        while PlantSitter.asyncScheduler is None or not ticks:
+            await asyncio.sleep(0.01)
+
+        ## gpiozero presses from its own thread; the handler runs on the loop
+        button = PlantSitter.hal.devices['button25']
+        setPoint = channel.setPoint
+        await loop.run_in_executor(None, button.press)
+        while not applied:
+            await asyncio.sleep(0.01)
+
+        PlantSitter.asyncScheduler.stop()
+        await asyncio.wait_for(task, 5.0)
+        return pressedOn, setPoint
+
+    try:
+        pressedOn, setPoint = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+    assert pressedOn == [threading.get_ident()]
+    assert channel.setPoint == setPoint + 1
+    assert set(ticks) == set(applied) == {ticks[0]}
+    assert ticks[0].startswith("PlantSitterIO")
@@ -0,0 +1,293 @@
+#
+# Tests of PlantSitterHAL: lazy devices and backend selection, the
+# simulated backend, and the periodic sensor modes and the pipelined
+# AHTx0 on fake I2C devices
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
+
+import sys
+import threading
+
+import pytest
+
+from PlantSitterHAL import (BACKEND_SIMULATED, BACKEND_VARIABLE, BackgroundSensor,
+                            LazyDevice, PeriodicSht31d, PipelinedAhtx0, RealHardware,
+                            SimulatedHardware, SimulatedPipelinedSensor, _sht31Crc,
+                            createHal, isBuilt)
+
+def testLazyDeviceBuildsOnFirstUse():
+    builds = []
+
+    class Device():
+        value = 0
+
+    def factory():
+        builds.append(1)
+        return Device()
+
+    device = LazyDevice(factory, 'thing')
+    assert repr(device) == '<LazyDevice thing (not built)>'
+    assert not isBuilt(device) and builds == []
+
+    device.value = 3
+    assert device.value == 3
+    assert repr(device) == '<LazyDevice thing (built)>'
+    assert builds == [1]
+    assert isBuilt(device) and isBuilt(object()) and not isBuilt(None)
+
+def testLazyDeviceIsBuiltOnce():
+    builds = []
+    gate = threading.Event()
+
+    def factory():
+        builds.append(1)
+        gate.wait(5.0)
+        return object()
+
+    device = LazyDevice(factory)
+    with ThreadPoolExecutor(max_workers = 8) as executor:
+        futures = [executor.submit(device.build) for index in range(8)]
+        sleep(0.05)
+        gate.set()
+    assert len(set(id(future.result()) for future in futures)) == 1
+    assert builds == [1]
+
+def testBackendSelection(monkeypatch):
+    monkeypatch.setenv(BACKEND_VARIABLE, BACKEND_SIMULATED)
+    assert isinstance(createHal().hardware, SimulatedHardware)
+
+    monkeypatch.delenv(BACKEND_VARIABLE)
+    assert isinstance(createHal().hardware, RealHardware)
+
+    with pytest.raises(ValueError, match = "Unknown hardware backend"):
+        createHal('emulated')
+
+def testRealBackendImportsNothingUntilUsed():
+    before = set(sys.modules)
+    hal = createHal('real')
+    devices = [hal.sensor(), hal.led(17), hal.button(23), hal.serialPort()]
+    assert not any(isBuilt(device) for device in devices)
+    assert set(sys.modules) - before == set()
+    assert sorted(hal.devices) == ['button23', 'led17', 'sensor', 'serial']
+
+def testSimulatedDevices():
+    hal = createHal('sim')
+
+    sensor = hal.sensor()
+    assert (sensor.temperature, sensor.relative_humidity) == (22.0, 40.0)
+
+    presses = []
+    button = hal.button(23)
+    button.when_pressed = lambda: presses.append('pressed')
+    button.press()
+    assert presses == ['pressed']
+
+    led = hal.led(17)
+    led.pulse()
+    assert led.is_lit and led.pulses == 1
+    led.off()
+    assert not led.is_lit and led.value == 0.0
+
+    serial = hal.serialPort()
+    serial.write(b'report')
+    serial.feed(b'ok\n')
+    assert serial.written == b'report'
+    assert serial.in_waiting == 3
+    assert serial.read(2) == b'ok' and serial.read(5) == b'\n'
+
+    lcd = hal.lcdFactory()(None, None, None, None, None, None, 16, 2)
+    lcd.message = "hello"
+    assert lcd.text().startswith("hello")
+
+##
+## FakeI2cDevice - adafruit_bus_device I2CDevice stand-in returning
+## 'result' from every read, or raising OSError while 'nack' is set
+##
+class FakeI2cDevice():
+    "I2C device with canned results"
+
+    def __init__(self, result):
+        self.result = bytes(result)
+        self.nack = False
+        self.written = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def write(self, data):
+        self.written.append(bytes(data))
+
+    def readinto(self, buffer):
+        if self.nack:
+            raise OSError(121, "Remote I/O error")
+        buffer[:] = self.result
+
+    ## End class FakeI2cDevice definition
+
+class FakeDriver():
+    def __init__(self, device):
+        self.i2c_device = device
+
+def sht31Result(rawTemperature, rawHumidity):
+    words = [rawTemperature.to_bytes(2, 'big'), rawHumidity.to_bytes(2, 'big')]
+    return b''.join(word + bytes([_sht31Crc(word)]) for word in words)
+
+##
+## Clock - Manually advanced monotonic clock
+##
+class Clock():
+    "Manual clock"
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    ## End class Clock definition
+
+def testPeriodicSht31dStaleAfterMaxAge():
+    device = FakeI2cDevice(sht31Result(0x6666, 0x8000))
+    clock = Clock()
+    sensor = PeriodicSht31d(FakeDriver(device), rate = 1, clock = clock)
+    temperature, humidity = sensor.read()
+    assert humidity == pytest.approx(50.0, abs = 0.01)
+
+    ## NACKed fetches serve the previous result for up to three periods
+    device.nack = True
+    clock.now = clock.now + 2.5
+    assert sensor.read() == (temperature, humidity)
+    clock.now = clock.now + 1.0
+    with pytest.raises(TimeoutError):
+        sensor.read()
+    assert sensor.getStats()['errors'] == 2
+    assert sensor.getStats()['stale'] == 1
+
+    device.nack = False
+    assert sensor.read() == (temperature, humidity)
+
+##
+## FailingSensor - Plain sensor whose reads fail while 'failing' is set
+##
+class FailingSensor():
+    "Sensor failing on demand"
+
+    def __init__(self):
+        self.failing = False
+
+    @property
+    def temperature(self):
+        if self.failing:
+            raise OSError(121, "Remote I/O error")
+        return 21.0
+
+    @property
+    def relative_humidity(self):
+        return 45.0
+
+def testBackgroundSensorStaleWhenConversionsFail():
+    source = FailingSensor()
+    sensor = BackgroundSensor(source, interval = 0.01)
+    try:
+        assert sensor.read() == (21.0, 45.0)
+
+        source.failing = True
+        deadline = monotonic() + 5.0
+        while monotonic() < deadline:
+            try:
+                sensor.read()
+            except TimeoutError:
+                break
+            sleep(0.005)
+        else:
+            pytest.fail("read() kept serving an old result")
+
+        stats = sensor.getStats()
+        assert stats['errors'] >= 3
+        assert stats['stale'] == 1
+        assert stats['age'] > sensor.maxAge
+
+        source.failing = False
+        deadline = monotonic() + 5.0
+        while monotonic() < deadline:
+            try:
+                assert sensor.read() == (21.0, 45.0)
+                break
+            except TimeoutError:
+                sleep(0.005)
+        else:
+            pytest.fail("read() did not recover")
+    finally:
+        sensor.close()
+
+def testBackgroundSensorStaleWhenThreadStopped():
+    clock = Clock()
+    sensor = BackgroundSensor(SimulatedPipelinedSensor(), interval = 1.0, clock = clock)
+    sensor.read()
+    sensor.close()
+
+    clock.now = clock.now + 3.5
+    with pytest.raises(TimeoutError, match = "thread stopped"):
+        sensor.read()
+
+def testAhtx0BusyTimesOut():
+    device = FakeI2cDevice(bytes([0x80, 0, 0, 0, 0, 0]))
+    sensor = PipelinedAhtx0(FakeDriver(device), pollInterval = 0.001, timeout = 0.02)
+    started = monotonic()
+    with pytest.raises(OSError):
+        sensor.collect()
+    assert monotonic() - started < 1.0
+
+def testAhtx0Collect():
+    device = FakeI2cDevice(bytes([0x1C, 0x80, 0x00, 0x06, 0x66, 0x66]))
+    sensor = PipelinedAhtx0(FakeDriver(device))
+    temperature, humidity = sensor.collect()
+    assert humidity == pytest.approx(50.0, abs = 0.01)
+    assert temperature == pytest.approx(30.0, abs = 0.01)
+
+def testBringUpKeepsGoingAfterFailure():
+    from PlantSitterHAL import LazyDevice, createHal
+    from StartupProfile import startup
+
+    builds = []
+    def failingLcd():
+        builds.append('lcd')
+        raise OSError(121, "Remote I/O error")
+
+    hal = createHal('sim')
+    lcd = LazyDevice(failingLcd, 'test.lcd')
+    led = hal.led(5)
+    reads = []
+    failures = hal.bringUp([
+        [lcd, lambda: reads.append('after lcd')],
+        [led],
+        [lambda: reads.append('other group')],
+    ])
+
+    ## Only the failing device is reported, everything else came up
+    assert [name for name, error in failures] == ['test.lcd']
+    assert isinstance(failures[0][1], OSError)
+    assert led.isBuilt() and not lcd.isBuilt()
+    assert sorted(reads) == ['after lcd', 'other group']
+
+    ## The failure is in the startup report, with its timing
+    entry = [entry for entry in startup.failures() if entry.name == 'test.lcd'][-1]
+    assert entry.kind == 'device' and entry.duration >= 0
+    assert "test.lcd" in startup.formatReport() and "FAILED: OSError" in startup.formatReport()
+
+    ## The device is built again on first use
+    with pytest.raises(OSError):
+        lcd.build()
+    assert builds == ['lcd', 'lcd']
@@ -0,0 +1,63 @@
+#
+# Tests of the PlantSitterLogging pipeline
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+import logging
+import threading
+
+import pytest
+
+from PlantSitterLogging import ROOT_LOGGER, getLogger, setupLogging
+
+##
+## Puts the plantsitter loggers back the way they were after a test
+##
+@pytest.fixture
+def restoreLoggers():
+    root = logging.getLogger(ROOT_LOGGER)
+    saved = (list(root.handlers), root.level, root.propagate)
+    yield
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handlers, level, propagate = saved
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+    root.propagate = propagate
+
+def testStopWithFullQueue(tmp_path, restoreLoggers):
+    path = tmp_path / "plantsitter.log"
+    pipeline = setupLogging('INFO', path = str(path), rateLimit = None, maxQueue = 2)
+
+    ## Hold the writer on its first record so the queue fills up
+    release = threading.Event()
+    writing = threading.Event()
+    def holdFirst(record):
+        writing.set()
+        release.wait(5.0)
+        return True
+    pipeline.handler.addFilter(holdFirst)
+
+    log = getLogger('test')
+    log.info("record 0")
+    assert writing.wait(5.0)
+    for index in range(1, 6):
+        log.info("record %d", index)
+
+    stats = pipeline.getStats()
+    assert stats['queueDepth'] == 2
+    assert stats['dropped'] == 3
+
+    threading.Timer(0.2, release.set).start()
+    pipeline.stop()
+
+    lines = path.read_text().splitlines()
+    assert [line.split()[-1] for line in lines] == ["0", "1", "2"]
+    assert pipeline.listener._thread is None
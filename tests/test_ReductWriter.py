@@ -0,0 +1,314 @@
+#
+# Tests of ReductWriter against a local http.server standing in for
+# ReductStore. The server speaks the part of the ReductStore HTTP API the
+# writer needs - create a bucket and write a batch, with one
+# x-reduct-time-<timestamp> header per record - and can refuse the first
+# requests to exercise the reconnection back-off. ReductBackend itself is
+# tested against a stand-in for the reduct client module.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, sleep, time
+from urllib.request import Request, urlopen
+
+import asyncio
+import sys
+import threading
+import types
+
+import pytest
+
+from ReductWriter import ReductWriter
+
+##
+## FakeReductServer - Records the batches written to it
+##
+class FakeReductServer():
+    "Local stand-in for a ReductStore server"
+
+    def __init__(self, failures = 0):
+        self.failures = failures
+        self.buckets = []
+        self.batches = []
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with server.lock:
+                    if server.failures:
+                        server.failures = server.failures - 1
+                        self.send_response(503)
+                        self.end_headers()
+                        return
+
+                    parts = self.path.strip('/').split('/')
+                    if self.path.endswith('/batch'):
+                        records = []
+                        offset = 0
+                        for name, value in self.headers.items():
+                            if name.lower().startswith('x-reduct-time-'):
+                                size = int(value.split(',')[0])
+                                records.append((int(name[len('x-reduct-time-'):]),
+                                                body[offset:offset + size]))
+                                offset = offset + size
+                        server.batches.append((parts[-2], records))
+                    else:
+                        server.buckets.append(parts[-1])
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = "http://127.0.0.1:%d" % self.httpd.server_address[1]
+        self.thread = threading.Thread(target = self.httpd.serve_forever, daemon = True)
+        self.thread.start()
+
+    def records(self):
+        with self.lock:
+            return [record for entry, records in self.batches for record in records]
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    ## End class FakeReductServer definition
+
+##
+## HttpBackend - Writer backend speaking to FakeReductServer with urllib
+##
+class HttpBackend():
+    "Minimal ReductStore HTTP client"
+
+    def __init__(self, url, bucketName):
+        self.url = url
+        self.bucketName = bucketName
+
+    async def _post(self, path, headers = None, body = b''):
+        request = Request(self.url + path, data = body, headers = headers or {}, method = 'POST')
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(None, lambda: urlopen(request, timeout = 5))
+        response.close()
+
+    async def open(self):
+        await self._post('/api/v1/b/' + self.bucketName)
+
+    async def write(self, entry, records):
+        headers = {}
+        for timestamp, payload in records:
+            headers['x-reduct-time-%d' % timestamp] = '%d,text/plain' % len(payload)
+        await self._post('/api/v1/b/%s/%s/batch' % (self.bucketName, entry), headers,
+                         b''.join(payload for timestamp, payload in records))
+
+    async def close(self):
+        pass
+
+    ## End class HttpBackend definition
+
+@pytest.fixture
+def server():
+    fake = FakeReductServer()
+    yield fake
+    fake.close()
+
+def createWriter(server, **settings):
+    return ReductWriter(server.url, "token", "bucket",
+                        backend = HttpBackend(server.url, "bucket"), **settings)
+
+def waitFor(condition, timeout = 5.0):
+    deadline = monotonic() + timeout
+    while not condition() and monotonic() < deadline:
+        sleep(0.01)
+    return condition()
+
+def testBatches(server):
+    writer = createWriter(server, batchSize = 5, flushInterval = 60.0)
+    writer.start()
+    for index in range(12):
+        writer.write('temperature' if index % 2 else 'humidity', index, 1000 + index)
+
+    ## Two full batches are flushed without waiting for the interval
+    assert waitFor(lambda: writer.written >= 10)
+    writer.stop()
+
+    stats = writer.getStats()
+    assert stats['written'] == 12
+    assert stats['batches'] == 3
+    assert stats['queueDepth'] == 0
+    assert stats['errors'] == 0
+    assert server.buckets == ["bucket"]
+    assert sorted(server.records()) == [(1000 + index, str(index).encode()) for index in range(12)]
+    assert max(len(records) for entry, records in server.batches) <= 5
+
+def testReconnectsAfterFailures(server):
+    server.failures = 3
+    writer = createWriter(server, batchSize = 2, flushInterval = 60.0,
+                          retryDelay = 0.01, maxRetryDelay = 0.05)
+    writer.start()
+    writer.write('temperature', 21.5, 1)
+    writer.write('temperature', 21.6, 2)
+
+    assert waitFor(lambda: writer.written == 2)
+    stats = writer.getStats()
+    assert stats['errors'] == 3
+    assert stats['retries'] == 3
+    assert stats['connected']
+    writer.stop()
+    assert server.records() == [(1, b'21.5'), (2, b'21.6')]
+
+def testFailedWriteIsRetried(server):
+    writer = createWriter(server, batchSize = 2, flushInterval = 60.0,
+                          retryDelay = 0.01, maxRetryDelay = 0.05)
+    writer.start()
+    assert waitFor(lambda: writer.connected)
+
+    ## The batch is refused once, then written on the next connection
+    server.failures = 1
+    writer.write('humidity', 40, 1)
+    writer.write('humidity', 41, 2)
+
+    assert waitFor(lambda: writer.written == 2)
+    writer.stop()
+    assert writer.dropped == 0
+    assert writer.errors == 1
+    assert server.records() == [(1, b'40'), (2, b'41')]
+
+def testStopWhileUnreachable():
+    server = FakeReductServer(failures = 1_000_000)
+    try:
+        writer = createWriter(server, retryDelay = 10.0)
+        writer.start()
+        writer.write('temperature', 20.0, 1)
+        assert waitFor(lambda: writer.errors >= 1)
+
+        started = monotonic()
+        writer.stop()
+        assert monotonic() - started < 2.0
+        assert writer.written == 0
+        assert writer.getStats()['queueDepth'] == 1
+    finally:
+        server.close()
+
+##
+## FailingEntryBackend - HttpBackend refusing the first write of one
+## entry, after the other entries of the same flush have been written
+##
+class FailingEntryBackend(HttpBackend):
+    "Backend failing one entry once"
+
+    def __init__(self, url, bucketName, failingEntry):
+        super().__init__(url, bucketName)
+        self.failingEntry = failingEntry
+
+    async def write(self, entry, records):
+        if entry == self.failingEntry:
+            self.failingEntry = None
+            raise ConnectionResetError("connection reset")
+        await super().write(entry, records)
+
+def testPartialFailureIsNotWrittenTwice(server):
+    writer = ReductWriter(server.url, "token", "bucket", batchSize = 4, flushInterval = 0.05,
+                          retryDelay = 0.01, maxRetryDelay = 0.05,
+                          backend = FailingEntryBackend(server.url, "bucket", 'humidity'))
+    writer.write('temperature', 21.0, 1)
+    writer.write('humidity', 40, 2)
+    writer.write('temperature', 21.5, 3)
+    writer.write('humidity', 41, 4)
+    writer.start()
+
+    assert waitFor(lambda: writer.written == 4)
+    writer.stop()
+    assert writer.errors == 1
+    assert sorted(server.records()) == [(1, b'21.0'), (2, b'40'), (3, b'21.5'), (4, b'41')]
+
+##
+## fakeReduct - Module standing in for the reduct client package,
+## recording the buckets created and the batches written
+##
+def fakeReduct():
+    module = types.ModuleType('reduct')
+    module.clients = []
+
+    class QuotaType():
+        FIFO = 'FIFO'
+
+    class BucketSettings():
+        def __init__(self, quota_type, quota_size):
+            self.quota_type = quota_type
+            self.quota_size = quota_size
+
+    class Batch():
+        def __init__(self):
+            self.records = []
+
+        def add(self, timestamp, data, content_type):
+            self.records.append((timestamp, data, content_type))
+
+    class Bucket():
+        def __init__(self, client):
+            self.client = client
+
+        async def write_batch(self, entry, batch):
+            self.client.batches.append((entry, batch.records))
+
+    class Client():
+        def __init__(self, url, api_token):
+            self.url = url
+            self.apiToken = api_token
+            self.buckets = []
+            self.batches = []
+            self.closed = False
+            module.clients.append(self)
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *args):
+            self.closed = True
+
+        async def create_bucket(self, name, settings, exist_ok = False):
+            self.buckets.append((name, settings.quota_type, settings.quota_size, exist_ok))
+            return Bucket(self)
+
+    module.QuotaType = QuotaType
+    module.BucketSettings = BucketSettings
+    module.Batch = Batch
+    module.Client = Client
+    return module
+
+def testReductBackend(monkeypatch):
+    reduct = fakeReduct()
+    monkeypatch.setitem(sys.modules, 'reduct', reduct)
+
+    writer = ReductWriter("http://reduct:8383", "token", "plants", quotaSize = 1000,
+                          batchSize = 2, flushInterval = 60.0)
+    writer.start()
+    before = int(time() * 1_000_000)
+    for value in (20.5, 21.0, 21.5, 22.0):
+        writer.write('temperature', value)
+    after = int(time() * 1_000_000)
+    assert waitFor(lambda: writer.written == 4)
+    writer.stop()
+
+    ## One connection, with the bucket created once
+    [client] = reduct.clients
+    assert (client.url, client.apiToken) == ("http://reduct:8383", "token")
+    assert client.buckets == [("plants", 'FIFO', 1000, True)]
+    assert client.closed
+
+    ## Two batches with epoch microsecond timestamps
+    assert [entry for entry, records in client.batches] == ['temperature', 'temperature']
+    records = [record for entry, records in client.batches for record in records]
+    assert [data for timestamp, data, contentType in records] == [b'20.5', b'21.0', b'21.5', b'22.0']
+    assert all(before <= timestamp <= after for timestamp, data, contentType in records)
+    assert all(contentType == "text/plain" for timestamp, data, contentType in records)
@@ -0,0 +1,106 @@
+#
+# Tests of the time-in-state accounting and the bucket boundaries of
+# Rollups
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from time import mktime
+
+import os
+import time
+
+import pytest
+
+from Rollups import DAY, HOUR, MAX_GAP, MINUTE, RollupEngine
+
+## Start of an hour bucket
+START = 1_699_999_200.0
+
+##
+## heatHour - Time in each state of a channel sampled every 'interval'
+## seconds for one hour in 'heat'. The interval after the last sample of
+## the hour belongs to the next one.
+##
+def heatHour(interval, **settings):
+    engine = RollupEngine(utcOffset = 0, **settings)
+    engine.addChannel(0, ('off', 'heat', 'cool'))
+    when = START
+    while when < START + 3600:
+        engine.update(0, when, 20.0, 'heat')
+        when = when + interval
+    return engine.current(0, HOUR).stateSeconds
+
+def testOneSecondSamples():
+    assert heatHour(1.0) == pytest.approx((0.0, 3599.0, 0.0))
+
+def testAdaptiveSamplesNeedLongerGap():
+    ## The default gap drops two thirds of every 30 s interval
+    assert heatHour(30.0)[1] == pytest.approx(119 * MAX_GAP)
+    assert heatHour(30.0, maxGap = 45.0) == pytest.approx((0.0, 3570.0, 0.0))
+
+def testOutageIsNotCounted():
+    engine = RollupEngine(utcOffset = 0, maxGap = 45.0)
+    engine.addChannel(0, ('off', 'heat', 'cool'))
+    engine.update(0, START, 20.0, 'heat')
+    engine.update(0, START + 600, 20.0, 'heat')
+    assert engine.current(0, HOUR).stateSeconds == pytest.approx((0.0, 45.0, 0.0))
+
+def testIntervalSplitAtBoundary():
+    closed = []
+    engine = RollupEngine(utcOffset = 0, onClose = closed.append)
+    engine.addChannel(0, ('off', 'heat', 'cool'))
+    for second in range(120):
+        engine.update(0, START + 0.5 + second, 20.0, 'heat' if second < 90 else 'cool')
+    engine.update(0, START + 3600.5, 20.0, 'cool')
+
+    ## Every second is credited to the minute it is in, and the capped
+    ## interval after the last sample does not leak into later buckets
+    first, second = [record for record in closed if record.resolution == MINUTE][:2]
+    assert first.stateSeconds == pytest.approx((0.0, 59.5, 0.0))
+    assert second.stateSeconds == pytest.approx((0.0, 30.5, 29.5))
+
+    ## The minutes add up to their hour
+    [hour] = [record for record in closed if record.resolution == HOUR]
+    assert hour.stateSeconds == pytest.approx((0.0, 90.0, 29.0 + MAX_GAP))
+
+##
+## localZone - Run the test in the Europe/Berlin time zone
+##
+@pytest.fixture
+def localZone():
+    saved = os.environ.get('TZ')
+    os.environ['TZ'] = 'Europe/Berlin'
+    time.tzset()
+    yield
+    if saved is None:
+        del os.environ['TZ']
+    else:
+        os.environ['TZ'] = saved
+    time.tzset()
+
+def testDaysFollowDaylightSavingTime(localZone):
+    closed = []
+    engine = RollupEngine(onClose = closed.append, maxGap = 90.0)
+    engine.addChannel(0, ('off', 'heat', 'cool'))
+
+    ## Across the night the clocks go forward (2024-03-31, 23 hours)
+    ## and back (2024-10-27, 25 hours)
+    for first, last in (((2024, 3, 30), (2024, 4, 1)), ((2024, 10, 26), (2024, 10, 28))):
+        when = mktime(first + (22, 0, 0, 0, 0, -1))
+        end = mktime(last + (2, 0, 0, 0, 0, -1))
+        while when < end:
+            engine.update(0, when, 20.0, 'heat')
+            when = when + 60
+
+    days = [record for record in closed if record.resolution == DAY]
+    lengths = dict((time.strftime('%m-%d', time.localtime(record.start)), record.stateSeconds[1])
+                   for record in days)
+    assert all(time.localtime(record.start)[3:6] == (0, 0, 0) for record in days)
+    assert lengths['03-31'] == pytest.approx(23 * 3600)
+    assert lengths['10-27'] == pytest.approx(25 * 3600)
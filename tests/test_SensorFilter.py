@@ -0,0 +1,96 @@
+#
+# Tests of SensorFilter: the running median, the moving average and the
+# spike rejection at their edges
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+import pytest
+
+from SensorFilter import StreamingFilter
+
+def testMedianOfPartialAndFullWindow():
+    stream = StreamingFilter(window = 4, alpha = 1)
+    assert stream.median() is None
+
+    assert stream.update(10.0) == 10.0
+    assert stream.update(20.0) == 15.0          # even count, mean of the middle two
+    assert stream.update(12.0) == 12.0
+
+    ## The window slides: 10 leaves when the fifth reading comes in
+    stream.update(30.0)
+    assert stream.median() == 16.0
+    stream.update(11.0)
+    assert stream.median() == 16.0              # 20 12 30 11
+    stream.update(11.0)
+    assert stream.median() == 11.5              # 12 30 11 11
+
+def testMedianWithDuplicatesLeaving():
+    stream = StreamingFilter(window = 3, alpha = 1)
+    for reading in (5.0, 5.0, 5.0, 7.0, 7.0):
+        stream.update(reading)
+    assert stream.median() == 7.0
+    assert sorted(stream._ring) == stream._sorted
+
+def testWindowOfOneFollowsTheReadings():
+    stream = StreamingFilter(window = 1, alpha = 1)
+    assert [stream.update(reading) for reading in (3.0, 9.0, -1.0)] == [3.0, 9.0, -1.0]
+
+def testMovingAverage():
+    stream = StreamingFilter(window = 1, alpha = 0.5)
+    assert stream.update(10.0) == 10.0          # starts at the first reading
+    assert stream.update(20.0) == 15.0
+    assert stream.update(20.0) == 17.5
+
+@pytest.mark.parametrize('arguments', [
+    {'window': 0},
+    {'alpha': 0},
+    {'alpha': 1.5},
+])
+def testBadSettings(arguments):
+    with pytest.raises(ValueError):
+        StreamingFilter(**arguments)
+
+def testSpikesAreDropped():
+    stream = StreamingFilter(window = 3, alpha = 1, spikeLimit = 2.0)
+    stream.update(70.0)
+    assert stream.update(90.0) == 70.0
+    assert stream.update(72.0) == 71.0          # exactly at the limit is kept
+    assert stream.update(float('nan')) == 71.0
+    assert stream.getStats() == {"samples": 4, "rejected": 2, "steps": 0}
+
+def testNothingAcceptedYet():
+    stream = StreamingFilter(spikeLimit = 1.0)
+    assert stream.update(float('nan')) is None
+    assert stream.value is None
+    assert stream.update(50.0) == 50.0
+
+def testRepeatedSpikesAreAStep():
+    stream = StreamingFilter(window = 3, alpha = 1, spikeLimit = 2.0, maxRejects = 3)
+    for reading in (70.0, 70.0, 70.0):
+        stream.update(reading)
+
+    ## Three rejections in a row, then the level is taken to have moved
+    assert [stream.update(80.0) for count in range(3)] == [70.0, 70.0, 70.0]
+    assert stream.update(80.0) == 80.0
+    assert stream.median() == 80.0
+    assert stream.getStats() == {"samples": 7, "rejected": 3, "steps": 1}
+
+    ## An accepted reading in between restarts the count
+    stream.update(90.0)
+    stream.update(80.5)
+    assert [stream.update(90.0) for count in range(3)] == [80.25, 80.25, 80.25]
+    assert stream.steps == 1
+
+def testReset():
+    stream = StreamingFilter(window = 3, alpha = 0.5, spikeLimit = 2.0)
+    stream.update(70.0)
+    stream.reset()
+    assert stream.value is None
+    assert stream.median() is None
+    assert stream.update(90.0) == 90.0
@@ -0,0 +1,125 @@
+#
+# Tests of the failed read policy of SensorSampler and MultiSensorSampler
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+import pytest
+
+from SensorSampler import MultiSensorSampler, SensorSampler, StaleReadingError
+
+##
+## FlakySensor - Pipelined sensor whose reads fail while 'failing' is set
+##
+class FlakySensor():
+    "Sensor failing on demand"
+
+    conversionTime = 0.0
+
+    def __init__(self, temperature):
+        self.temperature = temperature
+        self.failing = False
+        self.reads = 0
+
+    def read(self):
+        self.reads = self.reads + 1
+        if self.failing:
+            raise OSError(121, "Remote I/O error")
+        return self.temperature, 40.0
+
+    def trigger(self):
+        pass
+
+    def collect(self):
+        return self.read()
+
+    ## End class FlakySensor definition
+
+##
+## Clock - Manually advanced monotonic clock
+##
+class Clock():
+    "Manual clock"
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    ## End class Clock definition
+
+def testSingleSensorBridgesThenRaises():
+    clock = Clock()
+    sensor = FlakySensor(20.0)
+    sampler = SensorSampler(sensor, maxAge = 1.0, clock = clock, maxFailures = 2)
+    first = sampler.getSnapshot()
+
+    sensor.failing = True
+    for tick in range(2):
+        clock.now = clock.now + 1.5
+        assert sampler.getSnapshot() is first
+        ## A failed read is not retried before maxAge has passed
+        assert sampler.getSnapshot() is first
+    assert sensor.reads == 3
+
+    clock.now = clock.now + 1.5
+    with pytest.raises(StaleReadingError):
+        sampler.getSnapshot()
+    with pytest.raises(StaleReadingError):
+        sampler.getSnapshot()
+    assert sampler.errors == 4
+
+    sensor.failing = False
+    sensor.temperature = 21.0
+    assert sampler.getSnapshot().temperature == 21.0
+    assert sampler.failures == 0
+
+def testSingleSensorWithoutReadingRaises():
+    sensor = FlakySensor(20.0)
+    sensor.failing = True
+    sampler = SensorSampler(sensor, clock = Clock())
+    with pytest.raises(StaleReadingError):
+        sampler.getSnapshot()
+
+def testMultiSensorBridgesThenRaises():
+    clock = Clock()
+    bench = FlakySensor(20.0)
+    shelf = FlakySensor(25.0)
+    sampler = MultiSensorSampler([('bench', bench), ('shelf', shelf)], maxAge = 1.0,
+                                 clock = clock, maxFailures = 2)
+    first = sampler.getSnapshot(name = 'shelf')
+
+    shelf.failing = True
+    for tick in range(2):
+        clock.now = clock.now + 1.5
+        assert sampler.getSnapshot(name = 'shelf') is first
+        assert sampler.getSnapshot().temperature == 20.0
+
+    clock.now = clock.now + 1.5
+    with pytest.raises(StaleReadingError):
+        sampler.getSnapshot(name = 'shelf')
+    assert sampler.getSnapshot(name = 'bench').monotonic == clock.now
+    assert list(sampler.getSnapshots()) == ['bench']
+    assert sampler.sensorErrors == {'bench': 0, 'shelf': 3}
+
+    shelf.failing = False
+    clock.now = clock.now + 1.5
+    assert sampler.getSnapshot(name = 'shelf').monotonic == clock.now
+
+def testMultiSensorUsesClock():
+    clock = Clock()
+    sensor = FlakySensor(20.0)
+    sampler = MultiSensorSampler([('bench', sensor)], maxAge = 1.0, clock = clock)
+    sampler.getSnapshot()
+    clock.now = clock.now + 0.5
+    sampler.getSnapshot()
+    assert sampler.cycles == 1
+    clock.now = clock.now + 1.0
+    sampler.getSnapshot()
+    assert sampler.cycles == 2
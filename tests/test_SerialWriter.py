@@ -0,0 +1,74 @@
+#
+# Tests of SerialWriter: failed writes are logged and a stalled port
+# drops messages instead of queueing them without limit
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+import threading
+
+from SerialWriter import SerialWriter
+
+##
+## FakePort - Serial port recording its writes, raising OSError while
+## 'broken' is set and blocking while 'stalled' is clear
+##
+class FakePort():
+    "Serial port stand-in"
+
+    def __init__(self):
+        self.written = []
+        self.broken = False
+        self.stalled = threading.Event()
+        self.stalled.set()
+
+    def write(self, data):
+        self.stalled.wait()
+        if self.broken:
+            raise OSError(5, "Input/output error")
+        self.written.append(data)
+
+    ## End class FakePort definition
+
+def testFailedWritesAreLogged(caplog):
+    caplog.set_level('INFO', logger = 'plantsitter.serial')
+    port = FakePort()
+    port.broken = True
+    writer = SerialWriter(port, errorLogInterval = 3600.0)
+    for index in range(3):
+        writer.send(b'frame')
+        writer.flush()
+
+    ## The first failure is logged with its traceback, the repeats are not
+    failures = [record for record in caplog.records if "write of" in record.getMessage()]
+    assert writer.errors == 3
+    assert len(failures) == 1
+    assert failures[0].exc_info[0] is OSError
+
+    port.broken = False
+    writer.send(b'ok')
+    writer.flush()
+    writer.close()
+    assert port.written == [b'ok']
+    assert "recovered after 3 errors" in caplog.text
+
+def testStalledPortDropsMessages():
+    port = FakePort()
+    port.stalled.clear()
+    writer = SerialWriter(port, maxQueue = 4)
+
+    ## One message is held by the stalled write, four wait in the queue
+    for index in range(20):
+        writer.send(b'%d' % index)
+    assert writer.getStats()['queueDepth'] <= 4
+    assert writer.dropped >= 15
+
+    port.stalled.set()
+    writer.close()
+    assert writer.getStats()['dropped'] == writer.dropped
+    assert writer.messages + writer.dropped == 20
@@ -0,0 +1,89 @@
+#
+# Tests of SetpointSweep: the vectorized replay against a plain loop
+# over ControlChannel.target(), and the history file it reads
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from ControlChannel import ChannelConfig, ControlChannel
+from HistoryRing import HistoryRing
+from SetpointSweep import loadReadings, replay, runLengths, sweep
+
+##
+## loopReplay - Transitions and decisions below / above of one setpoint
+## (threshold 0), one ControlChannel.decide() per reading
+##
+def loopReplay(readings, setPoint):
+    channel = ControlChannel(ChannelConfig(name = 'temperature', channel = 0, read = None,
+                                           setPoint = setPoint, minSetPoint = 0,
+                                           maxSetPoint = 100, states = ('off', 'heat', 'cool'),
+                                           lights = {}))
+    below = above = 0
+    for reading in readings:
+        channel.decide(reading)
+        below = below + (channel.state == 'heat')
+        above = above + (channel.state == 'cool')
+    return channel.transitions, below, above
+
+def testReplayMatchesControlChannel():
+    generator = numpy.random.default_rng(5)
+    readings = numpy.floor(70 + numpy.cumsum(generator.normal(0, 0.3, 2000)))
+    values, weights = runLengths(readings)
+    setPoints = [66, 68, 70, 72, 74]
+    transitions, below, above = replay(values, weights, setPoints, [0] * len(setPoints),
+                                       chunkCells = 4096)
+
+    for index, setPoint in enumerate(setPoints):
+        assert (transitions[index], below[index], above[index]) == loopReplay(readings, setPoint)
+
+def testLongRunsAreCountedExactly():
+    ## Beyond 2**24 decisions float32 weights lose single decisions
+    transitions, below, above = replay(numpy.array([60.0, 80.0]),
+                                       numpy.array([2.0 ** 25, 1.0]), [70], [0])
+    assert below[0] == 2 ** 25
+    assert above[0] == 1
+    assert transitions[0] == 2
+
+def testSweepReadsHistoryReadOnly(tmp_path):
+    path = str(tmp_path / 'history.ring')
+    ring = HistoryRing(path, capacity = 100)
+    for second in range(150):
+        ring.append(1_700_000_000.0 + second, 70.0 + (second % 7), 40.0, 'off', 'off', 72, 40)
+    ring.close()
+    before = open(path, 'rb').read()
+
+    times, values = loadReadings(path, 'temperature')
+    assert len(times) == 100 and times[0] == 1_700_000_050.0
+    results = sweep(times, values, [70, 72], thresholds = [0, 1], decisionPeriods = [1, 10])
+    assert len(results) == 8
+    assert open(path, 'rb').read() == before
+
+    reader = HistoryRing(path, readOnly = True)
+    try:
+        with pytest.raises(ValueError, match = "read-only"):
+            reader.append(0.0, 70.0, 40.0, 'off', 'off', 72, 40)
+    finally:
+        reader.close()
+
+def testImportHasNoSideEffects():
+    environment = dict(os.environ)
+    environment.pop('PLANTSITTER_HAL', None)
+    script = ("import os, sys, SetpointSweep; "
+              "print('PlantSitter' in sys.modules, 'PLANTSITTER_HAL' in os.environ)")
+    output = subprocess.run([sys.executable, '-c', script], env = environment, check = True,
+                            cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            capture_output = True, text = True).stdout
+    assert output.split() == ['False', 'False']
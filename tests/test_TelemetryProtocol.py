@@ -0,0 +1,66 @@
+#
+# Tests of TelemetryProtocol: the CRC, and pack / unpack round trips of
+# whole frames
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+import pytest
+
+from TelemetryProtocol import (CHANNEL_HUMIDITY, CHANNEL_TEMPERATURE,
+                               FRAME_SIZE, SYNC, TelemetryRecord, crc16,
+                               packFrame, unpackFrame)
+
+def testCrcCheckValue():
+    ## The published check value of CRC-16/CCITT-FALSE
+    assert crc16(b'123456789') == 0x29B1
+    assert crc16(b'') == 0xFFFF
+
+@pytest.mark.parametrize('frame', [
+    (CHANNEL_TEMPERATURE, 'heat', 71.25, 72, 7, 1760000000),
+    (CHANNEL_HUMIDITY, 'dry', 48.5, 40, 0, 0),
+    (CHANNEL_TEMPERATURE, 'off', -12.34, -5, 65535, 0xFFFFFFFF),
+    (255, 'cool', 327.67, 95, 1, 1),
+])
+def testRoundTrip(frame):
+    packed = packFrame(*frame)
+    assert len(packed) == FRAME_SIZE == 16
+    assert packed.startswith(SYNC)
+    assert unpackFrame(packed) == TelemetryRecord(*frame)
+
+def testReadingIsRoundedToHundredths():
+    record = unpackFrame(packFrame(CHANNEL_TEMPERATURE, 'off', 70.126, 72, 1, 0))
+    assert record.reading == 70.13
+
+def testSequenceWraps():
+    record = unpackFrame(packFrame(CHANNEL_HUMIDITY, 'hum', 40, 40, 65537, 0))
+    assert record.sequence == 1
+
+def testFrameInsideBuffer():
+    frame = packFrame(CHANNEL_HUMIDITY, 'hum', 35.0, 40, 3, 100)
+    buffer = bytearray(b'noise' + frame + b'more')
+    assert unpackFrame(buffer) is None
+    assert unpackFrame(buffer, 5).state == 'hum'
+
+def testCorruptFramesAreRejected():
+    frame = packFrame(CHANNEL_TEMPERATURE, 'cool', 80.0, 72, 9, 100)
+
+    ## Any flipped bit between the marker and the CRC is caught
+    for index in range(len(SYNC), FRAME_SIZE):
+        damaged = bytearray(frame)
+        damaged[index] ^= 0x01
+        assert unpackFrame(damaged) is None
+
+    assert unpackFrame(frame[:-1]) is None
+    assert unpackFrame(b'\x00' + frame[1:]) is None
+
+def testUnknownStateCodeIsKeptAsNumber():
+    frame = bytearray(packFrame(CHANNEL_TEMPERATURE, 'off', 70.0, 72, 1, 0))
+    frame[3] = 200
+    frame[-2:] = crc16(bytes(frame[2:-2])).to_bytes(2, 'little')
+    assert unpackFrame(frame).state == '200'
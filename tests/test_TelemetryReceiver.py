@@ -0,0 +1,127 @@
+#
+# Tests of TelemetryReceiver over a Linux pty pair: the test writes a
+# stream to the master in pieces, so messages are split across reads,
+# and the receiver reads the slave like a serial device.
+#
+#------------------------------------------------------------------
+# Change History
+#------------------------------------------------------------------
+# Version   |   Description
+#------------------------------------------------------------------
+#    1          Initial Development
+#------------------------------------------------------------------
+
+from time import sleep
+
+import asyncio
+import os
+import threading
+import tty
+
+import pytest
+
+from TelemetryProtocol import CHANNEL_HUMIDITY, CHANNEL_TEMPERATURE, packFrame
+from TelemetryReceiver import TelemetryParser, aiterRecords, readRecords
+
+FIRST = packFrame(CHANNEL_TEMPERATURE, 'heat', 71.25, 72, 1, 1_700_000_000)
+SECOND = packFrame(CHANNEL_HUMIDITY, 'dry', 38.5, 40, 2, 1_700_000_030)
+LAST = packFrame(CHANNEL_TEMPERATURE, 'cool', 73.5, 72, 3, 1_700_000_060)
+
+## A frame whose reading was hit by line noise
+CORRUPTED = bytearray(packFrame(CHANNEL_HUMIDITY, 'hum', 45.0, 40, 9, 1_700_000_090))
+CORRUPTED[5] ^= 0x10
+CORRUPTED = bytes(CORRUPTED)
+
+##
+## The stream in the pieces it is written in. SECOND and the humidity
+## text report are split across two writes each.
+##
+PIECES = [
+    b'\x00\xffnoise\x13',
+    FIRST,
+    b'State: heat, \nCurrent Temp: 71.5, \nTarget Temp: 72',
+    CORRUPTED,
+    SECOND[:7],
+    SECOND[7:],
+    b'State: dry, \nHumidity: 3',
+    b'9.25, \nTarget Hum: 40',
+    LAST,
+]
+
+EXPECTED = [
+    (CHANNEL_TEMPERATURE, 'heat', 71.25, 72, 1, 1_700_000_000),
+    (CHANNEL_TEMPERATURE, 'heat', 71.5, 72, None, None),
+    (CHANNEL_HUMIDITY, 'dry', 38.5, 40, 2, 1_700_000_030),
+    (CHANNEL_HUMIDITY, 'dry', 39.25, 40, None, None),
+    (CHANNEL_TEMPERATURE, 'cool', 73.5, 72, 3, 1_700_000_060),
+]
+
+@pytest.fixture
+def pty():
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    yield master, slave
+    os.close(master)
+    os.close(slave)
+
+##
+## writePieces - Write PIECES to 'master' from a thread, pausing after
+## each one so that the reader sees them in separate reads
+##
+def writePieces(master):
+    def write():
+        for piece in PIECES:
+            os.write(master, piece)
+            sleep(0.02)
+    thread = threading.Thread(target = write, daemon = True)
+    thread.start()
+    return thread
+
+def checkParser(parser):
+    assert parser.binaryRecords == 3
+    assert parser.textRecords == 2
+    assert parser.crcErrors == 1
+    assert parser.garbageBytes >= len(b'\x00\xffnoise\x13') + len(CORRUPTED)
+    assert parser.bytesReceived == sum(len(piece) for piece in PIECES)
+
+def testReadRecords(pty):
+    master, slave = pty
+    parser = TelemetryParser()
+    writer = writePieces(master)
+
+    records = []
+    for record in readRecords(slave, parser):
+        records.append(tuple(record))
+        if len(records) == len(EXPECTED):
+            break
+    writer.join()
+
+    assert records == EXPECTED
+    checkParser(parser)
+
+def testAiterRecords(pty):
+    master, slave = pty
+    os.set_blocking(slave, False)
+    parser = TelemetryParser()
+
+    async def consume():
+        records = []
+        async for record in aiterRecords(slave, parser):
+            records.append(tuple(record))
+            if len(records) == len(EXPECTED):
+                break
+        return records
+
+    writer = writePieces(master)
+    records = asyncio.run(asyncio.wait_for(consume(), 5.0))
+    writer.join()
+
+    assert records == EXPECTED
+    checkParser(parser)
+
+def testTextReportCompletedByEndOfStream():
+    parser = TelemetryParser()
+    assert parser.feed(b'State: off, \nHumidity: 40.5, \nTarget Hum: 4') == []
+    assert parser.feed(b'0') == []
+    assert [tuple(record) for record in parser.flush()] == \
+        [(CHANNEL_HUMIDITY, 'off', 40.5, 40, None, None)]